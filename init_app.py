@@ -30,10 +30,27 @@ def init_app():
         from database.connection import engine, Base
         from models.usuario import Usuario
         from models.nota_fiscal import NotaFiscal
+        from models.job_processamento import JobProcessamento
+        from models.resumo_fiscal import ResumoMensal, ResumoCliente
+        from models.conversa import Conversa, MensagemChat
+        from models.busca_web import BuscaWebCache
+        from models.arquivo_ingerido import ArquivoIngerido
+        from models.versao_cache import VersaoCache
+        from database.migrations import executar_migracoes
         
         print("🗄️  Criando tabelas do banco de dados...")
-        Base.metadata.create_all(bind=engine)
+        for passo in executar_migracoes(engine):
+            print(f"🔄 Migração aplicada: {passo}")
         print("✅ Banco de dados inicializado com sucesso!")
+
+        from services.document_jobs import marcar_jobs_interrompidos
+        interrompidos = marcar_jobs_interrompidos()
+        if interrompidos:
+            print(f"⚠️  {interrompidos} job(s) de processamento interrompido(s) marcados como erro")
+        from processors.arquivo_upload import limpar_temporarios
+        temporarios = limpar_temporarios()
+        if temporarios:
+            print(f"🧹 {temporarios} arquivo(s) temporário(s) de uploads anteriores removido(s)")
         
     except Exception as e:
         print(f"⚠️  Aviso ao criar banco de dados: {e}")
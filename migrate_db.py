@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+"""
+Migra um app.db existente para o schema atual (colunas numéricas, datas e índices).
+Uso: python migrate_db.py [caminho/para/app.db]
+Sem argumento, usa o banco padrão (src/database/app.db).
+"""
+import os
+import sys
+
+# Adiciona o diretório src ao path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+from sqlalchemy import create_engine
+from database.connection import engine as engine_padrao
+from database.migrations import executar_migracoes
+import models.usuario  # noqa: F401 - registra as tabelas no Base
+import models.nota_fiscal  # noqa: F401
+import models.job_processamento  # noqa: F401
+import models.resumo_fiscal  # noqa: F401
+import models.conversa  # noqa: F401
+import models.busca_web  # noqa: F401
+import models.arquivo_ingerido  # noqa: F401
+import models.versao_cache  # noqa: F401
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        engine = create_engine(f"sqlite:///{os.path.abspath(sys.argv[1])}")
+    else:
+        engine = engine_padrao
+
+    print(f"🗄️  Migrando {engine.url.database}...")
+    aplicadas = executar_migracoes(engine)
+    if aplicadas:
+        for passo in aplicadas:
+            print(f"✅ {passo}")
+    else:
+        print("✅ Banco já está atualizado.")
@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+"""
+Recalcula do zero o resumo mensal (resumo_mensal/resumo_clientes) a partir das notas.
+Uso: python rebuild_resumo.py [cnpj]
+Sem argumento, reconstrói o resumo de todos os CNPJs.
+"""
+import os
+import sys
+
+# Adiciona o diretório src ao path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+from database.connection import SessionLocal
+from services.resumo_fiscal import reconstruir_resumo
+import models.usuario  # noqa: F401 - registra as tabelas no Base
+import models.job_processamento  # noqa: F401
+
+if __name__ == "__main__":
+    cnpj = sys.argv[1] if len(sys.argv) > 1 else None
+
+    print(f"📊 Reconstruindo resumo mensal{f' do CNPJ {cnpj}' if cnpj else ''}...")
+    db = SessionLocal()
+    try:
+        notas = reconstruir_resumo(db, cnpj)
+        print(f"✅ {notas} nota(s) consolidadas.")
+    finally:
+        db.close()
@@ -0,0 +1,169 @@
+"""
+Migrações do banco SQLite.
+O app cria as tabelas com Base.metadata.create_all, que não altera tabelas já
+existentes; aqui ficam os ajustes de schema para bancos criados por versões
+anteriores. executar_migracoes é idempotente e roda no init_app.py a cada deploy.
+"""
+import logging
+from sqlalchemy import inspect
+from database.connection import Base
+from utils.helpers import converter_decimal, converter_data
+
+LOTE_MIGRACAO = 1000  # Linhas copiadas por insert durante a reconstrução das tabelas
+
+# Colunas que deixaram de ser String, com o conversor usado no backfill
+CONVERSOES = {
+    "notas_fiscais": {
+        "data_emissao": converter_data,
+        "valor_total_nota": converter_decimal,
+    },
+    "itens_nota": {
+        "quantidade": converter_decimal,
+        "valor_unitario": converter_decimal,
+        "valor_total": converter_decimal,
+    },
+}
+
+
+def _precisa_migrar_numericos(engine):
+    inspector = inspect(engine)
+    if not inspector.has_table("notas_fiscais"):
+        return False  # Banco novo: create_all já cria no formato atual
+    tipos = {col["name"]: str(col["type"]).upper() for col in inspector.get_columns("notas_fiscais")}
+    return "CHAR" in tipos.get("valor_total_nota", "")
+
+
+def _copiar_tabela(conn, origem, tabela, conversoes):
+    """Copia origem -> tabela em lotes, convertendo as colunas que mudaram de tipo."""
+    colunas = set(tabela.c.keys())
+    total = 0
+    resultado = conn.exec_driver_sql(f"SELECT * FROM {origem}")
+    while True:
+        linhas = resultado.mappings().fetchmany(LOTE_MIGRACAO)
+        if not linhas:
+            break
+        registros = []
+        for linha in linhas:
+            registro = {chave: valor for chave, valor in linha.items() if chave in colunas}
+            for coluna, conversor in conversoes.items():
+                if coluna in registro:
+                    registro[coluna] = conversor(registro[coluna])
+            registros.append(registro)
+        conn.execute(tabela.insert(), registros)
+        total += len(registros)
+    return total
+
+
+def migrar_colunas_numericas(engine):
+    """
+    Converte valores/quantidades (String -> Numeric) e data_emissao (String -> Date)
+    de notas_fiscais e itens_nota. SQLite não altera tipo de coluna, então as duas
+    tabelas são reconstruídas numa única transação e os dados antigos convertidos.
+
+    Returns:
+        bool: True se a migração foi aplicada
+    """
+    if not _precisa_migrar_numericos(engine):
+        return False
+
+    from models.nota_fiscal import NotaFiscal, ItemNota
+    notas = NotaFiscal.__table__
+    itens = ItemNota.__table__
+
+    # AUTOCOMMIT desliga o BEGIN implícito do pysqlite; o BEGIN manual abaixo
+    # deixa os DDLs dentro da mesma transação dos INSERTs (tudo ou nada).
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.exec_driver_sql("PRAGMA foreign_keys=OFF")
+        # Sem isso o RENAME reescreveria a FK de itens_nota para a tabela antiga
+        conn.exec_driver_sql("PRAGMA legacy_alter_table=ON")
+        conn.exec_driver_sql("BEGIN")
+        try:
+            conn.exec_driver_sql("ALTER TABLE notas_fiscais RENAME TO notas_fiscais_antiga")
+            conn.exec_driver_sql("ALTER TABLE itens_nota RENAME TO itens_nota_antiga")
+            notas.create(conn)
+            itens.create(conn)
+            total_notas = _copiar_tabela(conn, "notas_fiscais_antiga", notas, CONVERSOES["notas_fiscais"])
+            total_itens = _copiar_tabela(conn, "itens_nota_antiga", itens, CONVERSOES["itens_nota"])
+            conn.exec_driver_sql("DROP TABLE itens_nota_antiga")
+            conn.exec_driver_sql("DROP TABLE notas_fiscais_antiga")
+            conn.exec_driver_sql("COMMIT")
+        except Exception:
+            conn.exec_driver_sql("ROLLBACK")
+            raise
+        finally:
+            conn.exec_driver_sql("PRAGMA legacy_alter_table=OFF")
+            conn.exec_driver_sql("PRAGMA foreign_keys=ON")
+
+    logging.info(f"MIGRAÇÃO NUMÉRICA: {total_notas} notas e {total_itens} itens convertidos")
+    return True
+
+
+def adicionar_colunas_faltantes(engine):
+    """Adiciona (ALTER TABLE ADD COLUMN) colunas novas dos modelos em tabelas já existentes."""
+    adicionadas = []
+    with engine.begin() as conn:
+        for tabela in Base.metadata.sorted_tables:
+            if not inspect(conn).has_table(tabela.name):
+                continue
+            existentes = {col["name"] for col in inspect(conn).get_columns(tabela.name)}
+            for coluna in tabela.columns:
+                if coluna.name not in existentes:
+                    tipo = coluna.type.compile(dialect=engine.dialect)
+                    conn.exec_driver_sql(f'ALTER TABLE "{tabela.name}" ADD COLUMN "{coluna.name}" {tipo}')
+                    adicionadas.append(f"{tabela.name}.{coluna.name}")
+    return adicionadas
+
+
+def criar_indices_faltantes(engine):
+    """Cria os índices declarados nos modelos que ainda não existem no banco (create_all não cria em tabelas existentes)."""
+    criados = []
+    with engine.begin() as conn:
+        for tabela in Base.metadata.sorted_tables:
+            for indice in tabela.indexes:
+                existentes = {idx["name"] for idx in inspect(conn).get_indexes(tabela.name)}
+                if indice.name not in existentes:
+                    indice.create(conn)
+                    criados.append(indice.name)
+    return criados
+
+
+def popular_resumo_mensal(engine):
+    """Preenche o resumo mensal recém-criado a partir das notas já existentes."""
+    from sqlalchemy.orm import Session
+    from services.resumo_fiscal import reconstruir_resumo
+
+    with Session(engine) as session:
+        # Resumo recém-criado: nada dele está em cache, e o engine pode não ser o banco padrão
+        return reconstruir_resumo(session, invalidar_cache=False)
+
+
+def executar_migracoes(engine):
+    """
+    Aplica todas as migrações pendentes e cria tabelas/índices novos.
+
+    Returns:
+        list: Descrição dos passos aplicados (vazia se o banco já estava atualizado)
+    """
+    aplicadas = []
+    if migrar_colunas_numericas(engine):
+        aplicadas.append("notas_fiscais/itens_nota: colunas numéricas e data_emissao como Date")
+    tinha_resumo = inspect(engine).has_table("resumo_mensal")
+    Base.metadata.create_all(bind=engine)
+    colunas = adicionar_colunas_faltantes(engine)
+    aplicadas.extend(f"coluna {nome}" for nome in colunas)
+    if "usuarios.rbt12_manual" in colunas:
+        # Até aqui o RBT12 só era informado à mão: preserva os valores existentes
+        with engine.begin() as conn:
+            conn.exec_driver_sql("UPDATE usuarios SET rbt12_manual = 1 WHERE rbt12 > 0")
+    aplicadas.extend(f"índice {nome}" for nome in criar_indices_faltantes(engine))
+    if not tinha_resumo and "resumo_mensal" in Base.metadata.tables:
+        notas = popular_resumo_mensal(engine)
+        if notas:
+            aplicadas.append(f"resumo_mensal: backfill de {notas} nota(s)")
+    if engine.dialect.name == "sqlite":
+        from services.indice_busca import criar_indice_busca
+        with engine.begin() as conn:
+            indexadas = criar_indice_busca(conn)
+        if indexadas:
+            aplicadas.append(f"busca_fts: backfill de {indexadas} linha(s)")
+    return aplicadas
@@ -13,7 +13,9 @@ from routes.auth import auth_bp
 from routes.documents import document_bp
 from routes.chat import chat_bp
 from routes.dashboard import dashboard_bp
+from routes.search import search_bp
 from database.connection import engine, Base
+from database.migrations import executar_migracoes
 
 TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
 STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
@@ -41,6 +43,7 @@ app.register_blueprint(auth_bp)
 app.register_blueprint(document_bp, url_prefix="/api")
 app.register_blueprint(chat_bp, url_prefix="/api")
 app.register_blueprint(dashboard_bp, url_prefix="/api")
+app.register_blueprint(search_bp, url_prefix="/api")
 
 def verificar_sessao():
     return "cnpj" in session
@@ -78,8 +81,8 @@ if __name__ == "__main__":
     os.makedirs("src/temp", exist_ok=True)
     os.makedirs("src/database", exist_ok=True)
     
-    # Inicializa o banco de dados
-    Base.metadata.create_all(bind=engine)
+    # Inicializa o banco de dados (cria tabelas e migra bancos antigos)
+    executar_migracoes(engine)
     print("Banco de dados inicializado!")
     
     # Configuração para desenvolvimento vs produção
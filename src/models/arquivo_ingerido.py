@@ -0,0 +1,15 @@
+from datetime import datetime
+from sqlalchemy import Column, String, DateTime
+from database.connection import Base
+
+
+class ArquivoIngerido(Base):
+    __tablename__ = "arquivos_ingeridos"
+
+    sha256 = Column(String(64), primary_key=True)  # Hash do conteúdo do arquivo enviado
+    chave_nfe = Column(String(44), primary_key=True, default="")  # Nota gerada ("" sem chave); CSV gera várias linhas
+    nome_arquivo = Column(String)  # Nome no primeiro upload (só pra inspeção)
+    ingerido_em = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f"<ArquivoIngerido(sha256='{self.sha256[:12]}', chave_nfe='{self.chave_nfe}')>"
@@ -0,0 +1,16 @@
+from datetime import datetime
+from sqlalchemy import Column, String, Text, DateTime
+from database.connection import Base
+
+
+class BuscaWebCache(Base):
+    __tablename__ = "busca_web_cache"
+
+    chave = Column(String, primary_key=True)  # sha256 da consulta normalizada
+    consulta = Column(String, nullable=False)  # Consulta normalizada (pra inspeção)
+    resultados = Column(Text, nullable=False)  # JSON com a lista de resultados do provedor
+    buscado_em = Column(DateTime, default=datetime.utcnow, nullable=False)  # Base do TTL
+    acessado_em = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)  # Base do LRU
+
+    def __repr__(self):
+        return f"<BuscaWebCache(consulta='{self.consulta}', buscado_em='{self.buscado_em}')>"
@@ -0,0 +1,33 @@
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Index
+from database.connection import Base
+
+
+class Conversa(Base):
+    __tablename__ = "conversas"
+
+    id = Column(String, primary_key=True)  # uuid4 hex, devolvido ao front como conversaId
+    cnpj = Column(String, nullable=False, index=True)  # Dono da conversa
+    titulo = Column(String)  # Começo da primeira pergunta
+    criado_em = Column(DateTime, default=datetime.utcnow)
+    atualizado_em = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<Conversa(id='{self.id}', cnpj='{self.cnpj}', titulo='{self.titulo}')>"
+
+
+class MensagemChat(Base):
+    __tablename__ = "mensagens_chat"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    conversa_id = Column(String, ForeignKey("conversas.id", ondelete="CASCADE"), nullable=False)
+    role = Column(String, nullable=False)  # 'user' ou 'model' (mesmos papéis do Gemini)
+    conteudo = Column(Text, nullable=False)
+    criado_em = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_mensagens_chat_conversa", "conversa_id", "id"),
+    )
+
+    def __repr__(self):
+        return f"<MensagemChat(conversa='{self.conversa_id}', role='{self.role}')>"
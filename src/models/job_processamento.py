@@ -0,0 +1,20 @@
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, Text, DateTime
+from database.connection import Base
+
+
+class JobProcessamento(Base):
+    __tablename__ = "jobs_processamento"
+
+    id = Column(String, primary_key=True)  # uuid4 hex, devolvido ao front pra polling
+    cnpj = Column(String, index=True)  # Dono do job (sessão no momento do upload)
+    status = Column(String, default="pendente")  # pendente / processando / concluido / erro
+    total_arquivos = Column(Integer, default=0)
+    processados = Column(Integer, default=0)
+    resultados = Column(Text, default="[]")  # JSON: status por arquivo (mesmo formato do upload síncrono)
+    erro = Column(String)
+    criado_em = Column(DateTime, default=datetime.utcnow)
+    atualizado_em = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<JobProcessamento(id='{self.id}', status='{self.status}', {self.processados}/{self.total_arquivos})>"
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, Numeric, Date, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from database.connection import Base
 
@@ -8,7 +8,7 @@ class NotaFiscal(Base):
 
     id = Column(Integer, primary_key=True)
     numero = Column(String)
-    data_emissao = Column(String)
+    data_emissao = Column(Date)
     cnpj_emitente = Column(String)
     nome_emitente = Column(String)
     ie_emitente = Column(String)
@@ -19,27 +19,33 @@ class NotaFiscal(Base):
     endereco_destinatario = Column(String)
     chave_nfe = Column(String, unique=True)
     natureza_operacao = Column(String)
-    valor_total_nota = Column(String)
+    valor_total_nota = Column(Numeric(15, 2))
     tipo_operacao = Column(String)
     versao = Column(String)
 
     itens = relationship("ItemNota", back_populates="nota", cascade="all, delete-orphan")
 
+    # Índices das consultas do dashboard/chat (vendas por emitente, compras por destinatário)
+    __table_args__ = (
+        Index("ix_notas_emitente_tipo_data", "cnpj_emitente", "tipo_operacao", "data_emissao"),
+        Index("ix_notas_destinatario_data", "cnpj_destinatario", "data_emissao"),
+    )
+
 
 class ItemNota(Base):
     __tablename__ = "itens_nota"
 
     id = Column(Integer, primary_key=True)
-    nota_id = Column(Integer, ForeignKey("notas_fiscais.id"))
+    nota_id = Column(Integer, ForeignKey("notas_fiscais.id"), index=True)
     codigo_produto = Column(String)
     descricao_produto = Column(String)
     ncm = Column(String)
     cst_ipi = Column(String)
     cfop = Column(String)
     unidade = Column(String)
-    quantidade = Column(String)
-    valor_unitario = Column(String)
-    valor_total = Column(String)
+    quantidade = Column(Numeric(15, 4))
+    valor_unitario = Column(Numeric(21, 10))  # vUnCom da NF-e aceita até 10 casas
+    valor_total = Column(Numeric(15, 2))
     cst_icms = Column(String)
     cst_pis = Column(String)
     cst_cofins = Column(String)
@@ -51,4 +57,10 @@ class ItemNota(Base):
     pis_valor = Column(Float, default=0.0)
     cofins_valor = Column(Float, default=0.0)
 
-    nota = relationship("NotaFiscal", back_populates="itens")
\ No newline at end of file
+    nota = relationship("NotaFiscal", back_populates="itens")
+
+    # Filtros estruturados da recuperação do chat (perguntas por NCM/CFOP)
+    __table_args__ = (
+        Index("ix_itens_ncm", "ncm"),
+        Index("ix_itens_cfop", "cfop"),
+    )
\ No newline at end of file
@@ -0,0 +1,44 @@
+from sqlalchemy import Column, Integer, String, Float, Numeric, UniqueConstraint
+from database.connection import Base
+
+
+class ResumoMensal(Base):
+    """
+    Totais mensais pré-agregados por CNPJ, mantidos na mesma transação que grava as notas
+    (services/resumo_fiscal.py). Cada nota entra uma vez para o emitente e, se for outro
+    CNPJ, uma vez para o destinatário; 'papel' diz de qual lado o CNPJ está na nota.
+    """
+    __tablename__ = "resumo_mensal"
+
+    id = Column(Integer, primary_key=True)
+    cnpj = Column(String, nullable=False)
+    ano_mes = Column(String, nullable=False)  # YYYY-MM ('' para notas sem data)
+    tipo_operacao = Column(String, nullable=False)
+    papel = Column(String, nullable=False)  # 'emitente' ou 'destinatario'
+    faturamento = Column(Numeric(15, 2), default=0)  # Soma de valor_total_nota
+    num_notas = Column(Integer, default=0)
+    num_clientes = Column(Integer, default=0)  # Contrapartes distintas no mês (clientes nas vendas)
+    icms = Column(Float, default=0.0)
+    ipi = Column(Float, default=0.0)
+    pis = Column(Float, default=0.0)
+    cofins = Column(Float, default=0.0)
+
+    __table_args__ = (
+        UniqueConstraint("cnpj", "ano_mes", "tipo_operacao", "papel", name="uq_resumo_mensal_chave"),
+    )
+
+
+class ResumoCliente(Base):
+    """Contrapartes distintas por mês: base do num_clientes mensal e da contagem do período inteiro."""
+    __tablename__ = "resumo_clientes"
+
+    id = Column(Integer, primary_key=True)
+    cnpj = Column(String, nullable=False)
+    ano_mes = Column(String, nullable=False)
+    tipo_operacao = Column(String, nullable=False)
+    papel = Column(String, nullable=False)
+    cnpj_cliente = Column(String, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("cnpj", "ano_mes", "tipo_operacao", "papel", "cnpj_cliente", name="uq_resumo_clientes_chave"),
+    )
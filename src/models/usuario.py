@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float  # ADICIONADO: Float pra rbt12
+from sqlalchemy import Column, Integer, String, Float, Boolean  # ADICIONADO: Float pra rbt12
 from database.connection import Base
 
 
@@ -14,6 +14,8 @@ class Usuario(Base):
     senha = Column(String, nullable=False)  # 🔒 senha com hash bcrypt
     # NOVO: RBT12 pra cálculo Simples
     rbt12 = Column(Float, default=0.0, comment="Receita Bruta últimos 12 meses (R$)")
+    # True quando o RBT12 foi informado à mão; senão é recalculado das notas de saída
+    rbt12_manual = Column(Boolean, default=False, comment="RBT12 informado manualmente")
 
     def __repr__(self):
         return f"<Usuario(nome='{self.nome}', cnpj='{self.cnpj}', regime='{self.regime_tributario}')>"
\ No newline at end of file
@@ -0,0 +1,12 @@
+from sqlalchemy import Column, String, Integer
+from database.connection import Base
+
+
+class VersaoCache(Base):
+    __tablename__ = "versoes_cache"
+
+    cnpj = Column(String(14), primary_key=True)
+    versao = Column(Integer, nullable=False, default=0)  # Incrementada a cada invalidação do cache de respostas
+
+    def __repr__(self):
+        return f"<VersaoCache(cnpj='{self.cnpj}', versao={self.versao})>"
@@ -0,0 +1,118 @@
+"""
+Conteúdo dos uploads sem passar pelo disco no caso comum.
+
+Um arquivo recebido vira uma "fonte": bytes (até UPLOAD_SPOOL_MB, em memória) ou o
+caminho de um arquivo temporário de nome único (acima disso). As duas formas
+atravessam o pool de processos do parsing (ver parse_pool.py); os processadores
+também aceitam um arquivo binário já aberto quando rodam no próprio processo.
+"""
+import io
+import os
+import hashlib
+import tempfile
+
+UPLOAD_MEMORIA_MAX = int(os.environ.get("UPLOAD_SPOOL_MB", "8")) * 1024 * 1024
+TEMP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "temp")
+BLOCO = 1024 * 1024
+
+
+def receber_upload(stream, nome="", limite=UPLOAD_MEMORIA_MAX):
+    """
+    Lê o stream do upload em blocos, calculando o SHA-256 na mesma passada.
+
+    Returns:
+        (fonte, sha): fonte são os bytes do arquivo ou, se passar de `limite`, o
+        caminho do temporário em TEMP_DIR (quem chama apaga com descartar)
+    """
+    sha = hashlib.sha256()
+    memoria = io.BytesIO()
+    destino = caminho = None
+    try:
+        for bloco in iter(lambda: stream.read(BLOCO), b""):
+            sha.update(bloco)
+            if destino is None and memoria.tell() + len(bloco) > limite:
+                os.makedirs(TEMP_DIR, exist_ok=True)
+                descritor, caminho = tempfile.mkstemp(dir=TEMP_DIR, suffix=f"_{nome}")
+                destino = os.fdopen(descritor, "wb")
+                destino.write(memoria.getvalue())
+                memoria = None
+            (destino or memoria).write(bloco)
+    except Exception:
+        if destino is not None:
+            destino.close()
+            os.remove(caminho)
+        raise
+    if destino is None:
+        return memoria.getvalue(), sha.hexdigest()
+    destino.close()
+    return caminho, sha.hexdigest()
+
+
+def como_arquivo(fonte):
+    """Fonte pronta para pdfplumber/iterparse: bytes viram BytesIO; caminho e arquivo aberto passam direto."""
+    if isinstance(fonte, (bytes, bytearray, memoryview)):
+        return io.BytesIO(fonte)
+    if hasattr(fonte, "seek"):
+        fonte.seek(0)
+    return fonte
+
+
+def abrir_texto(fonte, encoding="utf-8"):
+    """Fonte como arquivo de texto (leitura do CSV), sem copiar os bytes."""
+    if isinstance(fonte, str):
+        return open(fonte, "r", encoding=encoding, newline="")
+    return io.TextIOWrapper(como_arquivo(fonte), encoding=encoding, newline="")
+
+
+def tamanho(fonte):
+    """Tamanho da fonte em bytes."""
+    if isinstance(fonte, (bytes, bytearray, memoryview)):
+        return len(fonte)
+    if isinstance(fonte, str):
+        return os.path.getsize(fonte)
+    posicao = fonte.tell()
+    fim = fonte.seek(0, io.SEEK_END)
+    fonte.seek(posicao)
+    return fim
+
+
+def hash_fonte(fonte):
+    """SHA-256 do conteúdo da fonte (lida em blocos quando é arquivo)."""
+    if isinstance(fonte, (bytes, bytearray, memoryview)):
+        return hashlib.sha256(fonte).hexdigest()
+    sha = hashlib.sha256()
+    arquivo = open(fonte, "rb") if isinstance(fonte, str) else como_arquivo(fonte)
+    try:
+        for bloco in iter(lambda: arquivo.read(BLOCO), b""):
+            sha.update(bloco)
+    finally:
+        if isinstance(fonte, str):
+            arquivo.close()
+        else:
+            arquivo.seek(0)
+    return sha.hexdigest()
+
+
+def descartar(fonte):
+    """Apaga o temporário de uma fonte em disco (bytes não deixam nada pra trás)."""
+    if isinstance(fonte, str) and os.path.exists(fonte):
+        os.remove(fonte)
+
+
+def limpar_temporarios():
+    """
+    Apaga o que sobrou em TEMP_DIR (uploads grandes de jobs interrompidos).
+    Só pode rodar com nenhum upload em andamento, ou seja, na inicialização.
+
+    Returns:
+        int: Quantidade de arquivos apagados
+    """
+    if not os.path.isdir(TEMP_DIR):
+        return 0
+    apagados = 0
+    for nome in os.listdir(TEMP_DIR):
+        caminho = os.path.join(TEMP_DIR, nome)
+        if os.path.isfile(caminho):
+            os.remove(caminho)
+            apagados += 1
+    return apagados
@@ -0,0 +1,510 @@
+"""
+Parser determinístico de DANFE (PDF da NF-e) a partir das palavras posicionadas do pdfplumber
+
+O DANFE tem layout fixo (Manual do DANFE): cada campo é uma caixa com o rótulo em
+letra miúda em cima e o valor logo abaixo, e os itens ficam numa tabela com cabeçalho
+("CÓDIGO", "DESCRIÇÃO", "NCM/SH", ...). Então não precisa de IA para a maioria dos PDFs:
+- Palavras da mesma altura viram linhas; palavras próximas na linha (e sem fio vertical
+  entre elas) viram segmentos ("NOME / RAZÃO SOCIAL")
+- Valor de um campo = segmento da linha abaixo do rótulo que cai na mesma caixa
+- Seções (emitente, destinatário, cálculo do imposto) delimitadas pelos títulos
+- Tabela de itens: colunas pelo cabeçalho, cada palavra vai pra coluna que mais sobrepõe;
+  linha sem valor total continua a descrição do item anterior
+- Chave de acesso conferida pelo dígito verificador; CNPJ do emitente e número da nota
+  também saem dela
+
+O que não foi achado fica None (e 'itens' vazio): campos_faltantes() diz o que ainda
+precisa ser pedido à IA.
+"""
+import re
+import json
+import logging
+import unicodedata
+import pdfplumber
+from processors.pdf_extractor import (
+    PDF_MAX_BYTES, PDF_MAX_PAGINAS, _RE_CHAVE, _RE_FOLHA, hash_arquivo, ler_cache, gravar_cache
+)
+from processors.arquivo_upload import como_arquivo, tamanho
+
+VERSAO_PARSER = "1"  # Mudou o parser? Incremente para ignorar os resultados em cache
+EXTENSAO_CACHE = f"danfe{VERSAO_PARSER}.json"
+
+# Sem estes campos (ou sem itens) a nota vai para a IA completar
+CAMPOS_OBRIGATORIOS = (
+    "chave_nfe", "numero", "data_emissao", "cnpj_emitente", "nome_emitente",
+    "cnpj_destinatario", "nome_destinatario", "natureza_operacao", "valor_total_nota"
+)
+TOLERANCIA_LINHA = 2.0  # pt: palavras com topo até essa distância estão na mesma linha
+TOLERANCIA_TOTAL = 0.05  # R$: soma dos itens x "VALOR TOTAL DOS PRODUTOS"
+
+
+def _normalizar(texto):
+    """Maiúsculas, sem acento e só letras/dígitos: 'Nome / Razão Social' -> 'NOMERAZAOSOCIAL'."""
+    texto = unicodedata.normalize("NFKD", (texto or "").upper())
+    return re.sub(r"[^A-Z0-9]", "", "".join(c for c in texto if not unicodedata.combining(c)))
+
+
+def _rotulos(*textos):
+    return {_normalizar(texto) for texto in textos}
+
+
+_ROTULO_EMITENTE = _rotulos("IDENTIFICAÇÃO DO EMITENTE", "EMITENTE")
+_ROTULO_CHAVE = _rotulos("CHAVE DE ACESSO", "CHAVE DE ACESSO DA NF-E")
+_ROTULO_NATUREZA = _rotulos("NATUREZA DA OPERAÇÃO", "NATUREZA DE OPERAÇÃO")
+_ROTULO_IE = _rotulos("INSCRIÇÃO ESTADUAL", "INSC. ESTADUAL", "IE")
+_ROTULO_CNPJ = _rotulos("CNPJ", "CNPJ / CPF", "CPF / CNPJ", "CNPJ/CPF")
+_ROTULO_NOME = _rotulos("NOME / RAZÃO SOCIAL", "NOME/RAZÃO SOCIAL", "RAZÃO SOCIAL", "NOME")
+_ROTULO_ENDERECO = _rotulos("ENDEREÇO")
+_ROTULO_BAIRRO = _rotulos("BAIRRO / DISTRITO", "BAIRRO")
+_ROTULO_MUNICIPIO = _rotulos("MUNICÍPIO")
+_ROTULO_UF = _rotulos("UF")
+_ROTULO_EMISSAO = _rotulos("DATA DA EMISSÃO", "DATA DE EMISSÃO", "DATA EMISSÃO")
+_ROTULO_TOTAL_NOTA = _rotulos("VALOR TOTAL DA NOTA", "V. TOTAL DA NOTA", "VALOR TOTAL DA NF")
+_ROTULO_TOTAL_PRODUTOS = _rotulos("VALOR TOTAL DOS PRODUTOS", "V. TOTAL PRODUTOS", "V. TOTAL DOS PRODUTOS")
+
+# Títulos de seção (comparados pelo início do texto normalizado)
+_SECAO_DESTINATARIO = _normalizar("DESTINATÁRIO")
+_SECAO_IMPOSTO = _normalizar("CÁLCULO DO IMPOSTO")
+_SECAO_TRANSPORTE = _normalizar("TRANSPORTADOR")
+_SECAO_PRODUTOS = _normalizar("DADOS DOS PRODUTOS")
+_FIM_PRODUTOS = (_normalizar("CÁLCULO DO ISSQN"), _normalizar("DADOS ADICIONAIS"))
+
+_RE_NUMERO_BR = re.compile(r"^-?\d{1,3}(?:\.?\d{3})*(?:,\d+)?$")
+_RE_DATA = re.compile(r"(\d{2})/(\d{2})/(\d{4})")
+_RE_NUMERO_NOTA = re.compile(r"N[º°o]\.?\s*:?\s*(\d{1,3}(?:\.?\d{3}){0,2})", re.IGNORECASE)
+_RE_CANHOTO = re.compile(r"RECEBEMOS\s+DE\s+(.+?)\s+OS\s+PRODUTOS", re.IGNORECASE)
+
+
+def _numero_br(texto):
+    """'1.234,56' -> 1234.56; None se não for número."""
+    texto = (texto or "").replace("R$", "").replace(" ", "")
+    if not _RE_NUMERO_BR.match(texto):
+        return None
+    return float(texto.replace(".", "").replace(",", ".")) if "," in texto else float(texto.replace(".", ""))
+
+
+def _digitos(texto):
+    return re.sub(r"\D", "", texto or "")
+
+
+def chave_valida(chave):
+    """Confere os 44 dígitos e o dígito verificador (módulo 11, pesos 2..9 da direita)."""
+    if not re.fullmatch(r"\d{44}", chave or ""):
+        return False
+    soma = sum(int(digito) * (2 + indice % 8) for indice, digito in enumerate(reversed(chave[:43])))
+    resto = soma % 11
+    return int(chave[43]) == (0 if resto < 2 else 11 - resto)
+
+
+# ---------------------------------------------------------------- layout da página
+
+def _linhas(palavras):
+    """Agrupa as palavras em linhas (pelo topo), cada linha ordenada da esquerda pra direita."""
+    linhas = []
+    for palavra in sorted(palavras, key=lambda p: (p["top"], p["x0"])):
+        if linhas and palavra["top"] - linhas[-1][0]["top"] <= TOLERANCIA_LINHA:
+            linhas[-1].append(palavra)
+        else:
+            linhas.append([palavra])
+    return [sorted(linha, key=lambda p: p["x0"]) for linha in linhas]
+
+
+def _segmentos(linha, verticais):
+    """
+    Junta palavras vizinhas em segmentos (o texto de um rótulo ou de um valor). Separa
+    quando o espaço é maior que o de uma palavra comum ou quando há um fio vertical
+    (borda de caixa/coluna) entre elas.
+    """
+    topo = min(p["top"] for p in linha)
+    base = max(p["bottom"] for p in linha)
+    fios = [x for x, y0, y1 in verticais if y0 <= base and y1 >= topo]
+
+    segmentos = []
+    for palavra in linha:
+        if segmentos:
+            anterior = segmentos[-1]
+            altura = palavra["bottom"] - palavra["top"]
+            separado = palavra["x0"] - anterior["x1"] > 0.45 * altura or any(
+                anterior["x1"] - 0.5 <= x <= palavra["x0"] + 0.5 for x in fios
+            )
+            if not separado:
+                anterior["texto"] += " " + palavra["text"]
+                anterior["x1"] = palavra["x1"]
+                anterior["bottom"] = max(anterior["bottom"], palavra["bottom"])
+                continue
+        segmentos.append({
+            "texto": palavra["text"], "x0": palavra["x0"], "x1": palavra["x1"],
+            "top": palavra["top"], "bottom": palavra["bottom"]
+        })
+    for segmento in segmentos:
+        segmento["norma"] = _normalizar(segmento["texto"])
+    return segmentos
+
+
+class _Pagina:
+    """Linhas de segmentos de uma página do DANFE, com busca de valor por rótulo."""
+
+    def __init__(self, pagina):
+        palavras = pagina.extract_words(keep_blank_chars=False, use_text_flow=False)
+        self.verticais = [
+            (aresta["x0"], aresta["top"], aresta["bottom"])
+            for aresta in pagina.edges
+            if aresta["orientation"] == "v" and aresta["bottom"] - aresta["top"] > 3
+        ]
+        self.largura = pagina.width
+        self.altura = pagina.height
+        self.linhas_palavras = _linhas(palavras)
+        self.linhas = [_segmentos(linha, self.verticais) for linha in self.linhas_palavras]
+        self.texto = "\n".join(" ".join(p["text"] for p in linha) for linha in self.linhas_palavras)
+
+    def fios(self, topo, base):
+        """Posições x dos fios verticais que atravessam a faixa [topo, base]."""
+        return [x for x, y0, y1 in self.verticais if y0 <= topo and y1 >= base]
+
+    def caixa(self, linha, posicao):
+        """
+        Limites horizontais da caixa do rótulo linha[posicao]: os fios verticais em volta
+        dele ou, sem fios (DANFE sem bordas), o próximo rótulo da mesma linha.
+        """
+        rotulo = linha[posicao]
+        meio = (rotulo["top"] + rotulo["bottom"]) / 2
+        fios = self.fios(meio, meio)
+        esquerda = max([x for x in fios if x <= rotulo["x0"] + 1], default=rotulo["x0"] - 2)
+        direitas = [x for x in fios if x >= rotulo["x1"] - 1]
+        if posicao + 1 < len(linha):
+            direitas.append(linha[posicao + 1]["x0"] - 1)
+        return esquerda, min(direitas, default=self.largura)
+
+    def topo_secao(self, prefixo, depois_de=0.0):
+        """Topo da primeira linha (abaixo de depois_de) que começa com o título da seção."""
+        for linha in self.linhas:
+            if linha[0]["top"] >= depois_de and any(s["norma"].startswith(prefixo) for s in linha):
+                return linha[0]["top"]
+        return None
+
+    def valor(self, rotulos, de=0.0, ate=None):
+        """
+        Valor do primeiro campo com um desses rótulos entre as alturas [de, ate): os
+        segmentos da linha logo abaixo que caem dentro da caixa do rótulo (da borda
+        esquerda do rótulo até o próximo rótulo da mesma linha).
+        """
+        ate = self.altura if ate is None else ate
+        for indice, linha in enumerate(self.linhas):
+            if not de <= linha[0]["top"] < ate:
+                continue
+            for posicao, rotulo in enumerate(linha):
+                if rotulo["norma"] not in rotulos:
+                    continue
+                esquerda, direita = self.caixa(linha, posicao)
+                altura = rotulo["bottom"] - rotulo["top"]
+                for abaixo in self.linhas[indice + 1:indice + 3]:
+                    if abaixo[0]["top"] - rotulo["bottom"] > 4 * altura + 6:
+                        break
+                    partes = [s["texto"] for s in abaixo if s["x1"] > esquerda and s["x0"] < direita]
+                    if partes:
+                        return " ".join(partes).strip()
+        return None
+
+    def linhas_abaixo(self, rotulos, quantidade, de=0.0, ate=None):
+        """
+        Até `quantidade` linhas de texto inteiras dentro da caixa do rótulo (nome + endereço
+        do emitente). O quadro "DANFE" ao lado também limita a caixa quando não há fios.
+        """
+        ate = self.altura if ate is None else ate
+        for indice, linha in enumerate(self.linhas):
+            if not de <= linha[0]["top"] < ate:
+                continue
+            for posicao, rotulo in enumerate(linha):
+                if rotulo["norma"] not in rotulos:
+                    continue
+                esquerda, direita = self.caixa(linha, posicao)
+                direita = min([direita] + [
+                    s["x0"] - 1 for outra in self.linhas[indice:indice + 4] for s in outra
+                    if s["norma"] == "DANFE" and s["x0"] > rotulo["x1"]
+                ])
+                textos = []
+                for abaixo in self.linhas[indice + 1:]:
+                    if len(textos) >= quantidade or abaixo[0]["top"] >= ate:
+                        break
+                    partes = [s for s in abaixo if s["x0"] >= esquerda - 1 and s["x1"] <= direita + 1]
+                    if any(s["norma"] in _TODOS_ROTULOS for s in partes):
+                        break  # Chegou na próxima caixa
+                    if partes:
+                        textos.append(" ".join(s["texto"] for s in partes))
+                return textos
+        return []
+
+
+_TODOS_ROTULOS = set().union(
+    _ROTULO_CHAVE, _ROTULO_NATUREZA, _ROTULO_IE, _ROTULO_CNPJ, _ROTULO_NOME, _ROTULO_ENDERECO,
+    _ROTULO_BAIRRO, _ROTULO_MUNICIPIO, _ROTULO_UF, _ROTULO_EMISSAO
+)
+
+
+# ---------------------------------------------------------------- tabela de itens
+
+def _campo_coluna(norma):
+    """Campo do item para o texto (normalizado) do cabeçalho de uma coluna, ou None."""
+    if norma.startswith("ALIQ") or norma.startswith("BC") or norma.startswith("BASE"):
+        return None
+    if norma.startswith("COD"):
+        return "codigo_produto"
+    if norma.startswith("DESCR"):
+        return "descricao_produto"
+    if norma.startswith("NCM"):
+        return "ncm"
+    if "CST" in norma or "CSOSN" in norma:
+        return "cst_icms"
+    if norma.startswith("CFOP"):
+        return "cfop"
+    if norma.startswith("QU") or norma == "QTD":
+        return "quantidade"
+    if "UNIT" in norma:
+        return "valor_unitario"
+    if norma.startswith("UN"):
+        return "unidade"
+    if "ICMS" in norma:
+        return "icms_valor"
+    if "IPI" in norma:
+        return "ipi_valor"
+    if "TOTAL" in norma or norma in ("VALOR", "VLR", "VPROD"):
+        return "valor_total"
+    return None
+
+
+def _colunas(linhas_cabecalho, fios):
+    """
+    Colunas da tabela pelo cabeçalho, que pode ocupar mais de uma linha ("VALOR" em
+    cima de "UNIT"): segmentos que se sobrepõem na horizontal são a mesma coluna.
+    Retorna [(campo, esquerda, direita)]: limites nos fios verticais do cabeçalho ou,
+    sem fios, cada coluna vai até o início do próximo título (números alinhados à
+    direita terminam antes dele).
+    """
+    colunas = []
+    for linha in linhas_cabecalho:
+        for segmento in linha:
+            for coluna in colunas:
+                if segmento["x0"] < coluna["x1"] and segmento["x1"] > coluna["x0"]:
+                    coluna["texto"] += " " + segmento["texto"]
+                    coluna["x0"] = min(coluna["x0"], segmento["x0"])
+                    coluna["x1"] = max(coluna["x1"], segmento["x1"])
+                    break
+            else:
+                colunas.append(dict(segmento))
+    colunas.sort(key=lambda c: c["x0"])
+
+    limites = []
+    for posicao, coluna in enumerate(colunas):
+        esquerda = coluna["x0"] - 1 if posicao else float("-inf")
+        direita = colunas[posicao + 1]["x0"] - 1 if posicao + 1 < len(colunas) else float("inf")
+        esquerda = max([x for x in fios if x <= coluna["x0"] + 1], default=esquerda)
+        direita = min([x for x in fios if x >= coluna["x1"] - 1], default=direita)
+        limites.append((_campo_coluna(_normalizar(coluna["texto"])), esquerda, direita))
+    return limites
+
+
+def _linha_da_tabela(palavras, colunas):
+    """Texto de cada coluna numa linha: cada palavra vai para a coluna com maior sobreposição."""
+    valores = {}
+    for palavra in palavras:
+        melhor, sobreposicao = None, -1.0
+        for campo, esquerda, direita in colunas:
+            medida = min(palavra["x1"], direita) - max(palavra["x0"], esquerda)
+            if medida > sobreposicao:
+                melhor, sobreposicao = campo, medida
+        if melhor:
+            valores[melhor] = (valores[melhor] + " " + palavra["text"]) if melhor in valores else palavra["text"]
+    return valores
+
+
+def _novo_item(valores):
+    cst = _digitos(valores.get("cst_icms"))
+    cst = cst[-3:] if len(cst) == 4 else cst[-2:] if len(cst) == 3 else cst  # "0/00"/"000": origem + CST
+    return {
+        "codigo_produto": valores.get("codigo_produto", ""),
+        "descricao_produto": valores.get("descricao_produto", ""),
+        "ncm": _digitos(valores.get("ncm")),
+        "cst_ipi": cst,  # DANFE não traz CST do IPI: mesmo fallback do processar_xml
+        "cfop": _digitos(valores.get("cfop")),
+        "unidade": valores.get("unidade", ""),
+        "quantidade": _numero_br(valores.get("quantidade")),
+        "valor_unitario": _numero_br(valores.get("valor_unitario")),
+        "valor_total": _numero_br(valores.get("valor_total")),
+        "cst_icms": cst,
+        "cst_pis": "",
+        "cst_cofins": "",
+        "cest": "",
+        "icms_valor": _numero_br(valores.get("icms_valor")) or 0.0,
+        "ipi_valor": _numero_br(valores.get("ipi_valor")) or 0.0,
+        "pis_valor": 0.0,  # PIS/COFINS por item não aparecem no DANFE
+        "cofins_valor": 0.0
+    }
+
+
+def _itens_pagina(pagina, itens):
+    """Lê a tabela de itens de uma página (a 1ª e as folhas de continuação repetem o cabeçalho)."""
+    inicio = pagina.topo_secao(_SECAO_PRODUTOS)
+    if inicio is None:
+        return
+    fim = min(
+        [topo for topo in (pagina.topo_secao(prefixo, inicio + 1) for prefixo in _FIM_PRODUTOS) if topo is not None],
+        default=pagina.altura
+    )
+    indices = [i for i, linha in enumerate(pagina.linhas) if inicio < linha[0]["top"] < fim]
+
+    # Cabeçalho: linhas sem dígito logo após o título da seção
+    cabecalho = []
+    while indices and not any(ch.isdigit() for s in pagina.linhas[indices[0]] for ch in s["texto"]):
+        cabecalho.append(pagina.linhas[indices.pop(0)])
+    fios = pagina.fios(cabecalho[0][0]["top"], cabecalho[-1][0]["bottom"]) if cabecalho else []
+    colunas = _colunas(cabecalho, fios)
+    if not any(campo == "valor_total" for campo, _, _ in colunas):
+        return
+
+    for indice in indices:
+        valores = _linha_da_tabela(pagina.linhas_palavras[indice], colunas)
+        if _numero_br(valores.get("valor_total")) is not None and (
+            valores.get("codigo_produto") or valores.get("quantidade")
+        ):
+            itens.append(_novo_item(valores))
+        elif itens and set(valores) <= {"descricao_produto", "codigo_produto"} and valores.get("descricao_produto"):
+            itens[-1]["descricao_produto"] += " " + valores["descricao_produto"]  # Descrição em mais de uma linha
+
+
+# ---------------------------------------------------------------- nota
+
+def _data_iso(texto):
+    achado = _RE_DATA.search(texto or "")
+    return f"{achado.group(3)}-{achado.group(2)}-{achado.group(1)}" if achado else None
+
+
+def _endereco(*partes, uf=None):
+    endereco = ", ".join(parte for parte in partes if parte)
+    return f"{endereco} - {uf}" if endereco and uf else endereco or None
+
+
+def parsear_paginas(paginas):
+    """
+    Campos da NF-e a partir das páginas do DANFE (objetos do pdfplumber). Mesmo formato
+    do JSON pedido à IA; o que não foi achado fica None.
+    """
+    pagina = _Pagina(paginas[0])
+    texto = pagina.texto
+    y_dest = pagina.topo_secao(_SECAO_DESTINATARIO) or pagina.altura
+    y_imposto = pagina.topo_secao(_SECAO_IMPOSTO, y_dest) or pagina.altura
+    y_fim_imposto = min(
+        [topo for topo in (pagina.topo_secao(_SECAO_TRANSPORTE, y_imposto),
+                           pagina.topo_secao(_SECAO_PRODUTOS, y_imposto)) if topo is not None],
+        default=pagina.altura
+    )
+
+    # Chave: do campo ou, se o rótulo não casou, do texto todo; só vale com DV correto
+    candidatos = [_digitos(pagina.valor(_ROTULO_CHAVE))] + [_digitos(c) for c in _RE_CHAVE.findall(texto)]
+    chave = next((c for c in candidatos if chave_valida(c)), None)
+
+    numero = str(int(chave[25:34])) if chave else None
+    if not numero:
+        achado = _RE_NUMERO_NOTA.search(texto)
+        numero = str(int(_digitos(achado.group(1)))) if achado else None
+
+    nome_emitente = None
+    endereco_emitente = None
+    bloco = pagina.linhas_abaixo(_ROTULO_EMITENTE, 3, ate=y_dest)
+    if bloco:
+        nome_emitente, endereco_emitente = bloco[0], ", ".join(bloco[1:]) or None
+    else:
+        achado = _RE_CANHOTO.search(texto.replace("\n", " "))
+        nome_emitente = achado.group(1).strip() if achado else None
+
+    cnpj_emitente = _digitos(pagina.valor(_ROTULO_CNPJ, ate=y_dest)) or (chave[6:20] if chave else None)
+    cnpj_destinatario = _digitos(pagina.valor(_ROTULO_CNPJ, y_dest, y_imposto))
+
+    dados = {
+        "numero": numero,
+        "data_emissao": _data_iso(pagina.valor(_ROTULO_EMISSAO, y_dest, y_imposto)),
+        "cnpj_emitente": cnpj_emitente if cnpj_emitente and len(cnpj_emitente) == 14 else None,
+        "nome_emitente": nome_emitente,
+        "ie_emitente": _digitos(pagina.valor(_ROTULO_IE, ate=y_dest)) or None,
+        "endereco_emitente": endereco_emitente,
+        "cnpj_destinatario": cnpj_destinatario if len(cnpj_destinatario) in (11, 14) else None,
+        "nome_destinatario": pagina.valor(_ROTULO_NOME, y_dest, y_imposto),
+        "ie_destinatario": _digitos(pagina.valor(_ROTULO_IE, y_dest, y_imposto)) or None,
+        "endereco_destinatario": _endereco(
+            pagina.valor(_ROTULO_ENDERECO, y_dest, y_imposto),
+            pagina.valor(_ROTULO_BAIRRO, y_dest, y_imposto),
+            pagina.valor(_ROTULO_MUNICIPIO, y_dest, y_imposto),
+            uf=pagina.valor(_ROTULO_UF, y_dest, y_imposto)
+        ),
+        "chave_nfe": chave,
+        "natureza_operacao": pagina.valor(_ROTULO_NATUREZA, ate=y_dest),
+        "valor_total_nota": _numero_br(pagina.valor(_ROTULO_TOTAL_NOTA, y_imposto, y_fim_imposto)),
+        "tipo_operacao": None,  # Calculado pelo CNPJ logado em quem chama
+        "versao": "",  # Não aparece no DANFE
+        "itens": []
+    }
+
+    # Itens: 1ª página + folhas de continuação ("FOLHA 1/N")
+    folha = _RE_FOLHA.search(texto)
+    folhas = min(int(folha.group(2)) if folha else 1, len(paginas), PDF_MAX_PAGINAS)
+    itens = []
+    _itens_pagina(pagina, itens)
+    for indice in range(1, folhas):
+        _itens_pagina(_Pagina(paginas[indice]), itens)
+
+    # Conferência: tabela lida torta (colunas trocadas, linha perdida) não passa na soma
+    total_produtos = _numero_br(pagina.valor(_ROTULO_TOTAL_PRODUTOS, y_imposto, y_fim_imposto))
+    completos = itens and all(item["descricao_produto"] and item["valor_total"] is not None for item in itens)
+    soma = round(sum(item["valor_total"] or 0 for item in itens), 2)
+    if completos and (total_produtos is None or abs(soma - total_produtos) <= TOLERANCIA_TOTAL):
+        dados["itens"] = itens
+    elif itens:
+        logging.debug(f"DANFE: {len(itens)} itens descartados (soma {soma} x total dos produtos {total_produtos})")
+    return dados
+
+
+def campos_faltantes(dados):
+    """Campos obrigatórios que o parser não preencheu ('itens' se a tabela não foi lida)."""
+    if not dados:
+        return list(CAMPOS_OBRIGATORIOS) + ["itens"]
+    faltando = [campo for campo in CAMPOS_OBRIGATORIOS if dados.get(campo) in (None, "")]
+    if not dados.get("itens"):
+        faltando.append("itens")
+    return faltando
+
+
+def mesclar_campos(dados_parser, dados_ia):
+    """Resposta da IA (só com o que faltava) completada pelos campos que o parser já achou."""
+    dados = dict(dados_ia or {})
+    for campo, valor in (dados_parser or {}).items():
+        if valor not in (None, "", []):
+            dados[campo] = valor
+    return dados
+
+
+def extrair_danfe(fonte_pdf):
+    """
+    Campos da NF-e de um DANFE em PDF (caminho, bytes ou arquivo binário aberto),
+    sem IA. Resultado em cache pelo SHA-256 do arquivo, junto do texto extraído
+    (ver pdf_extractor).
+
+    Returns:
+        dict no formato do JSON de extração (faltantes como None), ou None se o PDF
+        não pôde ser lido (sem texto, protegido, grande demais)
+    """
+    try:
+        if tamanho(fonte_pdf) > PDF_MAX_BYTES:
+            return None
+        sha = hash_arquivo(fonte_pdf)
+        em_cache = ler_cache(sha, EXTENSAO_CACHE)
+        if em_cache is not None:
+            return json.loads(em_cache)
+
+        with pdfplumber.open(como_arquivo(fonte_pdf)) as pdf:
+            if not pdf.pages:
+                return None
+            dados = parsear_paginas(pdf.pages)
+        gravar_cache(sha, json.dumps(dados, ensure_ascii=False), EXTENSAO_CACHE)
+        return dados
+    except Exception as e:
+        logging.warning(f"DANFE: parser determinístico falhou: {e}")
+        return None
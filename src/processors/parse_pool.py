@@ -0,0 +1,146 @@
+"""
+Estágio de parsing paralelo dos uploads.
+processar_xml, extrair_danfe e extrair_texto_pdf são CPU-bound, então rodam num ProcessPoolExecutor
+compartilhado; quem chama continua sendo o único escritor no banco e recebe os
+resultados na ordem do upload.
+"""
+import os
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Importadores opcionais (mesmo padrão de routes/documents.py)
+try:
+    from processors.xml_processor import processar_xml
+except Exception:
+    processar_xml = None
+
+try:
+    from processors.pdf_extractor import extrair_texto_pdf
+except Exception:
+    extrair_texto_pdf = None
+
+try:
+    from processors.danfe_parser import extrair_danfe, campos_faltantes
+except Exception:
+    extrair_danfe = None
+
+# Processos de parsing (1 desativa o pool e parseia no próprio processo)
+PARSE_WORKERS = int(os.environ.get("PARSE_WORKERS", os.cpu_count() or 1))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class ErroParsing(Exception):
+    """Falha no parse de um arquivo: vira o status só desse arquivo, o resto do upload segue."""
+
+
+def parsear_documento(fonte, tipo, user_cnpj="", obter_executor=None):
+    """
+    Parse de um arquivo do upload. Roda dentro dos processos do pool.
+
+    Args:
+        fonte: Bytes do arquivo ou caminho do temporário (ver arquivo_upload.py)
+        tipo: 'xml' ou 'pdf' (outros tipos retornam None e ficam com quem chama)
+        user_cnpj: CNPJ logado, repassado ao processar_xml
+        obter_executor: Só fora do pool: permite ao extrator de PDF espalhar as
+            páginas de um PDF longo pelos processos (ver pdf_extractor)
+
+    Returns:
+        dict da nota (XML), {"danfe": campos lidos do DANFE, "texto": texto extraído}
+        (PDF) ou None. O texto só serve pro prompt da IA, então fica vazio quando o
+        parser do DANFE já preencheu tudo
+    """
+    if tipo == "xml" and processar_xml:
+        return processar_xml(fonte, user_cnpj=user_cnpj)
+    if tipo == "pdf" and extrair_texto_pdf:
+        danfe = extrair_danfe(fonte) if extrair_danfe else None
+        if danfe and not campos_faltantes(danfe):
+            return {"danfe": danfe, "texto": ""}
+        return {"danfe": danfe, "texto": extrair_texto_pdf(fonte, obter_executor=obter_executor)}
+    return None
+
+
+def _parsear_isolado(tarefa, obter_executor=None):
+    try:
+        return parsear_documento(*tarefa, obter_executor=obter_executor)
+    except Exception as e:
+        logging.error(f"ERRO PARSING ({tarefa[1]}): {type(e).__name__}: {e}")
+        return ErroParsing(f"{type(e).__name__}: {e}")
+
+
+def _parsear_lote(tarefas):
+    """Roda num processo do pool: um lote de tarefas, cada uma com a sua falha isolada."""
+    return [_parsear_isolado(tarefa) for tarefa in tarefas]
+
+
+def _obter_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: seguro com as threads dos jobs de upload e igual no Windows (run.bat)
+            _pool = ProcessPoolExecutor(
+                max_workers=PARSE_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+
+def _descartar_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def parsear_em_paralelo(tarefas):
+    """
+    Parseia vários arquivos no pool de processos.
+
+    Args:
+        tarefas: Lista de (fonte, tipo, user_cnpj), como em parsear_documento
+
+    Yields:
+        Resultado de parsear_documento de cada tarefa, na mesma ordem da lista, ou
+        ErroParsing quando o parse daquele arquivo falhou. Os resultados saem conforme
+        ficam prontos, então quem chama já pode gravar o primeiro arquivo enquanto
+        os demais ainda são parseados.
+    """
+    paralelizaveis = sum(1 for _, tipo, _ in tarefas if tipo in ("xml", "pdf"))
+    if PARSE_WORKERS <= 1 or paralelizaveis < 2:
+        # Um arquivo só: o paralelismo possível é entre as páginas de um PDF longo
+        obter_executor = _obter_pool if PARSE_WORKERS > 1 else None
+        for tarefa in tarefas:
+            yield _parsear_isolado(tarefa, obter_executor)
+        return
+
+    # Lotes por future: reduz o custo de IPC em uploads com milhares de XMLs pequenos
+    tamanho = max(1, len(tarefas) // (PARSE_WORKERS * 4))
+    lotes = [tarefas[inicio:inicio + tamanho] for inicio in range(0, len(tarefas), tamanho)]
+    try:
+        pool = _obter_pool()
+        futuros = [pool.submit(_parsear_lote, lote) for lote in lotes]
+    except (BrokenProcessPool, RuntimeError, OSError) as e:
+        logging.error(f"ERRO POOL DE PARSING: {e} - parseando no próprio processo")
+        _descartar_pool()
+        futuros = [None] * len(lotes)
+
+    for lote, futuro in zip(lotes, futuros):
+        resultados = None
+        if futuro is not None:
+            try:
+                resultados = futuro.result()
+            except BrokenProcessPool as e:
+                logging.error(f"ERRO POOL DE PARSING: {e} - parseando no próprio processo")
+                _descartar_pool()
+            except Exception as e:
+                # Ex.: fonte ou resultado que não atravessa o pickle; só este lote é afetado
+                logging.error(f"ERRO POOL DE PARSING: {type(e).__name__}: {e}")
+                resultados = [ErroParsing(f"{type(e).__name__}: {e}")] * len(lote)
+        if resultados is None:
+            resultados = [_parsear_isolado(tarefa) for tarefa in lote]
+        yield from resultados
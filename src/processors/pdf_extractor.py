@@ -1,26 +1,175 @@
 """
 Extrator de texto de arquivos PDF usando pdfplumber
+
+- Cache em disco pelo SHA-256 do arquivo: reenviar o mesmo DANFE não extrai de novo
+- Para cedo: os dados da NF-e ficam na 1ª página do DANFE (e nas folhas de
+  continuação indicadas em "FOLHA 1/N"); páginas seguintes (boletos, anexos) são puladas
+- Limites de tamanho (PDF_MAX_MB) e de páginas (PDF_MAX_PAGES)
+- PDFs longos: as páginas restantes são extraídas em paralelo no pool de processos
+  recebido (ver processors/parse_pool.py), em faixas de PAGINAS_POR_TAREFA
+- O PDF pode vir como caminho, bytes ou arquivo binário aberto (ver arquivo_upload.py)
 """
+import os
+import re
+import logging
+import tempfile
 import pdfplumber
+from processors.arquivo_upload import como_arquivo, tamanho, hash_fonte
+
+PDF_MAX_BYTES = int(os.environ.get("PDF_MAX_MB", "20")) * 1024 * 1024
+PDF_MAX_PAGINAS = int(os.environ.get("PDF_MAX_PAGES", "50"))
+PAGINAS_POR_TAREFA = 4  # Páginas por tarefa no pool de processos
+MIN_PAGINAS_PARALELO = 8  # Abaixo disso, extrair em sequência sai mais barato que o IPC
+
+CACHE_DIR = os.environ.get(
+    "PDF_TEXT_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cache", "pdf_texto")
+)
+CACHE_MAX_BYTES = int(os.environ.get("PDF_TEXT_CACHE_MAX_MB", "200")) * 1024 * 1024
+VERSAO_CACHE = "1"  # Mudou a extração? Incremente para ignorar os textos antigos
+INTERVALO_PODA = 100  # Gravações entre varreduras de tamanho do cache
+
+_RE_CHAVE = re.compile(r"(?<!\d)(?:\d{4}[ .]?){10}\d{4}(?!\d)")  # 44 dígitos, soltos ou em grupos de 4
+_RE_CNPJ = re.compile(r"\d{2}\.?\d{3}\.?\d{3}/?\d{4}-?\d{2}")
+_RE_TOTAL = re.compile(r"VALOR\s+TOTAL\s+DA\s+(NOTA|NF)|V\.\s*TOTAL\s+DA\s+NOTA", re.IGNORECASE)
+_RE_FOLHA = re.compile(r"FOLHA\s*:?\s*(\d+)\s*/\s*(\d+)", re.IGNORECASE)
+
+_gravacoes = 0
+
+
+def hash_arquivo(fonte):
+    """SHA-256 do conteúdo do PDF (caminho, bytes ou arquivo aberto)."""
+    return hash_fonte(fonte)
+
+
+def _caminho_cache(sha, extensao="txt"):
+    return os.path.join(CACHE_DIR, sha[:2], f"{sha}.v{VERSAO_CACHE}.{extensao}")
+
+
+def ler_cache(sha, extensao="txt"):
+    """Texto já extraído desse arquivo (ou outro derivado dele, pela extensão), ou None."""
+    caminho = _caminho_cache(sha, extensao)
+    try:
+        with open(caminho, encoding="utf-8") as arquivo:
+            texto = arquivo.read()
+        os.utime(caminho)  # Acesso recente: fica por último na poda
+        return texto
+    except OSError:
+        return None
+
+
+def gravar_cache(sha, texto, extensao="txt"):
+    """Grava o texto de forma atômica (arquivo temporário + rename), seguro entre processos."""
+    global _gravacoes
+    caminho = _caminho_cache(sha, extensao)
+    try:
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        descritor, temporario = tempfile.mkstemp(dir=os.path.dirname(caminho), suffix=".tmp")
+        with os.fdopen(descritor, "w", encoding="utf-8") as arquivo:
+            arquivo.write(texto)
+        os.replace(temporario, caminho)
+    except OSError as e:
+        logging.warning(f"CACHE PDF: não foi possível gravar {caminho}: {e}")
+        return
+    _gravacoes += 1
+    if _gravacoes % INTERVALO_PODA == 0:
+        podar_cache()
 
 
-def extrair_texto_pdf(caminho_pdf):
+def podar_cache():
+    """Apaga os textos menos usados até o cache caber em PDF_TEXT_CACHE_MAX_MB."""
+    arquivos = []
+    for raiz, _, nomes in os.walk(CACHE_DIR):
+        for nome in nomes:
+            caminho = os.path.join(raiz, nome)
+            try:
+                estado = os.stat(caminho)
+            except OSError:
+                continue
+            arquivos.append((estado.st_mtime, estado.st_size, caminho))
+    total = sum(tamanho_arquivo for _, tamanho_arquivo, _ in arquivos)
+    for _, tamanho_arquivo, caminho in sorted(arquivos):
+        if total <= CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(caminho)
+            total -= tamanho_arquivo
+        except OSError:
+            pass
+
+
+def extrair_paginas(fonte_pdf, inicio, fim):
+    """Texto das páginas [inicio, fim) — unidade de trabalho do pool de processos."""
+    with pdfplumber.open(como_arquivo(fonte_pdf)) as pdf:
+        return [pdf.pages[indice].extract_text() or "" for indice in range(inicio, fim)]
+
+
+def _extrair_em_paralelo(fonte_pdf, inicio, fim, executor):
+    faixas = [(a, min(a + PAGINAS_POR_TAREFA, fim)) for a in range(inicio, fim, PAGINAS_POR_TAREFA)]
+    futuros = [executor.submit(extrair_paginas, fonte_pdf, a, b) for a, b in faixas]
+    return [texto for futuro in futuros for texto in futuro.result()]
+
+
+def extrair_texto_pdf(fonte_pdf, obter_executor=None):
     """
-    Extrai o texto completo de um arquivo PDF
-    
+    Extrai o texto de um arquivo PDF
+
     Args:
-        caminho_pdf: Caminho do arquivo PDF
-    
+        fonte_pdf: Caminho, bytes ou arquivo binário aberto do PDF
+        obter_executor: Função que devolve um pool de processos para extrair as páginas
+            restantes em paralelo (None = tudo neste processo; arquivo aberto não
+            vai para outros processos)
+
     Returns:
         str: Texto extraído ou mensagem de erro
     """
     try:
-        texto = ""
-        with pdfplumber.open(caminho_pdf) as pdf:
-            for pagina in pdf.pages:
-                conteudo = pagina.extract_text()
-                if conteudo:
-                    texto += conteudo + "\n"
-        return texto.strip()
+        tamanho_pdf = tamanho(fonte_pdf)
+        if tamanho_pdf > PDF_MAX_BYTES:
+            return f"Erro ao ler PDF: arquivo de {tamanho_pdf / 1024 / 1024:.1f} MB excede o limite de {PDF_MAX_BYTES // 1024 // 1024} MB"
+
+        sha = hash_arquivo(fonte_pdf)
+        texto = ler_cache(sha)
+        if texto is not None:
+            logging.debug(f"CACHE PDF: texto reaproveitado ({sha[:12]})")
+            return texto
+
+        if not isinstance(fonte_pdf, (str, bytes)):
+            obter_executor = None  # Arquivo aberto não atravessa o pool de processos
+
+        paginas = []
+        with pdfplumber.open(como_arquivo(fonte_pdf)) as pdf:
+            limite = min(len(pdf.pages), PDF_MAX_PAGINAS)
+            if len(pdf.pages) > limite:
+                logging.warning(f"PDF com {len(pdf.pages)} páginas: lendo só as primeiras {limite}")
+
+            chave = cnpj = total = False
+            folhas = 1
+            for indice in range(limite):
+                conteudo = pdf.pages[indice].extract_text() or ""
+                paginas.append(conteudo)
+                chave = chave or bool(_RE_CHAVE.search(conteudo))
+                cnpj = cnpj or bool(_RE_CNPJ.search(conteudo))
+                total = total or bool(_RE_TOTAL.search(conteudo))
+                if indice == 0:
+                    folha = _RE_FOLHA.search(conteudo)
+                    folhas = int(folha.group(2)) if folha else 1
+
+                # Campos da NF-e achados e todas as folhas do DANFE lidas: o resto não interessa
+                if chave and cnpj and total and indice + 1 >= folhas:
+                    if indice + 1 < limite:
+                        logging.debug(f"PDF: dados da NF-e na(s) {indice + 1} primeira(s) página(s), {limite - indice - 1} ignorada(s)")
+                    break
+
+                # Se a NF-e já apareceu, só faltam as folhas de continuação
+                fim = min(limite, folhas) if (chave and cnpj and total) else limite
+                if obter_executor and fim - indice - 1 >= MIN_PAGINAS_PARALELO:
+                    paginas.extend(_extrair_em_paralelo(fonte_pdf, indice + 1, fim, obter_executor()))
+                    break
+
+        texto = "\n".join(conteudo for conteudo in paginas if conteudo).strip()
+        if texto:
+            gravar_cache(sha, texto)
+        return texto
     except Exception as e:
         return f"Erro ao ler PDF: {str(e)}"
@@ -2,58 +2,177 @@
 import xml.etree.ElementTree as ET
 from datetime import datetime
 import logging  # Para debug
+from processors.arquivo_upload import como_arquivo
 
 logging.basicConfig(level=logging.DEBUG)
 
-def processar_xml(caminho_arquivo, user_cnpj=""):
+NFE_NS = '{http://www.portalfiscal.inf.br/nfe}'  # Namespace NF-e (formato iterparse)
+
+# Grupos do XML que dão contexto às tags-folha (a mesma tag, ex. CNPJ/vICMS/CST,
+# aparece em vários grupos). O grupo vigente é sempre o ancestral mais próximo.
+_GRUPOS = {'ide', 'emit', 'dest', 'ICMSTot', 'det', 'prod', 'ICMS00', 'ICMS10', 'PISAliq', 'COFINSAliq', 'IPI'}
+
+# Tabela de despacho: (grupo, tag) -> (destino, campo). Destino 'nota' grava no dict
+# da nota; os demais gravam no item corrente (det), separados por grupo de imposto.
+_DESPACHO = {
+    ('ide', 'nNF'): ('nota', 'numero'),
+    ('ide', 'dhEmi'): ('nota', 'dhEmi'),
+    ('ide', 'natOp'): ('nota', 'natureza_operacao'),
+    ('ide', 'tpNF'): ('nota', 'tpNF'),
+    ('emit', 'CNPJ'): ('nota', 'cnpj_emitente'),
+    ('emit', 'xNome'): ('nota', 'nome_emitente'),
+    ('emit', 'IE'): ('nota', 'ie_emitente'),
+    ('emit', 'xLgr'): ('nota', 'emit_xLgr'),
+    ('emit', 'nro'): ('nota', 'emit_nro'),
+    ('emit', 'xBairro'): ('nota', 'emit_xBairro'),
+    ('emit', 'xMun'): ('nota', 'emit_xMun'),
+    ('emit', 'UF'): ('nota', 'emit_UF'),
+    ('dest', 'CNPJ'): ('nota', 'cnpj_destinatario'),
+    ('dest', 'xNome'): ('nota', 'nome_destinatario'),
+    ('dest', 'IE'): ('nota', 'ie_destinatario'),
+    ('dest', 'xLgr'): ('nota', 'dest_xLgr'),
+    ('dest', 'nro'): ('nota', 'dest_nro'),
+    ('dest', 'xBairro'): ('nota', 'dest_xBairro'),
+    ('dest', 'xMun'): ('nota', 'dest_xMun'),
+    ('dest', 'UF'): ('nota', 'dest_UF'),
+    ('ICMSTot', 'vNF'): ('nota', 'valor_total_nota'),
+    ('ICMSTot', 'vICMS'): ('nota', 'v_icms'),
+    ('ICMSTot', 'vPIS'): ('nota', 'v_pis'),
+    ('ICMSTot', 'vCOFINS'): ('nota', 'v_cofins'),
+    ('prod', 'cProd'): ('prod', 'codigo_produto'),
+    ('prod', 'xProd'): ('prod', 'descricao_produto'),
+    ('prod', 'NCM'): ('prod', 'ncm'),
+    ('prod', 'CFOP'): ('prod', 'cfop'),
+    ('prod', 'uCom'): ('prod', 'unidade'),
+    ('prod', 'qCom'): ('prod', 'quantidade'),
+    ('prod', 'vUnCom'): ('prod', 'valor_unitario'),
+    ('prod', 'vProd'): ('prod', 'valor_total'),
+    ('ICMS00', 'vICMS'): ('ICMS00', 'valor'),
+    ('ICMS00', 'CST'): ('ICMS00', 'cst'),
+    ('ICMS10', 'vICMS'): ('ICMS10', 'valor'),
+    ('ICMS10', 'CST'): ('ICMS10', 'cst'),
+    ('PISAliq', 'vPIS'): ('PISAliq', 'valor'),
+    ('PISAliq', 'CST'): ('PISAliq', 'cst'),
+    ('COFINSAliq', 'vCOFINS'): ('COFINSAliq', 'valor'),
+    ('COFINSAliq', 'CST'): ('COFINSAliq', 'cst'),
+    ('IPI', 'vIPI'): ('IPI', 'valor'),
+    ('IPI', 'CST'): ('IPI', 'cst'),
+}
+
+
+def _montar_item(det):
+    """Converte o estado acumulado de um <det> no dict de item usado pelo save."""
+    prod = det['prod']
+    icms = det.get('ICMS00') or det.get('ICMS10') or {}  # Flex pra variações
+    pis = det.get('PISAliq', {})
+    cofins = det.get('COFINSAliq', {})
+    ipi = det.get('IPI', {})
+    cst_icms = icms.get('cst', '')
+
+    return {
+        'nota_id': None,  # Preenchido no save
+        'codigo_produto': prod.get('codigo_produto', ''),
+        'descricao_produto': prod.get('descricao_produto', ''),
+        'ncm': prod.get('ncm', ''),
+        'cst_ipi': ipi.get('cst', cst_icms),  # Fallback CST ICMS
+        'cfop': prod.get('cfop', ''),
+        'unidade': prod.get('unidade', ''),
+        'quantidade': prod.get('quantidade', '0'),
+        'valor_unitario': prod.get('valor_unitario', '0.00'),
+        'valor_total': prod.get('valor_total', '0.00'),
+        'cst_icms': cst_icms,
+        'cst_pis': pis.get('cst', ''),
+        'cst_cofins': cofins.get('cst', ''),
+        'cest': None,  # Não no XML sample
+        # Impostos como Float
+        'icms_valor': float(icms.get('valor', '0.00')),
+        'ipi_valor': float(ipi.get('valor', '0.00')),
+        'pis_valor': float(pis.get('valor', '0.00')),
+        'cofins_valor': float(cofins.get('valor', '0.00'))
+    }
+
+
+def _endereco(campos, prefixo):
+    return (f"{campos.get(prefixo + 'xLgr', '')} {campos.get(prefixo + 'nro', '')}, "
+            f"{campos.get(prefixo + 'xBairro', '')}, {campos.get(prefixo + 'xMun', '')} - {campos.get(prefixo + 'UF', '')}")
+
+
+def processar_xml(fonte, user_cnpj=""):
     """
     Parse XML NF-e 4.00 e retorna dict pra NotaFiscal + itens com impostos.
+    fonte: caminho, bytes ou arquivo binário aberto (ex.: stream do upload).
     Robustez pra variações de fornecedores (ex: ICMS00/ICMS10, IPI ausente).
     user_cnpj: CNPJ logado pra definir tipo_operacao (Entrada/Saída).
+
+    Percorre o documento uma única vez com iterparse: cada tag-folha é despachada
+    pela tabela _DESPACHO conforme o grupo em que está, e os elementos são
+    descartados logo após o uso, então memória não cresce com o número de <det>.
     """
     try:
-        tree = ET.parse(caminho_arquivo)
-        root = tree.getroot()
-        ns = {'nfe': 'http://www.portalfiscal.inf.br/nfe'}  # Namespace NF-e
+        campos = {}        # Campos da nota (ide/emit/dest/ICMSTot)
+        grupos_vistos = set()
+        chave_nfe = ''
+        itens = []
+        det = None         # Estado do <det> corrente
+        pilha = []         # Elementos abertos (pra remover do pai ao fechar)
+        grupos = []        # Grupos abertos, o último é o contexto vigente
+
+        for evento, elem in ET.iterparse(como_arquivo(fonte), events=('start', 'end')):
+            tag = elem.tag[len(NFE_NS):] if elem.tag.startswith(NFE_NS) else None
+
+            if evento == 'start':
+                pilha.append(elem)
+                if tag in _GRUPOS:
+                    grupos.append(tag)
+                    if tag == 'det':
+                        det = {'nItem': elem.get('nItem')}
+                    elif det is not None:
+                        det.setdefault(tag, {})
+                elif tag == 'infNFe' and not chave_nfe:
+                    chave_nfe = (elem.get('Id') or '').replace('NFe', '')
+                continue
+
+            # evento 'end': texto da folha já está completo
+            pilha.pop()
+            if tag in _GRUPOS:
+                grupos.pop()
+                grupos_vistos.add(tag)
+                if tag == 'det':
+                    if 'prod' in det:  # Pula det sem prod
+                        itens.append(_montar_item(det))
+                    det = None
+            elif grupos and tag is not None:
+                destino = _DESPACHO.get((grupos[-1], tag))
+                if destino is not None:
+                    alvo, campo = destino
+                    if alvo == 'nota':
+                        campos.setdefault(campo, elem.text)
+                    elif det is not None:
+                        det[alvo].setdefault(campo, elem.text)
+
+            # Descarta o elemento já processado
+            elem.clear()
+            if pilha:
+                pilha[-1].remove(elem)
 
         # Dados da nota (ide)
-        ide = root.find('.//nfe:ide', ns)
-        if ide is None:
+        if 'ide' not in grupos_vistos:
             logging.error("Elemento 'ide' não encontrado.")
             return None
-        numero = ide.find('nfe:nNF', ns).text if ide.find('nfe:nNF', ns) is not None else ''
-        data_emissao_elem = ide.find('nfe:dhEmi', ns)
-        data_emissao = data_emissao_elem.text[:10] if data_emissao_elem is not None else ''  # YYYY-MM-DD
-        natureza_operacao = ide.find('nfe:natOp', ns).text if ide.find('nfe:natOp', ns) is not None else ''
-        tp_nf = ide.find('nfe:tpNF', ns)
-        tipo_base = 'Saída' if tp_nf is not None and tp_nf.text == '1' else 'Entrada'
-
-        # Emitente
-        emit = root.find('.//nfe:emit', ns)
-        if emit is None:
+        if 'emit' not in grupos_vistos:
             logging.error("Elemento 'emit' não encontrado.")
             return None
-        cnpj_emitente = emit.find('nfe:CNPJ', ns).text if emit.find('nfe:CNPJ', ns) is not None else ''
-        nome_emitente = emit.find('nfe:xNome', ns).text if emit.find('nfe:xNome', ns) is not None else ''
-        ie_emitente = emit.find('nfe:IE', ns).text if emit.find('nfe:IE', ns) is not None else ''
-        x_lgr = emit.find('.//nfe:xLgr', ns)
-        nro = emit.find('.//nfe:nro', ns)
-        x_bairro = emit.find('.//nfe:xBairro', ns)
-        x_mun = emit.find('.//nfe:xMun', ns)
-        uf = emit.find('.//nfe:UF', ns)
-        endereco_emitente = f"{x_lgr.text if x_lgr is not None else ''} {nro.text if nro is not None else ''}, {x_bairro.text if x_bairro is not None else ''}, {x_mun.text if x_mun is not None else ''} - {uf.text if uf is not None else ''}"
-
-        # Destinatário
-        dest = root.find('.//nfe:dest', ns)
-        cnpj_destinatario = dest.find('nfe:CNPJ', ns).text if dest.find('nfe:CNPJ', ns) is not None else None
-        nome_destinatario = dest.find('nfe:xNome', ns).text if dest.find('nfe:xNome', ns) is not None else ''
-        ie_destinatario = dest.find('nfe:IE', ns).text if dest.find('nfe:IE', ns) is not None else None
-        x_lgr_dest = dest.find('.//nfe:xLgr', ns)
-        nro_dest = dest.find('.//nfe:nro', ns)
-        x_bairro_dest = dest.find('.//nfe:xBairro', ns)
-        x_mun_dest = dest.find('.//nfe:xMun', ns)
-        uf_dest = dest.find('.//nfe:UF', ns)
-        endereco_destinatario = f"{x_lgr_dest.text if x_lgr_dest is not None else ''} {nro_dest.text if nro_dest is not None else ''}, {x_bairro_dest.text if x_bairro_dest is not None else ''}, {x_mun_dest.text if x_mun_dest is not None else ''} - {uf_dest.text if uf_dest is not None else ''}"
+        if 'ICMSTot' not in grupos_vistos:
+            logging.error("Elemento 'ICMSTot' não encontrado.")
+            return None
+
+        numero = campos.get('numero') or ''
+        data_emissao = campos['dhEmi'][:10] if campos.get('dhEmi') else ''  # YYYY-MM-DD
+        tipo_base = 'Saída' if campos.get('tpNF') == '1' else 'Entrada'
+        cnpj_emitente = campos.get('cnpj_emitente') or ''
+        cnpj_destinatario = campos.get('cnpj_destinatario')
+        valor_total_nota = campos.get('valor_total_nota', '0.00')
+        v_icms_total = campos.get('v_icms', '0.00')
 
         # NOVO: Tipo_operacao baseado em user_cnpj vs emit/dest
         if user_cnpj:
@@ -67,98 +186,27 @@ def processar_xml(caminho_arquivo, user_cnpj=""):
         else:
             tipo_operacao = tipo_base  # Fallback
 
-        # Totais (ICMSTot)
-        icms_tot = root.find('.//nfe:ICMSTot', ns)
-        if icms_tot is None:
-            logging.error("Elemento 'ICMSTot' não encontrado.")
-            return None
-        valor_total_nota = icms_tot.find('nfe:vNF', ns).text if icms_tot.find('nfe:vNF', ns) is not None else '0.00'
-        v_icms_total = icms_tot.find('nfe:vICMS', ns).text if icms_tot.find('nfe:vICMS', ns) is not None else '0.00'
-        v_pis_total = icms_tot.find('nfe:vPIS', ns).text if icms_tot.find('nfe:vPIS', ns) is not None else '0.00'
-        v_cofins_total = icms_tot.find('nfe:vCOFINS', ns).text if icms_tot.find('nfe:vCOFINS', ns) is not None else '0.00'
-
-        # Chave (infNFe @Id)
-        inf_nfe = root.find('.//nfe:infNFe', ns)
-        chave_nfe = inf_nfe.get('Id').replace('NFe', '') if inf_nfe is not None else ''
-
-        # Itens (det)
-        itens = []
-        dets = root.findall('.//nfe:det', ns)
-        logging.debug(f"Encontrados {len(dets)} itens no XML.")
-        for det in dets:
-            n_item = det.get('nItem')
-            prod = det.find('nfe:prod', ns)
-            if prod is None:
-                continue  # Pula det sem prod
-            c_prod = prod.find('nfe:cProd', ns).text if prod.find('nfe:cProd', ns) is not None else ''
-            x_prod = prod.find('nfe:xProd', ns).text if prod.find('nfe:xProd', ns) is not None else ''
-            ncm = prod.find('nfe:NCM', ns).text if prod.find('nfe:NCM', ns) is not None else ''
-            cfop = prod.find('nfe:CFOP', ns).text if prod.find('nfe:CFOP', ns) is not None else ''
-            u_com = prod.find('nfe:uCom', ns).text if prod.find('nfe:uCom', ns) is not None else ''
-            q_com = prod.find('nfe:qCom', ns).text if prod.find('nfe:qCom', ns) is not None else '0'
-            v_un_com = prod.find('nfe:vUnCom', ns).text if prod.find('nfe:vUnCom', ns) is not None else '0.00'
-            v_prod = prod.find('nfe:vProd', ns).text if prod.find('nfe:vProd', ns) is not None else '0.00'
-
-            # Impostos do item (tenta ICMS00/ICMS10, PISAliq, COFINSAliq; default 0)
-            icms_item = det.find('.//nfe:ICMS00', ns) or det.find('.//nfe:ICMS10', ns)  # Flex pra variações
-            v_icms_item = float(icms_item.find('nfe:vICMS', ns).text if icms_item is not None and icms_item.find('nfe:vICMS', ns) is not None else '0.00')
-            cst_icms = icms_item.find('nfe:CST', ns).text if icms_item is not None and icms_item.find('nfe:CST', ns) is not None else ''
-
-            pis_item = det.find('.//nfe:PISAliq', ns)
-            v_pis_item = float(pis_item.find('nfe:vPIS', ns).text if pis_item is not None and pis_item.find('nfe:vPIS', ns) is not None else '0.00')
-            cst_pis = pis_item.find('nfe:CST', ns).text if pis_item is not None and pis_item.find('nfe:CST', ns) is not None else ''
-
-            cofins_item = det.find('.//nfe:COFINSAliq', ns)
-            v_cofins_item = float(cofins_item.find('nfe:vCOFINS', ns).text if cofins_item is not None and cofins_item.find('nfe:vCOFINS', ns) is not None else '0.00')
-            cst_cofins = cofins_item.find('nfe:CST', ns).text if cofins_item is not None and cofins_item.find('nfe:CST', ns) is not None else ''
-
-            # IPI (se presente, opcional)
-            ipi_item = det.find('.//nfe:IPI', ns)
-            v_ipi_item = float(ipi_item.find('.//nfe:vIPI', ns).text if ipi_item is not None and ipi_item.find('.//nfe:vIPI', ns) is not None else '0.00')
-            cst_ipi = ipi_item.find('.//nfe:CST', ns).text if ipi_item is not None and ipi_item.find('.//nfe:CST', ns) is not None else cst_icms  # Fallback CST ICMS
-
-            item = {
-                'nota_id': None,  # Preenchido no save
-                'codigo_produto': c_prod,
-                'descricao_produto': x_prod,
-                'ncm': ncm,
-                'cst_ipi': cst_ipi,
-                'cfop': cfop,
-                'unidade': u_com,
-                'quantidade': q_com,
-                'valor_unitario': v_un_com,
-                'valor_total': v_prod,
-                'cst_icms': cst_icms,
-                'cst_pis': cst_pis,
-                'cst_cofins': cst_cofins,
-                'cest': None,  # Não no XML sample
-                # Impostos como Float
-                'icms_valor': v_icms_item,
-                'ipi_valor': v_ipi_item,
-                'pis_valor': v_pis_item,
-                'cofins_valor': v_cofins_item
-            }
-            itens.append(item)
+        logging.debug(f"Encontrados {len(itens)} itens no XML.")
 
         dados = {
             'numero': numero,
             'data_emissao': data_emissao,
             'cnpj_emitente': cnpj_emitente,
-            'nome_emitente': nome_emitente,
-            'ie_emitente': ie_emitente,
-            'endereco_emitente': endereco_emitente,
+            'nome_emitente': campos.get('nome_emitente') or '',
+            'ie_emitente': campos.get('ie_emitente') or '',
+            'endereco_emitente': _endereco(campos, 'emit_'),
             'cnpj_destinatario': cnpj_destinatario,
-            'nome_destinatario': nome_destinatario,
-            'ie_destinatario': ie_destinatario,
-            'endereco_destinatario': endereco_destinatario,
+            'nome_destinatario': campos.get('nome_destinatario') or '',
+            'ie_destinatario': campos.get('ie_destinatario'),
+            'endereco_destinatario': _endereco(campos, 'dest_'),
             'chave_nfe': chave_nfe,
-            'natureza_operacao': natureza_operacao,
+            'natureza_operacao': campos.get('natureza_operacao') or '',
             'valor_total_nota': valor_total_nota,
             'tipo_operacao': tipo_operacao,  # NOVO: Baseado em user_cnpj
             'versao': '4.00',
             'v_icms': v_icms_total,  # Total ICMS nota
-            'v_pis': v_pis_total,
-            'v_cofins': v_cofins_total,
+            'v_pis': campos.get('v_pis', '0.00'),
+            'v_cofins': campos.get('v_cofins', '0.00'),
             'itens': itens
         }
 
@@ -167,4 +215,4 @@ def processar_xml(caminho_arquivo, user_cnpj=""):
 
     except Exception as e:
         logging.error(f"ERRO PARSE XML: {e}")
-        return None
\ No newline at end of file
+        return None
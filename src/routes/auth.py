@@ -7,6 +7,8 @@ import sys
 import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from utils.helpers import limpar_cnpj, validar_cnpj
+from services.rbt12 import calcular_rbt12, rbt12_do_usuario
+from services.response_cache import cache_por_cnpj, invalidar_cnpj
 
 auth_bp = Blueprint("auth_bp", __name__)
 
@@ -104,6 +106,7 @@ def login_user():
 
 
 @auth_bp.route("/api/usuario_dados", methods=["GET"])
+@cache_por_cnpj()
 def get_usuario_dados():
     if "cnpj" not in session:
         return jsonify({"erro": "Não autorizado"}), 401
@@ -118,7 +121,8 @@ def get_usuario_dados():
             "nome": usuario.nome,
             "regime": usuario.regime_tributario,
             "natureza": usuario.natureza_juridica,
-            "rbt12": float(usuario.rbt12) if usuario.rbt12 else 0.0
+            "rbt12": rbt12_do_usuario(db, usuario),
+            "rbt12_automatico": not usuario.rbt12_manual
         }), 200
     finally:
         db.close()
@@ -131,8 +135,10 @@ def atualizar_rbt12():
     
     data = request.get_json()
     rbt12 = data.get("rbt12", 0.0)
+    # {"automatico": true} volta a calcular o RBT12 a partir das notas de saída
+    automatico = bool(data.get("automatico"))
     
-    if rbt12 < 0:
+    if not automatico and rbt12 < 0:
         return jsonify({"erro": "RBT12 deve ser positivo"}), 400
     
     db = SessionLocal()
@@ -141,9 +147,11 @@ def atualizar_rbt12():
         if not usuario:
             return jsonify({"erro": "Usuário não encontrado"}), 404
         
-        usuario.rbt12 = float(rbt12)
+        usuario.rbt12_manual = not automatico
+        usuario.rbt12 = calcular_rbt12(db, usuario.cnpj) if automatico else float(rbt12)
         db.commit()
-        return jsonify({"mensagem": "RBT12 atualizado com sucesso!", "rbt12": rbt12}), 200
+        invalidar_cnpj(usuario.cnpj)
+        return jsonify({"mensagem": "RBT12 atualizado com sucesso!", "rbt12": usuario.rbt12, "rbt12_automatico": automatico}), 200
     except Exception as e:
         db.rollback()
         return jsonify({"erro": str(e)}), 500
@@ -1,21 +1,20 @@
 # src/routes/chat.py
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, request, jsonify, session, Response
 import requests
 import time  # Para retry
 import os
+import json
+import logging
 from database.connection import SessionLocal
-from models.nota_fiscal import NotaFiscal, ItemNota  # ItemNota pra detalhes
-from models.usuario import Usuario  # Pra regime
+from services.chat_history import obter_store, HISTORY_TURNS
+from services.chat_compaction import montar_mensagem
+from services.answer_cache import answer_cache, hash_contexto, eh_continuacao
+from services.chat_context import EtapasContexto
+from services.contexto_notas import contexto_usuario
+from services.recuperacao_contexto import recuperar_contexto
+from services.web_search import web_search_cache, provedor_disponivel
 from services.gemini_service import chamar_gemini  # Mantenha para Grok se necessário, mas use processar_pergunta_chat para Gemini
 
-# Importar Tavily para busca web
-try:
-    from tavily import TavilyClient
-    TAVILY_AVAILABLE = True
-except ImportError:
-    TAVILY_AVAILABLE = False
-    print("AVISO: tavily-python não instalado. Busca web desabilitada.")
-
 chat_bp = Blueprint("chat_bp", __name__)
 
 @chat_bp.route("/chat", methods=["POST"])
@@ -23,11 +22,18 @@ def chat_ia():
     """
     Endpoint de chat fiscal inteligente (Gemini ou Grok) com contexto das notas do usuário
     e capacidade de busca web para informações fiscais atualizadas.
+    Dados do usuário, notas e busca web são montados em paralelo, com prazo comum.
+    Perguntas repetidas com o mesmo contexto de notas saem do cache de respostas,
+    sem chamar a IA. Com ?stream=1 a resposta vem como SSE
+    (ver _resposta_sse) usando o streaming do Gemini/Grok.
     """
     data = request.get_json()
     pergunta = data.get("pergunta")
     api_key = data.get("apiKey")
     tavily_key = data.get("tavilyKey")  # NOVO: Chave Tavily opcional
+    conversa_id = data.get("conversaId")  # Conversa persistida (sem ela, cria uma nova)
+    # ?stream=1 (ou "stream": true): resposta em Server-Sent Events, trecho a trecho
+    streaming = request.args.get("stream") == "1" or bool(data.get("stream"))
 
     if not pergunta:
         return jsonify({"erro": "Pergunta não fornecida."}), 400
@@ -39,104 +45,102 @@ def chat_ia():
     if not cnpj:
         return jsonify({"erro": "Não autorizado. Faça login."}), 401
 
-    db = SessionLocal()
+    store = obter_store()
+    if conversa_id and not store.conversa_existe(cnpj, conversa_id):
+        return jsonify({"erro": "Conversa não encontrada."}), 404
+
+    # Detectar tipo de modelo pela chave
+    if not api_key.startswith(("AIza", "gsk_")):
+        return jsonify({"erro": "Chave de API inválida."}), 400
+
+    # Detectar se pergunta é sobre saída/entrada para filtrar query
+    is_saida = "saida" in pergunta.lower() or "saída" in pergunta.lower()
+    is_entrada = "entrada" in pergunta.lower()
+
+    filter_tipo = None
+    if is_saida and not is_entrada:
+        filter_tipo = 'Saída'
+    elif is_entrada and not is_saida:
+        filter_tipo = 'Entrada'
+
+    # Detecta se a pergunta requer busca web
+    keywords_busca_web = [
+        "alíquota", "aliquota", "imposto", "cfop", "ncm", "lei", "legislação", 
+        "legislacao", "regra", "simples nacional", "lucro presumido", "icms", 
+        "ipi", "pis", "cofins", "anexo", "faixa", "limite"
+    ]
+    precisa_busca_web = any(keyword in pergunta.lower() for keyword in keywords_busca_web)
+
+    # Etapas independentes do contexto rodam em paralelo, com prazo comum (ver services/chat_context).
+    # A busca web já sai junto com as consultas ao banco; num acerto de cache o resultado é ignorado.
+    etapas = {
+        "usuario": lambda: _contexto_usuario(cnpj),
+        "notas": lambda: _contexto_notas(cnpj, pergunta, filter_tipo),
+    }
+    if precisa_busca_web and tavily_key and provedor_disponivel():
+        etapas["web"] = lambda: _busca_web(pergunta, tavily_key)
+    contexto_etapas = EtapasContexto(etapas)
+
     try:
-        # Detecta se a pergunta requer busca web
-        keywords_busca_web = [
-            "alíquota", "aliquota", "imposto", "cfop", "ncm", "lei", "legislação", 
-            "legislacao", "regra", "simples nacional", "lucro presumido", "icms", 
-            "ipi", "pis", "cofins", "anexo", "faixa", "limite"
-        ]
-        precisa_busca_web = any(keyword in pergunta.lower() for keyword in keywords_busca_web)
-        
-        # Realiza busca web se necessário e se Tavily estiver disponível
-        contexto_web = ""
-        if precisa_busca_web and tavily_key and TAVILY_AVAILABLE:
-            try:
-                tavily_client = TavilyClient(api_key=tavily_key)
-                search_results = tavily_client.search(
-                    query=f"Brasil fiscal tributário {pergunta}",
-                    max_results=3
-                )
-                
-                if search_results and 'results' in search_results:
-                    contexto_web = "\n\n=== INFORMAÇÕES ATUALIZADAS DA WEB ===\n"
-                    for idx, result in enumerate(search_results['results'][:3], 1):
-                        contexto_web += f"{idx}. {result.get('title', 'Sem título')}\n"
-                        contexto_web += f"   {result.get('content', 'Sem conteúdo')[:300]}...\n"
-                        contexto_web += f"   Fonte: {result.get('url', 'N/A')}\n\n"
-                    print(f"DEBUG BUSCA WEB: {len(search_results['results'])} resultados encontrados")
-            except Exception as e:
-                print(f"DEBUG ERRO BUSCA WEB: {e}")
-                contexto_web = "\n\n[Busca web falhou, usando apenas dados locais]\n"
-
-        # Detectar se pergunta é sobre saída/entrada para filtrar query
-        is_saida = "saida" in pergunta.lower() or "saída" in pergunta.lower()
-        is_entrada = "entrada" in pergunta.lower()
-
-        filter_tipo = None
-        if is_saida and not is_entrada:
-            filter_tipo = 'Saída'
-        elif is_entrada and not is_saida:
-            filter_tipo = 'Entrada'
-
-        # Query: Últimas 5 notas do usuário (emitente ou destinatário), filtrado se aplicável
-        query = db.query(NotaFiscal).filter(
-            (NotaFiscal.cnpj_emitente == cnpj) | (NotaFiscal.cnpj_destinatario == cnpj)
+        contexto = contexto_etapas.resultado(
+            "usuario", "Regime: desconhecido, Natureza: desconhecida (dados do usuário indisponíveis).\n"
         )
-        if filter_tipo:
-            query = query.filter(NotaFiscal.tipo_operacao == filter_tipo)
-        notas = query.order_by(NotaFiscal.data_emissao.desc()).limit(5).all()
-
-        # Query: Dados do usuário (regime tributário + natureza_juridica + RBT12)
-        usuario = db.query(Usuario).filter_by(cnpj=cnpj).first()
-        regime = usuario.regime_tributario if usuario else "desconhecido"
-        natureza = usuario.natureza_juridica if usuario else "desconhecida"
-        rbt12 = float(usuario.rbt12) if usuario and usuario.rbt12 else 0.0
-
-        # Constrói contexto resumido com itens detalhados + impostos (mais conciso)
-        contexto = f"Regime: {regime}, Natureza: {natureza}, RBT12 (Receita Bruta últimos 12 meses): R$ {rbt12:,.2f}.\n"
-        if not notas:
-            contexto += "Nenhuma nota encontrada."
-        else:
-            contexto += "Notas:\n"
-            for nota in notas:
-                itens_resumo = []
-                itens = db.query(ItemNota).filter_by(nota_id=nota.id).all()  # Removido limit para completude, mas mantém conciso
-                print(f"DEBUG CHAT: Nota {nota.id} tem {len(itens)} itens encontrados.")  # Debug
-                if itens:
-                    for item in itens:
-                        val_unit = float(getattr(item, 'valor_unitario', 0) or 0)
-                        val_total = float(getattr(item, 'valor_total', 0) or 0)
-                        qtd = float(getattr(item, 'quantidade', 0) or 0)
-                        icms_item = float(getattr(item, 'icms_valor', 0) or 0)
-                        ipi_item = float(getattr(item, 'ipi_valor', 0) or 0)
-                        pis_item = float(getattr(item, 'pis_valor', 0) or 0)
-                        cofins_item = float(getattr(item, 'cofins_valor', 0) or 0)
-                        itens_resumo.append(
-                            f"{item.descricao_produto or 'N/A'} (qtd:{qtd}, unit:R${val_unit:.2f}, total:R${val_total:.2f}, NCM:{item.ncm or 'N/A'}, CFOP:{item.cfop or 'N/A'}, CST IPI:{item.cst_ipi or 'N/A'}, ICMS:R${icms_item:.2f}, IPI:R${ipi_item:.2f}, PIS:R${pis_item:.2f}, COFINS:R${cofins_item:.2f})"
-                        )
-                    itens_str = "; ".join(itens_resumo)
-                else:
-                    itens_str = "Sem itens."
-                contexto += f"- Nota {nota.numero} ({nota.data_emissao}): Total R${nota.valor_total_nota or 0}, Natureza: {nota.natureza_operacao or 'N/A'}, Tipo: {nota.tipo_operacao or 'N/A'}. Itens: {itens_str}.\n"
-
-        # Adiciona contexto web se houver
-        contexto += contexto_web
+        contexto += contexto_etapas.resultado("notas", "Notas indisponíveis no momento.\n")
+
+        # Cache de respostas: mesma pergunta (ou equivalente) com o mesmo contexto de notas.
+        # Contexto incompleto (etapa do banco fora do prazo) não entra no cache.
+        contexto_hash = hash_contexto(contexto)
+        usar_cache = not eh_continuacao(pergunta) and not contexto_etapas.descartadas
+        if usar_cache:
+            em_cache = answer_cache.buscar(cnpj, contexto_hash, pergunta)
+            if em_cache:
+                contexto_etapas.registrar()
+                if not conversa_id:
+                    conversa_id = store.criar_conversa(cnpj, titulo=pergunta)
+                store.adicionar_troca(cnpj, conversa_id, pergunta, em_cache["resposta"])
+                logging.debug(f"CHAT CACHE: acerto {'semântico' if em_cache['semantico'] else 'exato'} ({em_cache['similaridade']})")
+                if streaming:
+                    return _resposta_sse(
+                        iter([em_cache["resposta"]]), conversa_id,
+                        cache="semantico" if em_cache["semantico"] else "exato"
+                    )
+                return jsonify({
+                    "resposta": em_cache["resposta"],
+                    "conversaId": conversa_id,
+                    "cache": "semantico" if em_cache["semantico"] else "exato"
+                }), 200
+
+        # Adiciona contexto web se houver (espera só o que sobrou do prazo)
+        contexto += contexto_etapas.resultado("web", "\n\n[Busca web excedeu o prazo, usando apenas dados locais]\n")
+        contexto_etapas.registrar()
 
-        db.close()
         print(f"DEBUG CONTEXTO: {contexto[:500]}...")  # Debug
 
         try:
-            # Detectar tipo de modelo pela chave
+            if not conversa_id:
+                conversa_id = store.criar_conversa(cnpj, titulo=pergunta)
+
+            if streaming:
+                chamar_stream = chamar_gemini_stream if api_key.startswith("AIza") else chamar_grok_stream
+
+                def ao_concluir(resposta):
+                    if usar_cache and not resposta.startswith(("⚠️ Erro", "Erro")):
+                        answer_cache.guardar(cnpj, contexto_hash, pergunta, resposta)
+
+                return _resposta_sse(
+                    chamar_stream(pergunta, api_key, contexto, cnpj, conversa_id=conversa_id),
+                    conversa_id, ao_concluir=ao_concluir
+                )
+
             if api_key.startswith("AIza"):  # Gemini
-                resposta = chamar_gemini_with_retry(pergunta, api_key, contexto, cnpj)
-            elif api_key.startswith("gsk_"):  # Grok
-                resposta = chamar_grok_with_retry(pergunta, api_key, contexto, cnpj)
-            else:
-                return jsonify({"erro": "Chave de API inválida."}), 400
+                resposta = chamar_gemini_with_retry(pergunta, api_key, contexto, cnpj, conversa_id=conversa_id)
+            else:  # Grok
+                resposta = chamar_grok_with_retry(pergunta, api_key, contexto, cnpj, conversa_id=conversa_id)
+
+            if usar_cache and not resposta.startswith(("⚠️ Erro", "Erro")):
+                answer_cache.guardar(cnpj, contexto_hash, pergunta, resposta)
 
-            return jsonify({"resposta": resposta}), 200
+            return jsonify({"resposta": resposta, "conversaId": conversa_id}), 200
 
         except Exception as e:
             print(f"DEBUG ERRO IA: {e}")
@@ -144,21 +148,48 @@ def chat_ia():
 
     except Exception as e:
         print(f"DEBUG ERRO GERAL: {e}")
-        if 'db' in locals():
-            db.close()
         return jsonify({"erro": f"Erro ao acessar dados: {str(e)}"}), 500
 
 
-# 🔹 Função auxiliar - Gemini com retry e MEMÓRIA DE CHAT
-def chamar_gemini_with_retry(pergunta, api_key, contexto, user_cnpj, max_retries=3):
-    """
-    Processa pergunta usando Gemini com memória persistente de conversa.
-    Mantém histórico separado por usuário (CNPJ).
-    """
-    from services.chat_manager import chat_manager
-    
-    # System instruction (personalidade do agente)
-    system_instruction = f"""Você é um contador estrategista experiente e amigável, especializado em orientar empresas brasileiras sobre tributação, compliance fiscal e planejamento tributário. Seu objetivo é educar, contextualizar e apoiar o cliente na tomada de decisões inteligentes.
+# 🔹 Etapas do contexto (rodam no pool de services/chat_context, cada uma com sua sessão)
+def _contexto_usuario(cnpj):
+    db = SessionLocal()
+    try:
+        return contexto_usuario(db, cnpj)
+    finally:
+        db.close()
+
+
+def _contexto_notas(cnpj, pergunta, filter_tipo=None):
+    db = SessionLocal()
+    try:
+        return recuperar_contexto(db, cnpj, pergunta, filter_tipo)
+    finally:
+        db.close()
+
+
+def _busca_web(pergunta, tavily_key):
+    """Trechos da busca Tavily sobre a pergunta (legislação, alíquotas...), via cache (services/web_search)."""
+    contexto_web = ""
+    try:
+        resultados = web_search_cache.buscar(f"Brasil fiscal tributário {pergunta}", tavily_key, max_results=3)
+        
+        if resultados:
+            contexto_web = "\n\n=== INFORMAÇÕES ATUALIZADAS DA WEB ===\n"
+            for idx, result in enumerate(resultados, 1):
+                contexto_web += f"{idx}. {result.get('title', 'Sem título')}\n"
+                contexto_web += f"   {result.get('content', 'Sem conteúdo')[:300]}...\n"
+                contexto_web += f"   Fonte: {result.get('url', 'N/A')}\n\n"
+            print(f"DEBUG BUSCA WEB: {len(resultados)} resultados encontrados")
+    except Exception as e:
+        print(f"DEBUG ERRO BUSCA WEB: {e}")
+        contexto_web = "\n\n[Busca web falhou, usando apenas dados locais]\n"
+    return contexto_web
+
+
+# 🔹 Personalidade do agente (system prompt comum ao Gemini e ao Grok)
+def _instrucao_sistema(user_cnpj):
+    return f"""Você é um contador estrategista experiente e amigável, especializado em orientar empresas brasileiras sobre tributação, compliance fiscal e planejamento tributário. Seu objetivo é educar, contextualizar e apoiar o cliente na tomada de decisões inteligentes.
 
 🎯 ESTILO DE COMUNICAÇÃO:
 - Seja conversacional, caloroso e acessível (como um consultor que conhece o cliente pessoalmente)
@@ -189,6 +220,19 @@ def chamar_gemini_with_retry(pergunta, api_key, contexto, user_cnpj, max_retries
 5. **Resumo executivo** (bullet points ou frase conclusiva)
 
 Use tabelas Markdown apenas para dados complexos que ganhem clareza visual. Para respostas simples, prefira texto corrido e estruturado."""
+
+
+# 🔹 Função auxiliar - Gemini com retry e MEMÓRIA DE CHAT
+def chamar_gemini_with_retry(pergunta, api_key, contexto, user_cnpj, max_retries=3, conversa_id=None):
+    """
+    Processa pergunta usando Gemini com memória persistente de conversa.
+    Mantém histórico separado por usuário (CNPJ) e conversa; a troca é gravada no
+    banco pra que outro worker (ou o próximo restart) continue de onde parou.
+    """
+    from services.chat_manager import chat_manager
+    
+    # System instruction (personalidade do agente)
+    system_instruction = _instrucao_sistema(user_cnpj)
     
     for attempt in range(max_retries):
         try:
@@ -197,20 +241,17 @@ Use tabelas Markdown apenas para dados complexos que ganhem clareza visual. Para
                 cnpj=user_cnpj,
                 api_key=api_key,
                 modelo="gemini-2.0-flash-exp",
-                system_instruction=system_instruction
+                system_instruction=system_instruction,
+                conversa_id=conversa_id
             )
             
             # Montar mensagem com contexto das notas
-            message = f"""📂 DADOS DISPONÍVEIS:
-{contexto}
-
-❓ PERGUNTA DO CLIENTE:
-{pergunta}
-
-💬 SUA RESPOSTA (como contador estrategista):"""
+            message = montar_mensagem(contexto, pergunta)
             
             # Enviar mensagem e obter resposta (com memória automática)
             response = agent.send_message(message)
+            if conversa_id and agent.last_error is None:
+                chat_manager.record_turn(user_cnpj, api_key, conversa_id, pergunta, response)
             
             # Log para debug
             summary = agent.get_conversation_summary()
@@ -225,64 +266,79 @@ Use tabelas Markdown apenas para dados complexos que ganhem clareza visual. Para
             raise e
 
 
-# 🔹 Função auxiliar - Grok com retry
-def chamar_grok_with_retry(pergunta, api_key, contexto, user_cnpj, max_retries=3):
-    url = "https://api.x.ai/v1/chat/completions"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {api_key}"
-    }
-    system_prompt = f"""Você é um contador estrategista experiente e amigável, especializado em orientar empresas brasileiras sobre tributação, compliance fiscal e planejamento tributário. Seu objetivo é educar, contextualizar e apoiar o cliente na tomada de decisões inteligentes.
+# 🔹 Função auxiliar - Gemini em streaming (mesma memória de chamar_gemini_with_retry)
+def chamar_gemini_stream(pergunta, api_key, contexto, user_cnpj, conversa_id=None):
+    """
+    Gera a resposta do Gemini em trechos. A troca só é gravada no banco quando o
+    stream termina sem erro.
+    """
+    from services.chat_manager import chat_manager
+    
+    agent = chat_manager.get_agent(
+        cnpj=user_cnpj,
+        api_key=api_key,
+        modelo="gemini-2.0-flash-exp",
+        system_instruction=_instrucao_sistema(user_cnpj),
+        conversa_id=conversa_id
+    )
+    
+    partes = []
+    for trecho in agent.send_message_stream(montar_mensagem(contexto, pergunta)):
+        partes.append(trecho)
+        yield trecho
+    
+    if conversa_id and agent.last_error is None:
+        chat_manager.record_turn(user_cnpj, api_key, conversa_id, pergunta, "".join(partes).strip())
+    print(f"DEBUG CHAT MEMORY: {agent.get_conversation_summary()}")
 
-🎯 ESTILO DE COMUNICAÇÃO:
-- Seja conversacional, caloroso e acessível (como um consultor que conhece o cliente pessoalmente)
-- Explique o "porquê" por trás dos números (não apenas liste dados)
-- Use analogias práticas quando relevante
-- Destaque oportunidades de otimização fiscal e alertas de conformidade
-- Termine respostas complexas com um resumo executivo ("Em resumo...")
-- Seja proativo: sugira próximos passos ou análises complementares quando apropriado
-- Use emojis ocasionalmente para tornar a conversa mais leve (📊 💡 ⚠️ ✅)
 
-🔍 METODOLOGIA DE ANÁLISE:
-- Classifique operações por tipo_operacao: 'Saída' (quando emitente={user_cnpj}), 'Entrada' (quando destinatário={user_cnpj})
-- Ignore natureza_operacao para classificação de entrada/saída
-- Analise impostos item por item dentro de cada nota (icms_valor, ipi_valor, pis_valor, cofins_valor individuais)
-- Agregue valores quando necessário (totais cross-itens e cross-notas)
-- Relacione os dados com o regime tributário do cliente para insights relevantes
-- **IMPORTANTE: O RBT12 (Receita Bruta dos últimos 12 meses) está sempre disponível no contexto**
-  - Use o RBT12 para calcular faixas do Simples Nacional (se aplicável)
-  - Considere o RBT12 para análises de planejamento tributário
-  - Alerte se o RBT12 está próximo dos limites de faixa ou regime
-  - Compare faturamento mensal/notas com o RBT12 para insights de sazonalidade
+# 🔹 Função auxiliar - Grok com retry
+GROK_URL = "https://api.x.ai/v1/chat/completions"
 
-📋 ESTRUTURA DE RESPOSTA:
-1. **Contexto/Introdução** (1-2 frases situando a pergunta)
-2. **Análise detalhada** (com números, breakdown e explicações)
-3. **Interpretação estratégica** (o que isso significa para o negócio?)
-4. **Recomendações práticas** (se aplicável)
-5. **Resumo executivo** (bullet points ou frase conclusiva)
 
-Use tabelas Markdown apenas para dados complexos que ganhem clareza visual. Para respostas simples, prefira texto corrido e estruturado.
+def _corpo_grok(pergunta, contexto, user_cnpj, conversa_id=None):
+    """Corpo da requisição ao Grok: system prompt com os dados + últimas trocas + pergunta."""
+    system_prompt = f"""{_instrucao_sistema(user_cnpj)}
 
 📂 DADOS DISPONÍVEIS:
 {contexto}"""
-    body = {
+    # Últimas trocas da conversa persistida (o Grok não guarda estado entre chamadas)
+    historico = []
+    if conversa_id:
+        historico = [
+            {"role": "assistant" if troca["role"] == "model" else "user", "content": troca["parts"][0]}
+            for troca in obter_store().ultimas_trocas(user_cnpj, conversa_id, HISTORY_TURNS)
+        ]
+    return {
         "model": "grok-beta",
         "messages": [
             {"role": "system", "content": system_prompt},
+            *historico,
             {"role": "user", "content": pergunta}
         ]
     }
 
+
+def chamar_grok_with_retry(pergunta, api_key, contexto, user_cnpj, max_retries=3, conversa_id=None):
+    url = GROK_URL
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {api_key}"
+    }
+    body = _corpo_grok(pergunta, contexto, user_cnpj, conversa_id)
+
     for attempt in range(max_retries):
         try:
             response = requests.post(url, headers=headers, json=body)
             if response.status_code == 200:
                 data = response.json()
                 try:
-                    return data["choices"][0]["message"]["content"]
+                    resposta = data["choices"][0]["message"]["content"]
                 except Exception:
                     return "Erro ao interpretar resposta."
+                if conversa_id:
+                    obter_store().adicionar_troca(user_cnpj, conversa_id, pergunta, resposta)
+                return resposta
             else:
                 if response.status_code == 503 and attempt < max_retries - 1:
                     time.sleep(2 ** attempt)
@@ -295,6 +351,81 @@ Use tabelas Markdown apenas para dados complexos que ganhem clareza visual. Para
             return f"Erro ao chamar Grok: {str(e)}"
 
 
+# 🔹 Função auxiliar - Grok em streaming (SSE da API, formato OpenAI)
+def chamar_grok_stream(pergunta, api_key, contexto, user_cnpj, conversa_id=None):
+    """Gera a resposta do Grok em trechos; grava a troca quando o stream termina."""
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {api_key}"
+    }
+    body = {**_corpo_grok(pergunta, contexto, user_cnpj, conversa_id), "stream": True}
+    
+    try:
+        with requests.post(GROK_URL, headers=headers, json=body, stream=True, timeout=120) as response:
+            if response.status_code != 200:
+                yield f"Erro Grok: {response.status_code} → {response.text}"
+                return
+            partes = []
+            for linha in response.iter_lines(decode_unicode=True):
+                if not linha or not linha.startswith("data:"):
+                    continue
+                dados = linha[len("data:"):].strip()
+                if dados == "[DONE]":
+                    break
+                try:
+                    trecho = json.loads(dados)["choices"][0]["delta"].get("content")
+                except (ValueError, KeyError, IndexError):
+                    continue
+                if trecho:
+                    partes.append(trecho)
+                    yield trecho
+    except Exception as e:
+        yield f"Erro ao chamar Grok: {str(e)}"
+        return
+    
+    if conversa_id and partes:
+        obter_store().adicionar_troca(user_cnpj, conversa_id, pergunta, "".join(partes))
+
+
+def _evento_sse(dados, evento=None):
+    prefixo = f"event: {evento}\n" if evento else ""
+    return f"{prefixo}data: {json.dumps(dados, ensure_ascii=False)}\n\n"
+
+
+def _resposta_sse(trechos, conversa_id, ao_concluir=None, cache=None):
+    """
+    Resposta text/event-stream do chat. Eventos, em ordem:
+      meta  -> {"conversaId", "cache"} (antes de chamar a IA)
+      (sem nome) -> {"delta": trecho} a cada pedaço da resposta
+      done  -> {"conversaId", "ttft_ms", "total_ms"} ou error -> {"erro"}
+    ao_concluir(resposta_completa) roda no fim do stream (ex.: gravar no cache).
+    """
+    def gerar():
+        inicio = time.perf_counter()
+        ttft_ms = None
+        partes = []
+        yield _evento_sse({"conversaId": conversa_id, "cache": cache}, "meta")
+        try:
+            for trecho in trechos:
+                if ttft_ms is None:
+                    ttft_ms = round((time.perf_counter() - inicio) * 1000)
+                partes.append(trecho)
+                yield _evento_sse({"delta": trecho})
+            if ao_concluir:
+                ao_concluir("".join(partes))
+            total_ms = round((time.perf_counter() - inicio) * 1000)
+            logging.debug(f"CHAT STREAM: ttft={ttft_ms}ms total={total_ms}ms")
+            yield _evento_sse({"conversaId": conversa_id, "ttft_ms": ttft_ms, "total_ms": total_ms}, "done")
+        except Exception as e:
+            logging.error(f"ERRO STREAM: {e}")
+            yield _evento_sse({"erro": f"Erro ao processar IA: {str(e)}"}, "error")
+
+    return Response(gerar(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"  # Sem buffer em proxies (nginx), pra o trecho chegar na hora
+    })
+
+
 # 🔹 Endpoint para limpar histórico de chat
 @chat_bp.route("/chat/clear", methods=["POST"])
 def clear_chat_history():
@@ -304,6 +435,7 @@ def clear_chat_history():
     """
     data = request.get_json()
     api_key = data.get("apiKey")
+    conversa_id = data.get("conversaId")  # Se informado, a conversa também é apagada do banco
     
     if not api_key:
         return jsonify({"erro": "Chave da API não fornecida."}), 400
@@ -314,7 +446,7 @@ def clear_chat_history():
     
     try:
         from services.chat_manager import chat_manager
-        chat_manager.clear_session(cnpj, api_key)
+        chat_manager.clear_session(cnpj, api_key, conversa_id)
         return jsonify({"mensagem": "✅ Histórico de chat limpo com sucesso."}), 200
     except Exception as e:
         return jsonify({"erro": f"Erro ao limpar histórico: {str(e)}"}), 500
@@ -337,7 +469,7 @@ def get_chat_stats():
     
     try:
         from services.chat_manager import chat_manager
-        summary = chat_manager.get_session_summary(cnpj, api_key)
+        summary = chat_manager.get_session_summary(cnpj, api_key, request.args.get("conversaId"))
         
         if summary:
             return jsonify(summary), 200
@@ -349,4 +481,57 @@ def get_chat_stats():
                 "model_messages": 0
             }), 200
     except Exception as e:
-        return jsonify({"erro": f"Erro ao obter estatísticas: {str(e)}"}), 500
\ No newline at end of file
+        return jsonify({"erro": f"Erro ao obter estatísticas: {str(e)}"}), 500
+
+
+# 🔹 Endpoint com métricas do gerenciador de sessões (deste worker)
+@chat_bp.route("/chat/metrics", methods=["GET"])
+def get_chat_metrics():
+    """
+    Retorna métricas das sessões de chat em memória: ativas, criadas, removidas
+    (LRU, inatividade, manualmente), tamanho estimado dos históricos, cache de respostas
+    e cache da busca web.
+    """
+    if not session.get("cnpj"):
+        return jsonify({"erro": "Não autorizado. Faça login."}), 401
+    
+    from services.chat_manager import chat_manager
+    return jsonify({**chat_manager.get_metrics(), "answer_cache": answer_cache.metricas(),
+                    "web_search_cache": web_search_cache.get_metrics()}), 200
+
+
+# 🔹 Conversas persistidas do usuário logado
+@chat_bp.route("/conversas", methods=["GET"])
+def listar_conversas():
+    """Lista as conversas do usuário (mais recentes primeiro). Aceita ?limite= (padrão 50)."""
+    cnpj = session.get("cnpj")
+    if not cnpj:
+        return jsonify({"erro": "Não autorizado. Faça login."}), 401
+    
+    limite = min(max(request.args.get("limite", 50, type=int), 1), 200)
+    return jsonify({"conversas": obter_store().listar_conversas(cnpj, limite)}), 200
+
+
+@chat_bp.route("/conversas/<conversa_id>", methods=["GET"])
+def carregar_conversa(conversa_id):
+    """Retorna a conversa com as mensagens em ordem cronológica (?limite= traz só as últimas)."""
+    cnpj = session.get("cnpj")
+    if not cnpj:
+        return jsonify({"erro": "Não autorizado. Faça login."}), 401
+    
+    conversa = obter_store().carregar_conversa(cnpj, conversa_id, request.args.get("limite", type=int))
+    if not conversa:
+        return jsonify({"erro": "Conversa não encontrada."}), 404
+    return jsonify(conversa), 200
+
+
+@chat_bp.route("/conversas/<conversa_id>", methods=["DELETE"])
+def apagar_conversa(conversa_id):
+    """Apaga a conversa e suas mensagens."""
+    cnpj = session.get("cnpj")
+    if not cnpj:
+        return jsonify({"erro": "Não autorizado. Faça login."}), 401
+    
+    if not obter_store().remover_conversa(cnpj, conversa_id):
+        return jsonify({"erro": "Conversa não encontrada."}), 404
+    return jsonify({"mensagem": "✅ Conversa apagada."}), 200
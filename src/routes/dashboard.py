@@ -1,17 +1,133 @@
 # src/routes/dashboard.py
-from flask import Blueprint, jsonify, session
-from sqlalchemy import func
+from datetime import timedelta
+from flask import Blueprint, jsonify, request, session
+from sqlalchemy import func, select, literal, union_all
 from database.connection import SessionLocal
 from models.nota_fiscal import NotaFiscal, ItemNota
 from models.usuario import Usuario
+from models.resumo_fiscal import ResumoMensal, ResumoCliente
+from utils.helpers import converter_data
+from services.rbt12 import mes_referencia, somar_meses, historico_rbt12
+from services.response_cache import cache_por_cnpj
 
 dashboard_bp = Blueprint("dashboard_bp", __name__)
 
+
+def _data_parametro(parametro):
+    """Lê ?de=/?ate= (YYYY-MM-DD). None se ausente; ValueError se inválido."""
+    valor = request.args.get(parametro)
+    if not valor:
+        return None
+    data = converter_data(valor)
+    if data is None:
+        raise ValueError(f"Parâmetro '{parametro}' inválido (use YYYY-MM-DD).")
+    return data
+
+
+def _filtro_periodo(query, coluna):
+    """
+    Aplica ?de=YYYY-MM-DD&ate=YYYY-MM-DD (inclusivos) na coluna de data.
+    Levanta ValueError se alguma data vier em formato inválido.
+    """
+    de, ate = _data_parametro("de"), _data_parametro("ate")
+    if de:
+        query = query.filter(coluna >= de)
+    if ate:
+        query = query.filter(coluna <= ate)
+    return query
+
+
+def _periodo_em_meses():
+    """
+    Quando ?de=&ate= cobrem meses inteiros (ou não foram informados), retorna os
+    limites como (mes_de, mes_ate) em 'YYYY-MM' (None = sem limite), e o resumo
+    mensal pode responder. Retorna None se algum limite cair no meio de um mês.
+    """
+    de, ate = _data_parametro("de"), _data_parametro("ate")
+    if de and de.day != 1:
+        return None
+    if ate and (ate + timedelta(days=1)).day != 1:
+        return None
+    return (de.strftime("%Y-%m") if de else None, ate.strftime("%Y-%m") if ate else None)
+
+
+def _filtro_meses(modelo, mes_de, mes_ate):
+    filtros = []
+    if mes_de:
+        filtros.append(modelo.ano_mes >= mes_de)
+    if mes_ate:
+        filtros.append(modelo.ano_mes <= mes_ate)
+    return filtros
+
+
+def _metricas_do_resumo(db, cnpj, mes_de, mes_ate):
+    """Totais e série mensal de vendas lidos do resumo_mensal (custo por mês, não por nota)."""
+    filtros_vendas = lambda modelo: [
+        modelo.cnpj == cnpj, modelo.papel == "emitente", modelo.tipo_operacao == "Saída",
+        *_filtro_meses(modelo, mes_de, mes_ate)
+    ]
+    meses = db.query(
+        ResumoMensal.ano_mes, ResumoMensal.faturamento, ResumoMensal.num_notas, ResumoMensal.num_clientes
+    ).filter(*filtros_vendas(ResumoMensal)).order_by(ResumoMensal.ano_mes).all()
+
+    # Clientes distintos no período todo (não dá pra somar os distintos de cada mês)
+    num_clientes = db.query(func.count(func.distinct(ResumoCliente.cnpj_cliente)))\
+        .filter(*filtros_vendas(ResumoCliente)).scalar()
+
+    total = {
+        "faturamento": sum(float(mes.faturamento or 0) for mes in meses),
+        "num_notas": sum(mes.num_notas or 0 for mes in meses),
+        "num_clientes": num_clientes or 0
+    }
+    serie = [
+        {"mes": mes.ano_mes, "faturamento": mes.faturamento, "num_notas": mes.num_notas, "num_clientes": mes.num_clientes}
+        for mes in meses if mes.ano_mes
+    ]
+    return total, serie
+
+
+def _metricas_das_notas(db, cnpj, com_serie):
+    """
+    Totais e série mensal de vendas direto de notas_fiscais, pra períodos que não
+    fecham meses inteiros. Uma única query agregada (UNION ALL com a série).
+
+    num_notas conta linhas de notas_fiscais, a mesma definição do resumo_mensal: o
+    upload já descarta duplicadas, e notas de séries diferentes com o mesmo número são
+    notas distintas (antes, COUNT(DISTINCT numero) as juntava só neste caminho).
+    """
+    metricas = (
+        func.coalesce(func.sum(NotaFiscal.valor_total_nota), 0).label("faturamento"),
+        func.count(NotaFiscal.id).label("num_notas"),
+        # Clientes únicos (CNPJs destinatários diferentes, ignorando vazios)
+        func.count(func.distinct(func.nullif(NotaFiscal.cnpj_destinatario, ""))).label("num_clientes"),
+    )
+
+    def vendas(query):
+        # Notas de saída (vendas) onde o usuário é o emitente
+        query = query.where(NotaFiscal.cnpj_emitente == cnpj, NotaFiscal.tipo_operacao == 'Saída')
+        return _filtro_periodo(query, NotaFiscal.data_emissao)
+
+    consulta = vendas(select(literal("total").label("mes"), *metricas))
+    if com_serie:
+        mes = func.coalesce(func.strftime("%Y-%m", NotaFiscal.data_emissao), "").label("mes")
+        consulta = union_all(consulta, vendas(select(mes, *metricas)).group_by(mes))
+
+    linhas = [dict(linha._mapping) for linha in db.execute(consulta)]
+    total = next(linha for linha in linhas if linha["mes"] == "total")
+    serie = sorted((linha for linha in linhas if linha["mes"] not in ("total", "")), key=lambda linha: linha["mes"])
+    return total, serie
+
+
 @dashboard_bp.route("/dashboard_metrics", methods=["GET"])
+@cache_por_cnpj()
 def get_dashboard_metrics():
     """
     Retorna métricas do dashboard: faturamento, número de notas, ticket médio e clientes únicos.
     Baseado nas notas de VENDA (tipo_operacao='Saída') do usuário logado.
+
+    Aceita ?de=&ate= (YYYY-MM-DD) e ?serie=mensal, que adiciona 'serie_mensal' com as
+    mesmas métricas por mês. Sem filtro, ou com filtro de meses inteiros, lê do resumo
+    mensal materializado; senão agrega as notas numa única query.
     """
     cnpj = session.get("cnpj")
     if not cnpj:
@@ -19,127 +135,201 @@ def get_dashboard_metrics():
 
     db = SessionLocal()
     try:
-        # Buscar notas de saída (vendas) onde o usuário é o emitente
-        notas_vendas = db.query(NotaFiscal).filter(
-            NotaFiscal.cnpj_emitente == cnpj,
-            NotaFiscal.tipo_operacao == 'Saída'
-        ).all()
-
-        if not notas_vendas:
-            return jsonify({
-                "faturamento_total": 0.0,
-                "num_notas": 0,
-                "ticket_medio": 0.0,
-                "num_clientes": 0
-            }), 200
-
-        # Calcular métricas
-        faturamento_total = sum(float(nota.valor_total_nota or 0) for nota in notas_vendas)
-        num_notas = len(set(nota.numero for nota in notas_vendas))  # Notas únicas
-        ticket_medio = faturamento_total / num_notas if num_notas > 0 else 0.0
-        
-        # Clientes únicos (CNPJs destinatários diferentes)
-        clientes_unicos = set(
-            nota.cnpj_destinatario for nota in notas_vendas 
-            if nota.cnpj_destinatario
-        )
-        num_clientes = len(clientes_unicos)
+        com_serie = request.args.get("serie") == "mensal"
+        meses = _periodo_em_meses()
+        if meses is not None:
+            total, serie = _metricas_do_resumo(db, cnpj, *meses)
+        else:
+            total, serie = _metricas_das_notas(db, cnpj, com_serie)
 
-        return jsonify({
-            "faturamento_total": round(faturamento_total, 2),
-            "num_notas": num_notas,
-            "ticket_medio": round(ticket_medio, 2),
-            "num_clientes": num_clientes
-        }), 200
+        def montar_metricas(linha):
+            faturamento = float(linha["faturamento"] or 0)
+            return {
+                "faturamento_total": round(faturamento, 2),
+                "num_notas": linha["num_notas"],
+                "ticket_medio": round(faturamento / linha["num_notas"], 2) if linha["num_notas"] else 0.0,
+                "num_clientes": linha["num_clientes"]
+            }
+
+        resposta = montar_metricas(total)
+        if com_serie:
+            resposta["serie_mensal"] = [{"mes": linha["mes"], **montar_metricas(linha)} for linha in serie]
+        return jsonify(resposta), 200
 
+    except ValueError as e:
+        return jsonify({"erro": str(e)}), 400
     except Exception as e:
         return jsonify({"erro": f"Erro ao calcular métricas: {str(e)}"}), 500
     finally:
         db.close()
 
 
+POR_PAGINA_PADRAO = 100  # Notas por página em /fiscal_data
+POR_PAGINA_MAX = 500
+
+
+def _totais_fiscais_do_resumo(db, cnpj, mes_de, mes_ate):
+    """(total_notas, icms, pis, cofins) e notas por tipo_operacao, lidos do resumo_mensal."""
+    filtros = [ResumoMensal.cnpj == cnpj, *_filtro_meses(ResumoMensal, mes_de, mes_ate)]
+    totais = db.query(
+        func.coalesce(func.sum(ResumoMensal.num_notas), 0),
+        func.coalesce(func.sum(ResumoMensal.icms), 0.0),
+        func.coalesce(func.sum(ResumoMensal.pis), 0.0),
+        func.coalesce(func.sum(ResumoMensal.cofins), 0.0)
+    ).filter(*filtros).one()
+    por_tipo = dict(
+        db.query(ResumoMensal.tipo_operacao, func.sum(ResumoMensal.num_notas))
+        .filter(*filtros).group_by(ResumoMensal.tipo_operacao).all()
+    )
+    return totais, por_tipo
+
+
 @dashboard_bp.route("/fiscal_data", methods=["GET"])
+@cache_por_cnpj()
 def get_fiscal_data():
     """
     Retorna dados fiscais para o Dashboard Fiscal:
     - classificacao: lista de notas com tipo (Entrada/Saída)
     - impostosPorNota: impostos detalhados por nota fiscal
     - impostosConsolidados: totais consolidados de ICMS, PIS, COFINS
+    - totaisPorTipo: quantidade de notas por tipo_operacao
+    - paginacao: pagina, por_pagina, total_notas, total_paginas
+
+    Aceita ?de=&ate= (YYYY-MM-DD) e ?pagina=&por_pagina=. As listas por nota são
+    paginadas; totais consolidados e por tipo consideram todo o período filtrado.
+    Tudo é agregado no banco (JOIN + GROUP BY ou resumo mensal), sem carregar itens em Python.
     """
     cnpj = session.get("cnpj")
     print(f"[DEBUG fiscal_data] CNPJ da sessão: {cnpj}")
     if not cnpj:
         return jsonify({"erro": "Não autorizado. Faça login."}), 401
 
+    try:
+        pagina = max(int(request.args.get("pagina", 1)), 1)
+        por_pagina = min(max(int(request.args.get("por_pagina", POR_PAGINA_PADRAO)), 1), POR_PAGINA_MAX)
+    except ValueError:
+        return jsonify({"erro": "Parâmetros de paginação inválidos."}), 400
+
     db = SessionLocal()
     try:
-        # Buscar TODAS as notas do usuário: 
+        # TODAS as notas do usuário:
         # - Saídas: onde o usuário é emitente
         # - Entradas: onde o usuário é destinatário
-        notas = db.query(NotaFiscal).filter(
-            (NotaFiscal.cnpj_emitente == cnpj) | (NotaFiscal.cnpj_destinatario == cnpj)
-        ).all()
-
-        if not notas:
-            return jsonify({
-                "classificacao": [],
-                "impostosPorNota": [],
-                "impostosConsolidados": {"ICMS": 0.0, "PIS": 0.0, "COFINS": 0.0}
-            }), 200
-
-        # Classificação: Entrada vs Saída
+        def notas_do_usuario(query):
+            query = query.filter((NotaFiscal.cnpj_emitente == cnpj) | (NotaFiscal.cnpj_destinatario == cnpj))
+            return _filtro_periodo(query, NotaFiscal.data_emissao)
+
+        icms = func.coalesce(func.sum(ItemNota.icms_valor), 0.0)
+        pis = func.coalesce(func.sum(ItemNota.pis_valor), 0.0)
+        cofins = func.coalesce(func.sum(ItemNota.cofins_valor), 0.0)
+
+        # Impostos por nota fiscal (agregando itens): uma query, paginada
+        por_nota = notas_do_usuario(
+            db.query(NotaFiscal.numero, NotaFiscal.tipo_operacao, icms, pis, cofins)
+            .outerjoin(ItemNota, ItemNota.nota_id == NotaFiscal.id)
+        ).group_by(NotaFiscal.id)\
+            .order_by(NotaFiscal.data_emissao.desc(), NotaFiscal.id.desc())\
+            .limit(por_pagina).offset((pagina - 1) * por_pagina).all()
+
+        # Impostos consolidados do período inteiro: do resumo mensal quando o
+        # período fecha meses inteiros, senão agregando as notas
+        meses = _periodo_em_meses()
+        if meses is not None:
+            (total_notas, icms_total, pis_total, cofins_total), totais_por_tipo = _totais_fiscais_do_resumo(db, cnpj, *meses)
+        else:
+            total_notas, icms_total, pis_total, cofins_total = notas_do_usuario(
+                db.query(func.count(func.distinct(NotaFiscal.id)), icms, pis, cofins)
+                .outerjoin(ItemNota, ItemNota.nota_id == NotaFiscal.id)
+            ).one()
+
+            totais_por_tipo = dict(notas_do_usuario(
+                db.query(NotaFiscal.tipo_operacao, func.count(NotaFiscal.id))
+            ).group_by(NotaFiscal.tipo_operacao).all())
+
         classificacao = []
-        for nota in notas:
+        impostos_por_nota = []
+        for numero, tipo, icms_nota, pis_nota, cofins_nota in por_nota:
+            # Classificação: Entrada vs Saída
             classificacao.append({
-                "nota": nota.numero,
-                "tipo": nota.tipo_operacao  # "Entrada" ou "Saída"
+                "nota": numero,
+                "tipo": tipo  # "Entrada" ou "Saída"
             })
-
-        # Impostos por nota fiscal (agregando itens)
-        impostos_por_nota = []
-        icms_total = 0.0
-        pis_total = 0.0
-        cofins_total = 0.0
-
-        for nota in notas:
-            # Buscar itens da nota (usando o relacionamento correto)
-            itens = db.query(ItemNota).filter(ItemNota.nota_id == nota.id).all()
-            
-            # Agregar impostos dos itens (usando os nomes corretos das colunas)
-            icms_nota = sum(float(item.icms_valor or 0) for item in itens)
-            pis_nota = sum(float(item.pis_valor or 0) for item in itens)
-            cofins_nota = sum(float(item.cofins_valor or 0) for item in itens)
-
             impostos_por_nota.append({
-                "nota": nota.numero,
+                "nota": numero,
                 "ICMS": round(icms_nota, 2),
                 "PIS": round(pis_nota, 2),
                 "COFINS": round(cofins_nota, 2)
             })
 
-            # Acumular totais consolidados
-            icms_total += icms_nota
-            pis_total += pis_nota
-            cofins_total += cofins_nota
-
-        # Impostos consolidados
         impostos_consolidados = {
             "ICMS": round(icms_total, 2),
             "PIS": round(pis_total, 2),
             "COFINS": round(cofins_total, 2)
         }
 
-        print(f"[DEBUG fiscal_data] Total de notas encontradas: {len(notas)}")
+        print(f"[DEBUG fiscal_data] Total de notas encontradas: {total_notas}")
         print(f"[DEBUG fiscal_data] Impostos consolidados: {impostos_consolidados}")
 
         return jsonify({
             "classificacao": classificacao,
             "impostosPorNota": impostos_por_nota,
-            "impostosConsolidados": impostos_consolidados
+            "impostosConsolidados": impostos_consolidados,
+            "totaisPorTipo": totais_por_tipo,
+            "paginacao": {
+                "pagina": pagina,
+                "por_pagina": por_pagina,
+                "total_notas": total_notas,
+                "total_paginas": (total_notas + por_pagina - 1) // por_pagina
+            }
         }), 200
 
+    except ValueError as e:
+        return jsonify({"erro": str(e)}), 400
     except Exception as e:
         print(f"[DEBUG fiscal_data] ERRO: {str(e)}")
         return jsonify({"erro": f"Erro ao buscar dados fiscais: {str(e)}"}), 500
     finally:
         db.close()
+
+
+MESES_HISTORICO_MAX = 120  # Limite de meses por consulta em /rbt12/historico
+
+
+def _mes_parametro(parametro, padrao):
+    """Lê um mês 'YYYY-MM' da query string; ValueError se inválido."""
+    valor = request.args.get(parametro) or padrao
+    if converter_data(f"{valor}-01") is None:
+        raise ValueError(f"Parâmetro '{parametro}' inválido (use YYYY-MM).")
+    return valor
+
+
+@dashboard_bp.route("/rbt12/historico", methods=["GET"])
+@cache_por_cnpj()
+def get_historico_rbt12():
+    """
+    Histórico do RBT12 (receita bruta dos 12 meses anteriores) por mês de referência,
+    calculado das notas de saída do usuário via resumo mensal.
+    Aceita ?de=YYYY-MM&ate=YYYY-MM (padrão: os últimos 12 meses até o atual).
+    """
+    cnpj = session.get("cnpj")
+    if not cnpj:
+        return jsonify({"erro": "Não autorizado. Faça login."}), 401
+
+    db = SessionLocal()
+    try:
+        mes_ate = _mes_parametro("ate", mes_referencia())
+        mes_de = _mes_parametro("de", somar_meses(mes_ate, -11))
+        if mes_de > mes_ate:
+            return jsonify({"erro": "'de' deve ser anterior ou igual a 'ate'."}), 400
+        if somar_meses(mes_de, MESES_HISTORICO_MAX) <= mes_ate:
+            return jsonify({"erro": f"Período máximo de {MESES_HISTORICO_MAX} meses."}), 400
+
+        historico = historico_rbt12(db, cnpj, mes_de, mes_ate)
+        return jsonify({"mes_atual": mes_referencia(), "historico": historico}), 200
+
+    except ValueError as e:
+        return jsonify({"erro": str(e)}), 400
+    except Exception as e:
+        return jsonify({"erro": f"Erro ao calcular histórico do RBT12: {str(e)}"}), 500
+    finally:
+        db.close()
@@ -1,15 +1,23 @@
 # src/routes/documents.py
 
 import os
+import uuid
 import json
 import re  # Pra regex stripping e clean CNPJ
 import csv  # Pra ler CSV
 import traceback
 import logging  # Melhor que print para debug
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, session
 from werkzeug.utils import secure_filename
+from sqlalchemy import insert
 from database.connection import SessionLocal
 from models.nota_fiscal import NotaFiscal, ItemNota
+from utils.helpers import converter_decimal, converter_data
+from services.resumo_fiscal import atualizar_resumo
+from services.response_cache import invalidar_cnpj
+from services import answer_cache
+from services.document_jobs import submeter_job, buscar_job, listar_jobs
+from services.registro_ingestao import registro_ingestao
 
 # Configura logging
 logging.basicConfig(level=logging.DEBUG)
@@ -25,14 +33,72 @@ try:
 except Exception:
     extrair_texto_pdf = None
 
-# serviço que chama Gemini/Grok (implementar em services/gemini_service.py)
 try:
-    from services.gemini_service import chamar_gemini
+    from processors.danfe_parser import campos_faltantes, mesclar_campos
 except Exception:
-    chamar_gemini = None
+    campos_faltantes = mesclar_campos = None
+
+from processors.parse_pool import parsear_em_paralelo, ErroParsing
+from processors.arquivo_upload import TEMP_DIR, receber_upload, abrir_texto, descartar
+
+# Extração de PDF pela IA em lotes (Gemini)
+try:
+    from services.extracao_pdf import extrair_em_lote
+except Exception:
+    extrair_em_lote = None
 
 document_bp = Blueprint("document_bp", __name__)
 
+LOTE_IN_SQLITE = 500  # Máx. de parâmetros por IN (...) (limite de variáveis do SQLite)
+STATUS_DUPLICADA = "ignorado: nota duplicada"  # Nota já no banco ou arquivo já importado (mesmo hash)
+
+
+def _campos_nota(dados_nota):
+    """Monta as colunas de NotaFiscal a partir do dict do parser (XML/PDF/CSV)."""
+    return {
+        "numero": str(dados_nota.get("numero", "")).strip(),
+        "data_emissao": converter_data(dados_nota.get("data_emissao")),
+        "cnpj_emitente": str(dados_nota.get("cnpj_emitente", "")).strip(),
+        "nome_emitente": dados_nota.get("nome_emitente", ""),
+        "ie_emitente": dados_nota.get("ie_emitente", ""),
+        "endereco_emitente": dados_nota.get("endereco_emitente", ""),
+        "cnpj_destinatario": dados_nota.get("cnpj_destinatario", ""),
+        "nome_destinatario": dados_nota.get("nome_destinatario", ""),
+        "ie_destinatario": dados_nota.get("ie_destinatario", ""),
+        "endereco_destinatario": dados_nota.get("endereco_destinatario", ""),
+        "chave_nfe": dados_nota.get("chave_nfe", "") or None,  # Sem chave fica NULL (o UNIQUE não se aplica)
+        "natureza_operacao": dados_nota.get("natureza_operacao", ""),
+        "valor_total_nota": converter_decimal(dados_nota.get("valor_total_nota")),
+        "tipo_operacao": dados_nota.get("tipo_operacao", ""),
+        "versao": dados_nota.get("versao", "")
+    }
+
+
+def _campos_item(item_data, nota_id):
+    """Monta as colunas de ItemNota a partir de um item do parser."""
+    return {
+        "nota_id": nota_id,  # FK
+        "codigo_produto": item_data.get("codigo_produto", ""),
+        "descricao_produto": item_data.get("descricao_produto", ""),
+        "ncm": item_data.get("ncm", ""),
+        "cst_ipi": item_data.get("cst_ipi", ""),
+        "cfop": item_data.get("cfop", ""),
+        "unidade": item_data.get("unidade", ""),
+        "quantidade": converter_decimal(item_data.get("quantidade")),
+        "valor_unitario": converter_decimal(item_data.get("valor_unitario")),
+        "valor_total": converter_decimal(item_data.get("valor_total")),
+        "cst_icms": item_data.get("cst_icms", ""),
+        "cst_pis": item_data.get("cst_pis", ""),
+        "cst_cofins": item_data.get("cst_cofins", ""),
+        "cest": item_data.get("cest", ""),
+        # NOVO: Set impostos de item_data (do parser XML/CSV)
+        "icms_valor": float(item_data.get("icms_valor", 0)),
+        "ipi_valor": float(item_data.get("ipi_valor", 0)),
+        "pis_valor": float(item_data.get("pis_valor", 0)),
+        "cofins_valor": float(item_data.get("cofins_valor", 0))
+    }
+
+
 def salvar_nota_no_db(dados_nota):
     """
     Espera um dict com campos da nota e uma lista 'itens'.
@@ -42,69 +108,38 @@ def salvar_nota_no_db(dados_nota):
     session = SessionLocal()
     try:
         # Checagem simples de duplicidade: chave_nfe se fornecida, senão numero+cnpj_emitente+data_emissao
-        chave = dados_nota.get("chave_nfe", "") or ""
-        numero = str(dados_nota.get("numero", "")).strip()
-        cnpj_emitente = str(dados_nota.get("cnpj_emitente", "")).strip()
-        data_emissao = str(dados_nota.get("data_emissao", "")).strip()
+        campos = _campos_nota(dados_nota)
+        chave = campos["chave_nfe"]
+        numero = campos["numero"]
 
         exists = None
         if chave:
             exists = session.query(NotaFiscal).filter_by(chave_nfe=chave).first()
         else:
-            exists = session.query(NotaFiscal).filter_by(numero=numero, cnpj_emitente=cnpj_emitente, data_emissao=data_emissao).first()
+            exists = session.query(NotaFiscal).filter_by(numero=numero, cnpj_emitente=campos["cnpj_emitente"], data_emissao=campos["data_emissao"]).first()
 
         if exists:
             return {"ok": False, "reason": "duplicado"}
 
-        nota = NotaFiscal(
-            numero=numero,
-            data_emissao=data_emissao,
-            cnpj_emitente=cnpj_emitente,
-            nome_emitente=dados_nota.get("nome_emitente", ""),
-            ie_emitente=dados_nota.get("ie_emitente", ""),
-            endereco_emitente=dados_nota.get("endereco_emitente", ""),
-            cnpj_destinatario=dados_nota.get("cnpj_destinatario", ""),
-            nome_destinatario=dados_nota.get("nome_destinatario", ""),
-            ie_destinatario=dados_nota.get("ie_destinatario", ""),
-            endereco_destinatario=dados_nota.get("endereco_destinatario", ""),
-            chave_nfe=chave,
-            natureza_operacao=dados_nota.get("natureza_operacao", ""),
-            valor_total_nota=str(dados_nota.get("valor_total_nota", "")),
-            tipo_operacao=dados_nota.get("tipo_operacao", ""),
-            versao=dados_nota.get("versao", "")
-        )
+        nota = NotaFiscal(**campos)
 
         session.add(nota)
         session.flush()  # Pega o ID da nota antes de commit
 
         # Salva itens se existirem
         itens = dados_nota.get("itens", [])
-        for item_data in itens:
-            item = ItemNota(
-                nota_id=nota.id,  # FK
-                codigo_produto=item_data.get("codigo_produto", ""),
-                descricao_produto=item_data.get("descricao_produto", ""),
-                ncm=item_data.get("ncm", ""),
-                cst_ipi=item_data.get("cst_ipi", ""),
-                cfop=item_data.get("cfop", ""),
-                unidade=item_data.get("unidade", ""),
-                quantidade=str(item_data.get("quantidade", "")),
-                valor_unitario=str(item_data.get("valor_unitario", "")),
-                valor_total=str(item_data.get("valor_total", "")),
-                cst_icms=item_data.get("cst_icms", ""),
-                cst_pis=item_data.get("cst_pis", ""),
-                cst_cofins=item_data.get("cst_cofins", ""),
-                cest=item_data.get("cest", ""),
-                # NOVO: Set impostos de item_data (do parser XML/CSV)
-                icms_valor=float(item_data.get("icms_valor", 0)),
-                ipi_valor=float(item_data.get("ipi_valor", 0)),
-                pis_valor=float(item_data.get("pis_valor", 0)),
-                cofins_valor=float(item_data.get("cofins_valor", 0))
-            )
+        linhas_itens = [_campos_item(item_data, nota.id) for item_data in itens]
+        for linha in linhas_itens:
+            item = ItemNota(**linha)
             session.add(item)
             logging.debug(f"ITEM SALVO: {item.descricao_produto} - ICMS R${item.icms_valor:.2f}, IPI R${item.ipi_valor:.2f}")
 
+        # Resumo mensal na mesma transação da nota
+        atualizar_resumo(session, [(campos, linhas_itens)])
+
         session.commit()
+        invalidar_cnpj(campos["cnpj_emitente"], campos["cnpj_destinatario"])
+        answer_cache.invalidar_cnpj(campos["cnpj_emitente"], campos["cnpj_destinatario"])
         logging.debug(f"NOTA SALVA: {numero} - Total R${nota.valor_total_nota}, {len(itens)} itens")
         return {"ok": True}
 
@@ -115,6 +150,86 @@ def salvar_nota_no_db(dados_nota):
     finally:
         session.close()
 
+
+def salvar_notas_em_lote(lista_dados):
+    """
+    Salva várias notas (mesmo formato de salvar_nota_no_db) numa única transação.
+    Duplicidade é checada com um só IN (...) por chave_nfe (e dentro do próprio lote);
+    notas e itens entram por insert em massa. Retorna uma lista de resultados
+    {"ok": ..., "reason": ...} na mesma ordem de lista_dados.
+
+    Se o lote falhar no banco, cai para salvar_nota_no_db nota a nota, pra que o
+    erro fique restrito à nota problemática.
+    """
+    resultados = [None] * len(lista_dados)
+    novas = []  # (indice, campos da nota, itens)
+
+    session = SessionLocal()
+    try:
+        chaves = list({(d.get("chave_nfe", "") or "") for d in lista_dados} - {""})
+        existentes = set()
+        for i in range(0, len(chaves), LOTE_IN_SQLITE):
+            existentes.update(
+                chave for (chave,) in session.query(NotaFiscal.chave_nfe)
+                .filter(NotaFiscal.chave_nfe.in_(chaves[i:i + LOTE_IN_SQLITE]))
+            )
+
+        vistas = set()  # Identificadores já aceitos neste lote
+        for idx, dados_nota in enumerate(lista_dados):
+            campos = _campos_nota(dados_nota)
+            chave = campos["chave_nfe"]
+            if chave:
+                identificador = chave
+                duplicada = chave in existentes
+            else:
+                # Sem chave (ex.: fallback de PDF): mesma regra de salvar_nota_no_db
+                identificador = (campos["numero"], campos["cnpj_emitente"], campos["data_emissao"])
+                duplicada = session.query(NotaFiscal.id).filter_by(
+                    numero=campos["numero"], cnpj_emitente=campos["cnpj_emitente"], data_emissao=campos["data_emissao"]
+                ).first() is not None
+
+            if duplicada or identificador in vistas:
+                resultados[idx] = {"ok": False, "reason": "duplicado"}
+                continue
+            vistas.add(identificador)
+            novas.append((idx, campos, dados_nota.get("itens", []) or []))
+
+        if novas:
+            ids = session.scalars(
+                insert(NotaFiscal).returning(NotaFiscal.id, sort_by_parameter_order=True),
+                [campos for _, campos, _ in novas]
+            ).all()
+            itens_por_nota = [
+                [_campos_item(item_data, nota_id) for item_data in itens]
+                for (_, _, itens), nota_id in zip(novas, ids)
+            ]
+            linhas_itens = [linha for linhas in itens_por_nota for linha in linhas]
+            if linhas_itens:
+                session.execute(insert(ItemNota), linhas_itens)
+
+            # Resumo mensal na mesma transação do lote
+            atualizar_resumo(session, [(campos, linhas) for (_, campos, _), linhas in zip(novas, itens_por_nota)])
+
+        session.commit()
+        afetados = [c for _, campos, _ in novas for c in (campos["cnpj_emitente"], campos["cnpj_destinatario"])]
+        invalidar_cnpj(*afetados)
+        answer_cache.invalidar_cnpj(*afetados)
+        for idx, _, _ in novas:
+            resultados[idx] = {"ok": True}
+        logging.debug(f"LOTE SALVO: {len(novas)} notas novas, {len(lista_dados) - len(novas)} duplicadas")
+        return resultados
+
+    except Exception as e:
+        session.rollback()
+        logging.error(f"ERRO SALVAR LOTE: {e} - salvando nota a nota")
+    finally:
+        session.close()
+
+    for idx, res in enumerate(resultados):
+        if res is None:  # Duplicadas já marcadas continuam como estão
+            resultados[idx] = salvar_nota_no_db(lista_dados[idx])
+    return resultados
+
 def calcular_tipo_operacao(dados, user_cnpj):
     """
     Calcula tipo_operacao baseado em user_cnpj vs cnpj_emitente/destinatario.
@@ -129,254 +244,388 @@ def calcular_tipo_operacao(dados, user_cnpj):
             return "Desconhecida"
     return dados.get("tipo_operacao", "")  # Fallback se já setado ou desconhecido
 
-@document_bp.route("/process-documents", methods=["POST"])
-def process_documents():
-    resultados = []
-    uploaded_files = request.files.getlist("files")
-    api_key = request.form.get("api_key", "")
-    user_cnpj = request.form.get("user_cnpj", "")  # NOVO: Pegue do form se disponível (ex.: de auth)
-    modelo = "gemini-2.5-flash"  # CORRIGIDO: Use versão válida; mude se for intencional 2.5
+def _enfileirar_nota(resultados, pendentes, resultado, dados, status_ok, prefixo_erro):
+    """
+    Reserva a posição do resultado (mantém a ordem dos arquivos) e guarda a nota
+    pra ser salva no lote; o status é preenchido por _salvar_pendentes.
+    """
+    resultados.append(resultado)
+    pendentes.append((resultado, dados, status_ok, prefixo_erro))
+
+
+def _salvar_pendentes(pendentes):
+    """Salva as notas enfileiradas numa única transação e preenche o status de cada uma."""
+    if not pendentes:
+        return
+    salvos = salvar_notas_em_lote([dados for _, dados, _, _ in pendentes])
+    for (resultado, _, status_ok, prefixo_erro), save_res in zip(pendentes, salvos):
+        if save_res.get("ok"):
+            resultado["status"] = status_ok
+        elif save_res.get("reason") == "duplicado":
+            resultado["status"] = STATUS_DUPLICADA
+        else:
+            resultado["status"] = f"{prefixo_erro}: {save_res.get('reason')}"
+
+
+def _tipo_parse(filename):
+    """Tipo repassado ao pool de parsing ('xml'/'pdf'); CSV e demais ficam no fluxo principal."""
+    nome = (filename or "").lower()
+    if nome.endswith('.xml'):
+        return "xml"
+    if nome.endswith('.pdf'):
+        return "pdf"
+    return None
+
+
+def _fallback_pdf(texto, danfe):
+    """Parse manual simples do texto raw (quando a IA falha), completado pelo que o parser do DANFE achou."""
+    dados_fallback = {}
+    match_num = re.search(r'Nº\s*(\d+)', texto)
+    dados_fallback["numero"] = match_num.group(1) if match_num else None
+    match_data = re.search(r'EMISSÃO:\s*(\d{2}/\d{2}/\d{4})', texto)
+    dados_fallback["data_emissao"] = match_data.group(1).replace('/', '-') if match_data else None
+    match_valor = re.search(r'VALOR TOTAL:\s*R\$\s*([\d.,]+)', texto)
+    dados_fallback["valor_total_nota"] = float(match_valor.group(1).replace('.', '').replace(',', '.')) if match_valor else None
+    match_cnpj_emit = re.search(r'CNPJ\s*([\d/.-]+)', texto)  # Ajuste se múltiplos
+    dados_fallback["cnpj_emitente"] = re.sub(r'[^\d]', '', match_cnpj_emit.group(1)) if match_cnpj_emit else None
+    dados_fallback["itens"] = []  # Sem itens no fallback
+    return mesclar_campos(danfe, dados_fallback)  # O que o parser do DANFE achou vale mais que a regex
+
+
+def _extrair_pdfs_com_ia(extracoes, api_key, modelo, user_cnpj, pendentes):
+    """
+    Manda à IA, em lotes (services/extracao_pdf.py), os PDFs que o parser do DANFE não
+    resolveu e enfileira as notas em pendentes. Documento que falhar em todas as
+    tentativas cai no fallback por regex.
+    """
+    if not extracoes:
+        return
+    tudo = campos_faltantes(None)
+    extraidos = extrair_em_lote(
+        [(texto, None if faltando == tudo else faltando) for _, _, texto, faltando in extracoes],
+        api_key, modelo
+    )
+    for (resultado, danfe, texto, faltando), dados in zip(extracoes, extraidos):
+        filename = resultado["arquivo"]
+        if dados is not None:
+            dados = mesclar_campos(danfe, dados)
+            # NOVO: Calcular tipo_operacao baseado em user_cnpj
+            dados["tipo_operacao"] = calcular_tipo_operacao(dados, user_cnpj)
+            logging.debug(f"JSON PARSED PDF ({filename}): {json.dumps(dados, indent=2)[:300]}...")
+            status = "sucesso (PDF->IA->DB)" if faltando == tudo else "sucesso (PDF->DANFE+IA->DB)"
+            pendentes.append((resultado, dados, status, "erro salvar no DB"))
+        else:
+            logging.error(f"ERRO EXTRAÇÃO IA PDF ({filename}): sem resposta válida - usando fallback")
+            dados_fallback = _fallback_pdf(texto, danfe)
+            # NOVO: Calcular tipo_operacao no fallback
+            dados_fallback["tipo_operacao"] = calcular_tipo_operacao(dados_fallback, user_cnpj)
+            logging.debug(f"FALLBACK DADOS PDF ({filename}): {dados_fallback}")
+            status = "sucesso parcial (fallback)" if dados_fallback["itens"] else "sucesso parcial (fallback sem itens)"
+            pendentes.append((resultado, dados_fallback, status, "erro fallback"))
 
+
+def _processar_arquivo(filename, fonte, parseado, api_key, user_cnpj, resultados, pendentes, extracoes):
+    """
+    Processa um arquivo do upload (XML/PDF/CSV) já recebido em fonte (bytes ou
+    temporário, ver arquivo_upload.py): registra o status em resultados e enfileira
+    as notas extraídas em pendentes pra gravação em lote. parseado é o resultado do pool de parsing (dict do XML; campos do DANFE
+    e texto, no PDF). PDFs que ainda precisam da IA vão para extracoes.
+    """
+    if not filename:
+        resultados.append({"arquivo": filename, "status": "nome inválido"})
+        return
+
+    try:
+        if isinstance(parseado, ErroParsing):
+            # O parse deste arquivo falhou no pool; os demais do upload seguem
+            resultados.append({"arquivo": filename, "status": f"erro parsing: {parseado}"})
+            return
+
+        if filename.lower().endswith('.xml'):
+            # Processa XML (igual antes)
+            if processar_xml:
+                dados = parseado  # processar_xml (no pool) já calcula tipo_operacao
+                if dados:
+                    _enfileirar_nota(resultados, pendentes, {"arquivo": filename}, dados, "sucesso (XML->DB)", "erro salvar no DB")
+                else:
+                    resultados.append({"arquivo": filename, "status": "erro parsing XML"})
+            else:
+                resultados.append({"arquivo": filename, "status": "processador XML não implementado"})
+
+        elif filename.lower().endswith('.pdf'):
+            # Processa PDF: parser do DANFE primeiro, IA só para o que ele não achou
+            if not extrair_texto_pdf:
+                resultados.append({"arquivo": filename, "status": "extrator PDF não implementado"})
+                return
+
+            danfe = parseado.get("danfe")
+            texto = parseado.get("texto") or ""
+            faltando = campos_faltantes(danfe)
+            logging.debug(f"DANFE ({filename}): campos faltando {faltando}")
+
+            if not faltando:
+                danfe["tipo_operacao"] = calcular_tipo_operacao(danfe, user_cnpj)
+                _enfileirar_nota(resultados, pendentes, {"arquivo": filename}, danfe, "sucesso (PDF->DANFE->DB)", "erro salvar no DB")
+                return
+
+            logging.debug(f"TEXTO EXTRAÍDO PDF ({filename}): {texto[:500]}...")
+
+            if not texto:
+                resultados.append({"arquivo": filename, "status": "PDF vazio ou erro extração"})
+                return
+
+            if api_key and extrair_em_lote:
+                # IA em lote no fim do upload (_extrair_pdfs_com_ia); a posição do resultado fica reservada
+                resultado = {"arquivo": filename, "status": "aguardando IA"}
+                resultados.append(resultado)
+                extracoes.append((resultado, danfe, texto, faltando))
+            else:
+                # Sem IA: salva .txt
+                try:
+                    os.makedirs(TEMP_DIR, exist_ok=True)
+                    txtpath = os.path.join(TEMP_DIR, f"{uuid.uuid4().hex}_{filename}.txt")
+                    with open(txtpath, "w", encoding="utf-8") as f:
+                        f.write(texto)
+                    resultados.append({"arquivo": filename, "status": "texto extraído (sem IA) salvo para análise"})
+                except Exception as e:
+                    resultados.append({"arquivo": filename, "status": f"erro salvando texto: {str(e)}"})
+            return
+
+        # Processa CSV (igual anterior)
+        elif filename.lower().endswith('.csv'):
+            logging.debug(f"CSV LIDO ({filename}): Iniciando parse...")
+            dados_notas = {}  # Agrupa por numero_nota + chave_acesso
+            try:
+                with abrir_texto(fonte, encoding='utf-8') as f:
+                    reader = csv.DictReader(f, delimiter=';')  # delimiter=';' pra CSV BR
+                    rows = list(reader)
+                
+                if rows:
+                    logging.debug(f"PRIMEIRA ROW KEYS CSV ({filename}): {list(rows[0].keys())}")
+                    logging.debug(f"PRIMEIRA ROW CSV ({filename}): {rows[0]}")
+                
+                for row in rows:
+                    numero = row.get('numero_nota', '').strip()
+                    chave = row.get('chave_acesso', '').strip()
+                    item_num = row.get('item', '').strip()
+
+                    if not numero or item_num == 'TOTAL':
+                        if item_num == 'TOTAL' and numero:  # Linha TOTAL: Pega valor_total_nota
+                            if numero in dados_notas:
+                                dados_notas[numero]['valor_total_nota'] = row.get('valor_total_nota', '')
+                                logging.debug(f"TOTAL SETADO pra nota {numero}: R${row.get('valor_total_nota', '')}")
+                        continue  # Pula TOTAL ou vazias
+
+                    key = f"{numero}_{chave}" if chave else numero  # Unique key
+                    if key not in dados_notas:
+                        dados_notas[key] = {
+                            "numero": numero,
+                            "data_emissao": row.get('data_emissao', ''),
+                            "cnpj_emitente": re.sub(r'[^\d]', '', row.get('emitente_cnpj', '')),
+                            "nome_emitente": row.get('emitente_razao_social', ''),
+                            "ie_emitente": row.get('emitente_ie', ''),
+                            "endereco_emitente": row.get('emitente_endereco', ''),
+                            "cnpj_destinatario": re.sub(r'[^\d]', '', row.get('destinatario_cnpj', '')),
+                            "nome_destinatario": row.get('destinatario_razao_social', ''),
+                            "ie_destinatario": row.get('destinatario_ie', ''),
+                            "endereco_destinatario": row.get('destinatario_endereco', ''),
+                            "chave_nfe": chave,
+                            "natureza_operacao": row.get('natureza_operacao', '') or row.get('tipo_operacao', ''),  # CORRIGIDO: Use coluna correta, fallback
+                            "valor_total_nota": '',  # Setado na TOTAL
+                            "tipo_operacao": '',  # Calculado pós-parse
+                            "versao": row.get('serie', ''),  # Serie como versao approx
+                            "itens": []
+                        }
+
+                    # Adiciona item se tem produto_codigo
+                    if row.get('produto_codigo', ''):
+                        item = {
+                            "codigo_produto": row.get('produto_codigo', ''),
+                            "descricao_produto": row.get('produto_descricao', ''),
+                            "ncm": row.get('produto_ncm', ''),
+                            "cfop": row.get('produto_cfop', ''),
+                            "unidade": row.get('produto_unidade', ''),
+                            "quantidade": row.get('produto_quantidade', ''),
+                            "valor_unitario": row.get('produto_valor_unitario', ''),
+                            "valor_total": row.get('produto_valor_total', ''),
+                            "cst_icms": row.get('icms_cst', ''),
+                            "cst_ipi": row.get('ipi_cst', ''),
+                            "cst_pis": row.get('pis_cst', ''),
+                            "cst_cofins": row.get('cofins_cst', ''),
+                            "cest": row.get('cest', ''),
+                            "icms_valor": float(row.get('icms_valor', 0)),
+                            "ipi_valor": float(row.get('ipi_valor', 0)),
+                            "pis_valor": float(row.get('pis_valor', 0)),
+                            "cofins_valor": float(row.get('cofins_valor', 0))
+                        }
+                        dados_notas[key]["itens"].append(item)
+
+                logging.debug(f"DADOS PARSED CSV ({filename}): {len(dados_notas)} notas encontradas.")
+
+                # Calcular tipo_operacao para cada nota e enfileirar pro lote
+                for key, dados in dados_notas.items():
+                    dados["tipo_operacao"] = calcular_tipo_operacao(dados, user_cnpj)  # NOVO: Calcula baseado em user_cnpj
+                    _enfileirar_nota(resultados, pendentes, {"arquivo": filename, "nota": dados['numero']}, dados, "sucesso (CSV->DB)", "erro salvar")
+
+            except Exception as e:
+                logging.error(f"ERRO PARSE CSV ({filename}): {e}")
+                resultados.append({"arquivo": filename, "status": f"erro parsing CSV: {str(e)}"})
+
+        else:
+            resultados.append({"arquivo": filename, "status": "formato não suportado"})
+            return
+
+    except Exception as e:
+        traceback.print_exc()
+        resultados.append({"arquivo": filename, "status": f"erro inesperado: {str(e)}"})
+    finally:
+        # Temporário só existe para uploads grandes (acima de UPLOAD_SPOOL_MB)
+        descartar(fonte)
+
+
+def _arquivos_aceitos(preparados, faixas, pendentes):
+    """
+    (sha, chaves_nfe, filename) dos arquivos cujas notas foram todas gravadas ou já
+    estavam no banco — os que entram no registro de ingestão. Extração parcial
+    (fallback) e erros ficam de fora: reenviar o arquivo tenta de novo.
+    """
+    notas_por_resultado = {}
+    for resultado, dados, _, _ in pendentes:
+        notas_por_resultado.setdefault(id(resultado), []).append(dados)
+
+    aceitos = []
+    for (filename, _, sha), resultados_arquivo in zip(preparados, faixas):
+        if not resultados_arquivo:
+            continue
+        if not all(r.get("status", "").startswith("sucesso (") or r.get("status") == STATUS_DUPLICADA for r in resultados_arquivo):
+            continue
+        chaves = [
+            str(dados.get("chave_nfe") or "").strip()
+            for resultado in resultados_arquivo
+            for dados in notas_por_resultado.get(id(resultado), [])
+        ]
+        aceitos.append((sha, [chave for chave in chaves if chave], filename))
+    return aceitos
+
+
+def receber_arquivos(uploaded_files):
+    """
+    Lê os arquivos do upload (objetos com .filename e .stream, FileStorage do Flask)
+    direto para a memória, ou para um temporário de nome único se grandes, numa
+    única passada que já calcula o SHA-256.
+
+    Returns:
+        list: (filename, fonte, sha) por arquivo, na ordem do upload
+    """
+    preparados = []
     for file in uploaded_files:
         filename = secure_filename(file.filename)
-        if not filename:
-            resultados.append({"arquivo": filename, "status": "nome inválido"})
-            continue
+        fonte = sha = None
+        if filename:
+            fonte, sha = receber_upload(file.stream, filename)
+        file.close()  # O conteúdo agora está na fonte; libera o spool do upload
+        preparados.append((filename, fonte, sha))
+    return preparados
 
-        # Salva temp
-        caminho = os.path.join("src/temp", filename)
-        file.save(caminho)
-
-        try:
-            if filename.lower().endswith('.xml'):
-                # Processa XML (igual antes)
-                if processar_xml:
-                    dados = processar_xml(caminho, user_cnpj=user_cnpj)  # Já calcula tipo_operacao
-                    if dados:
-                        save_res = salvar_nota_no_db(dados)
-                        if save_res.get("ok"):
-                            resultados.append({"arquivo": filename, "status": "sucesso (XML->DB)"})
-                        else:
-                            resultados.append({"arquivo": filename, "status": f"erro salvar no DB: {save_res.get('reason')}"})
-                    else:
-                        resultados.append({"arquivo": filename, "status": "erro parsing XML"})
-                else:
-                    resultados.append({"arquivo": filename, "status": "processador XML não implementado"})
-
-            elif filename.lower().endswith('.pdf'):
-                # Processa PDF (igual ao anterior, com stripping e fallback)
-                if not extrair_texto_pdf:
-                    resultados.append({"arquivo": filename, "status": "extrator PDF não implementado"})
-                    continue
-
-                texto = extrair_texto_pdf(caminho)
-                logging.debug(f"TEXTO EXTRAÍDO PDF ({filename}): {texto[:500]}...")
-
-                if not texto:
-                    resultados.append({"arquivo": filename, "status": "PDF vazio ou erro extração"})
-                    continue
-
-                if api_key and chamar_gemini:
-                    # PROMPT MELHORADO (adicionando campos faltantes)
-                    prompt = f"""
-                    Extraia dados de Nota Fiscal Eletrônica de um PDF de texto. Retorne APENAS o JSON cru válido, SEM markdown, blocos de código (sem ```), texto extra ou explicações. Use estrutura exata:
-                    {{
-                        "numero": "número da NF",
-                        "data_emissao": "YYYY-MM-DD",
-                        "cnpj_emitente": "14 dígitos sem pontos",
-                        "nome_emitente": "razão social",
-                        "ie_emitente": "IE sem pontos",
-                        "endereco_emitente": "endereço completo",
-                        "cnpj_destinatario": "14 dígitos sem pontos",
-                        "nome_destinatario": "nome",
-                        "ie_destinatario": "IE sem pontos",
-                        "endereco_destinatario": "endereço completo",
-                        "chave_nfe": "44 dígitos",
-                        "natureza_operacao": "descrição",
-                        "valor_total_nota": número float sem R$,
-                        "tipo_operacao": "Entrada/Saída",  # A IA infere, mas corrigiremos pós-parse
-                        "versao": "versão SEFAZ",
-                        "itens": [
-                            {{
-                                "codigo_produto": "código",
-                                "descricao_produto": "nome produto",
-                                "ncm": "8 dígitos",
-                                "cst_ipi": "código",
-                                "cfop": "código",
-                                "unidade": "UN",
-                                "quantidade": número float,
-                                "valor_unitario": número float sem R$,
-                                "valor_total": número float sem R$,
-                                "cst_icms": "código",
-                                "cst_pis": "código",
-                                "cst_cofins": "código",
-                                "cest": "código",
-                                "icms_valor": número float,
-                                "ipi_valor": número float,
-                                "pis_valor": número float,
-                                "cofins_valor": número float
-                            }}
-                        ]
-                    }}
-                    Se dados faltarem, use null. JSON Puro APENAS!
-                    Texto do PDF: {texto}
-                    """
-                    resposta = chamar_gemini(prompt, api_key, modelo=modelo)
-                    logging.debug(f"RESPOSTA IA PDF ({filename}): {resposta[:500]}...")
-
-                    resposta_texto = resposta if isinstance(resposta, str) else (resposta.get("text") if isinstance(resposta, dict) else str(resposta))
-                    
-                    # Stripping robusto pra markdown e extras
-                    resposta_texto = resposta_texto.strip()
-                    resposta_texto = re.sub(r'^```json\s*', '', resposta_texto)  # Remove ```json no start
-                    resposta_texto = re.sub(r'```\s*$', '', resposta_texto)  # Remove ``` no end
-                    resposta_texto = re.sub(r'^\{|\}$', '', resposta_texto.strip())  # Extra safe para braces soltas
-                    resposta_texto = '{' + resposta_texto + '}' if not resposta_texto.startswith('{') else resposta_texto
-
-                    logging.debug(f"RESPOSTA APÓS STRIP PDF ({filename}): {resposta_texto[:500]}...")
-
-                    # Try parse JSON
-                    try:
-                        dados = json.loads(resposta_texto)
-                        # NOVO: Calcular tipo_operacao baseado em user_cnpj
-                        dados["tipo_operacao"] = calcular_tipo_operacao(dados, user_cnpj)
-                        logging.debug(f"JSON PARSED PDF ({filename}): {json.dumps(dados, indent=2)[:300]}...")
-                        save_res = salvar_nota_no_db(dados)
-                        if save_res.get("ok"):
-                            resultados.append({"arquivo": filename, "status": "sucesso (PDF->IA->DB)"})
-                        elif save_res.get("reason") == "duplicado":
-                            resultados.append({"arquivo": filename, "status": "ignorado: nota duplicada"})
-                        else:
-                            resultados.append({"arquivo": filename, "status": f"erro salvar no DB: {save_res.get('reason')}"})
-                    except json.JSONDecodeError as e:
-                        logging.error(f"ERRO PARSE JSON PDF ({filename}): {e} - Resposta após strip: {resposta_texto[:200]}...")
-                        
-                        # FALLBACK: Parse manual simples do texto raw
-                        dados_fallback = {}
-                        match_num = re.search(r'Nº\s*(\d+)', texto)
-                        dados_fallback["numero"] = match_num.group(1) if match_num else None
-                        match_data = re.search(r'EMISSÃO:\s*(\d{2}/\d{2}/\d{4})', texto)
-                        dados_fallback["data_emissao"] = match_data.group(1).replace('/', '-') if match_data else None
-                        match_valor = re.search(r'VALOR TOTAL:\s*R\$\s*([\d.,]+)', texto)
-                        dados_fallback["valor_total_nota"] = float(match_valor.group(1).replace('.', '').replace(',', '.')) if match_valor else None
-                        match_cnpj_emit = re.search(r'CNPJ\s*([\d/.-]+)', texto)  # Ajuste se múltiplos
-                        dados_fallback["cnpj_emitente"] = re.sub(r'[^\d]', '', match_cnpj_emit.group(1)) if match_cnpj_emit else None
-                        dados_fallback["itens"] = []  # Sem itens no fallback
-                        # NOVO: Calcular tipo_operacao no fallback
-                        dados_fallback["tipo_operacao"] = calcular_tipo_operacao(dados_fallback, user_cnpj)
-                        
-                        logging.debug(f"FALLBACK DADOS PDF ({filename}): {dados_fallback}")
-                        save_res = salvar_nota_no_db(dados_fallback)
-                        if save_res.get("ok"):
-                            resultados.append({"arquivo": filename, "status": "sucesso parcial (fallback sem itens)"})
-                        else:
-                            resultados.append({"arquivo": filename, "status": f"erro fallback: {save_res.get('reason')}"})
-                else:
-                    # Sem IA: salva .txt
-                    try:
-                        txtpath = caminho + ".txt"
-                        with open(txtpath, "w", encoding="utf-8") as f:
-                            f.write(texto)
-                        resultados.append({"arquivo": filename, "status": "texto extraído (sem IA) salvo para análise"})
-                    except Exception as e:
-                        resultados.append({"arquivo": filename, "status": f"erro salvando texto: {str(e)}"})
-                continue
 
-            # Processa CSV (igual anterior)
-            elif filename.lower().endswith('.csv'):
-                logging.debug(f"CSV LIDO ({filename}): Iniciando parse...")
-                dados_notas = {}  # Agrupa por numero_nota + chave_acesso
-                try:
-                    with open(caminho, 'r', encoding='utf-8') as f:
-                        reader = csv.DictReader(f, delimiter=';')  # delimiter=';' pra CSV BR
-                        rows = list(reader)
-                    
-                    if rows:
-                        logging.debug(f"PRIMEIRA ROW KEYS CSV ({filename}): {list(rows[0].keys())}")
-                        logging.debug(f"PRIMEIRA ROW CSV ({filename}): {rows[0]}")
-                    
-                    for row in rows:
-                        numero = row.get('numero_nota', '').strip()
-                        chave = row.get('chave_acesso', '').strip()
-                        item_num = row.get('item', '').strip()
-
-                        if not numero or item_num == 'TOTAL':
-                            if item_num == 'TOTAL' and numero:  # Linha TOTAL: Pega valor_total_nota
-                                if numero in dados_notas:
-                                    dados_notas[numero]['valor_total_nota'] = row.get('valor_total_nota', '')
-                                    logging.debug(f"TOTAL SETADO pra nota {numero}: R${row.get('valor_total_nota', '')}")
-                            continue  # Pula TOTAL ou vazias
-
-                        key = f"{numero}_{chave}" if chave else numero  # Unique key
-                        if key not in dados_notas:
-                            dados_notas[key] = {
-                                "numero": numero,
-                                "data_emissao": row.get('data_emissao', ''),
-                                "cnpj_emitente": re.sub(r'[^\d]', '', row.get('emitente_cnpj', '')),
-                                "nome_emitente": row.get('emitente_razao_social', ''),
-                                "ie_emitente": row.get('emitente_ie', ''),
-                                "endereco_emitente": row.get('emitente_endereco', ''),
-                                "cnpj_destinatario": re.sub(r'[^\d]', '', row.get('destinatario_cnpj', '')),
-                                "nome_destinatario": row.get('destinatario_razao_social', ''),
-                                "ie_destinatario": row.get('destinatario_ie', ''),
-                                "endereco_destinatario": row.get('destinatario_endereco', ''),
-                                "chave_nfe": chave,
-                                "natureza_operacao": row.get('natureza_operacao', '') or row.get('tipo_operacao', ''),  # CORRIGIDO: Use coluna correta, fallback
-                                "valor_total_nota": '',  # Setado na TOTAL
-                                "tipo_operacao": '',  # Calculado pós-parse
-                                "versao": row.get('serie', ''),  # Serie como versao approx
-                                "itens": []
-                            }
-
-                        # Adiciona item se tem produto_codigo
-                        if row.get('produto_codigo', ''):
-                            item = {
-                                "codigo_produto": row.get('produto_codigo', ''),
-                                "descricao_produto": row.get('produto_descricao', ''),
-                                "ncm": row.get('produto_ncm', ''),
-                                "cfop": row.get('produto_cfop', ''),
-                                "unidade": row.get('produto_unidade', ''),
-                                "quantidade": row.get('produto_quantidade', ''),
-                                "valor_unitario": row.get('produto_valor_unitario', ''),
-                                "valor_total": row.get('produto_valor_total', ''),
-                                "cst_icms": row.get('icms_cst', ''),
-                                "cst_ipi": row.get('ipi_cst', ''),
-                                "cst_pis": row.get('pis_cst', ''),
-                                "cst_cofins": row.get('cofins_cst', ''),
-                                "cest": row.get('cest', ''),
-                                "icms_valor": float(row.get('icms_valor', 0)),
-                                "ipi_valor": float(row.get('ipi_valor', 0)),
-                                "pis_valor": float(row.get('pis_valor', 0)),
-                                "cofins_valor": float(row.get('cofins_valor', 0))
-                            }
-                            dados_notas[key]["itens"].append(item)
-
-                    logging.debug(f"DADOS PARSED CSV ({filename}): {len(dados_notas)} notas encontradas.")
-
-                    # Calcular tipo_operacao para cada nota e salvar
-                    for key, dados in dados_notas.items():
-                        dados["tipo_operacao"] = calcular_tipo_operacao(dados, user_cnpj)  # NOVO: Calcula baseado em user_cnpj
-                        save_res = salvar_nota_no_db(dados)
-                        num = dados['numero']
-                        if save_res.get("ok"):
-                            resultados.append({"arquivo": filename, "nota": num, "status": "sucesso (CSV->DB)"})
-                        else:
-                            resultados.append({"arquivo": filename, "nota": num, "status": f"erro salvar: {save_res.get('reason')}"})
+def processar_arquivos(uploaded_files, api_key="", user_cnpj="", ao_progredir=None):
+    """Pipeline completo de ingestão de um upload (receber_arquivos + processar_recebidos)."""
+    return processar_recebidos(receber_arquivos(uploaded_files), api_key, user_cnpj, ao_progredir)
 
-                except Exception as e:
-                    logging.error(f"ERRO PARSE CSV ({filename}): {e}")
-                    resultados.append({"arquivo": filename, "status": f"erro parsing CSV: {str(e)}"})
 
-            else:
-                resultados.append({"arquivo": filename, "status": "formato não suportado"})
-                continue
+def processar_recebidos(preparados, api_key="", user_cnpj="", ao_progredir=None):
+    """
+    Processa os arquivos já lidos por receber_arquivos. Retorna o status por arquivo.
+    Arquivos já importados (mesmo SHA-256, ver services/registro_ingestao.py) saem
+    como STATUS_DUPLICADA (com as chaves_nfe) sem parsing nem IA. O parsing de XML/PDF roda no pool de
+    processos (PARSE_WORKERS); só esta função grava no banco.
+    ao_progredir(processados, resultados), se informado, é chamado após cada arquivo.
+    """
+    resultados = []
+    pendentes = []  # Notas parseadas, salvas todas juntas no fim (um lote/transação)
+    extracoes = []  # PDFs que vão para a IA, todos juntos depois do parsing
+    modelo = "gemini-2.5-flash"  # CORRIGIDO: Use versão válida; mude se for intencional 2.5
 
-        except Exception as e:
-            traceback.print_exc()
-            resultados.append({"arquivo": filename, "status": f"erro inesperado: {str(e)}"})
-        finally:
-            # NOVO: Limpe o arquivo temp para segurança
-            if os.path.exists(caminho):
-                os.remove(caminho)
+    # Já importados (registro de ingestão) ou repetidos no próprio upload: não passam do hash
+    ja_ingeridos = registro_ingestao.buscar([sha for _, _, sha in preparados if sha])
+    vistos = set()
+    duplicados = {}  # posição no upload -> chaves_nfe
+    for posicao, (_, fonte, sha) in enumerate(preparados):
+        if sha in ja_ingeridos or sha in vistos:
+            duplicados[posicao] = ja_ingeridos.get(sha, [])
+            descartar(fonte)
+        elif sha:
+            vistos.add(sha)
+    if duplicados:
+        logging.debug(f"REGISTRO INGESTÃO: {len(duplicados)} de {len(preparados)} arquivo(s) já importado(s)")
+
+    # XML/PDF são parseados em paralelo (processos); gravação segue aqui, na ordem do upload
+    parseados = iter(parsear_em_paralelo([
+        (fonte, _tipo_parse(filename), user_cnpj)
+        for posicao, (filename, fonte, _) in enumerate(preparados) if posicao not in duplicados
+    ]))
+    faixas = []  # Resultados de cada arquivo (mesmos objetos de resultados)
+    for processados, (filename, fonte, sha) in enumerate(preparados, 1):
+        inicio = len(resultados)
+        if processados - 1 in duplicados:
+            resultados.append({"arquivo": filename, "status": STATUS_DUPLICADA, "chaves_nfe": duplicados[processados - 1]})
+            faixas.append([])
+        else:
+            _processar_arquivo(filename, fonte, next(parseados), api_key, user_cnpj, resultados, pendentes, extracoes)
+            faixas.append(resultados[inicio:])
+        if ao_progredir:
+            ao_progredir(processados, resultados)
+
+    _extrair_pdfs_com_ia(extracoes, api_key, modelo, user_cnpj, pendentes)
+    _salvar_pendentes(pendentes)
+    registro_ingestao.registrar(_arquivos_aceitos(preparados, faixas, pendentes))
+    return resultados
+
+
+@document_bp.route("/process-documents", methods=["POST"])
+def process_documents():
+    """
+    Recebe o upload e cria um job em segundo plano (202 + job_id pra polling em
+    /api/jobs/<job_id>). Com ?sync=1 processa dentro da requisição e devolve a
+    lista de resultados direto, como antes.
+    """
+    uploaded_files = request.files.getlist("files")
+    api_key = request.form.get("api_key", "")
+    user_cnpj = request.form.get("user_cnpj", "")  # NOVO: Pegue do form se disponível (ex.: de auth)
 
-    return jsonify(resultados)
\ No newline at end of file
+    if request.args.get("sync") == "1":
+        return jsonify(processar_arquivos(uploaded_files, api_key, user_cnpj))
+
+    # Lê o conteúdo agora (uma cópia só, já com o hash): o stream do upload é fechado
+    # quando a requisição termina. Até UPLOAD_SPOOL_MB fica em memória; acima, num temporário
+    preparados = receber_arquivos(uploaded_files)
+    job_id = submeter_job(
+        session.get("cnpj"),
+        len(preparados),
+        lambda ao_progredir: processar_recebidos(preparados, api_key, user_cnpj, ao_progredir)
+    )
+    return jsonify({"job_id": job_id, "status": "pendente", "status_url": f"/api/jobs/{job_id}"}), 202
+
+
+@document_bp.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    """Status e resultados por arquivo de um job de processamento."""
+    job = buscar_job(job_id)
+    if not job:
+        return jsonify({"erro": "Job não encontrado."}), 404
+    job_cnpj = job.pop("cnpj", None)
+    if job_cnpj and job_cnpj != session.get("cnpj"):
+        return jsonify({"erro": "Job não encontrado."}), 404
+    return jsonify(job), 200
+
+
+@document_bp.route("/jobs", methods=["GET"])
+def get_jobs():
+    """Últimos jobs de processamento do usuário logado."""
+    cnpj = session.get("cnpj")
+    if not cnpj:
+        return jsonify({"erro": "Não autorizado. Faça login."}), 401
+    jobs = listar_jobs(cnpj)
+    for job in jobs:
+        job.pop("cnpj", None)
+    return jsonify(jobs), 200
@@ -0,0 +1,105 @@
+# src/routes/search.py
+import logging
+from flask import Blueprint, jsonify, request, session
+from sqlalchemy.exc import OperationalError
+from database.connection import SessionLocal
+from models.nota_fiscal import NotaFiscal, ItemNota
+from services.indice_busca import pesquisar
+
+search_bp = Blueprint("search_bp", __name__)
+
+POR_PAGINA_PADRAO = 20
+POR_PAGINA_MAX = 100
+
+
+def _inteiro_parametro(parametro, padrao, minimo, maximo):
+    """Lê um inteiro da query string dentro de [minimo, maximo]; ValueError se inválido."""
+    valor = request.args.get(parametro)
+    if not valor:
+        return padrao
+    try:
+        numero = int(valor)
+    except ValueError:
+        raise ValueError(f"Parâmetro '{parametro}' inválido (use um número inteiro).")
+    if not minimo <= numero <= maximo:
+        raise ValueError(f"Parâmetro '{parametro}' deve estar entre {minimo} e {maximo}.")
+    return numero
+
+
+@search_bp.route("/search", methods=["GET"])
+def buscar():
+    """
+    Busca de texto nas notas e itens do usuário logado (índice FTS5 busca_fts).
+    ?q= termos (cada palavra vale como prefixo), ?tipo=nota|item (padrão: ambos),
+    ?pagina= (1..) e ?por_pagina= (até 100). Resultados por relevância, com o trecho
+    encontrado destacado entre « ».
+    """
+    cnpj = session.get("cnpj")
+    if not cnpj:
+        return jsonify({"erro": "Não autorizado. Faça login."}), 401
+
+    consulta = (request.args.get("q") or "").strip()
+    if not consulta:
+        return jsonify({"erro": "Parâmetro 'q' não fornecido."}), 400
+    tipo = request.args.get("tipo") or None
+    if tipo not in (None, "nota", "item"):
+        return jsonify({"erro": "Parâmetro 'tipo' inválido (use nota ou item)."}), 400
+
+    db = SessionLocal()
+    try:
+        pagina = _inteiro_parametro("pagina", 1, 1, 10_000)
+        por_pagina = _inteiro_parametro("por_pagina", POR_PAGINA_PADRAO, 1, POR_PAGINA_MAX)
+
+        resultados, tem_mais = pesquisar(
+            db, cnpj, consulta, tipo=tipo, limite=por_pagina, deslocamento=(pagina - 1) * por_pagina
+        )
+
+        # Dados de exibição das notas/itens da página (2 consultas por id, não uma por resultado)
+        ids_notas = {r["nota_id"] for r in resultados}
+        ids_itens = {r["item_id"] for r in resultados if r["item_id"]}
+        notas = {
+            nota.id: nota for nota in db.query(NotaFiscal).filter(NotaFiscal.id.in_(ids_notas))
+        } if ids_notas else {}
+        itens = {
+            item.id: item for item in db.query(ItemNota).filter(ItemNota.id.in_(ids_itens))
+        } if ids_itens else {}
+
+        for resultado in resultados:
+            nota = notas.get(resultado["nota_id"])
+            if nota:
+                resultado.update({
+                    "numero": nota.numero,
+                    "data_emissao": nota.data_emissao.isoformat() if nota.data_emissao else None,
+                    "tipo_operacao": nota.tipo_operacao,
+                    "emitente": nota.nome_emitente,
+                    "destinatario": nota.nome_destinatario,
+                    "valor_total_nota": float(nota.valor_total_nota or 0)
+                })
+            item = itens.get(resultado["item_id"])
+            if item:
+                resultado.update({
+                    "descricao_produto": item.descricao_produto,
+                    "codigo_produto": item.codigo_produto,
+                    "ncm": item.ncm,
+                    "cfop": item.cfop,
+                    "valor_total_item": float(item.valor_total or 0)
+                })
+
+        return jsonify({
+            "q": consulta,
+            "pagina": pagina,
+            "por_pagina": por_pagina,
+            "tem_mais": tem_mais,
+            "resultados": resultados
+        }), 200
+
+    except ValueError as e:
+        return jsonify({"erro": str(e)}), 400
+    except OperationalError as e:
+        logging.error(f"ERRO BUSCA (índice): {e}")
+        return jsonify({"erro": "Índice de busca indisponível. Rode as migrações (python migrate_db.py)."}), 503
+    except Exception as e:
+        logging.error(f"ERRO BUSCA: {e}")
+        return jsonify({"erro": "Erro ao buscar. Tente novamente."}), 500
+    finally:
+        db.close()
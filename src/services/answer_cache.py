@@ -0,0 +1,186 @@
+"""
+Cache de respostas do chat para perguntas repetidas.
+A chave é (CNPJ, hash do contexto de notas usado no prompt, pergunta normalizada):
+se as notas mudam, o contexto muda e a entrada antiga deixa de ser encontrada; o
+ingest também invalida o CNPJ explicitamente. Opcionalmente, perguntas parecidas
+(vetores de trigramas de caracteres com hashing, tudo local) reaproveitam a
+resposta, desde que os termos fiscais (impostos, meses, números...) sejam os mesmos.
+"""
+import os
+import re
+import math
+import time
+import hashlib
+import threading
+import unicodedata
+import zlib
+from collections import OrderedDict
+
+TTL = int(os.environ.get("ANSWER_CACHE_TTL", "3600"))  # Segundos
+MAX_ENTRADAS = int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", "2000"))
+# Similaridade mínima (cosseno) pra reaproveitar a resposta de outra pergunta; 0 desliga a camada semântica
+SIMILARIDADE_MINIMA = float(os.environ.get("ANSWER_CACHE_SIMILARITY", "0.8"))
+DIMENSOES = 2 ** 18  # Espaço do hashing dos trigramas
+
+STOPWORDS = {
+    "a", "o", "as", "os", "de", "da", "do", "das", "dos", "e", "em", "no", "na", "nos", "nas",
+    "um", "uma", "uns", "umas", "que", "qual", "quais", "me", "meu", "minha", "meus", "minhas",
+    "eu", "por", "para", "pra", "pro", "com", "se", "ao", "aos", "foi", "sao", "e", "ate",
+    "voce", "vc", "favor", "poderia", "pode", "sobre", "isto", "ai", "la",
+}
+# Termos que mudam o sentido da pergunta: precisam coincidir pra haver acerto por similaridade
+TERMOS_CHAVE = {
+    "icms", "ipi", "pis", "cofins", "iss", "simples", "presumido", "real", "mei", "rbt12",
+    "faixa", "anexo", "aliquota", "saida", "saidas", "entrada", "entradas", "venda", "vendas",
+    "compra", "compras", "cliente", "clientes", "fornecedor", "fornecedores", "cfop", "ncm",
+    "janeiro", "fevereiro", "marco", "abril", "maio", "junho", "julho", "agosto", "setembro",
+    "outubro", "novembro", "dezembro", "mes", "ano", "trimestre", "semestre", "maior", "menor",
+    "media", "nao",
+}
+# Perguntas que dependem da troca anterior ("e no mês passado?") não usam o cache
+INICIO_CONTINUACAO = re.compile(r"^(e|mas|entao|tambem|e\s+(o|a|os|as|no|na|quanto|qual))\b|\b(isso|isto|disso|nisso|esse|essa|desse|dessa|anterior|acima)\b")
+
+
+def normalizar_pergunta(pergunta):
+    """Minúsculas, sem acentos/pontuação e sem stopwords."""
+    texto = unicodedata.normalize("NFKD", pergunta.lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    palavras = re.findall(r"[a-z0-9]+", texto)
+    return " ".join(p for p in palavras if p not in STOPWORDS)
+
+
+def eh_continuacao(pergunta):
+    """True se a pergunta parece depender do histórico da conversa."""
+    texto = unicodedata.normalize("NFKD", pergunta.lower().strip())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return bool(INICIO_CONTINUACAO.search(texto))
+
+
+def hash_contexto(contexto):
+    return hashlib.sha256((contexto or "").encode("utf-8")).hexdigest()
+
+
+def _termos_chave(normalizada):
+    return frozenset(p for p in normalizada.split() if p in TERMOS_CHAVE or p.isdigit())
+
+
+def _vetor(normalizada):
+    """Trigramas de caracteres com hashing, normalizado (L2) como dict esparso."""
+    texto = f" {normalizada} "
+    vetor = {}
+    for i in range(len(texto) - 2):
+        indice = zlib.crc32(texto[i:i + 3].encode("utf-8")) % DIMENSOES
+        vetor[indice] = vetor.get(indice, 0.0) + 1.0
+    norma = math.sqrt(sum(v * v for v in vetor.values())) or 1.0
+    return {indice: v / norma for indice, v in vetor.items()}
+
+
+def _cosseno(a, b):
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(v * b.get(indice, 0.0) for indice, v in a.items())
+
+
+class AnswerCache:
+    """LRU com TTL, indexado por (cnpj, hash do contexto) pra busca por similaridade."""
+
+    def __init__(self, max_entradas=MAX_ENTRADAS, ttl=TTL, similaridade_minima=SIMILARIDADE_MINIMA):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self.similaridade_minima = similaridade_minima
+        self._entradas = OrderedDict()  # (cnpj, ctx, normalizada) -> entrada
+        self._grupos = {}  # (cnpj, ctx) -> set de normalizadas
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "semantic_hits": 0, "misses": 0, "stores": 0, "evicted": 0, "invalidated": 0}
+
+    def _remover(self, chave):
+        self._entradas.pop(chave, None)
+        grupo = self._grupos.get(chave[:2])
+        if grupo is not None:
+            grupo.discard(chave[2])
+            if not grupo:
+                del self._grupos[chave[:2]]
+
+    def _valida(self, chave):
+        entrada = self._entradas.get(chave)
+        if entrada is None:
+            return None
+        if entrada["expira_em"] < time.monotonic():
+            self._remover(chave)
+            return None
+        return entrada
+
+    def buscar(self, cnpj, contexto_hash, pergunta):
+        """
+        Resposta guardada para a pergunta (ou uma equivalente) com o mesmo contexto.
+
+        Returns:
+            dict {"resposta", "semantico", "similaridade"} ou None
+        """
+        normalizada = normalizar_pergunta(pergunta)
+        with self._lock:
+            chave = (cnpj, contexto_hash, normalizada)
+            entrada = self._valida(chave)
+            if entrada is not None:
+                self._entradas.move_to_end(chave)
+                self._stats["hits"] += 1
+                return {"resposta": entrada["resposta"], "semantico": False, "similaridade": 1.0}
+
+            if self.similaridade_minima > 0:
+                vetor, termos = _vetor(normalizada), _termos_chave(normalizada)
+                melhor, melhor_score = None, self.similaridade_minima
+                for candidata in list(self._grupos.get((cnpj, contexto_hash), ())):
+                    chave_candidata = (cnpj, contexto_hash, candidata)
+                    entrada = self._valida(chave_candidata)
+                    if entrada is None or entrada["termos"] != termos:
+                        continue
+                    score = _cosseno(vetor, entrada["vetor"])
+                    if score >= melhor_score:
+                        melhor, melhor_score = chave_candidata, score
+                if melhor is not None:
+                    self._entradas.move_to_end(melhor)
+                    self._stats["semantic_hits"] += 1
+                    return {"resposta": self._entradas[melhor]["resposta"], "semantico": True, "similaridade": round(melhor_score, 3)}
+
+            self._stats["misses"] += 1
+            return None
+
+    def guardar(self, cnpj, contexto_hash, pergunta, resposta):
+        normalizada = normalizar_pergunta(pergunta)
+        if not normalizada:
+            return
+        chave = (cnpj, contexto_hash, normalizada)
+        with self._lock:
+            self._entradas[chave] = {
+                "resposta": resposta,
+                "vetor": _vetor(normalizada),
+                "termos": _termos_chave(normalizada),
+                "expira_em": time.monotonic() + self.ttl,
+            }
+            self._entradas.move_to_end(chave)
+            self._grupos.setdefault(chave[:2], set()).add(normalizada)
+            self._stats["stores"] += 1
+            while len(self._entradas) > self.max_entradas:
+                self._remover(next(iter(self._entradas)))
+                self._stats["evicted"] += 1
+
+    def invalidar_cnpj(self, cnpj):
+        """Descarta todas as respostas do CNPJ (chamado após ingest de notas)."""
+        with self._lock:
+            chaves = [chave for chave in self._entradas if chave[0] == cnpj]
+            for chave in chaves:
+                self._remover(chave)
+            self._stats["invalidated"] += len(chaves)
+
+    def metricas(self):
+        with self._lock:
+            return {**self._stats, "entries": len(self._entradas), "max_entries": self.max_entradas, "ttl": self.ttl}
+
+
+# Instância global (por processo)
+answer_cache = AnswerCache()
+
+
+def invalidar_cnpj(*cnpjs):
+    for cnpj in {c for c in cnpjs if c}:
+        answer_cache.invalidar_cnpj(cnpj)
@@ -0,0 +1,155 @@
+"""
+Compactação do histórico do chat antes de cada chamada ao modelo.
+Cada pergunta vai pro Gemini com o bloco de dados das notas embutido
+(montar_mensagem); sem compactar, esse bloco se repete no histórico a cada troca.
+Etapas, em ordem:
+  1. remove os blocos de dados das mensagens antigas (fica só a pergunta);
+  2. trocas além da janela viram um resumo no início do histórico;
+  3. se ainda passar do orçamento de tokens, descarta as trocas mais antigas.
+As funções trabalham com listas de {"role", "text"} e devolvem também quantos
+tokens (estimados) cada etapa economizou.
+"""
+import logging
+
+CHARS_POR_TOKEN = 4  # Mesma estimativa de gemini_service (sem tokenizer)
+
+MARCADOR_DADOS = "📂 DADOS DISPONÍVEIS:"
+MARCADOR_PERGUNTA = "❓ PERGUNTA DO CLIENTE:"
+MARCADOR_RESPOSTA = "💬 SUA RESPOSTA"
+MARCADOR_RESUMO = "📝 RESUMO DA CONVERSA ATÉ AQUI:"
+CONFIRMACAO_RESUMO = "Entendido, vou considerar esse resumo nas próximas respostas."
+
+LOTE_RESUMO = 4  # Só resume quando sobram ao menos N trocas além da janela (1 chamada a cada N trocas)
+MAX_CHARS_RESUMO = 4000
+
+
+def montar_mensagem(contexto, pergunta):
+    """Mensagem enviada ao Gemini: bloco de dados das notas + pergunta."""
+    return f"""{MARCADOR_DADOS}
+{contexto}
+
+{MARCADOR_PERGUNTA}
+{pergunta}
+
+{MARCADOR_RESPOSTA} (como contador estrategista):"""
+
+
+def estimar_tokens(texto):
+    return len(texto or "") // CHARS_POR_TOKEN
+
+
+def _tokens_mensagens(mensagens):
+    return sum(estimar_tokens(m["text"]) for m in mensagens)
+
+
+def extrair_pergunta(texto):
+    """Tira o bloco de dados de uma mensagem montada por montar_mensagem (outras voltam iguais)."""
+    if MARCADOR_DADOS not in texto or MARCADOR_PERGUNTA not in texto:
+        return texto
+    pergunta = texto.split(MARCADOR_PERGUNTA, 1)[1]
+    return pergunta.split(MARCADOR_RESPOSTA, 1)[0].strip()
+
+
+def eh_resumo(mensagem):
+    return mensagem["role"] == "user" and mensagem["text"].startswith(MARCADOR_RESUMO)
+
+
+def remover_blocos_dados(mensagens):
+    """Etapa 1: mensagens do usuário ficam só com a pergunta."""
+    antes = _tokens_mensagens(mensagens)
+    limpas = [
+        {"role": m["role"], "text": extrair_pergunta(m["text"]) if m["role"] == "user" else m["text"]}
+        for m in mensagens
+    ]
+    return limpas, antes - _tokens_mensagens(limpas)
+
+
+def _separar_resumo(mensagens):
+    """(texto do resumo atual ou '', mensagens depois do par de resumo)."""
+    if len(mensagens) >= 2 and eh_resumo(mensagens[0]):
+        return mensagens[0]["text"][len(MARCADOR_RESUMO):].strip(), mensagens[2:]
+    return "", mensagens
+
+
+def _par_resumo(resumo):
+    return [
+        {"role": "user", "text": f"{MARCADOR_RESUMO}\n{resumo}"},
+        {"role": "model", "text": CONFIRMACAO_RESUMO},
+    ]
+
+
+def resumo_extrativo(resumo_anterior, trocas):
+    """Resumo sem chamar o modelo: trechos de cada troca, cortado em MAX_CHARS_RESUMO."""
+    linhas = [resumo_anterior] if resumo_anterior else []
+    for pergunta, resposta in trocas:
+        linhas.append(f"- Cliente: {pergunta[:200]} | Resposta: {resposta[:300]}")
+    return "\n".join(linhas)[-MAX_CHARS_RESUMO:]
+
+
+def resumir_antigas(mensagens, janela, resumidor=None):
+    """
+    Etapa 2: mantém as últimas `janela` trocas e funde as anteriores no resumo.
+    Só age quando o excesso chega a LOTE_RESUMO trocas.
+
+    Args:
+        resumidor: callable(resumo_anterior, [(pergunta, resposta)]) -> str;
+            se falhar (ou for None), usa resumo_extrativo
+    """
+    resumo, conversa = _separar_resumo(mensagens)
+    trocas = len(conversa) // 2
+    if not janela or trocas - janela < LOTE_RESUMO:
+        return mensagens, 0, False
+
+    corte = (trocas - janela) * 2
+    antigas = [(conversa[i]["text"], conversa[i + 1]["text"]) for i in range(0, corte, 2)]
+    novo_resumo = None
+    if resumidor:
+        try:
+            novo_resumo = (resumidor(resumo, antigas) or "").strip()[:MAX_CHARS_RESUMO]
+        except Exception as e:
+            logging.warning(f"Falha ao resumir histórico do chat, usando resumo extrativo: {e}")
+    novo_resumo = novo_resumo or resumo_extrativo(resumo, antigas)
+
+    compactadas = _par_resumo(novo_resumo) + conversa[corte:]
+    return compactadas, _tokens_mensagens(mensagens) - _tokens_mensagens(compactadas), True
+
+
+def aplicar_orcamento(mensagens, orcamento):
+    """
+    Etapa 3: descarta trocas antigas (depois do resumo) até caber no orçamento;
+    em último caso descarta o próprio resumo. A última troca sempre fica.
+    """
+    antes = _tokens_mensagens(mensagens)
+    if orcamento is None or antes <= orcamento:
+        return mensagens, 0
+    resumo, conversa = _separar_resumo(mensagens)
+    cabecalho = _par_resumo(resumo) if resumo else []
+    while len(conversa) > 2 and _tokens_mensagens(cabecalho + conversa) > orcamento:
+        conversa = conversa[2:]
+    if cabecalho and _tokens_mensagens(cabecalho + conversa) > orcamento:
+        cabecalho = []
+    compactadas = cabecalho + conversa
+    return compactadas, antes - _tokens_mensagens(compactadas)
+
+
+def compactar(mensagens, proxima_mensagem="", janela=None, orcamento=None, resumidor=None, tokens_fixos=0):
+    """
+    Roda as três etapas. O orçamento vale para o prompt inteiro: histórico +
+    próxima mensagem + tokens_fixos (ex.: system instruction).
+
+    Returns:
+        tuple: (mensagens compactadas, {"tokens_saved_strip", "tokens_saved_summary",
+                "tokens_saved_budget", "summarized", "prompt_tokens"})
+    """
+    mensagens, economia_dados = remover_blocos_dados(mensagens)
+    mensagens, economia_resumo, resumiu = resumir_antigas(mensagens, janela, resumidor)
+    reservado = estimar_tokens(proxima_mensagem) + tokens_fixos
+    orcamento_historico = max(orcamento - reservado, 0) if orcamento else None
+    mensagens, economia_orcamento = aplicar_orcamento(mensagens, orcamento_historico)
+    return mensagens, {
+        "tokens_saved_strip": economia_dados,
+        "tokens_saved_summary": economia_resumo,
+        "tokens_saved_budget": economia_orcamento,
+        "summarized": resumiu,
+        "prompt_tokens": _tokens_mensagens(mensagens) + reservado,
+    }
@@ -0,0 +1,62 @@
+"""
+Montagem do contexto do chat em paralelo.
+As etapas independentes (dados do usuário, notas do banco, busca web) são disparadas
+juntas num pool de threads e compartilham um prazo único: o que não ficar pronto até
+lá é descartado e o chat segue com o resto. Cada etapa abre a própria sessão do banco.
+"""
+import os
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+
+CONTEXT_DEADLINE = float(os.environ.get("CHAT_CONTEXT_DEADLINE", "4.0"))  # Segundos
+CONTEXT_WORKERS = int(os.environ.get("CHAT_CONTEXT_WORKERS", "8"))
+
+_executor = ThreadPoolExecutor(max_workers=CONTEXT_WORKERS, thread_name_prefix="chat-context")
+
+
+class EtapasContexto:
+    """
+    Dispara as etapas no pool assim que é criada. resultado(nome) espera a etapa só
+    até o prazo comum (contado da criação); se ele passar, devolve o padrão e a
+    etapa entra em `descartadas`. Erros da etapa sobem pra quem chamou resultado().
+    """
+
+    def __init__(self, etapas, prazo=None):
+        prazo = CONTEXT_DEADLINE if prazo is None else prazo
+        self.inicio = time.perf_counter()
+        self.limite = self.inicio + prazo
+        self.prazo = prazo
+        self.tempos = {}  # nome -> ms gastos pela etapa (só as que terminaram)
+        self.descartadas = set()
+        self._futuros = {nome: _executor.submit(self._medir, nome, funcao) for nome, funcao in etapas.items()}
+
+    def _medir(self, nome, funcao):
+        inicio = time.perf_counter()
+        try:
+            return funcao()
+        finally:
+            self.tempos[nome] = round((time.perf_counter() - inicio) * 1000)
+
+    def resultado(self, nome, padrao=None):
+        futuro = self._futuros.get(nome)
+        if futuro is None:
+            return padrao
+        restante = max(0.0, self.limite - time.perf_counter())
+        try:
+            return futuro.result(timeout=restante)
+        except FuturesTimeout:
+            futuro.cancel()  # Só tem efeito se ainda estiver na fila
+            self.descartadas.add(nome)
+            return padrao
+
+    def registrar(self):
+        """Loga o tempo de cada etapa (ou o descarte) e o tempo total de espera."""
+        partes = []
+        for nome in self._futuros:
+            if nome in self.descartadas:
+                partes.append(f"{nome}=descartada(>{self.prazo * 1000:.0f}ms)")
+            elif nome in self.tempos:
+                partes.append(f"{nome}={self.tempos[nome]}ms")
+        total = round((time.perf_counter() - self.inicio) * 1000)
+        logging.debug(f"CHAT CONTEXTO: {' '.join(partes)} total={total}ms")
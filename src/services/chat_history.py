@@ -0,0 +1,168 @@
+"""
+Histórico persistente do chat, por CNPJ e conversa.
+As trocas (pergunta/resposta) ficam no banco, então sobrevivem a restarts e
+valem para qualquer worker do gunicorn; o GeminiAgent em memória é só um cache
+reidratado com as últimas N trocas quando fica para trás (ver chat_manager).
+O store padrão usa o SQLite do app; configurar_store aceita outro backend com
+a mesma interface.
+"""
+import os
+import uuid
+from datetime import datetime
+from sqlalchemy import func
+from database.connection import SessionLocal
+from models.conversa import Conversa, MensagemChat
+
+HISTORY_TURNS = int(os.environ.get("CHAT_HISTORY_TURNS", "10"))  # Trocas carregadas ao reidratar
+TAMANHO_TITULO = 60
+
+
+def _mensagem_para_dict(mensagem):
+    return {
+        "id": mensagem.id,
+        "role": mensagem.role,
+        "conteudo": mensagem.conteudo,
+        "criado_em": mensagem.criado_em.isoformat() if mensagem.criado_em else None
+    }
+
+
+def _conversa_para_dict(conversa, total_mensagens=None):
+    dados = {
+        "conversa_id": conversa.id,
+        "titulo": conversa.titulo,
+        "criado_em": conversa.criado_em.isoformat() if conversa.criado_em else None,
+        "atualizado_em": conversa.atualizado_em.isoformat() if conversa.atualizado_em else None
+    }
+    if total_mensagens is not None:
+        dados["total_mensagens"] = total_mensagens
+    return dados
+
+
+class SQLiteChatStore:
+    """Store de conversas nas tabelas conversas/mensagens_chat."""
+
+    def criar_conversa(self, cnpj, titulo=None):
+        """Cria uma conversa vazia e retorna o id."""
+        session = SessionLocal()
+        try:
+            conversa = Conversa(id=uuid.uuid4().hex, cnpj=cnpj, titulo=(titulo or "")[:TAMANHO_TITULO] or None)
+            session.add(conversa)
+            session.commit()
+            return conversa.id
+        finally:
+            session.close()
+
+    def conversa_existe(self, cnpj, conversa_id):
+        session = SessionLocal()
+        try:
+            return session.query(Conversa.id).filter_by(id=conversa_id, cnpj=cnpj).first() is not None
+        finally:
+            session.close()
+
+    def listar_conversas(self, cnpj, limite=50):
+        """Conversas do CNPJ, da mais recente para a mais antiga, com o total de mensagens."""
+        session = SessionLocal()
+        try:
+            totais = session.query(MensagemChat.conversa_id, func.count(MensagemChat.id).label("total"))\
+                .group_by(MensagemChat.conversa_id).subquery()
+            linhas = session.query(Conversa, func.coalesce(totais.c.total, 0))\
+                .outerjoin(totais, totais.c.conversa_id == Conversa.id)\
+                .filter(Conversa.cnpj == cnpj)\
+                .order_by(Conversa.atualizado_em.desc()).limit(limite).all()
+            return [_conversa_para_dict(conversa, total) for conversa, total in linhas]
+        finally:
+            session.close()
+
+    def carregar_conversa(self, cnpj, conversa_id, limite=None):
+        """
+        Conversa com as mensagens em ordem cronológica (as últimas `limite`, se informado).
+
+        Returns:
+            dict ou None se a conversa não existir / for de outro CNPJ
+        """
+        session = SessionLocal()
+        try:
+            conversa = session.query(Conversa).filter_by(id=conversa_id, cnpj=cnpj).first()
+            if not conversa:
+                return None
+            query = session.query(MensagemChat).filter_by(conversa_id=conversa_id).order_by(MensagemChat.id.desc())
+            if limite:
+                query = query.limit(limite)
+            mensagens = [_mensagem_para_dict(m) for m in reversed(query.all())]
+            return {**_conversa_para_dict(conversa, len(mensagens)), "mensagens": mensagens}
+        finally:
+            session.close()
+
+    def ultima_mensagem_id(self, cnpj, conversa_id):
+        """Id da mensagem mais recente (0 se vazia); usado pra saber se o agente em memória está atrás."""
+        session = SessionLocal()
+        try:
+            ultimo = session.query(func.max(MensagemChat.id)).join(Conversa, Conversa.id == MensagemChat.conversa_id)\
+                .filter(Conversa.id == conversa_id, Conversa.cnpj == cnpj).scalar()
+            return ultimo or 0
+        finally:
+            session.close()
+
+    def ultimas_trocas(self, cnpj, conversa_id, trocas=HISTORY_TURNS):
+        """Últimas `trocas` pares user/model, no formato de histórico do Gemini ({'role', 'parts'})."""
+        conversa = self.carregar_conversa(cnpj, conversa_id, limite=trocas * 2)
+        if not conversa:
+            return []
+        mensagens = conversa["mensagens"]
+        # Histórico do Gemini precisa começar com 'user'
+        while mensagens and mensagens[0]["role"] != "user":
+            mensagens = mensagens[1:]
+        return [{"role": m["role"], "parts": [m["conteudo"]]} for m in mensagens]
+
+    def adicionar_troca(self, cnpj, conversa_id, pergunta, resposta):
+        """
+        Grava pergunta e resposta numa transação.
+
+        Returns:
+            int: Id da última mensagem gravada (ou 0 se a conversa não existir)
+        """
+        session = SessionLocal()
+        try:
+            conversa = session.query(Conversa).filter_by(id=conversa_id, cnpj=cnpj).first()
+            if not conversa:
+                return 0
+            resposta_msg = MensagemChat(conversa_id=conversa_id, role="model", conteudo=resposta)
+            session.add(MensagemChat(conversa_id=conversa_id, role="user", conteudo=pergunta))
+            session.add(resposta_msg)
+            if not conversa.titulo:
+                conversa.titulo = pergunta[:TAMANHO_TITULO]
+            conversa.atualizado_em = datetime.utcnow()
+            session.commit()
+            return resposta_msg.id
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def remover_conversa(self, cnpj, conversa_id):
+        """Apaga a conversa e suas mensagens. Retorna False se não existir."""
+        session = SessionLocal()
+        try:
+            conversa = session.query(Conversa).filter_by(id=conversa_id, cnpj=cnpj).first()
+            if not conversa:
+                return False
+            session.query(MensagemChat).filter_by(conversa_id=conversa_id).delete()
+            session.delete(conversa)
+            session.commit()
+            return True
+        finally:
+            session.close()
+
+
+_store = SQLiteChatStore()
+
+
+def obter_store():
+    return _store
+
+
+def configurar_store(store):
+    """Troca o store (qualquer objeto com a mesma interface de SQLiteChatStore)."""
+    global _store
+    _store = store
@@ -1,20 +1,57 @@
 """
 Gerenciador de sessões de chat com memória persistente por usuário.
-Mantém instâncias de GeminiAgent separadas para cada usuário (CNPJ).
+Mantém instâncias de GeminiAgent separadas para cada usuário (CNPJ) e conversa, com
+limite de sessões (LRU), expiração por inatividade e limite de tokens do histórico, pra
+que um worker de longa duração não acumule memória indefinidamente. O histórico de
+verdade fica no banco (services/chat_history.py); o agente é reidratado dele quando
+está atrás (outro worker respondeu, restart, sessão removida).
 """
+import os
+import time
+import threading
+from collections import OrderedDict
 from services.gemini_service import GeminiAgent
+from services.chat_history import obter_store
+
+MAX_SESSIONS = int(os.environ.get("CHAT_MAX_SESSIONS", "200"))
+MAX_HISTORY_TOKENS = int(os.environ.get("CHAT_MAX_HISTORY_TOKENS", "8000"))
+HISTORY_WINDOW = int(os.environ.get("CHAT_HISTORY_WINDOW", "6"))  # Trocas na íntegra; as anteriores viram resumo
+PROMPT_TOKEN_BUDGET = int(os.environ.get("CHAT_PROMPT_TOKEN_BUDGET", "16000"))  # Tokens por chamada ao modelo
+SESSION_TTL = int(os.environ.get("CHAT_SESSION_TTL", "1800"))  # Segundos sem uso até expirar
+SWEEP_INTERVAL = int(os.environ.get("CHAT_SWEEP_INTERVAL", "60"))  # Segundos entre varreduras
+
+COMPACTION_COUNTERS = ("tokens_saved_strip", "tokens_saved_summary", "tokens_saved_budget", "summaries")
 
 
 class ChatSessionManager:
     """
     Gerencia múltiplas sessões de chat com memória, uma por usuário.
+    As sessões ficam em ordem de uso (LRU); a menos usada sai quando o limite
+    é atingido e uma thread de varredura remove as que passaram do TTL.
     """
     
-    def __init__(self):
+    def __init__(self, max_sessions=MAX_SESSIONS, max_history_tokens=MAX_HISTORY_TOKENS,
+                 session_ttl=SESSION_TTL, sweep_interval=SWEEP_INTERVAL):
         """Inicializa o gerenciador de sessões."""
-        self.sessions = {}  # {cnpj: GeminiAgent}
+        self.sessions = OrderedDict()  # {session_key: GeminiAgent}, do menos ao mais recente
+        self.last_used = {}  # {session_key: time.monotonic() do último acesso}
+        self.synced_ids = {}  # {session_key: id da última mensagem persistida que o agente já tem}
+        self.max_sessions = max_sessions
+        self.max_history_tokens = max_history_tokens
+        self.session_ttl = session_ttl
+        self.sweep_interval = sweep_interval
+        self._lock = threading.RLock()
+        self._sweeper = None
+        self._stop_sweeper = threading.Event()
+        self._stats = {"created": 0, "evicted_lru": 0, "evicted_idle": 0, "removed": 0, "trimmed_messages": 0}
+        self._compaction_totals = dict.fromkeys(COMPACTION_COUNTERS, 0)  # Acumulado das sessões já removidas
+    
+    @staticmethod
+    def _session_key(cnpj, api_key, conversa_id=None):
+        session_key = f"{cnpj}_{api_key[-8:]}"  # Últimos 8 chars da chave
+        return f"{session_key}_{conversa_id}" if conversa_id else session_key
     
-    def get_agent(self, cnpj, api_key, modelo="gemini-2.0-flash-exp", system_instruction=None):
+    def get_agent(self, cnpj, api_key, modelo="gemini-2.0-flash-exp", system_instruction=None, conversa_id=None):
         """
         Obtém ou cria um agente para o usuário especificado.
         
@@ -23,36 +60,136 @@ class ChatSessionManager:
             api_key: Chave da API Gemini
             modelo: Nome do modelo a usar
             system_instruction: Instruções de sistema (opcional)
+            conversa_id: Conversa persistida; o agente é reidratado com as últimas trocas dela
         
         Returns:
             GeminiAgent: Instância do agente com memória
         """
-        # Criar chave única combinando CNPJ e parte da API key
-        session_key = f"{cnpj}_{api_key[-8:]}"  # Últimos 8 chars da chave
-        
-        # Se não existe ou API key mudou, criar novo agente
-        if session_key not in self.sessions:
-            self.sessions[session_key] = GeminiAgent(
-                api_key=api_key,
-                modelo=modelo,
-                system_instruction=system_instruction
-            )
-            print(f"✅ Nova sessão de chat criada para {cnpj}")
+        self.start_sweeper()
+        session_key = self._session_key(cnpj, api_key, conversa_id)
+        agent = self._get_or_create(session_key, cnpj, api_key, modelo, system_instruction)
+        if conversa_id:
+            self._sync_history(session_key, agent, cnpj, conversa_id)
+        return agent
+    
+    def _sync_history(self, session_key, agent, cnpj, conversa_id):
+        """Recarrega as últimas trocas do banco se alguma mensagem persistida não está no agente."""
+        store = obter_store()
+        ultimo_id = store.ultima_mensagem_id(cnpj, conversa_id)
+        if self.synced_ids.get(session_key) != ultimo_id:
+            agent.load_history(store.ultimas_trocas(cnpj, conversa_id))
+            self.synced_ids[session_key] = ultimo_id
+    
+    def record_turn(self, cnpj, api_key, conversa_id, pergunta, resposta):
+        """Persiste a troca e marca o agente da conversa como em dia com o banco."""
+        ultimo_id = obter_store().adicionar_troca(cnpj, conversa_id, pergunta, resposta)
+        session_key = self._session_key(cnpj, api_key, conversa_id)
+        with self._lock:
+            if session_key in self.sessions:
+                self.synced_ids[session_key] = ultimo_id
+    
+    def _get_or_create(self, session_key, cnpj, api_key, modelo, system_instruction):
+        """Agente da sessão (criado se não existe ou expirou), marcado como o mais recente."""
+        with self._lock:
+            agent = self.sessions.get(session_key)
+            if agent is not None and self._expired(session_key):
+                # Expirou mas a varredura ainda não passou: recria (e reidrata do banco)
+                self._evict(session_key, "evicted_idle")
+                agent = None
+            
+            # Se não existe ou API key mudou, criar novo agente
+            if agent is None:
+                agent = GeminiAgent(
+                    api_key=api_key,
+                    modelo=modelo,
+                    system_instruction=system_instruction,
+                    max_history_tokens=self.max_history_tokens,
+                    history_window=HISTORY_WINDOW,
+                    prompt_token_budget=PROMPT_TOKEN_BUDGET
+                )
+                self.sessions[session_key] = agent
+                self._stats["created"] += 1
+                print(f"✅ Nova sessão de chat criada para {cnpj}")
+                
+                while len(self.sessions) > self.max_sessions:
+                    self._evict(next(iter(self.sessions)), "evicted_lru")
+            
+            self.sessions.move_to_end(session_key)
+            self.last_used[session_key] = time.monotonic()
+            return agent
+    
+    def _expired(self, session_key):
+        return time.monotonic() - self.last_used.get(session_key, 0) > self.session_ttl
+    
+    def _evict(self, session_key, motivo):
+        """Remove a sessão (com o lock já adquirido) e contabiliza o motivo."""
+        agent = self.sessions.pop(session_key, None)
+        self.last_used.pop(session_key, None)
+        self.synced_ids.pop(session_key, None)
+        self._stats[motivo] += 1
+        if agent is not None:
+            self._stats["trimmed_messages"] += agent.trimmed_messages
+            for campo in COMPACTION_COUNTERS:
+                self._compaction_totals[campo] += agent.compaction_stats[campo]
+    
+    def sweep_expired(self):
+        """
+        Remove as sessões sem uso há mais de session_ttl segundos.
         
-        return self.sessions[session_key]
+        Returns:
+            int: Quantidade de sessões removidas
+        """
+        with self._lock:
+            expiradas = [key for key in self.sessions if self._expired(key)]
+            for session_key in expiradas:
+                self._evict(session_key, "evicted_idle")
+        if expiradas:
+            print(f"🧹 {len(expiradas)} sessão(ões) de chat expirada(s) removida(s)")
+        return len(expiradas)
+    
+    def _sweep_loop(self):
+        while not self._stop_sweeper.wait(self.sweep_interval):
+            try:
+                self.sweep_expired()
+            except Exception as e:
+                print(f"⚠️ Erro na varredura de sessões de chat: {e}")
+    
+    def start_sweeper(self):
+        """Inicia (uma vez) a thread daemon que varre sessões expiradas."""
+        if self._sweeper is not None and self._sweeper.is_alive():
+            return
+        with self._lock:
+            if self._sweeper is None or not self._sweeper.is_alive():
+                self._stop_sweeper.clear()
+                self._sweeper = threading.Thread(target=self._sweep_loop, name="chat-session-sweeper", daemon=True)
+                self._sweeper.start()
+    
+    def stop_sweeper(self):
+        """Interrompe a thread de varredura."""
+        self._stop_sweeper.set()
     
-    def clear_session(self, cnpj, api_key):
+    def clear_session(self, cnpj, api_key, conversa_id=None):
         """
         Limpa o histórico de uma sessão específica.
         
         Args:
             cnpj: CNPJ do usuário
             api_key: Chave da API
+            conversa_id: Conversa persistida (também é apagada do banco)
         """
-        session_key = f"{cnpj}_{api_key[-8:]}"
+        session_key = self._session_key(cnpj, api_key, conversa_id)
+        if conversa_id:
+            obter_store().remover_conversa(cnpj, conversa_id)
+            with self._lock:
+                if session_key in self.sessions:
+                    self._evict(session_key, "removed")
+            print(f"✅ Conversa {conversa_id} apagada para {cnpj}")
+            return
         
-        if session_key in self.sessions:
-            self.sessions[session_key].clear_history()
+        with self._lock:
+            agent = self.sessions.get(session_key)
+        if agent is not None:
+            agent.clear_history()
             print(f"✅ Histórico limpo para {cnpj}")
         else:
             print(f"⚠️ Nenhuma sessão ativa para {cnpj}")
@@ -65,27 +202,31 @@ class ChatSessionManager:
             cnpj: CNPJ do usuário
             api_key: Chave da API
         """
-        session_key = f"{cnpj}_{api_key[-8:]}"
+        session_key = self._session_key(cnpj, api_key)
         
-        if session_key in self.sessions:
-            del self.sessions[session_key]
-            print(f"✅ Sessão removida para {cnpj}")
+        with self._lock:
+            if session_key in self.sessions:
+                self._evict(session_key, "removed")
+                print(f"✅ Sessão removida para {cnpj}")
     
-    def get_session_summary(self, cnpj, api_key):
+    def get_session_summary(self, cnpj, api_key, conversa_id=None):
         """
         Retorna estatísticas da sessão de um usuário.
         
         Args:
             cnpj: CNPJ do usuário
             api_key: Chave da API
+            conversa_id: Conversa persistida (opcional)
         
         Returns:
             dict: Estatísticas da conversa ou None se não existir
         """
-        session_key = f"{cnpj}_{api_key[-8:]}"
+        session_key = self._session_key(cnpj, api_key, conversa_id)
         
-        if session_key in self.sessions:
-            return self.sessions[session_key].get_conversation_summary()
+        with self._lock:
+            agent = self.sessions.get(session_key)
+        if agent is not None:
+            return agent.get_conversation_summary()
         return None
     
     def get_active_sessions_count(self):
@@ -96,6 +237,35 @@ class ChatSessionManager:
             int: Quantidade de sessões ativas
         """
         return len(self.sessions)
+    
+    def get_metrics(self):
+        """
+        Métricas do gerenciador: sessões ativas/criadas/removidas por motivo e
+        memória ocupada pelos históricos (caracteres e tokens estimados).
+        
+        Returns:
+            dict: Métricas agregadas de todas as sessões deste processo
+        """
+        with self._lock:
+            agents = list(self.sessions.values())
+            metrics = dict(self._stats)
+            compaction = dict(self._compaction_totals)
+        for campo in COMPACTION_COUNTERS:
+            compaction[campo] += sum(agent.compaction_stats[campo] for agent in agents)
+        
+        history_chars = sum(agent.history_chars() for agent in agents)
+        metrics.update({
+            "active_sessions": len(agents),
+            "max_sessions": self.max_sessions,
+            "session_ttl": self.session_ttl,
+            "max_history_tokens": self.max_history_tokens,
+            "history_messages": sum(len(agent.history) for agent in agents),
+            "history_chars": history_chars,
+            "estimated_tokens": sum(agent.estimate_tokens() for agent in agents),
+            "trimmed_messages": metrics["trimmed_messages"] + sum(agent.trimmed_messages for agent in agents),
+            "compaction": compaction
+        })
+        return metrics
 
 
 # Instância global do gerenciador (singleton)
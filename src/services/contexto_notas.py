@@ -0,0 +1,87 @@
+"""
+Texto de contexto do chat: dados do usuário e resumo das notas com itens e impostos.
+Só depende de uma sessão do SQLAlchemy (nada de Flask), então dá pra medir e testar
+direto contra um banco qualquer. As notas vêm com os itens numa única consulta
+(selectinload: 1 SELECT de notas + 1 de itens) e os itens de cada nota são cortados
+por um orçamento de tokens dividido entre as notas.
+"""
+import os
+import logging
+from sqlalchemy.orm import selectinload
+from models.nota_fiscal import NotaFiscal
+from models.usuario import Usuario
+from services.rbt12 import rbt12_do_usuario
+from services.chat_compaction import CHARS_POR_TOKEN
+
+LIMITE_NOTAS = 5
+ORCAMENTO_TOKENS_NOTAS = int(os.environ.get("CHAT_CONTEXT_NOTES_TOKENS", "3000"))  # Itens de todas as notas juntas
+
+
+def contexto_usuario(session, cnpj):
+    """Linha com regime tributário + natureza_juridica + RBT12 do usuário."""
+    usuario = session.query(Usuario).filter_by(cnpj=cnpj).first()
+    regime = usuario.regime_tributario if usuario else "desconhecido"
+    natureza = usuario.natureza_juridica if usuario else "desconhecida"
+    rbt12 = rbt12_do_usuario(session, usuario)  # Manual ou calculado do resumo mensal (12 linhas)
+    return f"Regime: {regime}, Natureza: {natureza}, RBT12 (Receita Bruta últimos 12 meses): R$ {rbt12:,.2f}.\n"
+
+
+def formatar_item(item):
+    return (
+        f"{item.descricao_produto or 'N/A'} (qtd:{float(item.quantidade or 0)}, "
+        f"unit:R${float(item.valor_unitario or 0):.2f}, total:R${float(item.valor_total or 0):.2f}, "
+        f"NCM:{item.ncm or 'N/A'}, CFOP:{item.cfop or 'N/A'}, CST IPI:{item.cst_ipi or 'N/A'}, "
+        f"ICMS:R${item.icms_valor or 0:.2f}, IPI:R${item.ipi_valor or 0:.2f}, "
+        f"PIS:R${item.pis_valor or 0:.2f}, COFINS:R${item.cofins_valor or 0:.2f})"
+    )
+
+
+def formatar_nota(nota, itens_str):
+    return (
+        f"- Nota {nota.numero} ({nota.data_emissao}): Total R${nota.valor_total_nota or 0}, "
+        f"Natureza: {nota.natureza_operacao or 'N/A'}, Tipo: {nota.tipo_operacao or 'N/A'}. Itens: {itens_str}."
+    )
+
+
+def itens_no_orcamento(itens, orcamento_chars):
+    """Itens formatados até o orçamento (o primeiro sempre entra); o resto vira um aviso de omissão."""
+    partes = []
+    usados = 0
+    for indice, item in enumerate(itens):
+        texto = formatar_item(item)
+        if partes and usados + len(texto) > orcamento_chars:
+            partes.append(f"... +{len(itens) - indice} itens omitidos")
+            break
+        partes.append(texto)
+        usados += len(texto) + 2  # "; "
+    return partes, usados
+
+
+def contexto_notas(session, cnpj, filter_tipo=None, limite=LIMITE_NOTAS, orcamento_tokens=ORCAMENTO_TOKENS_NOTAS):
+    """
+    Resumo das últimas `limite` notas do usuário (emitente ou destinatário), filtradas por
+    tipo se pedido. Cada nota recebe uma fatia do orçamento de tokens dos itens; o que
+    uma nota não usa fica para as seguintes.
+    """
+    query = session.query(NotaFiscal).options(selectinload(NotaFiscal.itens)).filter(
+        (NotaFiscal.cnpj_emitente == cnpj) | (NotaFiscal.cnpj_destinatario == cnpj)
+    )
+    if filter_tipo:
+        query = query.filter(NotaFiscal.tipo_operacao == filter_tipo)
+    notas = query.order_by(NotaFiscal.data_emissao.desc()).limit(limite).all()
+
+    if not notas:
+        return "Nenhuma nota encontrada."
+
+    linhas = ["Notas:"]
+    restante = orcamento_tokens * CHARS_POR_TOKEN
+    total_itens = 0
+    for posicao, nota in enumerate(notas):
+        itens = sorted(nota.itens, key=lambda item: item.id)
+        total_itens += len(itens)
+        partes, usados = itens_no_orcamento(itens, restante // (len(notas) - posicao))
+        restante = max(0, restante - usados)
+        linhas.append(formatar_nota(nota, "; ".join(partes) if partes else "Sem itens."))
+
+    logging.debug(f"CHAT: {len(notas)} notas com {total_itens} itens no contexto.")
+    return "\n".join(linhas) + "\n"
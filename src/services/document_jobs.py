@@ -0,0 +1,137 @@
+"""
+Fila local de processamento de documentos em segundo plano.
+O upload vira um job persistido na tabela jobs_processamento (mesmo SQLite do app)
+e é executado num pool de threads; qualquer worker do gunicorn consegue responder
+o status, já que ele fica no banco e não na memória do processo.
+"""
+import os
+import json
+import time
+import uuid
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from database.connection import SessionLocal
+from models.job_processamento import JobProcessamento
+
+MAX_WORKERS = int(os.environ.get("DOCUMENT_JOB_WORKERS", "2"))
+INTERVALO_PROGRESSO = 1.0  # Segundos mínimos entre gravações de progresso no banco
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="document-job")
+
+
+def job_para_dict(job):
+    """Serializa o job pro JSON das rotas de status (a rota remove o cnpj antes de responder)."""
+    return {
+        "job_id": job.id,
+        "cnpj": job.cnpj,
+        "status": job.status,
+        "total_arquivos": job.total_arquivos,
+        "processados": job.processados,
+        "resultados": json.loads(job.resultados or "[]"),
+        "erro": job.erro,
+        "criado_em": job.criado_em.isoformat() if job.criado_em else None,
+        "atualizado_em": job.atualizado_em.isoformat() if job.atualizado_em else None
+    }
+
+
+def _atualizar_job(job_id, **campos):
+    session = SessionLocal()
+    try:
+        session.query(JobProcessamento).filter_by(id=job_id).update(campos)
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        logging.error(f"ERRO ATUALIZAR JOB {job_id}: {e}")
+    finally:
+        session.close()
+
+
+def submeter_job(cnpj, total_arquivos, tarefa):
+    """
+    Cria o job no banco e agenda a execução no pool.
+
+    Args:
+        cnpj: CNPJ dono do job (pode ser None pra uploads sem sessão)
+        total_arquivos: Quantidade de arquivos, pra cálculo de progresso
+        tarefa: Callable tarefa(ao_progredir) -> lista de resultados por arquivo.
+            ao_progredir(processados, resultados) deve ser chamado a cada arquivo.
+
+    Returns:
+        str: ID do job
+    """
+    job_id = uuid.uuid4().hex
+    session = SessionLocal()
+    try:
+        session.add(JobProcessamento(id=job_id, cnpj=cnpj, status="pendente", total_arquivos=total_arquivos))
+        session.commit()
+    finally:
+        session.close()
+
+    _executor.submit(_executar_job, job_id, tarefa)
+    logging.debug(f"JOB CRIADO: {job_id} ({total_arquivos} arquivos)")
+    return job_id
+
+
+def _executar_job(job_id, tarefa):
+    _atualizar_job(job_id, status="processando")
+    ultima_gravacao = 0.0
+
+    def ao_progredir(processados, resultados):
+        nonlocal ultima_gravacao
+        agora = time.monotonic()
+        if agora - ultima_gravacao < INTERVALO_PROGRESSO:
+            return  # Evita um commit por arquivo em uploads grandes
+        ultima_gravacao = agora
+        _atualizar_job(job_id, processados=processados, resultados=json.dumps(resultados, ensure_ascii=False))
+
+    try:
+        resultados = tarefa(ao_progredir)
+        _atualizar_job(
+            job_id,
+            status="concluido",
+            processados=JobProcessamento.total_arquivos,
+            resultados=json.dumps(resultados, ensure_ascii=False)
+        )
+        logging.debug(f"JOB CONCLUÍDO: {job_id}")
+    except Exception as e:
+        logging.error(f"ERRO JOB {job_id}: {e}")
+        _atualizar_job(job_id, status="erro", erro=str(e))
+
+
+def buscar_job(job_id):
+    """Retorna o job (ou None) como dict."""
+    session = SessionLocal()
+    try:
+        job = session.query(JobProcessamento).filter_by(id=job_id).first()
+        return job_para_dict(job) if job else None
+    finally:
+        session.close()
+
+
+def listar_jobs(cnpj, limite=20):
+    """Jobs mais recentes do usuário, do mais novo pro mais antigo."""
+    session = SessionLocal()
+    try:
+        jobs = session.query(JobProcessamento).filter_by(cnpj=cnpj)\
+            .order_by(JobProcessamento.criado_em.desc()).limit(limite).all()
+        return [job_para_dict(job) for job in jobs]
+    finally:
+        session.close()
+
+
+def marcar_jobs_interrompidos():
+    """
+    Jobs pendentes/em processamento de uma execução anterior não têm mais os
+    arquivos em memória: marca como erro pra o front parar de esperar.
+    Chamado no init da aplicação, antes de subir os workers.
+    """
+    session = SessionLocal()
+    try:
+        total = session.query(JobProcessamento).filter(
+            JobProcessamento.status.in_(["pendente", "processando"])
+        ).update({"status": "erro", "erro": "Processamento interrompido (reinício do servidor). Reenvie os arquivos."},
+                 synchronize_session=False)
+        session.commit()
+        return total
+    finally:
+        session.close()
@@ -0,0 +1,206 @@
+"""
+Extração de NF-e de PDFs pela IA, em lotes.
+Os PDFs que o parser do DANFE não resolveu sozinho (ver processors/danfe_parser.py)
+vão juntos num mesmo pedido ao Gemini, que devolve um array JSON com um objeto por
+documento:
+- Lotes montados por orçamento de tokens (PDF_LLM_BATCH_TOKENS) e número de
+  documentos (PDF_LLM_BATCH_DOCS; 1 = um PDF por chamada, como antes)
+- Lotes rodam em paralelo, limitados por um semáforo do processo todo
+  (PDF_LLM_CONCURRENCY), então vários uploads ao mesmo tempo não estouram a cota
+- Cliente da API reaproveitado por chave (gemini_service.cliente_gemini)
+- Só os documentos que falharam (lote com erro, JSON inválido, documento ausente na
+  resposta) são reenviados, em lotes menores
+"""
+import os
+import re
+import json
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from services.chat_compaction import estimar_tokens
+
+try:
+    from services.gemini_service import gerar_conteudo
+except Exception:
+    gerar_conteudo = None
+
+LOTE_TOKENS = int(os.environ.get("PDF_LLM_BATCH_TOKENS", "30000"))  # Tokens (estimados) de texto por pedido
+LOTE_MAX_DOCS = int(os.environ.get("PDF_LLM_BATCH_DOCS", "8"))
+CONCORRENCIA = int(os.environ.get("PDF_LLM_CONCURRENCY", "4"))  # Pedidos simultâneos ao Gemini (processo todo)
+TENTATIVAS = 1 + int(os.environ.get("PDF_LLM_RETRIES", "2"))
+ESPERA_NOVA_TENTATIVA = 1.0  # Segundos (multiplicado pela tentativa) antes de reenviar as falhas
+
+_semaforo = threading.BoundedSemaphore(CONCORRENCIA)
+_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="extracao-pdf")
+
+# Campos pedidos à IA (na ordem do JSON) e o formato de cada um
+_ESQUEMA = {
+    "numero": '"número da NF"',
+    "data_emissao": '"YYYY-MM-DD"',
+    "cnpj_emitente": '"14 dígitos sem pontos"',
+    "nome_emitente": '"razão social"',
+    "ie_emitente": '"IE sem pontos"',
+    "endereco_emitente": '"endereço completo"',
+    "cnpj_destinatario": '"14 dígitos sem pontos"',
+    "nome_destinatario": '"nome"',
+    "ie_destinatario": '"IE sem pontos"',
+    "endereco_destinatario": '"endereço completo"',
+    "chave_nfe": '"44 dígitos"',
+    "natureza_operacao": '"descrição"',
+    "valor_total_nota": 'número float sem R$',
+    "tipo_operacao": '"Entrada/Saída"',  # A IA infere, mas corrigiremos pós-parse
+    "versao": '"versão SEFAZ"',
+    "itens": """[
+                        {
+                            "codigo_produto": "código",
+                            "descricao_produto": "nome produto",
+                            "ncm": "8 dígitos",
+                            "cst_ipi": "código",
+                            "cfop": "código",
+                            "unidade": "UN",
+                            "quantidade": número float,
+                            "valor_unitario": número float sem R$,
+                            "valor_total": número float sem R$,
+                            "cst_icms": "código",
+                            "cst_pis": "código",
+                            "cst_cofins": "código",
+                            "cest": "código",
+                            "icms_valor": número float,
+                            "ipi_valor": número float,
+                            "pis_valor": número float,
+                            "cofins_valor": número float
+                        }
+                    ]"""
+}
+TODOS_OS_CAMPOS = list(_ESQUEMA)
+
+
+def campos_pedidos(faltando):
+    """
+    Campos a pedir para um PDF: os que o parser do DANFE não achou ou, se ele não achou
+    nada (faltando=None), todos, inclusive os opcionais (IE, endereço, versão).
+    """
+    if faltando is None:
+        return TODOS_OS_CAMPOS
+    return [campo for campo in _ESQUEMA if campo in faltando]
+
+
+def _estrutura(campos):
+    return ",\n".join(f'                    "{campo}": {_ESQUEMA[campo]}' for campo in campos)
+
+
+def prompt_lote(documentos):
+    """
+    Prompt de vários PDFs: um array JSON com um objeto por documento, identificado pelo
+    número do documento no lote. documentos: lista de (texto, faltando).
+    """
+    campos = [campo for campo in _ESQUEMA if any(campo in campos_pedidos(f) for _, f in documentos)]
+    blocos = "\n".join(
+        f"=== DOCUMENTO {numero} ===\nCampos: {', '.join(campos_pedidos(faltando))}\nTexto do PDF: {texto}"
+        for numero, (texto, faltando) in enumerate(documentos, 1)
+    )
+    return f"""Extraia dados de Notas Fiscais Eletrônicas de {len(documentos)} PDFs de texto. Retorne APENAS um array JSON cru válido, SEM markdown, blocos de código (sem ```), texto extra ou explicações, com um objeto por documento, na ordem dos documentos. Cada objeto tem "documento" (o número do documento) e somente os campos listados em "Campos" daquele documento, neste formato:
+                {{
+                    "documento": número do documento,
+{_estrutura(campos)}
+                }}
+Se dados faltarem, use null. Não misture dados de documentos diferentes. JSON Puro APENAS!
+{blocos}
+"""
+
+
+def ler_json_resposta(resposta):
+    """JSON da resposta da IA, tirando cercas de markdown (```json ... ```) se vierem."""
+    texto = (resposta or "").strip()
+    texto = re.sub(r"^```(?:json)?\s*", "", texto)
+    texto = re.sub(r"\s*```$", "", texto)
+    return json.loads(texto)
+
+
+def montar_lotes(indices, documentos, orcamento_tokens=LOTE_TOKENS, max_docs=LOTE_MAX_DOCS):
+    """
+    Agrupa os documentos (posições em `indices`) em lotes gulosos, na ordem: cada lote
+    até orcamento_tokens de texto e max_docs documentos. Um PDF maior que o orçamento
+    vai sozinho.
+    """
+    lotes, atual, usados = [], [], 0
+    for indice in indices:
+        tokens = estimar_tokens(documentos[indice][0]) + 50  # + cabeçalho do documento
+        if atual and (usados + tokens > orcamento_tokens or len(atual) >= max_docs):
+            lotes.append(atual)
+            atual, usados = [], 0
+        atual.append(indice)
+        usados += tokens
+    if atual:
+        lotes.append(atual)
+    return lotes
+
+
+def _executar_lote(lote, documentos, api_key, modelo):
+    """Um pedido ao Gemini com os documentos do lote. Retorna {indice: dict} dos que vieram certos."""
+    with _semaforo:
+        resposta = gerar_conteudo(prompt_lote([documentos[i] for i in lote]), api_key, modelo, resposta_json=True)
+    dados = ler_json_resposta(resposta)
+    if isinstance(dados, dict):
+        dados = [dados]  # Lote de um documento às vezes volta como objeto solto
+    if not isinstance(dados, list):
+        raise ValueError(f"resposta não é um array JSON ({type(dados).__name__})")
+
+    extraidos = {}
+    for posicao, objeto in enumerate(dados):
+        if not isinstance(objeto, dict):
+            continue
+        numero = objeto.pop("documento", posicao + 1)
+        try:
+            numero = int(numero)
+        except (TypeError, ValueError):
+            continue
+        if 1 <= numero <= len(lote):
+            extraidos[lote[numero - 1]] = objeto
+    return extraidos
+
+
+def extrair_em_lote(documentos, api_key, modelo):
+    """
+    Extrai os campos de vários PDFs com o mínimo de chamadas à IA.
+
+    Args:
+        documentos: lista de (texto, faltando); faltando = campos a pedir
+            (campos_faltantes do parser do DANFE) ou None para pedir tudo
+        api_key: chave do Gemini do usuário
+        modelo: nome do modelo
+
+    Returns:
+        lista na mesma ordem: dict com os campos extraídos, ou None se o documento
+        falhou em todas as tentativas
+    """
+    resultados = [None] * len(documentos)
+    if not documentos or gerar_conteudo is None:
+        return resultados
+
+    inicio = time.perf_counter()
+    pendentes = list(range(len(documentos)))
+    pedidos = 0
+    for tentativa in range(TENTATIVAS):
+        if tentativa:
+            time.sleep(ESPERA_NOVA_TENTATIVA * tentativa)
+        # Nas novas tentativas os lotes encolhem: um documento problemático atrapalha menos os outros
+        lotes = montar_lotes(pendentes, documentos, max_docs=max(1, LOTE_MAX_DOCS >> (2 * tentativa)))
+        futuros = [(lote, _executor.submit(_executar_lote, lote, documentos, api_key, modelo)) for lote in lotes]
+        pedidos += len(lotes)
+        for lote, futuro in futuros:
+            try:
+                for indice, dados in futuro.result().items():
+                    resultados[indice] = dados
+            except Exception as e:
+                logging.warning(f"EXTRAÇÃO IA: lote de {len(lote)} PDF(s) falhou (tentativa {tentativa + 1}): {e}")
+        pendentes = [indice for indice in pendentes if resultados[indice] is None]
+        if not pendentes:
+            break
+
+    logging.debug(
+        f"EXTRAÇÃO IA: {len(documentos)} PDF(s) em {pedidos} pedido(s), "
+        f"{len(pendentes)} falha(s), {(time.perf_counter() - inicio) * 1000:.0f}ms"
+    )
+    return resultados
@@ -2,7 +2,57 @@
 Serviço para integração com Google Gemini AI com memória de conversação
 """
 import os
+import logging
+import threading
+from collections import OrderedDict
 import google.generativeai as genai
+import google.ai.generativelanguage as glm
+from services.chat_compaction import CHARS_POR_TOKEN, compactar, remover_blocos_dados, estimar_tokens, eh_resumo
+
+
+GEMINI_API_ENDPOINT = os.environ.get("GEMINI_API_ENDPOINT")  # Outro servidor (ex.: Gemini falso local); usa REST
+MAX_CLIENTES = 32  # Clientes da API reaproveitados (um por chave de API)
+
+_clientes = OrderedDict()  # api_key -> GenerativeServiceClient (LRU)
+_clientes_lock = threading.Lock()
+
+
+def cliente_gemini(api_key):
+    """
+    Cliente da API configurado para a chave, criado uma vez e reaproveitado (conexões
+    incluídas). Diferente de genai.configure, que é global, cada chave tem o seu
+    cliente: chamadas simultâneas de usuários diferentes não trocam de chave.
+    """
+    with _clientes_lock:
+        cliente = _clientes.get(api_key)
+        if cliente is not None:
+            _clientes.move_to_end(api_key)
+            return cliente
+    opcoes = {"api_key": api_key}
+    if GEMINI_API_ENDPOINT:
+        opcoes["api_endpoint"] = GEMINI_API_ENDPOINT
+    cliente = glm.GenerativeServiceClient(transport="rest" if GEMINI_API_ENDPOINT else None, client_options=opcoes)
+    with _clientes_lock:
+        _clientes[api_key] = cliente
+        while len(_clientes) > MAX_CLIENTES:
+            _clientes.popitem(last=False)
+    return cliente
+
+
+def gerar_conteudo(prompt, api_key, modelo="gemini-2.0-flash-exp", resposta_json=False):
+    """
+    Uma chamada generateContent sem histórico pelo cliente reaproveitado.
+    resposta_json pede ao modelo JSON puro (response_mime_type). Levanta exceção em erro.
+    """
+    requisicao = glm.GenerateContentRequest(
+        model=f"models/{modelo}",
+        contents=[glm.Content(role="user", parts=[glm.Part(text=prompt)])],
+        generation_config=glm.GenerationConfig(response_mime_type="application/json") if resposta_json else None
+    )
+    resposta = cliente_gemini(api_key).generate_content(request=requisicao)
+    if not resposta.candidates:
+        raise ValueError(f"resposta sem candidatos ({resposta.prompt_feedback})")
+    return "".join(parte.text for parte in resposta.candidates[0].content.parts).strip()
 
 
 class GeminiAgent:
@@ -11,7 +61,8 @@ class GeminiAgent:
     Mantém o histórico da conversa para contexto contínuo entre mensagens.
     """
     
-    def __init__(self, api_key=None, modelo="gemini-2.0-flash-exp", system_instruction=None):
+    def __init__(self, api_key=None, modelo="gemini-2.0-flash-exp", system_instruction=None, max_history_tokens=None,
+                 history_window=None, prompt_token_budget=None):
         """
         Inicializa o agente Gemini com memória de chat.
         
@@ -19,11 +70,24 @@ class GeminiAgent:
             api_key: Chave da API (OBRIGATÓRIO - deve ser fornecida pelo usuário)
             modelo: Nome do modelo Gemini a ser usado
             system_instruction: Instruções de sistema/personalidade do agente (opcional)
+            max_history_tokens: Limite (estimado) de tokens do histórico; None = sem limite
+            history_window: Trocas mantidas na íntegra; as anteriores viram resumo (None = não resume)
+            prompt_token_budget: Orçamento (estimado) de tokens por chamada; None = sem limite
         """
         self.api_key = api_key  # Chave deve vir do frontend, não do ambiente
         self.modelo = modelo
         self.system_instruction = system_instruction
+        self.max_history_tokens = max_history_tokens
+        self.history_window = history_window
+        self.prompt_token_budget = prompt_token_budget
+        # Instrumentação da compactação (tokens estimados)
+        self.compaction_stats = {
+            "tokens_saved_strip": 0, "tokens_saved_summary": 0, "tokens_saved_budget": 0,
+            "summaries": 0, "last_prompt_tokens": 0
+        }
         self.history = []  # Histórico de mensagens (user/model)
+        self.trimmed_messages = 0  # Mensagens descartadas por trim_history
+        self.last_error = None  # Erro da última send_message (None se deu certo)
         self.chat_session = None
         self._initialize_chat()
     
@@ -65,23 +129,71 @@ class GeminiAgent:
         Returns:
             str: Resposta do modelo ou mensagem de erro
         """
+        self.last_error = None
         try:
             if not self.chat_session:
                 self._initialize_chat()
             
+            # Compacta o histórico antes de mandar (blocos de dados, resumo, orçamento)
+            self.compact_history(message)
+            
             # Enviar mensagem e obter resposta
             response = self.chat_session.send_message(message)
             response_text = response.text.strip()
             
-            # O histórico é automaticamente atualizado pela API
-            # mas mantemos uma cópia local para referência
-            self.history = self.chat_session.history
-            
+            self._after_response()
             return response_text
             
         except Exception as e:
+            self.last_error = e
             return f"⚠️ Erro ao processar mensagem: {e}"
     
+    def send_message_stream(self, message):
+        """
+        Como send_message, mas gera a resposta em pedaços à medida que a API
+        devolve (stream=True). O histórico é atualizado quando o stream termina.
+        
+        Args:
+            message: Mensagem do usuário (string)
+        
+        Yields:
+            str: Trechos da resposta (ou a mensagem de erro)
+        """
+        self.last_error = None
+        try:
+            if not self.chat_session:
+                self._initialize_chat()
+            
+            self.compact_history(message)
+            
+            response = self.chat_session.send_message(message, stream=True)
+            for chunk in response:
+                try:
+                    texto = chunk.text
+                except ValueError:
+                    continue  # Pedaço sem texto (ex.: só finish_reason)
+                if texto:
+                    yield texto
+            
+            self._after_response()
+            
+        except Exception as e:
+            self.last_error = e
+            yield f"⚠️ Erro ao processar mensagem: {e}"
+    
+    def _after_response(self):
+        """Atualiza a cópia local do histórico e aplica limpeza/limite depois de uma resposta."""
+        # O histórico é automaticamente atualizado pela API
+        # mas mantemos uma cópia local para referência
+        self.history = self.chat_session.history
+        # O bloco de dados da mensagem recém-enviada não precisa ficar na memória
+        limpas, economia = remover_blocos_dados(self._history_as_messages())
+        if economia:
+            self._set_history(limpas)
+            self.compaction_stats["tokens_saved_strip"] += economia
+        if self.max_history_tokens:
+            self.trim_history(self.max_history_tokens)
+    
     def get_history(self):
         """
         Retorna o histórico completo da conversa.
@@ -106,6 +218,101 @@ class GeminiAgent:
         self._initialize_chat()
         print("✅ Histórico de chat limpo. Nova conversa iniciada.")
     
+    def load_history(self, history):
+        """
+        Substitui o histórico (ex.: reidratação a partir do banco).
+        
+        Args:
+            history: Lista de {'role': 'user'|'model', 'parts': [texto]}
+        """
+        if not self.chat_session:
+            self._initialize_chat()
+        self.chat_session.history = history
+        self.history = self.chat_session.history
+    
+    @staticmethod
+    def _message_text(msg):
+        return "".join(getattr(part, 'text', '') or '' for part in msg.parts)
+    
+    def _history_as_messages(self):
+        return [{"role": msg.role, "text": self._message_text(msg)} for msg in self.history]
+    
+    def _set_history(self, messages):
+        self.chat_session.history = [{"role": m["role"], "parts": [m["text"]]} for m in messages]
+        self.history = self.chat_session.history
+    
+    def _summarize(self, previous_summary, turns):
+        """Resumo das trocas antigas feito pelo próprio modelo (usado pela compactação)."""
+        trocas = "\n\n".join(f"Cliente: {pergunta}\nContador: {resposta}" for pergunta, resposta in turns)
+        prompt = (
+            "Resuma a conversa abaixo entre um cliente e seu contador em no máximo 200 palavras, "
+            "em tópicos. Preserve números, valores, CNPJs, notas citadas, decisões e pendências.\n\n"
+            f"Resumo anterior:\n{previous_summary or '(nenhum)'}\n\nNovas trocas:\n{trocas}"
+        )
+        # Cliente da própria chave: genai.configure é global e trocaria a chave de outros chats
+        return gerar_conteudo(prompt, self.api_key, self.modelo)
+    
+    def compact_history(self, next_message=""):
+        """
+        Aplica a compactação (services/chat_compaction.py) antes de uma chamada e
+        acumula os tokens economizados em compaction_stats.
+        
+        Returns:
+            dict: Estatísticas desta compactação
+        """
+        if not self.chat_session:
+            self._initialize_chat()
+        antes = self._history_as_messages()
+        depois, stats = compactar(
+            antes, next_message,
+            janela=self.history_window,
+            orcamento=self.prompt_token_budget,
+            resumidor=self._summarize,
+            tokens_fixos=estimar_tokens(self.system_instruction)
+        )
+        if depois != antes:
+            self._set_history(depois)
+        for campo in ("tokens_saved_strip", "tokens_saved_summary", "tokens_saved_budget"):
+            self.compaction_stats[campo] += stats[campo]
+        self.compaction_stats["summaries"] += int(stats["summarized"])
+        self.compaction_stats["last_prompt_tokens"] = stats["prompt_tokens"]
+        logging.debug(f"CHAT COMPACTION: {stats}")
+        return stats
+    
+    @staticmethod
+    def _message_chars(msg):
+        return sum(len(getattr(part, 'text', '') or '') for part in msg.parts)
+    
+    def history_chars(self):
+        """Total de caracteres de texto guardados no histórico."""
+        return sum(self._message_chars(msg) for msg in self.history)
+    
+    def estimate_tokens(self):
+        """Estimativa de tokens do histórico (caracteres / CHARS_POR_TOKEN)."""
+        return self.history_chars() // CHARS_POR_TOKEN
+    
+    def trim_history(self, max_tokens):
+        """
+        Descarta as trocas mais antigas (pares user/model) até o histórico caber em
+        max_tokens, mantendo sempre a última troca e o resumo da compactação.
+        
+        Returns:
+            int: Quantidade de mensagens removidas
+        """
+        tamanhos = [self._message_chars(msg) for msg in self.history]
+        total = sum(tamanhos)
+        # O par de resumo (se houver) fica no início e não é descartado
+        inicio = 2 if self.history and eh_resumo({"role": self.history[0].role, "text": self._message_text(self.history[0])}) else 0
+        removidas = 0
+        while len(tamanhos) - inicio - removidas > 2 and total // CHARS_POR_TOKEN > max_tokens:
+            total -= tamanhos[inicio + removidas] + tamanhos[inicio + removidas + 1]
+            removidas += 2
+        if removidas:
+            self.chat_session.history = self.history[:inicio] + self.history[inicio + removidas:]
+            self.history = self.chat_session.history
+            self.trimmed_messages += removidas
+        return removidas
+    
     def get_conversation_summary(self):
         """
         Retorna um resumo da conversa (quantidade de mensagens).
@@ -119,14 +326,17 @@ class GeminiAgent:
         return {
             'total_messages': len(self.history),
             'user_messages': user_messages,
-            'model_messages': model_messages
+            'model_messages': model_messages,
+            'estimated_tokens': self.estimate_tokens(),
+            'compaction': dict(self.compaction_stats)
         }
 
 
 # Função legada para compatibilidade com código existente
 def chamar_gemini(prompt, api_key=None, modelo="gemini-2.0-flash-exp"):
     """
-    Função legada para compatibilidade. Cria um agente temporário sem memória.
+    Função legada para compatibilidade. Chamada única, sem memória (cliente da API
+    reaproveitado por chave, ver cliente_gemini).
     
     NOTA: Para conversas com memória, use a classe GeminiAgent diretamente.
     
@@ -142,10 +352,7 @@ def chamar_gemini(prompt, api_key=None, modelo="gemini-2.0-flash-exp"):
         if not api_key:
             return "❌ Nenhuma chave de API fornecida. Por favor, insira sua chave no frontend."
 
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel(modelo)
-        response = model.generate_content(prompt)
-        return response.text.strip()
+        return gerar_conteudo(prompt, api_key, modelo)
 
     except Exception as e:
         return f"⚠️ Erro ao chamar Gemini: {e}"
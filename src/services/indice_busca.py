@@ -0,0 +1,193 @@
+"""
+Índice de texto (SQLite FTS5) sobre notas e itens.
+A tabela virtual busca_fts tem uma linha por nota (rowid = -id da nota: nomes das
+partes, natureza, chave) e uma por item (rowid = id do item: descrição, código, NCM).
+A coluna `donos` guarda os CNPJs da nota como tokens "c<cnpj>", então o filtro por
+usuário também passa pelo índice em vez de varrer os resultados.
+
+Triggers em notas_fiscais/itens_nota mantêm o índice em dia tanto no insert em massa
+quanto no salvar nota a nota; criar_indice_busca (chamada nas migrações) cria tabela,
+triggers e faz o backfill quando o índice é novo.
+"""
+import re
+import logging
+import unicodedata
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+TABELA = "busca_fts"
+
+_DDL_TABELA = f"""
+CREATE VIRTUAL TABLE {TABELA} USING fts5(
+    donos, nomes, natureza, chave, descricao, codigo, ncm,
+    nota_id UNINDEXED,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+)
+"""
+
+# Colunas de cada tipo de linha (as demais ficam vazias)
+_VALORES_NOTA = """
+    -{n}.id, 'c' || coalesce({n}.cnpj_emitente, '') || ' c' || coalesce({n}.cnpj_destinatario, ''),
+    coalesce({n}.nome_emitente, '') || ' ' || coalesce({n}.nome_destinatario, ''),
+    coalesce({n}.natureza_operacao, ''), coalesce({n}.chave_nfe, ''), '', '', '', {n}.id
+"""
+_VALORES_ITEM = """
+    {i}.id, (SELECT 'c' || coalesce(cnpj_emitente, '') || ' c' || coalesce(cnpj_destinatario, '')
+             FROM notas_fiscais WHERE id = {i}.nota_id),
+    '', '', '', coalesce({i}.descricao_produto, ''), coalesce({i}.codigo_produto, ''), coalesce({i}.ncm, ''), {i}.nota_id
+"""
+_COLUNAS = f"{TABELA}(rowid, donos, nomes, natureza, chave, descricao, codigo, ncm, nota_id)"
+
+_TRIGGERS = [
+    f"""CREATE TRIGGER IF NOT EXISTS busca_fts_nota_ai AFTER INSERT ON notas_fiscais BEGIN
+        INSERT INTO {_COLUNAS} VALUES ({_VALORES_NOTA.format(n='NEW')});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS busca_fts_nota_ad AFTER DELETE ON notas_fiscais BEGIN
+        DELETE FROM {TABELA} WHERE rowid = -OLD.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS busca_fts_nota_au AFTER UPDATE ON notas_fiscais BEGIN
+        DELETE FROM {TABELA} WHERE rowid = -OLD.id;
+        INSERT INTO {_COLUNAS} VALUES ({_VALORES_NOTA.format(n='NEW')});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS busca_fts_item_ai AFTER INSERT ON itens_nota BEGIN
+        INSERT INTO {_COLUNAS} VALUES ({_VALORES_ITEM.format(i='NEW')});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS busca_fts_item_ad AFTER DELETE ON itens_nota BEGIN
+        DELETE FROM {TABELA} WHERE rowid = OLD.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS busca_fts_item_au AFTER UPDATE ON itens_nota BEGIN
+        DELETE FROM {TABELA} WHERE rowid = OLD.id;
+        INSERT INTO {_COLUNAS} VALUES ({_VALORES_ITEM.format(i='NEW')});
+    END""",
+]
+
+
+def criar_indice_busca(conn):
+    """
+    Cria a tabela FTS5 e os triggers se faltarem (idempotente). Retorna quantas linhas
+    foram indexadas no backfill (0 se o índice já existia).
+    """
+    existe = conn.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (TABELA,)
+    ).first() is not None
+    if not existe:
+        conn.exec_driver_sql(_DDL_TABELA)
+    for trigger in _TRIGGERS:
+        conn.exec_driver_sql(trigger)
+    return 0 if existe else reconstruir_indice_busca(conn)
+
+
+def reconstruir_indice_busca(conn):
+    """Reindexa todas as notas e itens do zero. Retorna o número de linhas no índice."""
+    conn.exec_driver_sql(f"DELETE FROM {TABELA}")
+    conn.exec_driver_sql(f"INSERT INTO {_COLUNAS} SELECT {_VALORES_NOTA.format(n='notas_fiscais')} FROM notas_fiscais")
+    conn.exec_driver_sql(f"INSERT INTO {_COLUNAS} SELECT {_VALORES_ITEM.format(i='itens_nota')} FROM itens_nota")
+    return conn.exec_driver_sql(f"SELECT count(*) FROM {TABELA}").scalar()
+
+
+def termos_busca(texto):
+    """Palavras (sem acento, minúsculas) do texto, prontas pra virar termos FTS5."""
+    texto = unicodedata.normalize("NFKD", (texto or "").lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return re.findall(r"[a-z0-9]+", texto)
+
+
+def expressao_fts(cnpj, termos, colunas=None, prefixo=False, operador="OR"):
+    """
+    Monta o MATCH do FTS5: termos entre aspas (sem risco de sintaxe inválida), restritos
+    às colunas pedidas e ao dono `cnpj`.
+    """
+    sufixo = "*" if prefixo else ""
+    corpo = f" {operador} ".join(f'"{termo}"{sufixo}' for termo in termos)
+    if colunas:
+        corpo = "{" + " ".join(colunas) + "} : (" + corpo + ")"
+    return f'donos : "c{cnpj}" AND ({corpo})'
+
+
+def buscar_notas(session, cnpj, termos, colunas=("nomes", "descricao", "codigo"), limite=50):
+    """
+    Notas do usuário que casam com algum dos termos, da mais relevante (bm25) para a menos.
+    Retorna lista de (nota_id, rank). Sem o índice (banco não migrado) retorna lista vazia.
+    """
+    if not termos:
+        return []
+    try:
+        linhas = session.execute(
+            text(f"""
+                SELECT nota_id, min(rank) AS melhor FROM (
+                    SELECT nota_id, rank FROM {TABELA} WHERE {TABELA} MATCH :expressao ORDER BY rank LIMIT :limite_linhas
+                ) GROUP BY nota_id ORDER BY melhor LIMIT :limite
+            """),
+            {"expressao": expressao_fts(cnpj, termos, colunas), "limite_linhas": limite * 10, "limite": limite}
+        ).all()
+    except OperationalError as e:
+        session.rollback()
+        logging.warning(f"ÍNDICE DE BUSCA INDISPONÍVEL: {e}")
+        return []
+    return [(int(nota_id), rank) for nota_id, rank in linhas]
+
+
+# Colunas pesquisadas por tipo de resultado e pesos do bm25 (na ordem das colunas da tabela)
+COLUNAS_NOTA = ("nomes", "natureza", "chave")
+COLUNAS_ITEM = ("descricao", "codigo", "ncm")
+PESOS_BM25 = "bm25(0.0, 5.0, 1.0, 10.0, 3.0, 8.0, 4.0, 0.0)"  # donos, nomes, natureza, chave, descricao, codigo, ncm, nota_id
+_INDICE_COLUNA = {coluna: indice for indice, coluna in enumerate(("donos",) + COLUNAS_NOTA + COLUNAS_ITEM)}
+
+
+def _trecho(rowid, colunas, trechos):
+    """
+    Trecho de exibição: o da coluna (do tipo da linha) onde a consulta casou. Nunca
+    o de `donos`: o filtro por CNPJ também casa e exporia os CNPJs das partes.
+    """
+    proprias = COLUNAS_NOTA if rowid < 0 else COLUNAS_ITEM
+    candidatos = [trecho for coluna, trecho in zip(colunas, trechos) if coluna in proprias and trecho]
+    return next((trecho for trecho in candidatos if "«" in trecho), candidatos[0] if candidatos else "")
+
+
+def pesquisar(session, cnpj, consulta, tipo=None, limite=20, deslocamento=0):
+    """
+    Busca de texto nas notas/itens do usuário. Cada palavra da consulta vira um prefixo
+    ("paraf" acha "parafuso") e todas precisam aparecer na mesma nota ou item. Ordena por
+    relevância (bm25 com pesos por coluna) e pagina com limite/deslocamento.
+
+    Args:
+        tipo: 'nota', 'item' ou None (ambos)
+
+    Returns:
+        (resultados, tem_mais): resultados com tipo, ids, trecho destacado e score
+    """
+    termos = [termo for termo in termos_busca(consulta) if len(termo) >= 2]
+    if not termos:
+        return [], False
+    colunas = {"nota": COLUNAS_NOTA, "item": COLUNAS_ITEM}.get(tipo, COLUNAS_NOTA + COLUNAS_ITEM)
+    # Um snippet por coluna pesquisada (índice explícito; -1 escolheria `donos`)
+    trechos = ", ".join(f"snippet({TABELA}, {_INDICE_COLUNA[coluna]}, '«', '»', '…', 10)" for coluna in colunas)
+
+    linhas = session.execute(
+        text(f"""
+            SELECT rowid, nota_id, rank, {trechos}
+            FROM {TABELA}
+            WHERE {TABELA} MATCH :expressao AND rank MATCH '{PESOS_BM25}'
+            ORDER BY rank
+            LIMIT :limite OFFSET :deslocamento
+        """),
+        {
+            "expressao": expressao_fts(cnpj, termos, colunas, prefixo=True, operador="AND"),
+            "limite": limite + 1,  # Um a mais só pra saber se existe próxima página
+            "deslocamento": deslocamento
+        }
+    ).all()
+
+    tem_mais = len(linhas) > limite
+    resultados = [
+        {
+            "tipo": "nota" if rowid < 0 else "item",
+            "nota_id": int(nota_id),
+            "item_id": rowid if rowid > 0 else None,
+            "trecho": _trecho(rowid, colunas, trechos),
+            "score": round(-rank, 4)  # bm25 do SQLite é negativo: maior score = mais relevante
+        }
+        for rowid, nota_id, rank, *trechos in linhas[:limite]
+    ]
+    return resultados, tem_mais
@@ -0,0 +1,89 @@
+"""
+RBT12 (Receita Bruta acumulada nos 12 meses anteriores ao período de apuração),
+base das faixas do Simples Nacional. Calculado a partir do resumo_mensal
+(notas de Saída onde o CNPJ é emitente), então custa no máximo 12 linhas por mês
+de referência, independente do volume de notas.
+"""
+from datetime import date
+from sqlalchemy import func
+from models.resumo_fiscal import ResumoMensal
+from models.usuario import Usuario
+
+MESES_RBT12 = 12
+
+
+def mes_referencia(data=None):
+    """Mês de apuração ('YYYY-MM'); padrão é o mês atual."""
+    return (data or date.today()).strftime("%Y-%m")
+
+
+def somar_meses(ano_mes, meses):
+    """Desloca um 'YYYY-MM' em N meses (N pode ser negativo)."""
+    ano, mes = map(int, ano_mes.split("-"))
+    indice = ano * 12 + (mes - 1) + meses
+    return f"{indice // 12:04d}-{indice % 12 + 1:02d}"
+
+
+def _filtro_vendas(cnpj):
+    return [ResumoMensal.cnpj == cnpj, ResumoMensal.papel == "emitente", ResumoMensal.tipo_operacao == "Saída"]
+
+
+def calcular_rbt12(session, cnpj, ano_mes=None):
+    """Soma do faturamento dos 12 meses anteriores ao mês de referência."""
+    ano_mes = ano_mes or mes_referencia()
+    total = session.query(func.coalesce(func.sum(ResumoMensal.faturamento), 0)).filter(
+        *_filtro_vendas(cnpj),
+        ResumoMensal.ano_mes >= somar_meses(ano_mes, -MESES_RBT12),
+        ResumoMensal.ano_mes < ano_mes
+    ).scalar()
+    return round(float(total or 0), 2)
+
+
+def historico_rbt12(session, cnpj, mes_de, mes_ate):
+    """
+    RBT12 de cada mês de referência entre mes_de e mes_ate (inclusivos), com uma
+    única query no resumo e janela deslizante de 12 meses em Python.
+
+    Returns:
+        list: [{"mes", "faturamento_mes", "rbt12"}, ...] em ordem cronológica
+    """
+    faturamento = dict(session.query(ResumoMensal.ano_mes, ResumoMensal.faturamento).filter(
+        *_filtro_vendas(cnpj),
+        ResumoMensal.ano_mes >= somar_meses(mes_de, -MESES_RBT12),
+        ResumoMensal.ano_mes <= mes_ate
+    ).all())
+    valor = lambda mes: float(faturamento.get(mes) or 0)
+
+    # Janela inicial: os 12 meses anteriores a mes_de
+    janela = sum(valor(somar_meses(mes_de, -n)) for n in range(1, MESES_RBT12 + 1))
+    historico = []
+    mes = mes_de
+    while mes <= mes_ate:
+        historico.append({"mes": mes, "faturamento_mes": round(valor(mes), 2), "rbt12": round(janela, 2)})
+        # Avança a janela: entra o mês atual, sai o mais antigo
+        janela += valor(mes) - valor(somar_meses(mes, -MESES_RBT12))
+        mes = somar_meses(mes, 1)
+    return historico
+
+
+def rbt12_do_usuario(session, usuario):
+    """RBT12 vigente: o valor manual se o usuário informou um, senão o calculado das notas."""
+    if usuario is None:
+        return 0.0
+    if usuario.rbt12_manual:
+        return float(usuario.rbt12 or 0.0)
+    return calcular_rbt12(session, usuario.cnpj)
+
+
+def atualizar_rbt12_usuarios(session, cnpjs):
+    """
+    Regrava Usuario.rbt12 (mês atual) dos CNPJs que tiveram vendas novas, exceto
+    quem informou o valor à mão. Não faz commit (roda na transação da gravação).
+    """
+    if not cnpjs:
+        return
+    usuarios = session.query(Usuario).filter(
+        Usuario.cnpj.in_(list(cnpjs)), Usuario.rbt12_manual.isnot(True)
+    ).all()
+    for usuario in usuarios:
+        usuario.rbt12 = calcular_rbt12(session, usuario.cnpj)
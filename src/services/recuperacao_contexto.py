@@ -0,0 +1,315 @@
+"""
+Recuperação do contexto do chat conforme a pergunta.
+Em vez de sempre mandar as 5 notas mais recentes, extrai da pergunta os filtros que
+ela cita (NCM, CFOP, CST, número da nota, mês/ano, nomes de produtos e de partes) e
+escolhe, entre todas as notas do usuário, as que casam com eles:
+  - NCM/CFOP/CST: consultas estruturadas em itens_nota (índices ix_itens_ncm/ix_itens_cfop)
+  - produtos, fornecedores e clientes: índice FTS5 (services/indice_busca)
+  - meses e totais: resumo mensal pré-agregado (resumo_mensal)
+Tudo cabe no mesmo orçamento de tokens do contexto_notas. Pergunta sem nenhum filtro
+reconhecido recebe exatamente o contexto de sempre (contexto_notas).
+"""
+import re
+import logging
+import unicodedata
+from datetime import date
+from collections import defaultdict
+from sqlalchemy import and_, or_, func
+from sqlalchemy.orm import selectinload
+from models.nota_fiscal import NotaFiscal, ItemNota
+from models.resumo_fiscal import ResumoMensal
+from services.answer_cache import STOPWORDS
+from services.chat_compaction import CHARS_POR_TOKEN
+from services.contexto_notas import (
+    contexto_notas, formatar_nota, itens_no_orcamento, ORCAMENTO_TOKENS_NOTAS, LIMITE_NOTAS
+)
+from services.indice_busca import buscar_notas, termos_busca
+
+LIMITE_NOTAS_RECUPERADAS = 10
+MESES_RESUMO = 12  # Meses do resumo mensal quando a pergunta não cita nenhum
+
+MESES = {
+    "janeiro": 1, "fevereiro": 2, "marco": 3, "abril": 4, "maio": 5, "junho": 6, "julho": 7,
+    "agosto": 8, "setembro": 9, "outubro": 10, "novembro": 11, "dezembro": 12,
+}
+# Palavras que pedem totais/evolução: a resposta precisa do resumo mensal, não só de notas
+PALAVRAS_AGREGADO = {
+    "total", "totais", "mes", "meses", "mensal", "mensais", "faturamento", "faturei", "faturou",
+    "quanto", "soma", "periodo", "ano", "anual", "evolucao", "media", "trimestre", "semestre",
+}
+# Palavras genéricas que não ajudam a achar produto ou parte no índice de texto
+PALAVRAS_GENERICAS = STOPWORDS | PALAVRAS_AGREGADO | set(MESES) | {
+    "nota", "notas", "nf", "nfe", "fiscal", "fiscais", "item", "itens", "produto", "produtos",
+    "valor", "valores", "imposto", "impostos", "icms", "ipi", "pis", "cofins", "ncm", "cfop", "cst",
+    "cnpj", "venda", "vendas", "vendi", "compra", "compras", "comprei", "entrada", "entradas",
+    "saida", "saidas", "cliente", "clientes", "fornecedor", "fornecedores", "empresa", "quantos",
+    "quantas", "como", "onde", "quando", "maior", "menor", "mais", "menos", "teve", "tive", "tenho",
+    "paguei", "pago", "pagar", "emiti", "emitidas", "recebi", "recebidas", "dados", "lista", "liste",
+    "fale", "falar", "mostre", "mostrar", "diga", "explique", "detalhe", "detalhes", "informacoes",
+    "tem", "ter", "existe", "existem", "houve", "ver", "veja", "todas", "todos", "ultima", "ultimas",
+}
+
+_RE_NCM = re.compile(r"\b(\d{4})\.?(\d{2})\.?(\d{2})\b")
+_RE_NCM_PREFIXO = re.compile(r"\bncm\s*(?:de\s*)?(\d{4,8})(?![.\d])")
+_RE_CFOP = re.compile(r"\b([1-35-7])\.?(\d{3})\b")
+_RE_CST = re.compile(r"\bcst\s*(?:icms|ipi|pis|cofins)?\s*(\d{2,3})\b")
+_RE_NUMERO_NOTA = re.compile(r"\b(?:nota|nf|nfe)\s*(?:n[o.]?\s*)?(\d{1,9})\b")
+_RE_MES_NOME = re.compile(r"\b(" + "|".join(MESES) + r")\b(?:\s*(?:de|/)?\s*(20\d{2}))?")
+_RE_MES_NUMERO = re.compile(r"\b(0?[1-9]|1[0-2])[/-](20\d{2})\b|\b(20\d{2})-(0[1-9]|1[0-2])\b")
+_RE_ANO = re.compile(r"\b(20\d{2})\b")
+
+
+def _normalizar(texto):
+    texto = unicodedata.normalize("NFKD", (texto or "").lower())
+    return "".join(c for c in texto if not unicodedata.combining(c))
+
+
+def _do_usuario(cnpj):
+    return or_(NotaFiscal.cnpj_emitente == cnpj, NotaFiscal.cnpj_destinatario == cnpj)
+
+
+def _meses_do_usuario(session, cnpj):
+    return sorted(
+        (ano_mes for (ano_mes,) in session.query(ResumoMensal.ano_mes).filter(ResumoMensal.cnpj == cnpj).distinct() if ano_mes),
+        reverse=True
+    )
+
+
+def extrair_filtros(session, cnpj, pergunta):
+    """
+    Filtros citados na pergunta: {"ncm", "cfop", "cst", "numeros", "meses" (YYYY-MM),
+    "termos" (pro índice de texto), "agregado" (pede totais)}.
+    Mês sem ano vira o mais recente em que o usuário tem notas.
+    """
+    texto = _normalizar(pergunta)
+    filtros = {"ncm": [], "cfop": [], "cst": [], "numeros": [], "meses": [], "termos": [], "agregado": False}
+
+    trechos_ncm = []  # Posições já lidas como NCM ("7318.15.00" não é também o CFOP 7318)
+    for match in _RE_NCM.finditer(texto):
+        filtros["ncm"].append("".join(match.groups()))
+        trechos_ncm.append(match.span())
+    for match in _RE_NCM_PREFIXO.finditer(texto):
+        trechos_ncm.append(match.span(1))
+        if match.group(1) not in filtros["ncm"]:
+            filtros["ncm"].append(match.group(1))
+    if "cfop" in texto:
+        for match in _RE_CFOP.finditer(texto):
+            if any(inicio <= match.start() < fim for inicio, fim in trechos_ncm):
+                continue
+            codigo = "".join(match.groups())
+            if not 1900 <= int(codigo) <= 2099:  # Ano, não CFOP (os CFOPs 2.xxx começam em 2101)
+                filtros["cfop"].append(codigo)
+    filtros["cst"] = [match.group(1) for match in _RE_CST.finditer(texto)]
+    filtros["numeros"] = [match.group(1) for match in _RE_NUMERO_NOTA.finditer(texto)]
+
+    meses_usuario = None
+    for match in _RE_MES_NOME.finditer(texto):
+        mes = f"{MESES[match.group(1)]:02d}"
+        ano = match.group(2)
+        if not ano:
+            if meses_usuario is None:
+                meses_usuario = _meses_do_usuario(session, cnpj)
+            ano = next((ano_mes[:4] for ano_mes in meses_usuario if ano_mes.endswith(f"-{mes}")), str(date.today().year))
+        filtros["meses"].append(f"{ano}-{mes}")
+    for match in _RE_MES_NUMERO.finditer(texto):
+        if match.group(1):
+            filtros["meses"].append(f"{match.group(2)}-{int(match.group(1)):02d}")
+        else:
+            filtros["meses"].append(f"{match.group(3)}-{match.group(4)}")
+    if not filtros["meses"]:
+        anos = {match.group(1) for match in _RE_ANO.finditer(texto)}
+        filtros["meses"] = [f"{ano}-{mes:02d}" for ano in sorted(anos) for mes in range(1, 13)]
+    filtros["meses"] = sorted(set(filtros["meses"]))
+
+    palavras = termos_busca(texto)
+    filtros["agregado"] = any(palavra in PALAVRAS_AGREGADO for palavra in palavras)
+    # Números já usados como filtro (NCM, CFOP, nota, ano) não vão pro índice de texto;
+    # os demais podem ser parte de nome de parte ou código de produto
+    usados = set(filtros["ncm"]) | set(filtros["cfop"]) | set(filtros["numeros"]) | {m[:4] for m in filtros["meses"]}
+    filtros["termos"] = [
+        palavra for palavra in dict.fromkeys(palavras)
+        if len(palavra) >= 3 and palavra not in PALAVRAS_GENERICAS and palavra not in usados
+        and not (palavra.isdigit() and any(palavra in codigo for codigo in usados))
+    ]
+    return filtros
+
+
+def _filtro_meses(meses):
+    faixas = []
+    for ano_mes in meses:
+        ano, mes = int(ano_mes[:4]), int(ano_mes[5:7])
+        fim = date(ano + 1, 1, 1) if mes == 12 else date(ano, mes + 1, 1)
+        faixas.append(and_(NotaFiscal.data_emissao >= date(ano, mes, 1), NotaFiscal.data_emissao < fim))
+    return or_(*faixas)
+
+
+def _condicoes_itens(filtros):
+    condicoes = []
+    for ncm in filtros["ncm"]:
+        # Faixa em vez de LIKE: prefixo de NCM usa o índice ix_itens_ncm
+        condicoes.append(and_(ItemNota.ncm >= ncm, ItemNota.ncm < ncm + ":"))
+    for cfop in filtros["cfop"]:
+        condicoes.append(ItemNota.cfop == cfop)
+    for cst in filtros["cst"]:
+        condicoes.append(or_(ItemNota.cst_icms == cst, ItemNota.cst_ipi == cst, ItemNota.cst_pis == cst, ItemNota.cst_cofins == cst))
+    return condicoes
+
+
+def _item_casa(item, filtros):
+    """True se o item bate com algum filtro da pergunta (vai pro começo da lista da nota)."""
+    if any((item.ncm or "").startswith(ncm) for ncm in filtros["ncm"]):
+        return True
+    if item.cfop in filtros["cfop"]:
+        return True
+    if filtros["cst"] and {item.cst_icms, item.cst_ipi, item.cst_pis, item.cst_cofins} & set(filtros["cst"]):
+        return True
+    descricao = _normalizar(item.descricao_produto)
+    return any(termo in descricao for termo in filtros["termos"])
+
+
+def _descrever_filtros(filtros):
+    partes = []
+    if filtros["ncm"]:
+        partes.append("NCM " + ", ".join(filtros["ncm"]))
+    if filtros["cfop"]:
+        partes.append("CFOP " + ", ".join(filtros["cfop"]))
+    if filtros["cst"]:
+        partes.append("CST " + ", ".join(filtros["cst"]))
+    if filtros["numeros"]:
+        partes.append("nota " + ", ".join(filtros["numeros"]))
+    if filtros["meses"]:
+        partes.append("meses " + ", ".join(filtros["meses"]) if len(filtros["meses"]) <= 3
+                      else f"{filtros['meses'][0]} a {filtros['meses'][-1]}")
+    if filtros["termos"]:
+        partes.append("termos " + ", ".join(filtros["termos"]))
+    return "; ".join(partes)
+
+
+def _notas_relevantes(session, cnpj, filtros, filter_tipo):
+    """
+    Notas que casam com os filtros, da mais relevante para a menos (empate: mais recente).
+    None se a pergunta não tem filtro de notas (nem período).
+    """
+    pontos = defaultdict(float)
+    tem_sinal = False
+
+    condicoes = _condicoes_itens(filtros)
+    if condicoes:
+        tem_sinal = True
+        query = session.query(ItemNota.nota_id).join(NotaFiscal, ItemNota.nota_id == NotaFiscal.id).filter(
+            _do_usuario(cnpj), or_(*condicoes)
+        ).distinct()
+        for (nota_id,) in query:
+            pontos[nota_id] += 3
+
+    if filtros["numeros"]:
+        tem_sinal = True
+        query = session.query(NotaFiscal.id).filter(_do_usuario(cnpj), NotaFiscal.numero.in_(filtros["numeros"]))
+        for (nota_id,) in query:
+            pontos[nota_id] += 5
+
+    encontradas = buscar_notas(session, cnpj, filtros["termos"])
+    if encontradas:
+        tem_sinal = True
+        for posicao, (nota_id, _) in enumerate(encontradas):
+            pontos[nota_id] += 2 * (1 - posicao / len(encontradas))
+
+    if not tem_sinal and not filtros["meses"]:
+        return None
+
+    query = session.query(NotaFiscal).options(selectinload(NotaFiscal.itens)).filter(_do_usuario(cnpj))
+    if tem_sinal:
+        if not pontos:
+            return []
+        query = query.filter(NotaFiscal.id.in_(list(pontos)))
+    if filtros["meses"]:
+        query = query.filter(_filtro_meses(filtros["meses"]))
+    if filter_tipo:
+        query = query.filter(NotaFiscal.tipo_operacao == filter_tipo)
+
+    if tem_sinal:
+        notas = query.all()
+        notas.sort(key=lambda nota: (pontos[nota.id], nota.data_emissao or date.min), reverse=True)
+        return notas[:LIMITE_NOTAS_RECUPERADAS]
+    # Só período: as mais recentes dentro dele
+    return query.order_by(NotaFiscal.data_emissao.desc()).limit(LIMITE_NOTAS_RECUPERADAS).all()
+
+
+def _formatar_notas(notas, filtros, orcamento_tokens):
+    linhas = [f"Notas relevantes para a pergunta ({_descrever_filtros(filtros)}):"]
+    restante = orcamento_tokens * CHARS_POR_TOKEN
+    for posicao, nota in enumerate(notas):
+        # Itens que batem com a pergunta primeiro, pra sobreviverem ao corte do orçamento
+        itens = sorted(nota.itens, key=lambda item: (not _item_casa(item, filtros), item.id))
+        partes, usados = itens_no_orcamento(itens, restante // (len(notas) - posicao))
+        restante = max(0, restante - usados)
+        linhas.append(formatar_nota(nota, "; ".join(partes) if partes else "Sem itens."))
+    return "\n".join(linhas) + "\n"
+
+
+def _resumo_mensal(session, cnpj, meses, filter_tipo):
+    query = session.query(ResumoMensal).filter(ResumoMensal.cnpj == cnpj, ResumoMensal.ano_mes != "")
+    if meses:
+        query = query.filter(ResumoMensal.ano_mes.in_(meses))
+    else:
+        recentes = _meses_do_usuario(session, cnpj)[:MESES_RESUMO]
+        query = query.filter(ResumoMensal.ano_mes.in_(recentes))
+    if filter_tipo:
+        query = query.filter(ResumoMensal.tipo_operacao == filter_tipo)
+    linhas = query.order_by(ResumoMensal.ano_mes.desc(), ResumoMensal.tipo_operacao, ResumoMensal.papel).all()
+    if not linhas:
+        return ""
+    texto = ["Resumo mensal (totais de todas as notas do mês):"]
+    for linha in linhas:
+        texto.append(
+            f"- {linha.ano_mes} {linha.tipo_operacao} ({linha.papel}): {linha.num_notas} notas, "
+            f"R$ {float(linha.faturamento or 0):,.2f}, ICMS R$ {linha.icms or 0:,.2f}, IPI R$ {linha.ipi or 0:,.2f}, "
+            f"PIS R$ {linha.pis or 0:,.2f}, COFINS R$ {linha.cofins or 0:,.2f}"
+        )
+    return "\n".join(texto) + "\n"
+
+
+def _totais_itens(session, cnpj, filtros, filter_tipo):
+    """Totais de todos os itens do usuário que batem com NCM/CFOP/CST da pergunta."""
+    condicoes = _condicoes_itens(filtros)
+    if not condicoes:
+        return ""
+    query = session.query(
+        func.count(ItemNota.id), func.count(func.distinct(ItemNota.nota_id)), func.sum(ItemNota.valor_total),
+        func.sum(ItemNota.icms_valor), func.sum(ItemNota.ipi_valor), func.sum(ItemNota.pis_valor), func.sum(ItemNota.cofins_valor)
+    ).join(NotaFiscal, ItemNota.nota_id == NotaFiscal.id).filter(_do_usuario(cnpj), or_(*condicoes))
+    if filtros["meses"]:
+        query = query.filter(_filtro_meses(filtros["meses"]))
+    if filter_tipo:
+        query = query.filter(NotaFiscal.tipo_operacao == filter_tipo)
+    itens, notas, valor, icms, ipi, pis, cofins = query.one()
+    if not itens:
+        return ""
+    return (
+        f"Totais dos itens com {_descrever_filtros({**filtros, 'numeros': [], 'termos': []})}: {itens} itens em {notas} notas, "
+        f"R$ {float(valor or 0):,.2f}, ICMS R$ {icms or 0:,.2f}, IPI R$ {ipi or 0:,.2f}, "
+        f"PIS R$ {pis or 0:,.2f}, COFINS R$ {cofins or 0:,.2f}.\n"
+    )
+
+
+def recuperar_contexto(session, cnpj, pergunta, filter_tipo=None, orcamento_tokens=ORCAMENTO_TOKENS_NOTAS):
+    """
+    Contexto de notas para a pergunta: notas relevantes (ou as mais recentes, se a pergunta
+    não filtra nada), mais o resumo mensal quando ela pede totais/período e os totais dos
+    itens quando cita NCM/CFOP/CST.
+    """
+    filtros = extrair_filtros(session, cnpj, pergunta)
+    notas = _notas_relevantes(session, cnpj, filtros, filter_tipo)
+
+    if notas is None:
+        partes = [contexto_notas(session, cnpj, filter_tipo, limite=LIMITE_NOTAS, orcamento_tokens=orcamento_tokens)]
+    elif not notas:
+        partes = [f"Nenhuma nota encontrada para os filtros da pergunta ({_descrever_filtros(filtros)}).\n"]
+    else:
+        partes = [_formatar_notas(notas, filtros, orcamento_tokens)]
+        logging.debug(f"CHAT RECUPERAÇÃO: {len(notas)} notas para ({_descrever_filtros(filtros)})")
+
+    if filtros["agregado"] or filtros["meses"]:
+        partes.append(_resumo_mensal(session, cnpj, filtros["meses"], filter_tipo))
+    partes.append(_totais_itens(session, cnpj, filtros, filter_tipo))
+    return "".join(partes)
@@ -0,0 +1,149 @@
+"""
+Registro de ingestão: SHA-256 de cada arquivo aceito no upload e as chaves de NF-e
+que ele gerou (tabela arquivos_ingeridos). Um arquivo já importado é reconhecido
+pelo hash antes de qualquer parsing ou chamada à IA.
+
+Na frente da tabela fica um filtro de Bloom em memória, carregado do banco no
+primeiro uso: um hash novo (o caso comum) é descartado sem consulta por hash; só os
+"talvez" — já registrados ou falsos positivos (~1%) — são confirmados no banco.
+Cada worker do gunicorn tem o seu filtro, então antes de cada busca ele recebe as
+linhas gravadas depois da última leitura (rowid > último visto, inclusive as de
+outros workers): uma consulta pela chave primária que normalmente volta vazia.
+"""
+import os
+import math
+import logging
+import threading
+from sqlalchemy import literal_column
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.dialects.sqlite import insert
+from database.connection import SessionLocal
+from models.arquivo_ingerido import ArquivoIngerido
+
+CAPACIDADE_BLOOM = int(os.environ.get("INGEST_BLOOM_CAPACITY", "1000000"))  # Hashes antes de redimensionar
+TAXA_FALSO_POSITIVO = 0.01
+LOTE_IN = 500  # Máx. de parâmetros por IN (...) (limite de variáveis do SQLite)
+
+
+class FiltroBloom:
+    """Filtro de Bloom sobre hashes SHA-256 em hex (as posições saem do próprio hash)."""
+
+    def __init__(self, capacidade, taxa_erro=TAXA_FALSO_POSITIVO):
+        self.capacidade = max(1, capacidade)
+        self.bits = max(64, int(-self.capacidade * math.log(taxa_erro) / math.log(2) ** 2))
+        self.funcoes = max(1, round(self.bits / self.capacidade * math.log(2)))
+        self.itens = 0
+        self._mapa = bytearray((self.bits + 7) // 8)
+
+    def _posicoes(self, sha):
+        # Hashing duplo (Kirsch-Mitzenmacher): o SHA-256 já é uniforme, basta fatiá-lo
+        h1 = int(sha[:16], 16)
+        h2 = int(sha[16:32], 16) | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.funcoes)]
+
+    def adicionar(self, sha):
+        for posicao in self._posicoes(sha):
+            self._mapa[posicao >> 3] |= 1 << (posicao & 7)
+        self.itens += 1
+
+    def __contains__(self, sha):
+        return all(self._mapa[posicao >> 3] & (1 << (posicao & 7)) for posicao in self._posicoes(sha))
+
+
+class RegistroIngestao:
+    def __init__(self, capacidade=CAPACIDADE_BLOOM):
+        self.capacidade = capacidade
+        self._filtro = None
+        self._ultimo_rowid = 0  # Linhas da tabela até aqui já estão no filtro
+        self._lock = threading.Lock()
+        self.metrics = {"consultados": 0, "descartados_filtro": 0, "duplicados": 0, "falsos_positivos": 0}
+
+    def _linhas_novas(self, session, desde):
+        rowid = literal_column("rowid")
+        return session.query(rowid, ArquivoIngerido.sha256).filter(rowid > desde).order_by(rowid).all()
+
+    def _sincronizar(self, session):
+        """
+        Põe no filtro o que foi gravado na tabela desde a última leitura, por este ou
+        por outro processo. Na primeira vez (ou quando o filtro enche) lê tudo.
+        """
+        with self._lock:
+            if self._filtro is None or self._filtro.itens > self._filtro.capacidade:
+                self._ultimo_rowid = 0
+                linhas = self._linhas_novas(session, 0)
+                self._filtro = FiltroBloom(max(self.capacidade, 2 * len(linhas)))
+                logging.debug(f"REGISTRO INGESTÃO: filtro carregado com {len(linhas)} linha(s)")
+            else:
+                linhas = self._linhas_novas(session, self._ultimo_rowid)
+            for rowid, sha in linhas:
+                self._filtro.adicionar(sha)
+            if linhas:
+                self._ultimo_rowid = linhas[-1][0]
+            return self._filtro
+
+    def buscar(self, hashes):
+        """
+        Arquivos já ingeridos entre os hashes informados.
+
+        Returns:
+            dict: {sha256: [chaves_nfe]} só dos hashes já registrados
+        """
+        hashes = list(set(hashes))
+        if not hashes:
+            return {}
+        session = SessionLocal()
+        try:
+            filtro = self._sincronizar(session)
+            talvez = [sha for sha in hashes if sha in filtro]
+            encontrados = {}
+            for inicio in range(0, len(talvez), LOTE_IN):
+                consulta = session.query(ArquivoIngerido.sha256, ArquivoIngerido.chave_nfe).filter(
+                    ArquivoIngerido.sha256.in_(talvez[inicio:inicio + LOTE_IN])
+                )
+                for sha, chave in consulta:
+                    chaves = encontrados.setdefault(sha, [])
+                    if chave:
+                        chaves.append(chave)
+        except OperationalError as e:
+            # Banco sem a tabela (migrate_db.py ainda não rodou): segue sem deduplicar pelo hash
+            logging.warning(f"REGISTRO INGESTÃO indisponível: {e}")
+            return {}
+        finally:
+            session.close()
+
+        with self._lock:
+            self.metrics["consultados"] += len(hashes)
+            self.metrics["descartados_filtro"] += len(hashes) - len(talvez)
+            self.metrics["duplicados"] += len(encontrados)
+            self.metrics["falsos_positivos"] += len(talvez) - len(encontrados)
+        return encontrados
+
+    def registrar(self, entradas):
+        """
+        Registra arquivos aceitos. entradas: lista de (sha256, chaves_nfe, nome_arquivo);
+        linhas já existentes são ignoradas.
+        """
+        linhas = [
+            {"sha256": sha, "chave_nfe": chave, "nome_arquivo": nome}
+            for sha, chaves, nome in entradas
+            for chave in (sorted(set(chaves)) or [""])
+        ]
+        if not linhas:
+            return
+        session = SessionLocal()
+        try:
+            session.execute(insert(ArquivoIngerido).on_conflict_do_nothing(), linhas)
+            session.commit()
+        except OperationalError as e:
+            session.rollback()
+            logging.warning(f"REGISTRO INGESTÃO: não foi possível registrar {len(entradas)} arquivo(s): {e}")
+        finally:
+            session.close()
+        # O filtro recebe as linhas novas na próxima busca (_sincronizar), junto com as dos outros workers
+
+    def get_metrics(self):
+        with self._lock:
+            return {**self.metrics, "hashes_no_filtro": self._filtro.itens if self._filtro else None}
+
+
+registro_ingestao = RegistroIngestao()
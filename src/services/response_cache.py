@@ -0,0 +1,181 @@
+"""
+Cache de respostas JSON do dashboard, separado por CNPJ.
+Cada CNPJ tem um número de versão; as chaves levam a versão, então invalidar um
+CNPJ é só incrementá-la (as entradas antigas expiram por TTL/LRU). No backend
+padrão as entradas ficam na memória de cada processo e as versões no banco
+(tabela versoes_cache, uma leitura pela chave primária por requisição), então a
+invalidação feita por um worker do gunicorn vale na hora para os outros. Com
+RESPONSE_CACHE_REDIS_URL entradas e versões ficam no Redis.
+"""
+import os
+import time
+import pickle
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from functools import wraps
+from flask import request, session, make_response
+from sqlalchemy.dialects.sqlite import insert
+from database.connection import SessionLocal
+from models.versao_cache import VersaoCache
+
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+TTL_PADRAO = int(os.environ.get("RESPONSE_CACHE_TTL", "300"))  # Segundos
+MAX_ENTRADAS = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+
+
+class CacheLocal:
+    """LRU com TTL em memória (por processo), seguro entre threads; versões no banco, compartilhadas."""
+
+    def __init__(self, max_entradas=MAX_ENTRADAS):
+        self.max_entradas = max_entradas
+        self._entradas = OrderedDict()  # chave -> (expira_em, valor)
+        self._lock = threading.Lock()
+
+    def obter(self, chave):
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is None:
+                return None
+            expira_em, valor = entrada
+            if expira_em < time.monotonic():
+                del self._entradas[chave]
+                return None
+            self._entradas.move_to_end(chave)
+            return valor
+
+    def gravar(self, chave, valor, ttl):
+        with self._lock:
+            self._entradas[chave] = (time.monotonic() + ttl, valor)
+            self._entradas.move_to_end(chave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+    def versao(self, cnpj):
+        db = SessionLocal()
+        try:
+            linha = db.get(VersaoCache, cnpj)
+            return linha.versao if linha else 0
+        finally:
+            db.close()
+
+    def invalidar(self, cnpj):
+        db = SessionLocal()
+        try:
+            db.execute(
+                insert(VersaoCache).values(cnpj=cnpj, versao=1)
+                .on_conflict_do_update(index_elements=["cnpj"], set_={"versao": VersaoCache.versao + 1})
+            )
+            db.commit()
+        finally:
+            db.close()
+
+
+class CacheRedis:
+    """Backend compartilhado entre processos; TTL e LRU ficam a cargo do Redis (maxmemory-policy)."""
+
+    PREFIXO = "agente-fiscal:resp:"
+
+    def __init__(self, url):
+        self._cliente = redis.Redis.from_url(url)
+
+    def obter(self, chave):
+        valor = self._cliente.get(self.PREFIXO + chave)
+        return pickle.loads(valor) if valor is not None else None
+
+    def gravar(self, chave, valor, ttl):
+        self._cliente.set(self.PREFIXO + chave, pickle.dumps(valor), ex=ttl)
+
+    def versao(self, cnpj):
+        return int(self._cliente.get(f"{self.PREFIXO}versao:{cnpj}") or 0)
+
+    def invalidar(self, cnpj):
+        self._cliente.incr(f"{self.PREFIXO}versao:{cnpj}")
+
+
+def _criar_backend():
+    url = os.environ.get("RESPONSE_CACHE_REDIS_URL")
+    if url:
+        if REDIS_AVAILABLE:
+            return CacheRedis(url)
+        print("AVISO: redis não instalado. Cache de respostas local ao processo.")
+    return CacheLocal()
+
+
+_backend = _criar_backend()
+
+
+def configurar_backend(backend):
+    """Troca o backend (qualquer objeto com obter/gravar/versao/invalidar)."""
+    global _backend
+    _backend = backend
+
+
+def invalidar_cnpj(*cnpjs):
+    """Descarta as respostas em cache dos CNPJs (chamar depois do commit que mudou os dados)."""
+    for cnpj in {c for c in cnpjs if c}:
+        try:
+            _backend.invalidar(cnpj)
+        except Exception as e:
+            logging.warning(f"Falha ao invalidar cache do CNPJ {cnpj}: {e}")
+
+
+def _chave(cnpj):
+    consulta = "&".join(f"{k}={v}" for k, v in sorted(request.args.items(multi=True)))
+    return f"{cnpj}:{_backend.versao(cnpj)}:{request.path}?{consulta}"
+
+
+def _responder(corpo, etag, cache):
+    """Monta a resposta (ou 304 se o navegador já tem essa versão)."""
+    if etag in request.if_none_match:
+        resposta = make_response("", 304)
+    else:
+        resposta = make_response(corpo, 200)
+        resposta.mimetype = "application/json"
+    resposta.set_etag(etag)
+    # O navegador guarda, mas sempre revalida com If-None-Match
+    resposta.headers["Cache-Control"] = "private, no-cache"
+    resposta.headers["X-Cache"] = cache
+    return resposta
+
+
+def cache_por_cnpj(ttl=TTL_PADRAO):
+    """
+    Decorator de rota GET: guarda a resposta 200 por CNPJ da sessão + caminho + query
+    string, com ETag/304. Sem sessão, a rota roda normalmente (e responde 401).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            cnpj = session.get("cnpj")
+            if not cnpj:
+                return view(*args, **kwargs)
+
+            try:
+                chave = _chave(cnpj)
+                guardado = _backend.obter(chave)
+            except Exception as e:
+                logging.warning(f"Cache de respostas indisponível: {e}")
+                return view(*args, **kwargs)
+            if guardado is not None:
+                return _responder(guardado["corpo"], guardado["etag"], "HIT")
+
+            resposta = make_response(view(*args, **kwargs))
+            if resposta.status_code != 200 or not resposta.is_json:
+                return resposta
+
+            corpo = resposta.get_data()
+            etag = hashlib.sha1(corpo).hexdigest()
+            try:
+                _backend.gravar(chave, {"corpo": corpo, "etag": etag}, ttl)
+            except Exception as e:
+                logging.warning(f"Falha ao gravar no cache de respostas: {e}")
+            return _responder(corpo, etag, "MISS")
+        return wrapper
+    return decorator
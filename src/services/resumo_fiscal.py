@@ -0,0 +1,143 @@
+"""
+Resumo fiscal mensal materializado (tabelas resumo_mensal/resumo_clientes).
+Quem grava notas chama atualizar_resumo dentro da própria transação, então o
+resumo nunca fica fora de sincronia com notas_fiscais. Os endpoints do dashboard
+leem daqui com custo proporcional ao número de meses, não de notas.
+"""
+import logging
+from decimal import Decimal
+from sqlalchemy import func, update, delete, or_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models.nota_fiscal import NotaFiscal, ItemNota
+from models.resumo_fiscal import ResumoMensal, ResumoCliente
+from services.rbt12 import atualizar_rbt12_usuarios
+from services.response_cache import invalidar_cnpj
+
+LOTE_RECONSTRUCAO = 1000  # Notas por lote ao reconstruir o resumo
+
+CAMPOS_CHAVE = ("cnpj", "ano_mes", "tipo_operacao", "papel")
+
+
+def _ano_mes(data_emissao):
+    return data_emissao.strftime("%Y-%m") if data_emissao else ""
+
+
+def atualizar_resumo(session, notas, somente_cnpj=None):
+    """
+    Soma notas recém-gravadas ao resumo mensal. Não faz commit: deve rodar na
+    mesma sessão/transação que inseriu as notas.
+
+    Args:
+        session: Sessão SQLAlchemy da gravação
+        notas: Lista de (campos, itens): campos com as colunas de NotaFiscal
+            (como em _campos_nota) e itens com as colunas de ItemNota
+        somente_cnpj: Se informado, só atualiza as linhas desse CNPJ
+    """
+    deltas = {}  # chave -> somas
+    clientes = set()
+
+    for campos, itens in notas:
+        emitente = (campos.get("cnpj_emitente") or "").strip()
+        destinatario = (campos.get("cnpj_destinatario") or "").strip()
+        papeis = [("emitente", emitente, destinatario)]
+        if destinatario and destinatario != emitente:
+            papeis.append(("destinatario", destinatario, emitente))
+
+        ano_mes = _ano_mes(campos.get("data_emissao"))
+        tipo = campos.get("tipo_operacao") or ""
+        valor = campos.get("valor_total_nota") or Decimal("0")
+        impostos = {
+            "icms": sum(float(item.get("icms_valor") or 0) for item in itens),
+            "ipi": sum(float(item.get("ipi_valor") or 0) for item in itens),
+            "pis": sum(float(item.get("pis_valor") or 0) for item in itens),
+            "cofins": sum(float(item.get("cofins_valor") or 0) for item in itens),
+        }
+
+        for papel, cnpj, contraparte in papeis:
+            if not cnpj or (somente_cnpj and cnpj != somente_cnpj):
+                continue
+            chave = (cnpj, ano_mes, tipo, papel)
+            soma = deltas.setdefault(chave, {"faturamento": Decimal("0"), "num_notas": 0, "icms": 0.0, "ipi": 0.0, "pis": 0.0, "cofins": 0.0})
+            soma["faturamento"] += valor
+            soma["num_notas"] += 1
+            for imposto, valor_imposto in impostos.items():
+                soma[imposto] += valor_imposto
+            if contraparte:
+                clientes.add(chave + (contraparte,))
+
+    if not deltas:
+        return
+
+    # Upsert somando os deltas (INSERT ... ON CONFLICT DO UPDATE)
+    for chave, soma in deltas.items():
+        stmt = sqlite_insert(ResumoMensal).values(**dict(zip(CAMPOS_CHAVE, chave)), num_clientes=0, **soma)
+        session.execute(stmt.on_conflict_do_update(
+            index_elements=list(CAMPOS_CHAVE),
+            set_={campo: getattr(ResumoMensal, campo) + getattr(stmt.excluded, campo) for campo in soma}
+        ))
+
+    if clientes:
+        session.execute(
+            sqlite_insert(ResumoCliente).on_conflict_do_nothing(),
+            [dict(zip(CAMPOS_CHAVE + ("cnpj_cliente",), linha)) for linha in clientes]
+        )
+
+    # num_clientes = contrapartes distintas registradas pra cada chave afetada
+    for chave in {linha[:4] for linha in clientes}:
+        filtro = dict(zip(CAMPOS_CHAVE, chave))
+        total = session.query(func.count(ResumoCliente.id)).filter_by(**filtro).scalar()
+        session.execute(update(ResumoMensal).filter_by(**filtro).values(num_clientes=total))
+
+    # Vendas novas mudam o RBT12 de quem as emitiu
+    atualizar_rbt12_usuarios(session, {chave[0] for chave in deltas if chave[2] == "Saída" and chave[3] == "emitente"})
+
+
+def reconstruir_resumo(session, cnpj=None, invalidar_cache=True):
+    """
+    Recalcula o resumo do zero a partir de notas_fiscais/itens_nota (todas as notas
+    ou só as que envolvem um CNPJ). Faz commit no fim. invalidar_cache=False não mexe
+    no cache de respostas, que grava as versões pelo SessionLocal (banco padrão).
+
+    Returns:
+        int: Quantidade de notas processadas
+    """
+    if cnpj:
+        # Só as linhas do próprio CNPJ; as contrapartes mantêm o resumo delas
+        session.execute(delete(ResumoMensal).where(ResumoMensal.cnpj == cnpj))
+        session.execute(delete(ResumoCliente).where(ResumoCliente.cnpj == cnpj))
+    else:
+        session.execute(delete(ResumoMensal))
+        session.execute(delete(ResumoCliente))
+
+    consulta = session.query(
+        NotaFiscal.id, NotaFiscal.cnpj_emitente, NotaFiscal.cnpj_destinatario, NotaFiscal.data_emissao,
+        NotaFiscal.tipo_operacao, NotaFiscal.valor_total_nota,
+        func.coalesce(func.sum(ItemNota.icms_valor), 0.0), func.coalesce(func.sum(ItemNota.ipi_valor), 0.0),
+        func.coalesce(func.sum(ItemNota.pis_valor), 0.0), func.coalesce(func.sum(ItemNota.cofins_valor), 0.0)
+    ).outerjoin(ItemNota, ItemNota.nota_id == NotaFiscal.id).group_by(NotaFiscal.id).order_by(NotaFiscal.id)
+    if cnpj:
+        consulta = consulta.filter(or_(NotaFiscal.cnpj_emitente == cnpj, NotaFiscal.cnpj_destinatario == cnpj))
+
+    total = 0
+    lote = []
+    for _, emitente, destinatario, data_emissao, tipo, valor, icms, ipi, pis, cofins in consulta.yield_per(LOTE_RECONSTRUCAO):
+        campos = {
+            "cnpj_emitente": emitente,
+            "cnpj_destinatario": destinatario,
+            "data_emissao": data_emissao,
+            "tipo_operacao": tipo,
+            "valor_total_nota": valor,
+        }
+        lote.append((campos, [{"icms_valor": icms, "ipi_valor": ipi, "pis_valor": pis, "cofins_valor": cofins}]))
+        total += 1
+        if len(lote) >= LOTE_RECONSTRUCAO:
+            atualizar_resumo(session, lote, somente_cnpj=cnpj)
+            lote = []
+    if lote:
+        atualizar_resumo(session, lote, somente_cnpj=cnpj)
+
+    session.commit()
+    if invalidar_cache:
+        invalidar_cnpj(*([cnpj] if cnpj else [c for (c,) in session.query(ResumoMensal.cnpj).distinct()]))
+    logging.info(f"RESUMO RECONSTRUÍDO: {total} notas" + (f" (CNPJ {cnpj})" if cnpj else ""))
+    return total
@@ -0,0 +1,185 @@
+"""
+Busca web do chat (Tavily) com cache persistente.
+Os resultados ficam na tabela busca_web_cache, indexados pela consulta normalizada
+(sem acentos/stopwords, ver answer_cache.normalizar_pergunta), então valem para
+todos os workers e sobrevivem a restarts. Dentro do TTL o resultado sai do banco;
+depois dele, e até TTL + janela "stale", o resultado antigo é devolvido na hora e
+a consulta é refeita em segundo plano (stale-while-revalidate). A tabela é limitada
+a WEB_SEARCH_CACHE_MAX_ENTRIES linhas, descartando as menos acessadas.
+
+O provedor padrão é o TavilyClient; configurar_provedor aceita qualquer fábrica
+api_key -> objeto com search(query=..., max_results=...) (ex.: um provedor falso local).
+"""
+import os
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from database.connection import SessionLocal
+from models.busca_web import BuscaWebCache
+from services.answer_cache import normalizar_pergunta
+
+# Importar Tavily para busca web
+try:
+    from tavily import TavilyClient
+    TAVILY_AVAILABLE = True
+except ImportError:
+    TAVILY_AVAILABLE = False
+    print("AVISO: tavily-python não instalado. Busca web desabilitada.")
+
+WEB_SEARCH_CACHE_TTL = int(os.environ.get("WEB_SEARCH_CACHE_TTL", "86400"))  # 1 dia
+WEB_SEARCH_CACHE_STALE = int(os.environ.get("WEB_SEARCH_CACHE_STALE", "604800"))  # +7 dias servindo o antigo
+WEB_SEARCH_CACHE_MAX_ENTRIES = int(os.environ.get("WEB_SEARCH_CACHE_MAX_ENTRIES", "5000"))
+MAX_CLIENTES = 32  # Clientes do provedor reaproveitados (um por chave de API)
+INTERVALO_ACESSO = timedelta(minutes=1)  # Só regrava acessado_em se o último acesso for mais antigo
+
+
+def _provedor_tavily(api_key):
+    return TavilyClient(api_key=api_key)
+
+
+_fabrica_provedor = None
+
+
+def configurar_provedor(fabrica):
+    """Troca o provedor de busca (None volta pro Tavily). Descarta os clientes já criados."""
+    global _fabrica_provedor
+    _fabrica_provedor = fabrica
+    web_search_cache.limpar_clientes()
+
+
+def provedor_disponivel():
+    return _fabrica_provedor is not None or TAVILY_AVAILABLE
+
+
+def chave_consulta(consulta, max_results):
+    normalizada = normalizar_pergunta(consulta)
+    return hashlib.sha256(f"{max_results}:{normalizada}".encode("utf-8")).hexdigest(), normalizada
+
+
+class WebSearchCache:
+    """Cache da busca web no SQLite do app, com revalidação em segundo plano."""
+
+    def __init__(self, ttl=WEB_SEARCH_CACHE_TTL, stale=WEB_SEARCH_CACHE_STALE, max_entries=WEB_SEARCH_CACHE_MAX_ENTRIES):
+        self.ttl = timedelta(seconds=ttl)
+        self.stale = timedelta(seconds=stale)
+        self.max_entries = max_entries
+        self._clientes = OrderedDict()  # api_key -> cliente do provedor (LRU)
+        self._revalidando = set()  # Chaves com revalidação em andamento (evita buscas duplicadas)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="web-search-refresh")
+        self.metrics = {"hits": 0, "stale_hits": 0, "misses": 0, "revalidacoes": 0, "erros_revalidacao": 0}
+
+    def cliente(self, api_key):
+        """Cliente do provedor pra essa chave, criado uma vez e reaproveitado."""
+        with self._lock:
+            cliente = self._clientes.get(api_key)
+            if cliente is not None:
+                self._clientes.move_to_end(api_key)
+                return cliente
+        cliente = (_fabrica_provedor or _provedor_tavily)(api_key)
+        with self._lock:
+            self._clientes[api_key] = cliente
+            while len(self._clientes) > MAX_CLIENTES:
+                self._clientes.popitem(last=False)
+        return cliente
+
+    def limpar_clientes(self):
+        with self._lock:
+            self._clientes.clear()
+
+    def buscar(self, consulta, api_key, max_results=3):
+        """
+        Lista de resultados ({title, content, url}) da consulta. Erros do provedor
+        só sobem quando não há nada em cache pra devolver.
+        """
+        chave, normalizada = chave_consulta(consulta, max_results)
+        em_cache = self._ler(chave)
+        if em_cache is not None:
+            resultados, idade = em_cache
+            if idade <= self.ttl:
+                self._contar("hits")
+                return resultados
+            if idade <= self.ttl + self.stale:
+                self._contar("stale_hits")
+                self._revalidar(chave, normalizada, consulta, api_key, max_results)
+                return resultados
+
+        self._contar("misses")
+        resultados = self._consultar_provedor(consulta, api_key, max_results)
+        self._gravar(chave, normalizada, resultados)
+        return resultados
+
+    def _consultar_provedor(self, consulta, api_key, max_results):
+        resposta = self.cliente(api_key).search(query=consulta, max_results=max_results)
+        return list((resposta or {}).get("results") or [])[:max_results]
+
+    def _revalidar(self, chave, normalizada, consulta, api_key, max_results):
+        with self._lock:
+            if chave in self._revalidando:
+                return
+            self._revalidando.add(chave)
+
+        def tarefa():
+            try:
+                self._gravar(chave, normalizada, self._consultar_provedor(consulta, api_key, max_results))
+                self._contar("revalidacoes")
+            except Exception as e:
+                self._contar("erros_revalidacao")
+                logging.warning(f"ERRO BUSCA WEB (revalidação): {e}")
+            finally:
+                with self._lock:
+                    self._revalidando.discard(chave)
+
+        self._executor.submit(tarefa)
+
+    def _ler(self, chave):
+        session = SessionLocal()
+        try:
+            linha = session.get(BuscaWebCache, chave)
+            if linha is None:
+                return None
+            agora = datetime.utcnow()
+            if agora - linha.acessado_em > INTERVALO_ACESSO:
+                linha.acessado_em = agora
+                session.commit()
+            return json.loads(linha.resultados), agora - linha.buscado_em
+        finally:
+            session.close()
+
+    def _gravar(self, chave, normalizada, resultados):
+        session = SessionLocal()
+        try:
+            agora = datetime.utcnow()
+            session.merge(BuscaWebCache(
+                chave=chave, consulta=normalizada, resultados=json.dumps(resultados, ensure_ascii=False),
+                buscado_em=agora, acessado_em=agora
+            ))
+            session.commit()
+
+            excedente = session.query(BuscaWebCache).count() - self.max_entries
+            if excedente > 0:
+                antigas = session.query(BuscaWebCache.chave).order_by(BuscaWebCache.acessado_em).limit(excedente)
+                session.query(BuscaWebCache).filter(BuscaWebCache.chave.in_(antigas.scalar_subquery())).delete(synchronize_session=False)
+                session.commit()
+        finally:
+            session.close()
+
+    def _contar(self, nome):
+        with self._lock:
+            self.metrics[nome] += 1
+
+    def get_metrics(self):
+        session = SessionLocal()
+        try:
+            entradas = session.query(BuscaWebCache).count()
+        finally:
+            session.close()
+        with self._lock:
+            return {**self.metrics, "entradas": entradas, "clientes": len(self._clientes), "revalidando": len(self._revalidando)}
+
+
+web_search_cache = WebSearchCache()
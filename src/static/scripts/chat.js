@@ -14,6 +14,7 @@ document.addEventListener("DOMContentLoaded", () => {
 
   let currentApiKey = localStorage.getItem("apiKey") || "";
   let currentTavilyKey = localStorage.getItem("tavilyKey") || "";
+  let currentConversaId = "";  // Conversa persistida no servidor (criada na primeira pergunta)
 
   if (currentApiKey) {
     apiKeyInput.value = currentApiKey;
@@ -99,6 +100,30 @@ document.addEventListener("DOMContentLoaded", () => {
     refreshBadges();
   });
 
+  // Lê a resposta text/event-stream do /api/chat?stream=1, chamando aoEvento(evento, dados) por frame
+  async function lerStreamChat(resposta, aoEvento) {
+    const reader = resposta.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      let fim;
+      while ((fim = buffer.indexOf("\n\n")) !== -1) {
+        const frame = buffer.slice(0, fim);
+        buffer = buffer.slice(fim + 2);
+        let evento = "message";
+        let dados = "";
+        frame.split("\n").forEach((linha) => {
+          if (linha.startsWith("event:")) evento = linha.slice(6).trim();
+          else if (linha.startsWith("data:")) dados += linha.slice(5).trim();
+        });
+        if (dados) aoEvento(evento, JSON.parse(dados));
+      }
+    }
+  }
+
   async function enviarPergunta() {
     const pergunta = perguntaInput.value.trim();
 
@@ -121,17 +146,39 @@ document.addEventListener("DOMContentLoaded", () => {
     enviarBtn.textContent = "Enviando...";
 
     try {
-      const resposta = await fetch("/api/chat", {
+      const resposta = await fetch("/api/chat?stream=1", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ pergunta, apiKey: currentApiKey, tavilyKey: currentTavilyKey }),
+        body: JSON.stringify({ pergunta, apiKey: currentApiKey, tavilyKey: currentTavilyKey, conversaId: currentConversaId || undefined }),
         credentials: "include"
       });
 
+      if (resposta.ok && (resposta.headers.get("Content-Type") || "").includes("text/event-stream")) {
+        // Streaming: o texto entra na bolha de "Pensando..." conforme a IA gera
+        let textoBot = "";
+        await lerStreamChat(resposta, (evento, dados) => {
+          if (evento === "meta" || evento === "done") {
+            currentConversaId = dados.conversaId || currentConversaId;
+          } else if (evento === "error") {
+            loadingMsg.textContent = "Erro: " + dados.erro;
+            setStatus(dados.erro, "error");
+          } else if (dados.delta) {
+            textoBot += dados.delta;
+            loadingMsg.textContent = textoBot;
+            chatBox.scrollTop = chatBox.scrollHeight;
+          }
+        });
+        if (!textoBot && loadingMsg.textContent.startsWith("Pensando")) {
+          loadingMsg.textContent = "Erro: Sem resposta da IA.";
+        }
+        return;
+      }
+
       const data = await resposta.json();
       chatBox.removeChild(loadingMsg);
 
       if (resposta.ok && data.resposta) {
+        currentConversaId = data.conversaId || currentConversaId;
         addMessage(data.resposta, "bot");
       } else {
         addMessage("Erro: " + (data.erro || "Sem resposta da IA."), "bot");
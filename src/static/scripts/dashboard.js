@@ -3,7 +3,9 @@ import { DASHBOARD_SCREENS, DEFAULT_DASHBOARD_SCREEN } from "/config/screens.js"
 // Dashboard - Funcionalidades principais
 const STORAGE_KEYS = { gemini: "apiKey", tavily: "tavilyKey" };
 const SCREEN_STORAGE_KEY = "dashboardActiveScreen";
+const CONVERSA_STORAGE_KEY = "chatConversaId";
 let currentApiKey = "";
+let currentConversaId = sessionStorage.getItem(CONVERSA_STORAGE_KEY) || "";
 let currentTavilyKey = "";
 let currentScreenId = DEFAULT_DASHBOARD_SCREEN;
 
@@ -508,13 +510,14 @@ document.addEventListener("DOMContentLoaded", async () => {
             const resposta = await fetch("/api/chat/clear", {
                 method: "POST",
                 headers: { "Content-Type": "application/json" },
-                body: JSON.stringify({ apiKey: currentApiKey }),
+                body: JSON.stringify({ apiKey: currentApiKey, conversaId: currentConversaId || undefined }),
                 credentials: "include"
             });
 
             const data = await resposta.json();
 
             if (resposta.ok) {
+                definirConversaAtual("");
                 // Limpar visualmente o chat (manter apenas mensagem de confirmação)
                 if (chatBox) {
                     chatBox.innerHTML = "";
@@ -529,6 +532,61 @@ document.addEventListener("DOMContentLoaded", async () => {
         }
     }
 
+    function definirConversaAtual(conversaId) {
+        currentConversaId = conversaId || "";
+        if (currentConversaId) {
+            sessionStorage.setItem(CONVERSA_STORAGE_KEY, currentConversaId);
+        } else {
+            sessionStorage.removeItem(CONVERSA_STORAGE_KEY);
+        }
+    }
+
+    // Retoma a conversa da aba (o histórico fica no servidor)
+    async function carregarConversaAtual() {
+        if (!currentConversaId || !chatBox) return;
+        try {
+            const res = await fetch(`/api/conversas/${currentConversaId}`, { credentials: "include" });
+            if (!res.ok) {
+                definirConversaAtual("");
+                return;
+            }
+            const conversa = await res.json();
+            if (!conversa.mensagens?.length) return;
+            clearInitialChatMessage();
+            conversa.mensagens.forEach((mensagem) => {
+                addChatMessage(mensagem.conteudo, mensagem.role === "user" ? "user" : "bot");
+            });
+        } catch (err) {
+            console.error("Erro ao carregar conversa:", err);
+        }
+    }
+
+    carregarConversaAtual();
+
+    // Lê a resposta text/event-stream do /api/chat?stream=1, chamando aoEvento(evento, dados) por frame
+    async function lerStreamChat(resposta, aoEvento) {
+        const reader = resposta.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = "";
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            let fim;
+            while ((fim = buffer.indexOf("\n\n")) !== -1) {
+                const frame = buffer.slice(0, fim);
+                buffer = buffer.slice(fim + 2);
+                let evento = "message";
+                let dados = "";
+                frame.split("\n").forEach((linha) => {
+                    if (linha.startsWith("event:")) evento = linha.slice(6).trim();
+                    else if (linha.startsWith("data:")) dados += linha.slice(5).trim();
+                });
+                if (dados) aoEvento(evento, JSON.parse(dados));
+            }
+        }
+    }
+
     async function enviarPergunta() {
         if (!perguntaInput || !enviarChatBtn) return;
 
@@ -553,19 +611,45 @@ document.addEventListener("DOMContentLoaded", async () => {
         enviarChatBtn.textContent = "Enviando...";
 
         try {
-            const resposta = await fetch("/api/chat", {
+            const resposta = await fetch("/api/chat?stream=1", {
                 method: "POST",
                 headers: { "Content-Type": "application/json" },
-                body: JSON.stringify({ pergunta, apiKey: currentApiKey, tavilyKey: currentTavilyKey }),
+                body: JSON.stringify({ pergunta, apiKey: currentApiKey, tavilyKey: currentTavilyKey, conversaId: currentConversaId || undefined }),
                 credentials: "include"
             });
 
+            if (resposta.ok && (resposta.headers.get("Content-Type") || "").includes("text/event-stream")) {
+                // Streaming: o texto entra na bolha de "Pensando..." conforme a IA gera
+                let textoBot = "";
+                await lerStreamChat(resposta, (evento, dados) => {
+                    if (evento === "meta" || evento === "done") {
+                        definirConversaAtual(dados.conversaId);
+                    } else if (evento === "error") {
+                        loadingMsg.textContent = "Erro: " + dados.erro;
+                        setSidebarStatus(dados.erro, "error");
+                    } else if (dados.delta) {
+                        textoBot += dados.delta;
+                        loadingMsg.textContent = textoBot;
+                        chatBox.scrollTop = chatBox.scrollHeight;
+                    }
+                });
+                if (!textoBot && loadingMsg.textContent.startsWith("Pensando")) {
+                    loadingMsg.textContent = "Erro: Sem resposta da IA.";
+                }
+                return;
+            }
+
             const data = await resposta.json();
             if (loadingMsg && chatBox.contains(loadingMsg)) {
                 chatBox.removeChild(loadingMsg);
             }
+            if (resposta.status === 404 && currentConversaId) {
+                // Conversa apagada em outra aba: a próxima pergunta começa uma nova
+                definirConversaAtual("");
+            }
 
             if (resposta.ok && data.resposta) {
+                definirConversaAtual(data.conversaId);
                 addChatMessage(data.resposta, "bot");
             } else {
                 addChatMessage("Erro: " + (data.erro || "Sem resposta da IA."), "bot");
@@ -708,6 +792,24 @@ async function salvarRBT12() {
     }
 }
 
+const JOB_POLL_INTERVAL_MS = 1000;
+
+async function aguardarJobProcessamento(jobId, onProgress) {
+    // Consulta /api/jobs/<id> até o job terminar (concluido/erro)
+    while (true) {
+        const res = await fetch(`/api/jobs/${jobId}`, { credentials: "include" });
+        const job = await res.json();
+        if (!res.ok) {
+            throw new Error(job?.erro || res.statusText || "Falha ao consultar o processamento.");
+        }
+        if (job.status === "concluido" || job.status === "erro") {
+            return job;
+        }
+        onProgress?.(job);
+        await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+    }
+}
+
 async function processarUpload() {
     const files = uploadUI.fileInput?.files;
 
@@ -771,7 +873,19 @@ async function processarUpload() {
             return;
         }
 
-        const payload = Array.isArray(data) ? data : data?.result;
+        let payload = Array.isArray(data) ? data : data?.result;
+
+        if (data?.job_id) {
+            setUploadResult("Arquivos recebidos. Processando...", "info");
+            const job = await aguardarJobProcessamento(data.job_id, (andamento) => {
+                setUploadResult(`Processando ${andamento.processados} de ${andamento.total_arquivos} arquivo(s)...`, "info");
+            });
+            if (job.status === "erro") {
+                throw new Error(job.erro || "Falha no processamento.");
+            }
+            payload = job.resultados;
+        }
+
         const { html, state } = buildUploadResultMarkup(payload || []);
         setUploadResult(html, state);
 
@@ -869,7 +983,7 @@ async function carregarDadosFiscais() {
         });
 
         // Render charts with fetched data
-        renderChartClassificacao(data.classificacao);
+        renderChartClassificacao(data.classificacao, data.totaisPorTipo);
         renderChartImpostosConsolidados(data.impostosConsolidados);
         renderChartImpostosPorNota(data.impostosPorNota);
 
@@ -880,13 +994,13 @@ async function carregarDadosFiscais() {
     }
 }
 
-function renderChartClassificacao(classificacao) {
+function renderChartClassificacao(classificacao, totaisPorTipo) {
     const ctx = document.getElementById("classificacaoChart");
     if (!ctx) return;
 
-    // Count entrada vs saida
-    const entrada = classificacao.filter(n => n.tipo === "Entrada").length;
-    const saida = classificacao.filter(n => n.tipo === "Saída").length;
+    // Count entrada vs saida (totaisPorTipo cobre todas as notas; classificacao é só a página atual)
+    const entrada = totaisPorTipo ? (totaisPorTipo["Entrada"] || 0) : classificacao.filter(n => n.tipo === "Entrada").length;
+    const saida = totaisPorTipo ? (totaisPorTipo["Saída"] || 0) : classificacao.filter(n => n.tipo === "Saída").length;
 
     // Destroy previous instance
     if (chartClassificacao) {
@@ -160,6 +160,24 @@ function buildResultMarkup(items) {
     };
 }
 
+const JOB_POLL_INTERVAL_MS = 1000;
+
+async function waitForJob(jobId, onProgress) {
+    // Consulta /api/jobs/<id> até o job terminar (concluido/erro)
+    while (true) {
+        const response = await fetch(`/api/jobs/${jobId}`, { credentials: "include" });
+        const job = await response.json();
+        if (!response.ok) {
+            throw new Error(job?.erro || response.statusText || "Falha ao consultar o processamento");
+        }
+        if (job.status === "concluido" || job.status === "erro") {
+            return job;
+        }
+        onProgress?.(job);
+        await new Promise(resolve => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+    }
+}
+
 if (uploadBtn && fileInput && uploadBox) {
     const originalButtonContent = uploadBtn.innerHTML;
     uploadBtn.disabled = true;
@@ -229,7 +247,21 @@ if (uploadBtn && fileInput && uploadBox) {
                 return;
             }
 
-            const payload = Array.isArray(data) ? data : data?.result;
+            let payload = Array.isArray(data) ? data : data?.result;
+
+            if (data?.job_id) {
+                uploadBtn.innerHTML = "Processando...";
+                setResult("Arquivos recebidos. Processando...", "info");
+                const job = await waitForJob(data.job_id, progress => {
+                    setResult(`Processando ${progress.processados} de ${progress.total_arquivos} arquivo(s)...`, "info");
+                });
+                if (job.status === "erro") {
+                    setResult(`Erro: ${job.erro || "Falha no processamento"}`, "error");
+                    return;
+                }
+                payload = job.resultados;
+            }
+
             const { html, state } = buildResultMarkup(payload || []);
             setResult(html, state);
             clearFileSelection({ resetResult: false });
@@ -2,6 +2,8 @@
 Funções auxiliares reutilizáveis em todo o projeto
 """
 import re
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
 
 
 def limpar_cnpj(cnpj):
@@ -40,3 +42,43 @@ def formatar_valor_monetario(valor):
         return f"R$ {valor_float:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
     except (ValueError, TypeError):
         return "R$ 0,00"
+
+
+def converter_decimal(valor):
+    """
+    Converte valores vindos dos parsers (str/float, formato '1234.56' ou '1.234,56',
+    com ou sem 'R$') para Decimal. Retorna None se vazio ou inválido.
+    """
+    if valor is None or isinstance(valor, bool):
+        return None
+    if isinstance(valor, Decimal):
+        return valor
+    if isinstance(valor, (int, float)):
+        return Decimal(str(valor))
+    texto = str(valor).replace('R$', '').strip()
+    if not texto:
+        return None
+    if ',' in texto:  # Formato brasileiro: 1.234,56
+        texto = texto.replace('.', '').replace(',', '.')
+    try:
+        return Decimal(texto)
+    except InvalidOperation:
+        return None
+
+
+def converter_data(valor):
+    """
+    Converte a data de emissão (YYYY-MM-DD, DD/MM/YYYY ou DD-MM-YYYY, com ou sem hora)
+    para date. Retorna None se vazia ou inválida.
+    """
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    texto = str(valor or '').strip()[:10]
+    for formato in ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y'):
+        try:
+            return datetime.strptime(texto, formato).date()
+        except ValueError:
+            continue
+    return None
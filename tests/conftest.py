@@ -0,0 +1,43 @@
+"""
+Configuração comum dos testes: src no path e um SQLite temporário por teste,
+ligado ao SessionLocal do app (os serviços abrem as sessões por ele).
+"""
+import os
+import sys
+
+import pytest
+from sqlalchemy import create_engine
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from database.connection import Base, SessionLocal, engine as engine_padrao  # noqa: E402
+import models.usuario  # noqa: E402,F401 - registra as tabelas no Base
+import models.nota_fiscal  # noqa: E402,F401
+import models.job_processamento  # noqa: E402,F401
+import models.resumo_fiscal  # noqa: E402,F401
+import models.conversa  # noqa: E402,F401
+import models.busca_web  # noqa: E402,F401
+import models.arquivo_ingerido  # noqa: E402,F401
+import models.versao_cache  # noqa: E402,F401
+
+
+@pytest.fixture
+def banco(tmp_path):
+    """Engine de um banco novo, já com as tabelas; SessionLocal aponta pra ele durante o teste."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'teste.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    SessionLocal.configure(bind=engine)
+    yield engine
+    SessionLocal.configure(bind=engine_padrao)
+    engine.dispose()
+
+
+def esperar(condicao, timeout=5.0):
+    """Espera condicao() ficar verdadeira (tarefas em segundo plano)."""
+    import time
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        if condicao():
+            return True
+        time.sleep(0.01)
+    return condicao()
@@ -0,0 +1,96 @@
+"""
+Benchmark do parser de DANFE (processors/danfe_parser.py) no corpus de tests/danfes.
+
+Para cada PDF compara os campos e os itens com verdade.json, conta quantos sairiam sem
+nenhuma chamada à IA (campos_faltantes vazio) e mede o tempo de parse (p50/p95/máx) e
+o de uma leitura do cache em disco.
+
+    python tests/danfes/bench_danfe.py
+"""
+import os
+import sys
+import json
+import time
+import logging
+import tempfile
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(RAIZ, "src"))
+logging.getLogger("pdfminer").setLevel(logging.WARNING)
+os.environ["PDF_TEXT_CACHE_DIR"] = tempfile.mkdtemp()  # Cache vazio: mede o parse, não o disco
+
+import pdfplumber  # noqa: E402
+from processors.danfe_parser import parsear_paginas, campos_faltantes, extrair_danfe  # noqa: E402
+
+CORPUS = os.path.dirname(os.path.abspath(__file__))
+CAMPOS = [
+    "numero", "data_emissao", "cnpj_emitente", "nome_emitente", "ie_emitente", "cnpj_destinatario",
+    "nome_destinatario", "natureza_operacao", "chave_nfe", "valor_total_nota"
+]
+CAMPOS_ITEM = ["codigo_produto", "descricao_produto", "ncm", "cfop", "unidade", "cst_icms"]
+VALORES_ITEM = ["quantidade", "valor_unitario", "valor_total", "icms_valor", "ipi_valor"]
+
+
+def campo_igual(campo, lido, esperado):
+    if campo == "valor_total_nota":
+        return lido is not None and abs(lido - esperado) < 0.005
+    return str(lido or "") == str(esperado or "")
+
+
+def itens_iguais(lidos, esperados):
+    return len(lidos) == len(esperados) and all(
+        all(lido[c] == esperado[c] for c in CAMPOS_ITEM)
+        and all(abs(lido[c] - esperado[c]) < 0.005 for c in VALORES_ITEM)
+        for lido, esperado in zip(lidos, esperados)
+    )
+
+
+def main():
+    with open(os.path.join(CORPUS, "verdade.json"), encoding="utf-8") as arquivo:
+        verdade = json.load(arquivo)
+
+    acertos = dict.fromkeys(CAMPOS + ["itens"], 0)
+    sem_ia = 0
+    tempos = []
+    erros = []
+    for nome, esperado in sorted(verdade.items()):
+        inicio = time.perf_counter()
+        with pdfplumber.open(os.path.join(CORPUS, nome)) as pdf:
+            dados = parsear_paginas(pdf.pages)
+        tempos.append((time.perf_counter() - inicio) * 1000)
+
+        for campo in CAMPOS:
+            if campo_igual(campo, dados.get(campo), esperado[campo]):
+                acertos[campo] += 1
+            else:
+                erros.append((nome, campo, dados.get(campo), esperado[campo]))
+        if itens_iguais(dados["itens"], esperado["itens"]):
+            acertos["itens"] += 1
+        else:
+            erros.append((nome, "itens", len(dados["itens"]), len(esperado["itens"])))
+        sem_ia += not campos_faltantes(dados)
+
+    total = len(verdade)
+    print(f"{total} DANFEs, {sum(len(v['itens']) for v in verdade.values())} itens no corpus")
+    for campo, certos in acertos.items():
+        print(f"  {campo:20s} {certos}/{total}")
+    print(f"sem chamada à IA (nada faltando): {sem_ia}/{total}")
+    tempos.sort()
+    print(f"parse: p50 {tempos[total // 2]:.1f} ms, p95 {tempos[int(total * .95)]:.1f} ms, "
+          f"máx {tempos[-1]:.1f} ms, total {sum(tempos):.0f} ms")
+    for erro in erros[:20]:
+        print("ERRO", erro)
+
+    caminho = os.path.join(CORPUS, sorted(verdade)[-1])
+    inicio = time.perf_counter()
+    extrair_danfe(caminho)
+    primeira = (time.perf_counter() - inicio) * 1000
+    inicio = time.perf_counter()
+    extrair_danfe(caminho)
+    em_cache = (time.perf_counter() - inicio) * 1000
+    print(f"extrair_danfe {os.path.basename(caminho)}: 1ª leitura {primeira:.1f} ms, do cache {em_cache:.2f} ms")
+    return 1 if erros else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
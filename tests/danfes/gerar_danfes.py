@@ -0,0 +1,309 @@
+"""
+Gera o corpus de DANFEs de teste (tests/danfes/*.pdf) e o gabarito verdade.json.
+
+São 50 DANFEs em PDF de texto, desenhados direto em PDF (Helvetica, sem dependências):
+as 10 NF-e de nfe_simuladas_v2/ e 40 notas sintéticas (1 a 90 itens, descrições que
+quebram linha, folhas de continuação "FOLHA 1/N"), em quatro variantes de layout:
+com bordas, sem bordas, cabeçalho da tabela em uma linha e com boleto anexo.
+A geração é determinística (semente fixa): rodar de novo recria os mesmos arquivos.
+
+    python tests/danfes/gerar_danfes.py
+"""
+import os
+import sys
+import json
+import random
+import zlib
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(RAIZ, 'src'))
+from processors.xml_processor import processar_xml  # noqa: E402
+
+OUT = os.path.dirname(os.path.abspath(__file__))
+XML_DIR = os.path.join(RAIZ, 'nfe_simuladas_v2')
+W, H = 595, 842
+
+def esc(s):
+    b = s.encode('cp1252', 'replace')
+    return b.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+
+def largura(s, size):
+    from pdfminer.fontmetrics import FONT_METRICS
+    w = FONT_METRICS['Helvetica'][1]
+    return sum(w.get(c, 556) for c in s) * size / 1000
+
+class Pagina:
+    def __init__(self): self.ops = []
+    def t(self, x, y, s, size=7, direita=None):
+        if direita is not None:
+            x = direita - largura(s, size)
+        self.ops.append(b'BT /F1 %d Tf %.2f %.2f Td (' % (size, x, H - y - size) + esc(s) + b') Tj ET')
+    def r(self, x, y, w, h):
+        self.ops.append(b'%.2f %.2f %.2f %.2f re S' % (x, H - y - h, w, h))
+
+def salvar(paginas, caminho):
+    objs = []
+    objs.append(b'<< /Type /Catalog /Pages 2 0 R >>')
+    n = len(paginas)
+    kids = ' '.join(f'{4 + 2*i} 0 R' for i in range(n))
+    objs.append(f'<< /Type /Pages /Kids [{kids}] /Count {n} >>'.encode())
+    objs.append(b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>')
+    for i, p in enumerate(paginas):
+        objs.append(f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {W} {H}] /Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2*i} 0 R >>'.encode())
+        dados = zlib.compress(b'\n'.join(p.ops))
+        objs.append(b'<< /Length %d /Filter /FlateDecode >>\nstream\n' % len(dados) + dados + b'\nendstream')
+    out = bytearray(b'%PDF-1.4\n')
+    offs = []
+    for i, o in enumerate(objs, 1):
+        offs.append(len(out))
+        out += b'%d 0 obj\n' % i + o + b'\nendobj\n'
+    x = len(out)
+    out += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objs) + 1)
+    for o in offs:
+        out += b'%010d 00000 n \n' % o
+    out += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objs) + 1, x)
+    with open(caminho, 'wb') as arquivo:
+        arquivo.write(out)
+
+def br(v, casas=2):
+    s = f'{v:,.{casas}f}'
+    return s.replace(',', 'X').replace('.', ',').replace('X', '.')
+
+def fmt_cnpj(c):
+    return f'{c[:2]}.{c[2:5]}.{c[5:8]}/{c[8:12]}-{c[12:]}' if len(c) == 14 else f'{c[:3]}.{c[3:6]}.{c[6:9]}-{c[9:]}'
+
+def dv(chave43):
+    soma = sum(int(d) * (2 + i % 8) for i, d in enumerate(reversed(chave43)))
+    r = soma % 11
+    return '0' if r < 2 else str(11 - r)
+
+def gerar_chave(uf, aamm, cnpj, serie, numero, cnf):
+    c = f'{uf}{aamm}{cnpj}55{serie:03d}{numero:09d}1{cnf:08d}'
+    return c + dv(c)
+
+def caixa(p, x, y, w, h, rotulo, valor, bordas, size=8, direita=False):
+    if bordas: p.r(x, y, w, h)
+    p.t(x + 2, y + 1.5, rotulo, 5)
+    if valor:
+        if direita: p.t(0, y + 10, valor, size, direita=x + w - 2)
+        else: p.t(x + 2, y + 10, valor, size)
+
+# colunas: (rotulo linhas, x, w, campo, alinhamento)
+COLS = [
+    (('CÓDIGO', 'PRODUTO'), 20, 45, 'codigo_produto', 'e'),
+    (('DESCRIÇÃO DO PRODUTO / SERVIÇO',), 65, 150, 'descricao_produto', 'e'),
+    (('NCM/SH',), 215, 34, 'ncm', 'e'),
+    (('O/CST',), 249, 20, 'cst', 'e'),
+    (('CFOP',), 269, 20, 'cfop', 'e'),
+    (('UN',), 289, 16, 'unidade', 'e'),
+    (('QUANT.',), 305, 36, 'quantidade', 'd'),
+    (('VALOR', 'UNIT.'), 341, 40, 'valor_unitario', 'd'),
+    (('VALOR', 'TOTAL'), 381, 42, 'valor_total', 'd'),
+    (('B.CÁLC', 'ICMS'), 423, 40, 'bc', 'd'),
+    (('VALOR', 'ICMS'), 463, 36, 'icms_valor', 'd'),
+    (('VALOR', 'IPI'), 499, 30, 'ipi_valor', 'd'),
+    (('ALÍQ.', 'ICMS'), 529, 23, 'aliq', 'd'),
+    (('ALÍQ.', 'IPI'), 552, 23, 'aliqipi', 'd'),
+]
+LIMITE_DESCR = 34
+
+def cabecalho_itens(p, y, bordas, uma_linha):
+    p.t(20, y, 'DADOS DOS PRODUTOS / SERVIÇOS', 6)
+    y += 9
+    for rot, x, w, _, _ in COLS:
+        if bordas: p.r(x, y, w, 14)
+        if uma_linha:
+            p.t(x + 1.5, y + 2, ' '.join(rot), 4.5 if len(' '.join(rot)) > 8 else 5)
+        else:
+            for k, linha in enumerate(rot):
+                p.t(x + 1.5, y + 1 + k * 6, linha, 5)
+    return y + 16
+
+def linhas_item(it):
+    d = it['descricao_produto']
+    partes = []
+    while len(d) > LIMITE_DESCR:
+        corte = d.rfind(' ', 0, LIMITE_DESCR)
+        corte = corte if corte > 0 else LIMITE_DESCR
+        partes.append(d[:corte]); d = d[corte:].strip()
+    partes.append(d)
+    return partes
+
+def desenhar_item(p, y, it, bordas):
+    vals = {
+        'codigo_produto': it['codigo_produto'], 'ncm': it['ncm'], 'cst': '0' + it['cst_icms'],
+        'cfop': it['cfop'], 'unidade': it['unidade'], 'quantidade': br(it['quantidade'], 4),
+        'valor_unitario': br(it['valor_unitario'], 2), 'valor_total': br(it['valor_total'], 2),
+        'bc': br(it['valor_total'] if it['icms_valor'] else 0), 'icms_valor': br(it['icms_valor']),
+        'ipi_valor': br(it['ipi_valor']), 'aliq': br(18 if it['icms_valor'] else 0), 'aliqipi': '0,00'
+    }
+    desc = linhas_item(it)
+    for rot, x, w, campo, al in COLS:
+        if campo == 'descricao_produto':
+            for k, l in enumerate(desc):
+                p.t(x + 1.5, y + k * 7, l, 6)
+        else:
+            if al == 'd': p.t(0, y, vals[campo], 6, direita=x + w - 1.5)
+            else: p.t(x + 1.5, y, vals[campo], 6)
+    return y + 7 * len(desc) + 1.5
+
+def danfe(n, caminho, bordas=True, uma_linha=False, boleto=False):
+    itens = n['itens']
+    # paginação
+    paginas_itens = [[]]
+    y = 426; lim = 770
+    for it in itens:
+        h = 7 * len(linhas_item(it)) + 1.5
+        if y + h > lim:
+            paginas_itens.append([]); y = 150; lim = 800
+        paginas_itens[-1].append(it); y += h
+    folhas = len(paginas_itens)
+    num_fmt = f'{int(n["numero"]):09d}'; num_fmt = f'{num_fmt[:3]}.{num_fmt[3:6]}.{num_fmt[6:]}'
+    chave_fmt = ' '.join(n['chave_nfe'][i:i+4] for i in range(0, 44, 4))
+    pags = []
+    for f, lista in enumerate(paginas_itens, 1):
+        p = Pagina(); pags.append(p)
+        if f == 1:
+            if bordas: p.r(20, 15, 470, 30); p.r(490, 15, 85, 30)
+            p.t(22, 17, f'RECEBEMOS DE {n["nome_emitente"]} OS PRODUTOS E/OU SERVIÇOS CONSTANTES DA NOTA FISCAL ELETRÔNICA INDICADA ABAIXO', 5)
+            p.t(22, 30, 'DATA DE RECEBIMENTO', 5); p.t(150, 30, 'IDENTIFICAÇÃO E ASSINATURA DO RECEBEDOR', 5)
+            p.t(505, 18, 'NF-e', 9); p.t(495, 28, f'Nº {num_fmt}', 7); p.t(495, 36, 'SÉRIE 001', 7)
+        y0 = 55
+        if bordas: p.r(20, y0, 230, 80); p.r(250, y0, 95, 80); p.r(345, y0, 230, 80)
+        p.t(22, y0 + 2, 'IDENTIFICAÇÃO DO EMITENTE', 5)
+        p.t(24, y0 + 14, n['nome_emitente'], 10)
+        p.t(24, y0 + 30, n['end1'], 7); p.t(24, y0 + 39, n['end2'], 7)
+        p.t(272, y0 + 4, 'DANFE', 12)
+        p.t(256, y0 + 18, 'DOCUMENTO AUXILIAR DA', 5); p.t(256, y0 + 24, 'NOTA FISCAL ELETRÔNICA', 5)
+        p.t(256, y0 + 34, '0 - ENTRADA', 6); p.t(256, y0 + 41, '1 - SAÍDA', 6); p.t(320, y0 + 37, n['tp'], 10)
+        p.t(256, y0 + 52, f'Nº {num_fmt}', 7); p.t(256, y0 + 60, 'SÉRIE 001', 7); p.t(256, y0 + 68, f'FOLHA {f}/{folhas}', 7)
+        caixa(p, 345, y0 + 20, 230, 20, 'CHAVE DE ACESSO', chave_fmt, False, size=8)
+        p.t(350, y0 + 50, 'Consulta de autenticidade no portal nacional da NF-e', 6)
+        p.t(350, y0 + 58, 'www.nfe.fazenda.gov.br/portal ou no site da Sefaz Autorizadora', 6)
+        y = y0 + 82
+        caixa(p, 20, y, 325, 20, 'NATUREZA DA OPERAÇÃO', n['natureza_operacao'], bordas)
+        caixa(p, 345, y, 230, 20, 'PROTOCOLO DE AUTORIZAÇÃO DE USO', '135250000123456 10/09/2025 17:24:01', bordas)
+        y += 20
+        caixa(p, 20, y, 190, 20, 'INSCRIÇÃO ESTADUAL', n['ie_emitente'], bordas)
+        caixa(p, 210, y, 190, 20, 'INSCRIÇÃO ESTADUAL DO SUBST. TRIB.', '', bordas)
+        caixa(p, 400, y, 175, 20, 'CNPJ', fmt_cnpj(n['cnpj_emitente']), bordas)
+        y += 24
+        if f == 1:
+            p.t(20, y, 'DESTINATÁRIO / REMETENTE', 6); y += 8
+            caixa(p, 20, y, 320, 20, 'NOME / RAZÃO SOCIAL', n['nome_destinatario'], bordas)
+            caixa(p, 340, y, 140, 20, 'CNPJ / CPF', fmt_cnpj(n['cnpj_destinatario']), bordas)
+            caixa(p, 480, y, 95, 20, 'DATA DA EMISSÃO', n['data_br'], bordas)
+            y += 20
+            caixa(p, 20, y, 240, 20, 'ENDEREÇO', n['dest_end'], bordas)
+            caixa(p, 260, y, 140, 20, 'BAIRRO / DISTRITO', n['dest_bairro'], bordas)
+            caixa(p, 400, y, 80, 20, 'CEP', '01002-000', bordas)
+            caixa(p, 480, y, 95, 20, 'DATA DA SAÍDA/ENTRADA', n['data_br'], bordas)
+            y += 20
+            caixa(p, 20, y, 210, 20, 'MUNICÍPIO', n['dest_mun'], bordas)
+            caixa(p, 230, y, 100, 20, 'FONE / FAX', '(11) 3333-4444', bordas)
+            caixa(p, 330, y, 30, 20, 'UF', n['dest_uf'], bordas)
+            caixa(p, 360, y, 120, 20, 'INSCRIÇÃO ESTADUAL', n.get('ie_destinatario') or '', bordas)
+            caixa(p, 480, y, 95, 20, 'HORA DA SAÍDA', '17:23:53', bordas)
+            y += 24
+            p.t(20, y, 'CÁLCULO DO IMPOSTO', 6); y += 8
+            for k, (rot, v) in enumerate([('BASE DE CÁLCULO DO ICMS', n['bc']), ('VALOR DO ICMS', n['vicms']), ('BASE DE CÁLC. ICMS S.T.', 0), ('VALOR DO ICMS SUBST.', 0), ('VALOR TOTAL DOS PRODUTOS', n['vprod'])]):
+                caixa(p, 20 + k * 111, y, 111, 20, rot, br(v), bordas, direita=True)
+            y += 20
+            for k, (rot, v) in enumerate([('VALOR DO FRETE', 0), ('VALOR DO SEGURO', 0), ('DESCONTO', 0), ('OUTRAS DESPESAS', 0), ('VALOR TOTAL DO IPI', n['vipi']), ('VALOR TOTAL DA NOTA', n['valor_total_nota'])]):
+                caixa(p, 20 + k * 92.5, y, 92.5, 20, rot, br(v), bordas, direita=True)
+            y += 24
+            p.t(20, y, 'TRANSPORTADOR / VOLUMES TRANSPORTADOS', 6); y += 8
+            caixa(p, 20, y, 250, 20, 'RAZÃO SOCIAL', 'Transportadora Exemplo Ltda', bordas)
+            caixa(p, 270, y, 100, 20, 'FRETE POR CONTA', '9-Sem Frete', bordas)
+            caixa(p, 370, y, 205, 20, 'CNPJ / CPF', '11.222.333/0001-81', bordas)
+            y += 24
+            y = cabecalho_itens(p, y, bordas, uma_linha)
+        else:
+            y = cabecalho_itens(p, y, bordas, uma_linha)
+        for it in lista:
+            y = desenhar_item(p, y, it, bordas)
+        if f == 1:
+            if bordas: p.r(20, 790, 555, 40)
+            p.t(20, 782, 'DADOS ADICIONAIS', 6)
+            p.t(22, 792, 'INFORMAÇÕES COMPLEMENTARES', 5)
+            p.t(22, 800, 'Documento emitido por ME ou EPP optante pelo Simples Nacional. Valor aproximado dos tributos R$ 123,45', 6)
+    if boleto:
+        p = Pagina(); pags.append(p)
+        p.t(20, 40, 'BOLETO BANCÁRIO - RECIBO DO PAGADOR', 10)
+        p.t(20, 60, f'Pagador: {n["nome_destinatario"]}  Valor: R$ {br(n["valor_total_nota"])}', 8)
+    salvar(pags, caminho)
+
+PALAVRAS = ['Parafuso', 'Sextavado', 'Aço', 'Inox', 'Porca', 'Arruela', 'Chapa', 'Galvanizada', 'Tubo', 'PVC', 'Cabo', 'Flexível', 'Cobre', 'Disjuntor', 'Tomada', 'Luva', 'Nitrílica', 'Óleo', 'Lubrificante', 'Camisa', 'Algodão', 'Calça', 'Jeans', 'Café', 'Torrado', 'Açúcar', 'Cristal', 'Papel', 'Sulfite', 'A4']
+
+def nota_sintetica(i, rnd):
+    cnpj_e = f'{rnd.randrange(10**13, 10**14)}'
+    dest_cpf = rnd.random() < 0.2
+    cnpj_d = f'{rnd.randrange(10**10, 10**11)}' if dest_cpf else f'{rnd.randrange(10**13, 10**14)}'
+    numero = rnd.randrange(1, 999999)
+    mes = rnd.randrange(1, 13)
+    n_itens = rnd.choice([1, 2, 3, 5, 8, 12, 20, 35, 60, 90])
+    itens = []
+    for k in range(n_itens):
+        q = round(rnd.uniform(1, 500), 4 if rnd.random() < 0.3 else 2)
+        u = round(rnd.uniform(0.5, 3000), 2)
+        tot = round(q * u, 2)
+        desc = ' '.join(rnd.choice(PALAVRAS) for _ in range(rnd.randrange(2, 10))) + f' {rnd.randrange(1, 100)}mm'
+        icms = round(tot * 0.18, 2) if rnd.random() < 0.7 else 0.0
+        ipi = round(tot * 0.05, 2) if rnd.random() < 0.2 else 0.0
+        itens.append({'codigo_produto': f'P{rnd.randrange(1000, 99999)}', 'descricao_produto': desc,
+                      'ncm': f'{rnd.randrange(10**7, 10**8)}', 'cst_icms': rnd.choice(['00', '10', '20', '40', '60']),
+                      'cfop': rnd.choice(['5102', '6102', '1102', '5405']), 'unidade': rnd.choice(['UN', 'KG', 'CX', 'M']),
+                      'quantidade': q, 'valor_unitario': u, 'valor_total': tot, 'icms_valor': icms, 'ipi_valor': ipi})
+    vprod = round(sum(t['valor_total'] for t in itens), 2)
+    vipi = round(sum(t['ipi_valor'] for t in itens), 2)
+    return {
+        'numero': str(numero), 'data_emissao': f'2025-{mes:02d}-{rnd.randrange(1, 29):02d}',
+        'cnpj_emitente': cnpj_e, 'nome_emitente': f'{rnd.choice(["Comercial", "Distribuidora", "Indústria", "Atacadão"])} {rnd.choice(PALAVRAS)} Ltda',
+        'ie_emitente': f'{rnd.randrange(10**8, 10**9)}', 'cnpj_destinatario': cnpj_d,
+        'nome_destinatario': f'{rnd.choice(["João da Silva", "Maria Souza", "Mercado Bom Preço", "Oficina São José"])} {i}',
+        'natureza_operacao': rnd.choice(['VENDA DE MERCADORIA', 'VENDA DE PRODUÇÃO DO ESTABELECIMENTO', 'DEVOLUÇÃO DE COMPRA', 'REMESSA PARA CONSERTO']),
+        'chave_nfe': gerar_chave('35', f'25{mes:02d}', cnpj_e, 1, numero, rnd.randrange(10**7, 10**8)),
+        'valor_total_nota': round(vprod + vipi, 2), 'vprod': vprod, 'vipi': vipi,
+        'bc': round(sum(t['valor_total'] for t in itens if t['icms_valor']), 2), 'vicms': round(sum(t['icms_valor'] for t in itens), 2),
+        'itens': itens, 'dest_end': f'Rua das Flores, {rnd.randrange(1, 999)}', 'dest_bairro': 'Centro', 'dest_mun': 'São Paulo', 'dest_uf': 'SP',
+        'ie_destinatario': '' if dest_cpf else f'{rnd.randrange(10**8, 10**9)}',
+    }
+
+def nota_do_xml(caminho, rnd):
+    d = processar_xml(caminho)
+    itens = [{'codigo_produto': t['codigo_produto'], 'descricao_produto': t['descricao_produto'], 'ncm': t['ncm'],
+              'cst_icms': t['cst_icms'] or '00', 'cfop': t['cfop'], 'unidade': t['unidade'],
+              'quantidade': float(t['quantidade']), 'valor_unitario': float(t['valor_unitario']),
+              'valor_total': float(t['valor_total']), 'icms_valor': t['icms_valor'], 'ipi_valor': t['ipi_valor']} for t in d['itens']]
+    data = str(d['data_emissao'])[:10]
+    numero = int(d['numero'])
+    vprod = round(sum(t['valor_total'] for t in itens), 2)
+    return {
+        'numero': str(numero), 'data_emissao': data, 'cnpj_emitente': d['cnpj_emitente'], 'nome_emitente': d['nome_emitente'],
+        'ie_emitente': d.get('ie_emitente') or '', 'cnpj_destinatario': d['cnpj_destinatario'], 'nome_destinatario': d['nome_destinatario'],
+        'natureza_operacao': d['natureza_operacao'],
+        'chave_nfe': gerar_chave('35', data[2:4] + data[5:7], d['cnpj_emitente'], 1, numero, rnd.randrange(10**7, 10**8)),
+        'valor_total_nota': float(d['valor_total_nota']), 'vprod': vprod, 'vipi': 0.0, 'bc': vprod,
+        'vicms': round(sum(t['icms_valor'] for t in itens), 2), 'itens': itens,
+        'dest_end': 'Rua Destino, 200', 'dest_bairro': 'Bairro', 'dest_mun': 'São Paulo', 'dest_uf': 'SP', 'ie_destinatario': '',
+    }
+
+if __name__ == '__main__':
+    rnd = random.Random(7)
+    verdade = {}
+    notas = []
+    for nome in sorted(os.listdir(XML_DIR)):
+        notas.append(nota_do_xml(os.path.join(XML_DIR, nome), rnd))
+    for i in range(40):
+        notas.append(nota_sintetica(i, rnd))
+    for i, n in enumerate(notas):
+        n['tp'] = '1'
+        n['data_br'] = f'{n["data_emissao"][8:10]}/{n["data_emissao"][5:7]}/{n["data_emissao"][:4]}'
+        n['end1'] = 'Rua Simulada, 100 - Centro'; n['end2'] = 'São Paulo - SP - CEP 01001-000'
+        variante = ['bordas', 'sem_bordas', 'cabecalho_1_linha', 'boleto'][i % 4]
+        caminho = os.path.join(OUT, f'danfe_{i:02d}_{variante}.pdf')
+        danfe(n, caminho, bordas=variante != 'sem_bordas', uma_linha=variante == 'cabecalho_1_linha', boleto=variante == 'boleto')
+        verdade[os.path.basename(caminho)] = {k: n[k] for k in ('numero', 'data_emissao', 'cnpj_emitente', 'nome_emitente', 'ie_emitente', 'cnpj_destinatario', 'nome_destinatario', 'natureza_operacao', 'chave_nfe', 'valor_total_nota', 'itens')}
+    with open(os.path.join(OUT, 'verdade.json'), 'w', encoding='utf-8') as arquivo:
+        json.dump(verdade, arquivo, ensure_ascii=False, indent=1)
+    print(len(notas), 'DANFEs em', OUT)
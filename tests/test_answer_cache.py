@@ -0,0 +1,92 @@
+"""Cache de respostas do chat (services/answer_cache.py): acerto exato, por similaridade, TTL e LRU."""
+import time
+
+from services import answer_cache as modulo
+from services.answer_cache import AnswerCache, hash_contexto, eh_continuacao
+
+CNPJ = "11222333000181"
+CONTEXTO = hash_contexto("Notas:\n- Nota 100 ...")
+
+
+def test_acerto_exato_com_pergunta_normalizada():
+    cache = AnswerCache()
+    cache.guardar(CNPJ, CONTEXTO, "Qual o total de ICMS das vendas em 2024?", "R$ 1.000,00")
+
+    acerto = cache.buscar(CNPJ, CONTEXTO, "qual o total do ICMS nas vendas de 2024, por favor")
+    assert acerto == {"resposta": "R$ 1.000,00", "semantico": False, "similaridade": 1.0}
+    assert cache.metricas()["hits"] == 1
+
+
+def test_acerto_semantico_acima_do_limiar():
+    cache = AnswerCache(similaridade_minima=0.8)
+    cache.guardar(CNPJ, CONTEXTO, "Qual o valor total de ICMS das vendas em 2024?", "R$ 1.000,00")
+
+    acerto = cache.buscar(CNPJ, CONTEXTO, "Total de ICMS das vendas em 2024")
+    assert acerto["semantico"] and acerto["resposta"] == "R$ 1.000,00"
+    assert acerto["similaridade"] >= 0.8
+    assert cache.metricas()["semantic_hits"] == 1
+
+    # Com limiar acima da similaridade do par, não reaproveita
+    exigente = AnswerCache(similaridade_minima=0.95)
+    exigente.guardar(CNPJ, CONTEXTO, "Qual o valor total de ICMS das vendas em 2024?", "R$ 1.000,00")
+    assert exigente.buscar(CNPJ, CONTEXTO, "Total de ICMS das vendas em 2024") is None
+
+
+def test_termos_chave_ou_numeros_diferentes_nao_acertam():
+    cache = AnswerCache(similaridade_minima=0.5)
+    cache.guardar(CNPJ, CONTEXTO, "Total de ICMS das vendas em 2024", "R$ 1.000,00")
+
+    assert cache.buscar(CNPJ, CONTEXTO, "Total de ICMS das vendas em 2025") is None
+    assert cache.buscar(CNPJ, CONTEXTO, "Total de IPI das vendas em 2024") is None
+    assert cache.buscar(CNPJ, CONTEXTO, "Total de ICMS das compras em 2024") is None
+    assert cache.metricas()["misses"] == 3
+
+
+def test_outro_contexto_ou_outro_cnpj_nao_acertam():
+    cache = AnswerCache()
+    cache.guardar(CNPJ, CONTEXTO, "Total de ICMS em 2024", "R$ 1.000,00")
+
+    assert cache.buscar(CNPJ, hash_contexto("notas mudaram"), "Total de ICMS em 2024") is None
+    assert cache.buscar("99888777000166", CONTEXTO, "Total de ICMS em 2024") is None
+
+
+def test_entrada_expira_pelo_ttl():
+    cache = AnswerCache(ttl=0.05)
+    cache.guardar(CNPJ, CONTEXTO, "Total de ICMS em 2024", "R$ 1.000,00")
+    assert cache.buscar(CNPJ, CONTEXTO, "Total de ICMS em 2024")
+
+    time.sleep(0.1)
+    assert cache.buscar(CNPJ, CONTEXTO, "Total de ICMS em 2024") is None
+    assert cache.buscar(CNPJ, CONTEXTO, "Valor total de ICMS em 2024") is None  # Nem por similaridade
+    assert cache.metricas()["entries"] == 0
+
+
+def test_lru_descarta_a_menos_usada():
+    cache = AnswerCache(max_entradas=2)
+    cache.guardar(CNPJ, CONTEXTO, "Total de ICMS em 2023", "a")
+    cache.guardar(CNPJ, CONTEXTO, "Total de ICMS em 2024", "b")
+    cache.buscar(CNPJ, CONTEXTO, "Total de ICMS em 2023")  # Vira a mais recente
+    cache.guardar(CNPJ, CONTEXTO, "Total de ICMS em 2025", "c")
+
+    assert cache.buscar(CNPJ, CONTEXTO, "Total de ICMS em 2024") is None
+    assert cache.buscar(CNPJ, CONTEXTO, "Total de ICMS em 2023")["resposta"] == "a"
+    assert cache.metricas()["evicted"] == 1
+
+
+def test_invalidar_cnpj_so_afeta_o_cnpj(monkeypatch):
+    cache = AnswerCache()
+    monkeypatch.setattr(modulo, "answer_cache", cache)
+    cache.guardar(CNPJ, CONTEXTO, "Total de ICMS em 2024", "a")
+    cache.guardar("99888777000166", CONTEXTO, "Total de ICMS em 2024", "b")
+
+    modulo.invalidar_cnpj(CNPJ, "")
+
+    assert cache.buscar(CNPJ, CONTEXTO, "Total de ICMS em 2024") is None
+    assert cache.buscar("99888777000166", CONTEXTO, "Total de ICMS em 2024")["resposta"] == "b"
+    assert cache.metricas()["invalidated"] == 1
+
+
+def test_continuacao_nao_usa_cache():
+    assert eh_continuacao("E no mês passado?")
+    assert eh_continuacao("Quanto disso foi ICMS?")
+    assert not eh_continuacao("Qual o total de ICMS em 2024?")
@@ -0,0 +1,97 @@
+"""Busca de texto (services/indice_busca.py e /api/search): triggers do índice, resultados e trechos."""
+from datetime import date
+
+import pytest
+from flask import Flask
+
+from database.connection import SessionLocal
+from models.nota_fiscal import NotaFiscal, ItemNota
+from routes.search import search_bp
+from services.indice_busca import criar_indice_busca, pesquisar
+
+CNPJ = "22263229720925"
+CLIENTE = "64795776000128"
+OUTRO = "99888777000166"
+
+
+def _nota(numero, emitente, destinatario, nome_destinatario, natureza, itens):
+    return NotaFiscal(
+        numero=numero, chave_nfe=f"3525{numero:0>40}", data_emissao=date(2025, 1, 10),
+        cnpj_emitente=emitente, nome_emitente="Ferragens Alfa Ltda", cnpj_destinatario=destinatario,
+        nome_destinatario=nome_destinatario, natureza_operacao=natureza, tipo_operacao="Saída",
+        valor_total_nota=100, itens=[ItemNota(descricao_produto=d, codigo_produto=c, ncm="73181500") for d, c in itens]
+    )
+
+
+@pytest.fixture
+def db(banco):
+    with banco.begin() as conn:
+        criar_indice_busca(conn)
+    session = SessionLocal()
+    session.add_all([
+        _nota("1", CNPJ, CLIENTE, "Construtora Beta", "Venda de mercadoria", [("Parafuso sextavado M8", "PAR-08")]),
+        _nota("2", CNPJ, CLIENTE, "Construtora Beta", "Venda de mercadoria", [("Porca M8 zincada", "POR-08")]),
+        _nota("3", OUTRO, CLIENTE, "Construtora Beta", "Venda", [("Parafuso de outro dono", "X")]),
+    ])
+    session.commit()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def cliente(db):
+    app = Flask(__name__)
+    app.secret_key = "teste"
+    app.register_blueprint(search_bp, url_prefix="/api")
+    cliente = app.test_client()
+    with cliente.session_transaction() as sessao:
+        sessao["cnpj"] = CNPJ
+    return cliente
+
+
+def test_trigger_indexa_no_insert(db):
+    resultados, _ = pesquisar(db, CNPJ, "paraf", tipo="item")
+    assert [r["item_id"] for r in resultados] == [db.query(ItemNota).filter_by(codigo_produto="PAR-08").one().id]
+
+
+def test_trigger_reindexa_no_update_e_remove_no_delete(db):
+    item = db.query(ItemNota).filter_by(codigo_produto="PAR-08").one()
+    item.descricao_produto = "Arruela lisa"
+    db.commit()
+    assert pesquisar(db, CNPJ, "parafuso")[0] == []
+    assert [r["item_id"] for r in pesquisar(db, CNPJ, "arruela")[0]] == [item.id]
+
+    nota = db.query(NotaFiscal).filter_by(numero="2").one()
+    nota.nome_destinatario = "Incorporadora Gama"
+    db.commit()
+    assert [r["nota_id"] for r in pesquisar(db, CNPJ, "gama", tipo="nota")[0]] == [nota.id]
+
+    db.delete(nota)
+    db.commit()
+    assert pesquisar(db, CNPJ, "porca")[0] == []
+
+
+def test_search_trecho_mostra_o_que_casou_sem_cnpjs(cliente):
+    corpo = cliente.get("/api/search?q=paraf").get_json()
+
+    assert [r["tipo"] for r in corpo["resultados"]] == ["item"]  # A nota de outro dono não aparece
+    resultado = corpo["resultados"][0]
+    assert "«Parafuso»" in resultado["trecho"]
+    assert CNPJ not in resultado["trecho"] and CLIENTE not in resultado["trecho"]
+    assert resultado["descricao_produto"] == "Parafuso sextavado M8"
+    assert resultado["numero"] == "1"
+
+    notas = cliente.get("/api/search?q=beta&tipo=nota").get_json()["resultados"]
+    assert len(notas) == 2
+    assert all("«Beta»" in r["trecho"] and CLIENTE not in r["trecho"] for r in notas)
+
+
+def test_search_pagina_e_valida_parametros(cliente):
+    primeira = cliente.get("/api/search?q=beta&tipo=nota&por_pagina=1").get_json()
+    segunda = cliente.get("/api/search?q=beta&tipo=nota&por_pagina=1&pagina=2").get_json()
+    assert primeira["tem_mais"] and not segunda["tem_mais"]
+    assert primeira["resultados"][0]["nota_id"] != segunda["resultados"][0]["nota_id"]
+
+    assert cliente.get("/api/search").status_code == 400
+    assert cliente.get("/api/search?q=x&tipo=outro").status_code == 400
+    assert cliente.get("/api/search?q=beta&por_pagina=500").status_code == 400
@@ -0,0 +1,107 @@
+"""Compactação do histórico do chat (services/chat_compaction.py) com um resumidor falso."""
+from services import gemini_service
+from services.chat_compaction import (
+    compactar, montar_mensagem, remover_blocos_dados, estimar_tokens, eh_resumo,
+    LOTE_RESUMO, MARCADOR_RESUMO, MARCADOR_DADOS
+)
+
+
+class ResumidorFalso:
+    def __init__(self, falhar=False):
+        self.chamadas = []
+        self.falhar = falhar
+
+    def __call__(self, resumo_anterior, trocas):
+        self.chamadas.append((resumo_anterior, trocas))
+        if self.falhar:
+            raise RuntimeError("modelo fora do ar")
+        return f"resumo {len(self.chamadas)}: " + ", ".join(pergunta for pergunta, _ in trocas)
+
+
+def _conversa(trocas, inicio=0, dados="", detalhe=""):
+    mensagens = []
+    for i in range(inicio, inicio + trocas):
+        pergunta = montar_mensagem(dados, f"pergunta {i}") if dados else f"pergunta {i}"
+        mensagens += [{"role": "user", "text": pergunta}, {"role": "model", "text": f"resposta {i}{detalhe}"}]
+    return mensagens
+
+
+def _tokens(mensagens):
+    return sum(estimar_tokens(m["text"]) for m in mensagens)
+
+
+def test_blocos_de_dados_saem_das_mensagens_antigas():
+    mensagens = _conversa(2, dados="NF 1 | R$ 100,00\n" * 50)
+    limpas, economia = remover_blocos_dados(mensagens)
+
+    assert [m["text"] for m in limpas] == ["pergunta 0", "resposta 0", "pergunta 1", "resposta 1"]
+    assert economia > 0 and not any(MARCADOR_DADOS in m["text"] for m in limpas)
+
+
+def test_so_resume_quando_o_excesso_chega_ao_lote():
+    resumidor = ResumidorFalso()
+    abaixo, stats = compactar(_conversa(2 + LOTE_RESUMO - 1), janela=2, resumidor=resumidor)
+    assert not stats["summarized"] and resumidor.chamadas == []
+    assert len(abaixo) == 2 * (2 + LOTE_RESUMO - 1)
+
+    resumidas, stats = compactar(_conversa(2 + LOTE_RESUMO, detalhe=" com detalhes" * 20), janela=2, resumidor=resumidor)
+    assert stats["summarized"] and stats["tokens_saved_summary"] > 0
+    assert len(resumidor.chamadas) == 1
+    assert [p for p, _ in resumidor.chamadas[0][1]] == [f"pergunta {i}" for i in range(LOTE_RESUMO)]
+    assert eh_resumo(resumidas[0])
+    assert [m["text"] for m in resumidas[2::2]] == ["pergunta 4", "pergunta 5"]
+
+
+def test_resumo_anterior_passa_para_o_proximo():
+    resumidor = ResumidorFalso()
+    primeira, _ = compactar(_conversa(6), janela=2, resumidor=resumidor)
+    segunda, stats = compactar(primeira + _conversa(4, inicio=6), janela=2, resumidor=resumidor)
+
+    assert stats["summarized"]
+    anterior, trocas = resumidor.chamadas[1]
+    assert anterior == "resumo 1: pergunta 0, pergunta 1, pergunta 2, pergunta 3"
+    assert [p for p, _ in trocas] == ["pergunta 4", "pergunta 5", "pergunta 6", "pergunta 7"]
+    assert segunda[0]["text"] == f"{MARCADOR_RESUMO}\nresumo 2: pergunta 4, pergunta 5, pergunta 6, pergunta 7"
+    assert len(segunda) == 2 + 4
+
+
+def test_resumidor_com_falha_usa_resumo_extrativo():
+    compactadas, stats = compactar(_conversa(6), janela=2, resumidor=ResumidorFalso(falhar=True))
+
+    assert stats["summarized"]
+    assert "- Cliente: pergunta 0 | Resposta: resposta 0" in compactadas[0]["text"]
+
+
+def test_orcamento_descarta_as_trocas_mais_antigas():
+    mensagens = _conversa(5)
+    proxima = "x" * 40
+    orcamento = estimar_tokens(proxima) + _tokens(mensagens[-4:])
+
+    compactadas, stats = compactar(mensagens, proxima, orcamento=orcamento)
+
+    assert [m["text"] for m in compactadas] == ["pergunta 3", "resposta 3", "pergunta 4", "resposta 4"]
+    assert stats["tokens_saved_budget"] > 0
+    assert stats["prompt_tokens"] <= orcamento
+
+
+def test_orcamento_mantem_a_ultima_troca_e_descarta_o_resumo_por_ultimo():
+    resumidas, _ = compactar(_conversa(6), janela=2, resumidor=ResumidorFalso())
+
+    apertado, _ = compactar(resumidas, orcamento=1)
+    assert [m["text"] for m in apertado] == ["pergunta 5", "resposta 5"]
+
+    folgado, _ = compactar(resumidas, orcamento=_tokens(resumidas[:2]) + _tokens(resumidas[-2:]))
+    assert eh_resumo(folgado[0]) and folgado[-1]["text"] == "resposta 5"
+
+
+def test_resumo_do_agente_usa_o_cliente_da_propria_chave(monkeypatch):
+    chamadas = []
+    monkeypatch.setattr(gemini_service, "gerar_conteudo", lambda prompt, api_key, modelo: chamadas.append((api_key, modelo)) or "ok")
+    configurados = []
+    monkeypatch.setattr(gemini_service.genai, "configure", lambda **opcoes: configurados.append(opcoes))
+    agente = gemini_service.GeminiAgent(api_key="chave-a", modelo="modelo-teste")
+    configurados.clear()
+
+    assert agente._summarize("", [("p", "r")]) == "ok"
+    assert chamadas == [("chave-a", "modelo-teste")]
+    assert configurados == []  # Não mexe na chave global
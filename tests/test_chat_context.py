@@ -0,0 +1,65 @@
+"""Etapas do contexto do chat em paralelo com prazo comum (services/chat_context.py)."""
+import time
+import logging
+
+import pytest
+
+from services.chat_context import EtapasContexto
+
+
+def _lenta(segundos, valor):
+    def etapa():
+        time.sleep(segundos)
+        return valor
+    return etapa
+
+
+def test_etapa_fora_do_prazo_e_descartada():
+    inicio = time.perf_counter()
+    etapas = EtapasContexto({"rapida": lambda: "notas", "lenta": _lenta(1.0, "web")}, prazo=0.1)
+
+    assert etapas.resultado("rapida") == "notas"
+    assert etapas.resultado("lenta", "sem web") == "sem web"
+    assert time.perf_counter() - inicio < 0.5  # Não esperou a etapa lenta
+    assert etapas.descartadas == {"lenta"}
+    assert "rapida" in etapas.tempos and "lenta" not in etapas.tempos
+
+
+def test_etapas_rodam_juntas_e_o_prazo_conta_da_criacao():
+    inicio = time.perf_counter()
+    etapas = EtapasContexto({"a": _lenta(0.2, 1), "b": _lenta(0.2, 2), "c": _lenta(0.2, 3)}, prazo=0.5)
+
+    assert [etapas.resultado(nome) for nome in ("a", "b", "c")] == [1, 2, 3]
+    assert time.perf_counter() - inicio < 0.45  # Em paralelo, não 0,6s em sequência
+    assert etapas.descartadas == set()
+
+
+def test_prazo_e_compartilhado_entre_as_etapas():
+    etapas = EtapasContexto({"a": _lenta(0.15, 1), "b": _lenta(0.6, 2)}, prazo=0.3)
+    time.sleep(0.25)  # Quem chama gastou parte do prazo com outra coisa
+
+    assert etapas.resultado("a") == 1
+    inicio = time.perf_counter()
+    assert etapas.resultado("b") is None
+    assert time.perf_counter() - inicio < 0.15  # Só o que restava do prazo
+
+
+def test_erro_da_etapa_sobe_e_etapa_desconhecida_usa_padrao():
+    def falha():
+        raise ValueError("banco fora do ar")
+
+    etapas = EtapasContexto({"notas": falha}, prazo=1.0)
+    with pytest.raises(ValueError, match="banco fora do ar"):
+        etapas.resultado("notas")
+    assert etapas.resultado("outra", "padrão") == "padrão"
+
+
+def test_registrar_loga_tempos_e_descartes(caplog):
+    etapas = EtapasContexto({"usuario": lambda: "ok", "web": _lenta(1.0, "x")}, prazo=0.05)
+    etapas.resultado("usuario")
+    etapas.resultado("web")
+
+    with caplog.at_level(logging.DEBUG):
+        etapas.registrar()
+    assert "web=descartada(>50ms)" in caplog.text
+    assert "usuario=" in caplog.text and "total=" in caplog.text
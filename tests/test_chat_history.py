@@ -0,0 +1,132 @@
+"""Histórico persistente do chat (services/chat_history.py) e reidratação dos agentes (_sync_history)."""
+import pytest
+
+from database.connection import SessionLocal
+from models.conversa import MensagemChat
+from services.chat_history import SQLiteChatStore
+from services.chat_manager import ChatSessionManager
+
+CNPJ = "11222333000181"
+OUTRO_CNPJ = "99888777000166"
+CHAVE = "chave-de-teste-12345678"
+
+
+@pytest.fixture
+def store(banco):
+    return SQLiteChatStore()
+
+
+@pytest.fixture
+def gerenciador(store):
+    criados = []
+
+    def criar(**opcoes):
+        gerenciador = ChatSessionManager(**opcoes)
+        criados.append(gerenciador)
+        return gerenciador
+    yield criar
+    for gerenciador in criados:
+        gerenciador.stop_sweeper()
+
+
+def _textos(agente):
+    return [msg["parts"][0] for msg in agente.get_history()]
+
+
+def test_store_grava_trocas_e_separa_conversas_e_cnpjs(store):
+    a = store.criar_conversa(CNPJ)
+    b = store.criar_conversa(CNPJ)
+    outra = store.criar_conversa(OUTRO_CNPJ)
+
+    primeiro = store.adicionar_troca(CNPJ, a, "Total de ICMS em 2024?", "R$ 1.000,00")
+    segundo = store.adicionar_troca(CNPJ, a, "E em 2025?", "R$ 2.000,00")
+    store.adicionar_troca(CNPJ, b, "Quantas notas de entrada?", "3")
+
+    assert 0 < primeiro < segundo == store.ultima_mensagem_id(CNPJ, a)
+    assert store.ultimas_trocas(CNPJ, b) == [{"role": "user", "parts": ["Quantas notas de entrada?"]},
+                                              {"role": "model", "parts": ["3"]}]
+    conversas = {c["conversa_id"]: c for c in store.listar_conversas(CNPJ)}
+    assert set(conversas) == {a, b}
+    assert conversas[a]["total_mensagens"] == 4 and conversas[a]["titulo"] == "Total de ICMS em 2024?"
+
+    # A conversa de um CNPJ não é visível nem gravável pelo outro
+    assert store.adicionar_troca(OUTRO_CNPJ, a, "intruso", "x") == 0
+    assert store.carregar_conversa(OUTRO_CNPJ, a) is None
+    assert store.ultimas_trocas(OUTRO_CNPJ, a) == []
+    assert store.ultima_mensagem_id(OUTRO_CNPJ, a) == 0
+    assert [c["conversa_id"] for c in store.listar_conversas(OUTRO_CNPJ)] == [outra]
+    assert not store.remover_conversa(OUTRO_CNPJ, a)
+    assert store.remover_conversa(CNPJ, a) and not store.conversa_existe(CNPJ, a)
+
+
+def test_ultimas_trocas_limita_e_comeca_pelo_usuario(store):
+    conversa = store.criar_conversa(CNPJ)
+    for i in range(5):
+        store.adicionar_troca(CNPJ, conversa, f"pergunta {i}", f"resposta {i}")
+
+    historico = store.ultimas_trocas(CNPJ, conversa, trocas=2)
+    assert [m["parts"][0] for m in historico] == ["pergunta 3", "resposta 3", "pergunta 4", "resposta 4"]
+
+    # Uma resposta a mais desalinha a janela: a resposta solta do começo é descartada
+    session = SessionLocal()
+    session.add(MensagemChat(conversa_id=conversa, role="model", conteudo="complemento"))
+    session.commit()
+    session.close()
+    historico = store.ultimas_trocas(CNPJ, conversa, trocas=2)
+    assert [m["parts"][0] for m in historico] == ["pergunta 4", "resposta 4", "complemento"]
+
+
+def test_agente_recarrega_so_quando_o_banco_avanca(store, gerenciador, monkeypatch):
+    chat = gerenciador()
+    conversa = store.criar_conversa(CNPJ)
+    store.adicionar_troca(CNPJ, conversa, "pergunta 1", "resposta 1")
+    agente = chat.get_agent(CNPJ, CHAVE, conversa_id=conversa)
+    assert _textos(agente) == ["pergunta 1", "resposta 1"]
+
+    recargas = []
+    original = agente.load_history
+    monkeypatch.setattr(agente, "load_history", lambda historico: (recargas.append(historico), original(historico)))
+
+    # Troca gravada por este worker: o agente já a tem, não recarrega
+    chat.record_turn(CNPJ, CHAVE, conversa, "pergunta 2", "resposta 2")
+    assert chat.get_agent(CNPJ, CHAVE, conversa_id=conversa) is agente
+    assert recargas == []
+
+    # Troca gravada por outro worker: o id da última mensagem mudou, recarrega
+    outro_worker = gerenciador()
+    outro_worker.record_turn(CNPJ, CHAVE, conversa, "pergunta 3", "resposta 3")
+    chat.get_agent(CNPJ, CHAVE, conversa_id=conversa)
+    assert len(recargas) == 1
+    assert _textos(agente)[-2:] == ["pergunta 3", "resposta 3"]
+
+
+def test_conversa_restaurada_do_banco_depois_do_lru(store, gerenciador):
+    chat = gerenciador(max_sessions=1)
+    a = store.criar_conversa(CNPJ)
+    b = store.criar_conversa(CNPJ)
+    antigo = chat.get_agent(CNPJ, CHAVE, conversa_id=a)
+    chat.record_turn(CNPJ, CHAVE, a, "pergunta a", "resposta a")
+
+    chat.get_agent(CNPJ, CHAVE, conversa_id=b)  # Tira "a" da memória
+    assert chat.get_metrics()["evicted_lru"] == 1
+
+    restaurado = chat.get_agent(CNPJ, CHAVE, conversa_id=a)
+    assert restaurado is not antigo
+    assert _textos(restaurado) == ["pergunta a", "resposta a"]
+
+
+def test_agentes_separados_por_conversa_e_por_cnpj(store, gerenciador):
+    chat = gerenciador()
+    a = store.criar_conversa(CNPJ)
+    b = store.criar_conversa(CNPJ)
+    store.adicionar_troca(CNPJ, a, "pergunta a", "resposta a")
+    store.adicionar_troca(CNPJ, b, "pergunta b", "resposta b")
+
+    agente_a = chat.get_agent(CNPJ, CHAVE, conversa_id=a)
+    agente_b = chat.get_agent(CNPJ, CHAVE, conversa_id=b)
+    intruso = chat.get_agent(OUTRO_CNPJ, CHAVE, conversa_id=a)
+
+    assert len({id(agente_a), id(agente_b), id(intruso)}) == 3
+    assert _textos(agente_a) == ["pergunta a", "resposta a"]
+    assert _textos(agente_b) == ["pergunta b", "resposta b"]
+    assert _textos(intruso) == []  # Mesmo id de conversa, outro CNPJ: nada do histórico
@@ -0,0 +1,81 @@
+"""Sessões de chat em memória (services/chat_manager.py): LRU, expiração, varredura e limite do histórico."""
+import time
+
+import pytest
+
+from conftest import esperar
+from services.chat_manager import ChatSessionManager
+
+CHAVE = "chave-de-teste-12345678"
+
+
+@pytest.fixture
+def gerenciador():
+    criados = []
+
+    def criar(**opcoes):
+        gerenciador = ChatSessionManager(**opcoes)
+        criados.append(gerenciador)
+        return gerenciador
+    yield criar
+    for gerenciador in criados:
+        gerenciador.stop_sweeper()
+
+
+def test_lru_remove_a_sessao_menos_usada(gerenciador):
+    chat = gerenciador(max_sessions=2)
+    a = chat.get_agent("cnpj-a", CHAVE)
+    chat.get_agent("cnpj-b", CHAVE)
+    assert chat.get_agent("cnpj-a", CHAVE) is a  # "a" vira a mais recente
+    chat.get_agent("cnpj-c", CHAVE)
+
+    assert chat.get_active_sessions_count() == 2
+    assert chat.get_session_summary("cnpj-b", CHAVE) is None
+    assert chat.get_agent("cnpj-a", CHAVE) is a
+    assert chat.get_metrics()["evicted_lru"] == 1
+
+
+def test_sessao_ociosa_expira_e_e_recriada(gerenciador):
+    chat = gerenciador(session_ttl=0.05)
+    antigo = chat.get_agent("cnpj-a", CHAVE)
+    time.sleep(0.1)
+
+    # Antes da varredura passar, o acesso já recria a sessão expirada
+    assert chat.get_agent("cnpj-a", CHAVE) is not antigo
+    assert chat.get_metrics()["evicted_idle"] == 1
+
+    time.sleep(0.1)
+    assert chat.sweep_expired() == 1
+    assert chat.get_active_sessions_count() == 0
+
+
+def test_varredura_em_segundo_plano_remove_expiradas(gerenciador):
+    chat = gerenciador(session_ttl=0.05, sweep_interval=0.05)
+    chat.get_agent("cnpj-a", CHAVE)  # Inicia a thread de varredura
+    chat.get_agent("cnpj-b", CHAVE)
+
+    assert esperar(lambda: chat.get_active_sessions_count() == 0, timeout=2)
+    assert chat.get_metrics()["evicted_idle"] == 2
+    chat.stop_sweeper()
+    assert esperar(lambda: not chat._sweeper.is_alive(), timeout=2)
+
+
+def test_historico_cortado_no_limite_de_tokens(gerenciador):
+    chat = gerenciador(max_history_tokens=100)
+    agente = chat.get_agent("cnpj-a", CHAVE)
+    trocas = []
+    for i in range(6):
+        trocas += [{"role": "user", "parts": [f"pergunta {i} " + "x" * 100]},
+                   {"role": "model", "parts": [f"resposta {i} " + "y" * 100]}]
+    agente.chat_session.history = trocas
+
+    agente._after_response()  # O que roda depois de cada resposta do modelo
+
+    historico = agente.get_history()
+    assert agente.estimate_tokens() <= 100
+    assert len(historico) == 2  # Só a última troca cabe (cada mensagem tem ~28 tokens)
+    assert historico[-1]["parts"][0].startswith("resposta 5")
+    assert historico[0]["role"] == "user"
+    metricas = chat.get_metrics()
+    assert metricas["trimmed_messages"] == 12 - len(historico)
+    assert metricas["max_history_tokens"] == 100
@@ -0,0 +1,49 @@
+"""Resposta em stream do chat (routes/chat.py, _resposta_sse) com geradores falsos."""
+import json
+
+from routes.chat import _resposta_sse
+
+
+def _eventos(resposta):
+    """Lê o corpo text/event-stream: lista de (evento, dados); evento None para as mensagens sem nome."""
+    eventos = []
+    for bloco in resposta.get_data(as_text=True).split("\n\n"):
+        if not bloco:
+            continue
+        campos = dict(linha.split(": ", 1) for linha in bloco.split("\n"))
+        eventos.append((campos.get("event"), json.loads(campos["data"])))
+    return eventos
+
+
+def test_stream_meta_deltas_e_done():
+    concluidas = []
+    resposta = _resposta_sse(iter(["Olá", ", tudo ", "certo"]), "conv-1", ao_concluir=concluidas.append, cache="miss")
+
+    assert resposta.mimetype == "text/event-stream"
+    assert resposta.headers["Cache-Control"] == "no-cache"
+    eventos = _eventos(resposta)
+    assert eventos[0] == ("meta", {"conversaId": "conv-1", "cache": "miss"})
+    assert eventos[1:4] == [(None, {"delta": "Olá"}), (None, {"delta": ", tudo "}), (None, {"delta": "certo"})]
+    nome, dados = eventos[4]
+    assert nome == "done" and dados["conversaId"] == "conv-1"
+    assert dados["ttft_ms"] <= dados["total_ms"]
+    assert len(eventos) == 5
+    assert concluidas == ["Olá, tudo certo"]
+
+
+def test_stream_com_erro_termina_com_evento_error():
+    def trechos():
+        yield "começo"
+        raise ConnectionError("conexão caiu")
+
+    concluidas = []
+    eventos = _eventos(_resposta_sse(trechos(), "conv-2", ao_concluir=concluidas.append))
+
+    assert [nome for nome, _ in eventos] == ["meta", None, "error"]
+    assert eventos[-1][1] == {"erro": "Erro ao processar IA: conexão caiu"}
+    assert concluidas == []  # Resposta incompleta não vai pro cache
+
+
+def test_stream_quebra_de_linha_no_trecho_fica_dentro_do_json():
+    eventos = _eventos(_resposta_sse(iter(["linha 1\n\nlinha 2"]), "conv-3"))
+    assert eventos[1] == (None, {"delta": "linha 1\n\nlinha 2"})
@@ -0,0 +1,83 @@
+"""Contexto de notas do chat (services/contexto_notas.py): consultas ao banco e orçamento de itens."""
+from datetime import date
+
+import pytest
+from sqlalchemy import event
+
+from database.connection import SessionLocal
+from models.nota_fiscal import NotaFiscal, ItemNota
+from services.chat_compaction import CHARS_POR_TOKEN
+from services.contexto_notas import contexto_notas, formatar_item
+
+CNPJ = "11222333000181"
+
+
+def _nota(numero, dia, itens, tipo="Saída", emitente=CNPJ):
+    return NotaFiscal(
+        numero=str(numero), chave_nfe=f"3525{numero:040d}", data_emissao=date(2025, 1, dia),
+        cnpj_emitente=emitente, cnpj_destinatario="64795776000128", tipo_operacao=tipo, valor_total_nota=100,
+        itens=[ItemNota(descricao_produto=f"Produto {numero}-{i}", quantidade=1, valor_unitario=10, valor_total=10,
+                        ncm="73181500", cfop="5102") for i in range(itens)]
+    )
+
+
+@pytest.fixture
+def db(banco):
+    session = SessionLocal()
+    session.add_all([_nota(n, n, itens=30) for n in range(1, 7)] + [_nota(99, 28, itens=1, emitente="99888777000166")])
+    session.commit()
+    yield session
+    session.close()
+
+
+def _contar_selects(engine):
+    selects = []
+
+    def ao_executar(conn, cursor, sql, parametros, contexto, varios):
+        if sql.lstrip().upper().startswith("SELECT"):
+            selects.append(sql)
+    event.listen(engine, "before_cursor_execute", ao_executar)
+    return selects
+
+
+def test_notas_e_itens_em_duas_consultas(db, banco):
+    db.expire_all()
+    selects = _contar_selects(banco)
+
+    texto = contexto_notas(db, CNPJ, orcamento_tokens=100_000)
+
+    assert len(selects) == 2  # Notas + itens (selectinload), não uma consulta por nota
+    # As 5 mais recentes do usuário, da mais nova para a mais antiga
+    assert [linha.split()[2] for linha in texto.splitlines()[1:]] == ["6", "5", "4", "3", "2"]
+    assert "Produto 6-29" in texto and "omitidos" not in texto
+
+
+def test_itens_cortados_no_orcamento(db):
+    orcamento = 300
+    texto = contexto_notas(db, CNPJ, orcamento_tokens=orcamento)
+    linhas = texto.splitlines()[1:]
+
+    assert len(linhas) == 5
+    assert all("Produto" in linha and "itens omitidos" in linha for linha in linhas)  # O primeiro item sempre entra
+    tamanho_item = len(formatar_item(db.query(ItemNota).first())) + 2
+    itens_no_texto = texto.count("Produto ")
+    assert itens_no_texto * tamanho_item <= orcamento * CHARS_POR_TOKEN + 5 * tamanho_item
+    assert itens_no_texto < 5 * 30
+
+
+def test_sobra_de_uma_nota_fica_para_as_seguintes(db):
+    orcamento = 1500
+    fatia_fixa = contexto_notas(db, CNPJ, orcamento_tokens=orcamento).splitlines()[1].count("Produto ")
+
+    db.add(_nota(50, 27, itens=1))  # Mais recente, com um item só
+    db.commit()
+    linhas = contexto_notas(db, CNPJ, orcamento_tokens=orcamento).splitlines()[1:]
+
+    assert "omitidos" not in linhas[0]
+    # O que a nota de um item não usou é dividido entre as 4 seguintes
+    assert linhas[1].count("Produto ") > fatia_fixa
+
+
+def test_filtro_por_tipo_e_sem_notas(db):
+    assert contexto_notas(db, CNPJ, filter_tipo="Entrada") == "Nenhuma nota encontrada."
+    assert contexto_notas(db, "00000000000000") == "Nenhuma nota encontrada."
@@ -0,0 +1,155 @@
+"""
+Parser determinístico de DANFE (processors/danfe_parser.py) sobre o corpus de
+tests/danfes (gerado por tests/danfes/gerar_danfes.py, gabarito em verdade.json).
+"""
+import io
+import os
+import json
+import random
+
+import pdfplumber
+import pytest
+from werkzeug.datastructures import FileStorage
+
+from danfes import gerar_danfes
+from danfes.bench_danfe import CAMPOS, campo_igual, itens_iguais
+from processors import pdf_extractor, parse_pool
+from processors.danfe_parser import (
+    parsear_paginas, chave_valida, campos_faltantes, mesclar_campos, extrair_danfe, CAMPOS_OBRIGATORIOS
+)
+from services.extracao_pdf import campos_pedidos, prompt_lote
+
+CORPUS = os.path.dirname(gerar_danfes.__file__)
+with open(os.path.join(CORPUS, "verdade.json"), encoding="utf-8") as _arquivo:
+    VERDADE = json.load(_arquivo)
+
+# Uma de cada variante de layout, mais as de mais itens (várias folhas)
+AMOSTRA = sorted(VERDADE)[:4] + sorted(VERDADE, key=lambda nome: len(VERDADE[nome]["itens"]))[-2:]
+
+
+@pytest.fixture(autouse=True)
+def cache_temporario(tmp_path, monkeypatch):
+    """Cache de texto/DANFE num diretório do teste (não suja src/cache nem reaproveita resultados)."""
+    monkeypatch.setattr(pdf_extractor, "CACHE_DIR", str(tmp_path / "cache"))
+
+
+def _parsear(caminho):
+    with pdfplumber.open(caminho) as pdf:
+        return parsear_paginas(pdf.pages)
+
+
+def _gerar(tmp_path, nome="danfe.pdf", semente=3, **alteracoes):
+    """DANFE sintético em tmp_path; alteracoes sobrescrevem campos da nota antes de desenhar."""
+    nota = gerar_danfes.nota_sintetica(0, random.Random(semente))
+    nota.update(tp="1", end1="Rua Simulada, 100 - Centro", end2="São Paulo - SP - CEP 01001-000")
+    nota["data_br"] = f"{nota['data_emissao'][8:10]}/{nota['data_emissao'][5:7]}/{nota['data_emissao'][:4]}"
+    for campo, alterar in alteracoes.items():
+        nota[campo] = alterar(nota[campo])
+    caminho = tmp_path / nome
+    gerar_danfes.danfe(nota, str(caminho))
+    return str(caminho), nota
+
+
+def _trocar_dv(chave):
+    return chave[:-1] + str((int(chave[-1]) + 1) % 10)
+
+
+def test_chave_valida_confere_digito_verificador():
+    for esperado in VERDADE.values():
+        assert chave_valida(esperado["chave_nfe"])
+    chave = VERDADE[sorted(VERDADE)[0]]["chave_nfe"]
+    assert not chave_valida(_trocar_dv(chave))
+    assert not chave_valida(chave[:43])
+    assert not chave_valida(chave[:-1] + "X")
+    assert not chave_valida(None)
+
+
+@pytest.mark.parametrize("nome", AMOSTRA)
+def test_corpus_campos_e_itens(nome):
+    dados = _parsear(os.path.join(CORPUS, nome))
+    esperado = VERDADE[nome]
+
+    for campo in CAMPOS:
+        assert campo_igual(campo, dados.get(campo), esperado[campo]), campo
+    assert itens_iguais(dados["itens"], esperado["itens"])
+    assert campos_faltantes(dados) == []
+
+
+def test_chave_com_digito_errado_fica_faltando(tmp_path):
+    caminho, nota = _gerar(tmp_path, chave_nfe=_trocar_dv)
+    dados = _parsear(caminho)
+
+    assert dados["chave_nfe"] is None
+    # Número e CNPJ não dependem só da chave: saem das próprias caixas
+    assert dados["numero"] == nota["numero"]
+    assert dados["cnpj_emitente"] == nota["cnpj_emitente"]
+    assert campos_faltantes(dados) == ["chave_nfe"]
+
+
+def test_itens_descartados_quando_soma_nao_bate_com_total(tmp_path):
+    caminho, nota = _gerar(tmp_path, vprod=lambda total: round(total + 100, 2))
+    dados = _parsear(caminho)
+
+    assert nota["itens"]
+    assert dados["itens"] == []
+    assert dados["valor_total_nota"] == pytest.approx(nota["valor_total_nota"])
+    assert campos_faltantes(dados) == ["itens"]
+
+
+def test_campos_faltantes_sem_parse_pede_tudo():
+    assert campos_faltantes(None) == list(CAMPOS_OBRIGATORIOS) + ["itens"]
+
+
+def test_ia_recebe_so_os_campos_faltantes_e_parser_prevalece(tmp_path):
+    caminho, nota = _gerar(tmp_path, vprod=lambda total: round(total + 100, 2))
+    danfe = extrair_danfe(caminho)
+    faltando = campos_faltantes(danfe)
+
+    assert campos_pedidos(faltando) == ["itens"]
+    prompt = prompt_lote([("texto do PDF", faltando)])
+    assert "Campos: itens\n" in prompt
+    assert '"numero"' not in prompt
+
+    resposta_ia = {"numero": "999", "itens": [{"descricao_produto": "item da IA", "valor_total": 1.0}]}
+    dados = mesclar_campos(danfe, resposta_ia)
+    assert dados["numero"] == nota["numero"]  # O que o parser leu vale mais que a IA
+    assert dados["itens"] == resposta_ia["itens"]
+
+
+def test_upload_pede_a_ia_so_o_que_o_parser_nao_achou(tmp_path, banco, monkeypatch):
+    from routes import documents
+    from services.registro_ingestao import registro_ingestao
+    from models.nota_fiscal import NotaFiscal, ItemNota
+    from database.connection import SessionLocal
+
+    monkeypatch.setattr(parse_pool, "PARSE_WORKERS", 1)
+    monkeypatch.setattr(registro_ingestao, "_filtro", None)  # Filtro do banco de outro teste
+    pedidos = []
+
+    def extrair_em_lote_falso(documentos, api_key, modelo):
+        pedidos.extend(documentos)
+        return [{"itens": [{"descricao_produto": "item da IA", "quantidade": 1, "valor_unitario": 5, "valor_total": 5}]}
+                for _ in documentos]
+
+    monkeypatch.setattr(documents, "extrair_em_lote", extrair_em_lote_falso)
+
+    completo, nota_completa = _gerar(tmp_path, "completo.pdf")
+    sem_itens, nota = _gerar(tmp_path, "sem_itens.pdf", semente=4, vprod=lambda t: round(t + 100, 2))
+    arquivos = [
+        FileStorage(stream=io.BytesIO(open(caminho, "rb").read()), filename=os.path.basename(caminho))
+        for caminho in (completo, sem_itens)
+    ]
+    resultados = documents.processar_arquivos(arquivos, api_key="chave", user_cnpj=nota["cnpj_destinatario"])
+
+    assert [r["status"] for r in resultados] == ["sucesso (PDF->DANFE->DB)", "sucesso (PDF->DANFE+IA->DB)"]
+    assert [faltando for _, faltando in pedidos] == [["itens"]]  # Só o PDF incompleto, só os itens
+
+    session = SessionLocal()
+    try:
+        salva = session.query(NotaFiscal).filter_by(chave_nfe=nota["chave_nfe"]).one()
+        assert salva.numero == nota["numero"]
+        assert [i.descricao_produto for i in session.query(ItemNota).filter_by(nota_id=salva.id)] == ["item da IA"]
+        completa = session.query(NotaFiscal).filter_by(chave_nfe=nota_completa["chave_nfe"]).one()
+        assert session.query(ItemNota).filter_by(nota_id=completa.id).count() == len(nota_completa["itens"])
+    finally:
+        session.close()
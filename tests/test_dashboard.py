@@ -0,0 +1,47 @@
+"""Métricas do dashboard (routes/dashboard.py): resumo mensal x agregação direta das notas."""
+import pytest
+from flask import Flask
+
+from routes.dashboard import dashboard_bp
+from routes.documents import salvar_notas_em_lote
+from services import response_cache
+
+CNPJ = "11222333000181"
+
+
+def _nota(numero, chave, data, valor, destinatario="64795776000128"):
+    return {
+        "numero": numero, "chave_nfe": chave, "data_emissao": data, "cnpj_emitente": CNPJ,
+        "cnpj_destinatario": destinatario, "tipo_operacao": "Saída", "valor_total_nota": valor, "itens": []
+    }
+
+
+@pytest.fixture
+def cliente(banco):
+    app = Flask(__name__)
+    app.secret_key = "teste"
+    app.register_blueprint(dashboard_bp, url_prefix="/api")
+    response_cache.invalidar_cnpj(CNPJ)
+    cliente = app.test_client()
+    with cliente.session_transaction() as sessao:
+        sessao["cnpj"] = CNPJ
+    yield cliente
+    response_cache.invalidar_cnpj(CNPJ)
+
+
+def test_num_notas_igual_no_resumo_e_nas_notas(cliente):
+    # Mesmo número em séries diferentes (chaves diferentes): são duas notas
+    salvos = salvar_notas_em_lote([
+        _nota("100", "35250111222333000181550010000001001000000011", "2025-01-10", 300),
+        _nota("100", "35250111222333000181550020000001001000000016", "2025-01-12", 100),
+        _nota("101", "35250111222333000181550010000001011000000017", "2025-01-20", 200, destinatario="99888777000166"),
+    ])
+    assert all(salvo["ok"] for salvo in salvos)
+
+    do_resumo = cliente.get("/api/dashboard_metrics?de=2025-01-01&ate=2025-01-31&serie=mensal").get_json()
+    das_notas = cliente.get("/api/dashboard_metrics?de=2025-01-01&ate=2025-01-30&serie=mensal").get_json()
+
+    assert do_resumo["num_notas"] == das_notas["num_notas"] == 3
+    assert do_resumo["ticket_medio"] == das_notas["ticket_medio"] == 200.0
+    assert do_resumo["num_clientes"] == das_notas["num_clientes"] == 2
+    assert do_resumo["serie_mensal"][0]["num_notas"] == das_notas["serie_mensal"][0]["num_notas"] == 3
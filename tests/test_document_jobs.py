@@ -0,0 +1,151 @@
+"""Jobs de processamento de upload (services/document_jobs.py e /api/process-documents, /api/jobs)."""
+import io
+import itertools
+import threading
+import time
+
+import pytest
+from flask import Flask
+
+from conftest import esperar
+from database.connection import SessionLocal
+from models.job_processamento import JobProcessamento
+from processors import parse_pool, arquivo_upload
+from routes import documents
+from services import document_jobs
+from services.registro_ingestao import registro_ingestao
+
+CNPJ = "11222333000181"
+
+
+@pytest.fixture
+def cliente(banco, monkeypatch):
+    numeros = itertools.count(1)
+
+    def processar_xml(fonte, user_cnpj=""):
+        numero = next(numeros)
+        return {
+            "numero": str(numero), "chave_nfe": f"3525{numero:040d}", "data_emissao": "2025-01-10",
+            "cnpj_emitente": CNPJ, "cnpj_destinatario": "64795776000128", "tipo_operacao": "Saída",
+            "valor_total_nota": 100, "itens": []
+        }
+    monkeypatch.setattr(parse_pool, "PARSE_WORKERS", 1)
+    monkeypatch.setattr(parse_pool, "processar_xml", processar_xml)
+    monkeypatch.setattr(registro_ingestao, "_filtro", None)  # Filtro do banco de outro teste
+
+    app = Flask(__name__)
+    app.secret_key = "teste"
+    app.register_blueprint(documents.document_bp, url_prefix="/api")
+    cliente = app.test_client()
+    with cliente.session_transaction() as sessao:
+        sessao["cnpj"] = CNPJ
+    return cliente
+
+
+def _enviar(cliente, *conteudos):
+    arquivos = [(io.BytesIO(conteudo), f"nota-{i}.xml") for i, conteudo in enumerate(conteudos)]
+    return cliente.post("/api/process-documents", data={"files": arquivos, "user_cnpj": CNPJ},
+                        content_type="multipart/form-data")
+
+
+def test_upload_vira_job_e_status_pelo_polling(cliente, monkeypatch):
+    leituras = []
+    receber_upload = documents.receber_upload
+
+    def contar(stream, nome):
+        leituras.append(threading.current_thread().name)
+        return receber_upload(stream, nome)
+    monkeypatch.setattr(documents, "receber_upload", contar)
+
+    resposta = _enviar(cliente, b"<nfe n='1'/>", b"<nfe n='2'/>")
+    assert resposta.status_code == 202
+    status_url = resposta.get_json()["status_url"]
+
+    assert esperar(lambda: cliente.get(status_url).get_json()["status"] == "concluido")
+    job = cliente.get(status_url).get_json()
+    assert job["processados"] == job["total_arquivos"] == 2
+    assert [r["status"] for r in job["resultados"]] == ["sucesso (XML->DB)"] * 2
+    assert "cnpj" not in job
+    # Cada upload lido uma vez só, ainda na requisição (o job recebe o conteúdo pronto)
+    assert len(leituras) == 2 and not any(nome.startswith("document-job") for nome in leituras)
+
+    listados = cliente.get("/api/jobs").get_json()
+    assert [j["job_id"] for j in listados] == [job["job_id"]]
+
+
+def test_job_de_outro_cnpj_ou_inexistente_da_404(cliente):
+    status_url = _enviar(cliente, b"<nfe/>").get_json()["status_url"]
+    assert cliente.get(status_url).status_code == 200
+    assert cliente.get("/api/jobs/nao-existe").status_code == 404
+
+    with cliente.session_transaction() as sessao:
+        sessao["cnpj"] = "99888777000166"
+    assert cliente.get(status_url).status_code == 404
+    assert cliente.get("/api/jobs").get_json() == []
+
+    with cliente.session_transaction() as sessao:
+        sessao.clear()
+    assert cliente.get("/api/jobs").status_code == 401
+
+
+def test_progresso_gravado_no_maximo_a_cada_intervalo(banco, monkeypatch):
+    monkeypatch.setattr(document_jobs, "INTERVALO_PROGRESSO", 0.2)
+    gravacoes = []
+    atualizar = document_jobs._atualizar_job
+
+    def contar(job_id, **campos):
+        if "processados" in campos and "status" not in campos:
+            gravacoes.append(campos["processados"])
+        atualizar(job_id, **campos)
+    monkeypatch.setattr(document_jobs, "_atualizar_job", contar)
+
+    def tarefa(ao_progredir):
+        resultados = []
+        for processados in range(1, 51):
+            resultados.append({"arquivo": f"{processados}.xml", "status": "sucesso (XML->DB)"})
+            ao_progredir(processados, resultados)
+            if processados == 25:
+                time.sleep(0.25)
+        return resultados
+
+    job_id = document_jobs.submeter_job(CNPJ, 50, tarefa)
+    assert esperar(lambda: document_jobs.buscar_job(job_id)["status"] == "concluido")
+
+    assert gravacoes == [1, 26]  # Um commit por intervalo, não um por arquivo
+    job = document_jobs.buscar_job(job_id)
+    assert job["processados"] == 50 and len(job["resultados"]) == 50
+
+
+def test_erro_na_tarefa_marca_o_job(banco):
+    def tarefa(ao_progredir):
+        raise RuntimeError("disco cheio")
+
+    job_id = document_jobs.submeter_job(CNPJ, 1, tarefa)
+    assert esperar(lambda: document_jobs.buscar_job(job_id)["status"] == "erro")
+    assert document_jobs.buscar_job(job_id)["erro"] == "disco cheio"
+
+
+def test_jobs_interrompidos_marcados_como_erro(banco):
+    session = SessionLocal()
+    session.add_all([JobProcessamento(id=status, cnpj=CNPJ, status=status)
+                     for status in ("pendente", "processando", "concluido", "erro")])
+    session.commit()
+    session.close()
+
+    assert document_jobs.marcar_jobs_interrompidos() == 2
+
+    jobs = {job["job_id"]: job for job in document_jobs.listar_jobs(CNPJ)}
+    assert {job_id: job["status"] for job_id, job in jobs.items()} == {
+        "pendente": "erro", "processando": "erro", "concluido": "concluido", "erro": "erro"}
+    assert "interrompido" in jobs["pendente"]["erro"] and jobs["erro"]["erro"] is None
+    assert document_jobs.marcar_jobs_interrompidos() == 0
+
+
+def test_upload_grande_de_job_interrompido_e_apagado_na_inicializacao(tmp_path, monkeypatch):
+    monkeypatch.setattr(arquivo_upload, "TEMP_DIR", str(tmp_path / "temp"))
+    fonte, _ = arquivo_upload.receber_upload(io.BytesIO(b"x" * 300), "grande.pdf", limite=100)
+    assert fonte.startswith(str(tmp_path / "temp"))  # Acima do limite: temporário em disco
+
+    assert arquivo_upload.limpar_temporarios() == 1
+    assert not any((tmp_path / "temp").iterdir())
+    assert arquivo_upload.limpar_temporarios() == 0
@@ -0,0 +1,195 @@
+"""
+Extração de PDFs pela IA em lotes (services/extracao_pdf.py) contra um servidor
+Gemini falso local (generateContent via REST, GEMINI_API_ENDPOINT).
+"""
+import re
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+from services import gemini_service, extracao_pdf
+from services.extracao_pdf import extrair_em_lote, montar_lotes, ler_json_resposta, TODOS_OS_CAMPOS
+
+_RE_DOCUMENTO = re.compile(r"=== DOCUMENTO (\d+) ===\nCampos: ([^\n]*)\nTexto do PDF: (.*?)(?=\n=== DOCUMENTO|\Z)", re.S)
+
+
+class GeminiFalso(ThreadingHTTPServer):
+    """
+    Responde generateContent com um objeto por documento do prompt. falhas[marca] = n
+    omite o documento NOTA-<marca> das n primeiras respostas; erros_500 = n faz os n
+    próximos pedidos falharem com HTTP 500.
+    """
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.lock = threading.Lock()
+        self.atraso = 0.05
+        self.falhas = {}
+        self.erros_500 = 0
+        self.prompts = []
+        self.em_voo = self.max_em_voo = 0
+
+    @property
+    def endpoint(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def documentos(self, prompt):
+        return [re.search(r"NOTA-(\d+)", texto).group(1) for _, _, texto in _RE_DOCUMENTO.findall(prompt)]
+
+    def responder(self, prompt):
+        saida = []
+        for numero, campos, texto in _RE_DOCUMENTO.findall(prompt):
+            marca = re.search(r"NOTA-(\d+)", texto).group(1)
+            with self.lock:
+                if self.falhas.get(marca, 0) > 0:
+                    self.falhas[marca] -= 1
+                    continue
+            objeto = {"documento": int(numero)}
+            for campo in (c.strip() for c in campos.split(",")):
+                objeto[campo] = [] if campo == "itens" else f"{campo}-{marca}"
+            saida.append(objeto)
+        return json.dumps(saida)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _enviar(self, status, corpo):
+        dados = json.dumps(corpo).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def do_POST(self):
+        servidor = self.server
+        corpo = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        prompt = corpo["contents"][0]["parts"][0]["text"]
+        with servidor.lock:
+            servidor.prompts.append(prompt)
+            servidor.em_voo += 1
+            servidor.max_em_voo = max(servidor.max_em_voo, servidor.em_voo)
+            falhar = servidor.erros_500 > 0
+            servidor.erros_500 -= falhar
+        try:
+            time.sleep(servidor.atraso)
+            if falhar:
+                self._enviar(500, {"error": {"code": 500, "message": "falha simulada", "status": "INTERNAL"}})
+                return
+            texto = servidor.responder(prompt)
+            self._enviar(200, {"candidates": [{"content": {"role": "model", "parts": [{"text": texto}]}, "finishReason": "STOP", "index": 0}]})
+        finally:
+            with servidor.lock:
+                servidor.em_voo -= 1
+
+
+@pytest.fixture
+def gemini(monkeypatch):
+    servidor = GeminiFalso()
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    monkeypatch.setattr(gemini_service, "GEMINI_API_ENDPOINT", servidor.endpoint)
+    monkeypatch.setattr(extracao_pdf, "ESPERA_NOVA_TENTATIVA", 0)
+    gemini_service._clientes.clear()
+    yield servidor
+    gemini_service._clientes.clear()
+    servidor.shutdown()
+    servidor.server_close()
+
+
+def _documentos(quantidade, faltando=None):
+    return [(f"DANFE NOTA-{i} texto do pdf", faltando) for i in range(quantidade)]
+
+
+def test_lotes_agrupam_documentos(gemini, monkeypatch):
+    monkeypatch.setattr(extracao_pdf, "LOTE_MAX_DOCS", 4)
+    resultados = extrair_em_lote(_documentos(10), "chave", "modelo-teste")
+
+    # Lotes rodam em paralelo: a ordem de chegada varia, a composição não
+    assert sorted(gemini.documentos(p) for p in gemini.prompts) == [
+        ["0", "1", "2", "3"], ["4", "5", "6", "7"], ["8", "9"]
+    ]
+    # Cada resultado volta para o seu documento, na ordem de entrada
+    assert [r["numero"] for r in resultados] == [f"numero-{i}" for i in range(10)]
+    assert all(set(r) == set(TODOS_OS_CAMPOS) for r in resultados)
+
+
+def test_so_os_campos_faltantes_sao_pedidos(gemini):
+    resultados = extrair_em_lote(_documentos(2, faltando=["chave_nfe", "itens"]), "chave", "modelo-teste")
+
+    assert len(gemini.prompts) == 1
+    assert "Campos: chave_nfe, itens\n" in gemini.prompts[0]
+    assert resultados == [{"chave_nfe": "chave_nfe-0", "itens": []}, {"chave_nfe": "chave_nfe-1", "itens": []}]
+
+
+def test_semaforo_limita_pedidos_em_voo(gemini, monkeypatch):
+    monkeypatch.setattr(extracao_pdf, "LOTE_MAX_DOCS", 1)
+    monkeypatch.setattr(extracao_pdf, "_semaforo", threading.BoundedSemaphore(2))
+    gemini.atraso = 0.1
+
+    resultados = extrair_em_lote(_documentos(8), "chave", "modelo-teste")
+
+    assert len(gemini.prompts) == 8
+    assert gemini.max_em_voo == 2
+    assert all(resultados)
+
+
+def test_documento_com_falha_reenviado_sozinho(gemini, monkeypatch):
+    monkeypatch.setattr(extracao_pdf, "LOTE_MAX_DOCS", 8)
+    gemini.falhas = {"5": 1}  # Some da primeira resposta
+
+    resultados = extrair_em_lote(_documentos(8), "chave", "modelo-teste")
+
+    assert [gemini.documentos(p) for p in gemini.prompts] == [[str(i) for i in range(8)], ["5"]]
+    assert [r["numero"] for r in resultados] == [f"numero-{i}" for i in range(8)]
+
+
+def test_documento_que_sempre_falha_nao_derruba_o_lote(gemini, monkeypatch):
+    monkeypatch.setattr(extracao_pdf, "LOTE_MAX_DOCS", 4)
+    gemini.falhas = {"2": 99}
+
+    resultados = extrair_em_lote(_documentos(4), "chave", "modelo-teste")
+
+    assert resultados[2] is None
+    assert [r["numero"] for i, r in enumerate(resultados) if i != 2] == ["numero-0", "numero-1", "numero-3"]
+    # Uma rodada com o lote inteiro e as novas tentativas só com o documento 2
+    assert [gemini.documentos(p) for p in gemini.prompts][1:] == [["2"]] * (extracao_pdf.TENTATIVAS - 1)
+
+
+def test_erro_http_refaz_so_o_lote_que_falhou(gemini, monkeypatch):
+    monkeypatch.setattr(extracao_pdf, "LOTE_MAX_DOCS", 3)
+    gemini.erros_500 = 1
+
+    resultados = extrair_em_lote(_documentos(6), "chave", "modelo-teste")
+
+    assert all(resultados)
+    enviados = [gemini.documentos(p) for p in gemini.prompts]
+    assert sorted(enviados[:2]) == [["0", "1", "2"], ["3", "4", "5"]]
+    # Só os documentos do lote que levou o 500 voltam, em lotes menores (um por pedido aqui)
+    reenviados = sorted(documento for lote in enviados[2:] for documento in lote)
+    assert reenviados in (["0", "1", "2"], ["3", "4", "5"])
+    assert all(len(lote) == 1 for lote in enviados[2:])
+
+
+def test_cliente_reaproveitado_entre_lotes(gemini):
+    extrair_em_lote(_documentos(1), "chave", "modelo-teste")
+    cliente = gemini_service.cliente_gemini("chave")
+    extrair_em_lote(_documentos(1), "chave", "modelo-teste")
+    assert gemini_service.cliente_gemini("chave") is cliente
+    assert len(gemini_service._clientes) == 1
+
+
+def test_montar_lotes_respeita_orcamento_de_tokens():
+    documentos = [("x" * 4000, None), ("x" * 4000, None), ("x" * 100, None), ("x" * 40000, None)]
+    lotes = montar_lotes(range(4), documentos, orcamento_tokens=2000, max_docs=8)
+    # O PDF maior que o orçamento vai sozinho; os demais juntam até o limite
+    assert lotes == [[0], [1, 2], [3]]
+
+
+def test_ler_json_resposta_tira_cercas_de_markdown():
+    assert ler_json_resposta('```json\n[{"documento": 1}]\n```') == [{"documento": 1}]
+    assert ler_json_resposta(' [{"documento": 1}] ') == [{"documento": 1}]
@@ -0,0 +1,81 @@
+"""Migrações (database/migrations.py) sobre um app.db no schema original do projeto."""
+import sqlite3
+from datetime import date
+
+import pytest
+from sqlalchemy import create_engine, inspect, text
+
+from database.connection import engine as engine_padrao
+from database.migrations import executar_migracoes
+from services import resumo_fiscal
+
+CNPJ = "11222333000181"
+
+# Schema das primeiras versões: valores e datas como texto, sem resumo, registro ou índice de busca
+SCHEMA_ORIGINAL = """
+CREATE TABLE usuarios (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, cnpj VARCHAR NOT NULL UNIQUE, nome VARCHAR NOT NULL,
+    situacao_cadastral VARCHAR, regime_tributario VARCHAR, natureza_juridica VARCHAR,
+    senha VARCHAR NOT NULL, rbt12 FLOAT
+);
+CREATE TABLE notas_fiscais (
+    id INTEGER PRIMARY KEY, numero VARCHAR, data_emissao VARCHAR, cnpj_emitente VARCHAR, nome_emitente VARCHAR,
+    ie_emitente VARCHAR, endereco_emitente VARCHAR, cnpj_destinatario VARCHAR, nome_destinatario VARCHAR,
+    ie_destinatario VARCHAR, endereco_destinatario VARCHAR, chave_nfe VARCHAR UNIQUE, natureza_operacao VARCHAR,
+    valor_total_nota VARCHAR, tipo_operacao VARCHAR, versao VARCHAR
+);
+CREATE TABLE itens_nota (
+    id INTEGER PRIMARY KEY, nota_id INTEGER REFERENCES notas_fiscais (id), codigo_produto VARCHAR,
+    descricao_produto VARCHAR, ncm VARCHAR, cst_ipi VARCHAR, cfop VARCHAR, unidade VARCHAR, quantidade VARCHAR,
+    valor_unitario VARCHAR, valor_total VARCHAR, cst_icms VARCHAR, cst_pis VARCHAR, cst_cofins VARCHAR,
+    cest VARCHAR, icms_valor FLOAT, ipi_valor FLOAT, pis_valor FLOAT, cofins_valor FLOAT
+);
+INSERT INTO usuarios (cnpj, nome, senha, rbt12) VALUES ('11222333000181', 'Ferragens Alfa', 'x', 150000.0);
+INSERT INTO notas_fiscais (id, numero, data_emissao, cnpj_emitente, cnpj_destinatario, nome_destinatario,
+    chave_nfe, natureza_operacao, valor_total_nota, tipo_operacao)
+VALUES (1, '100', '2025-01-10T10:00:00-03:00', '11222333000181', '64795776000128', 'Construtora Beta',
+    '35250111222333000181550010000001001000000011', 'Venda', '1234.56', 'Saída');
+INSERT INTO itens_nota (nota_id, descricao_produto, quantidade, valor_unitario, valor_total, icms_valor)
+VALUES (1, 'Parafuso sextavado', '10', '123.456', '1234.56', 222.22);
+"""
+
+
+@pytest.fixture
+def banco_antigo(tmp_path):
+    caminho = tmp_path / "app.db"
+    with sqlite3.connect(caminho) as conn:
+        conn.executescript(SCHEMA_ORIGINAL)
+    engine = create_engine(f"sqlite:///{caminho}")
+    yield engine
+    engine.dispose()
+
+
+def test_migracao_do_schema_original_e_idempotente(banco_antigo, monkeypatch):
+    invalidados = []
+    monkeypatch.setattr(resumo_fiscal, "invalidar_cnpj", lambda *cnpjs: invalidados.extend(cnpjs))
+
+    aplicadas = executar_migracoes(banco_antigo)
+
+    assert "notas_fiscais/itens_nota: colunas numéricas e data_emissao como Date" in aplicadas
+    assert "coluna usuarios.rbt12_manual" in aplicadas
+    assert "resumo_mensal: backfill de 1 nota(s)" in aplicadas
+    assert any(passo.startswith("busca_fts: backfill") for passo in aplicadas)
+    # Nada de versões de cache no banco padrão (o migrado é outro arquivo)
+    assert invalidados == []
+
+    with banco_antigo.connect() as conn:
+        valor, emissao = conn.execute(text("SELECT valor_total_nota, data_emissao FROM notas_fiscais")).one()
+        assert float(valor) == 1234.56 and emissao == date(2025, 1, 10).isoformat()
+        assert conn.execute(text("SELECT rbt12_manual FROM usuarios")).scalar() == 1
+        assert conn.execute(text(
+            "SELECT faturamento, num_notas FROM resumo_mensal WHERE cnpj = :cnpj AND papel = 'emitente'"
+        ), {"cnpj": CNPJ}).one() == (1234.56, 1)
+        assert conn.execute(text("SELECT nota_id FROM busca_fts WHERE busca_fts MATCH 'parafuso'")).scalar() == 1
+
+    # Segunda rodada: nada a fazer, dados intactos
+    assert executar_migracoes(banco_antigo) == []
+    with banco_antigo.connect() as conn:
+        assert conn.execute(text("SELECT count(*) FROM resumo_mensal")).scalar() == 2
+        assert conn.execute(text("SELECT count(*) FROM busca_fts")).scalar() == 2
+    assert "versoes_cache" in inspect(banco_antigo).get_table_names()
+    assert banco_antigo.url != engine_padrao.url
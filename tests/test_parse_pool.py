@@ -0,0 +1,74 @@
+"""Parsing paralelo dos uploads (processors/parse_pool.py): falha de um arquivo não derruba os outros."""
+import io
+import pickle
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import pytest
+from werkzeug.datastructures import FileStorage
+
+from processors import parse_pool
+from processors.parse_pool import parsear_em_paralelo, ErroParsing
+
+CNPJ = "11222333000181"
+
+
+def _processar_xml_falso(fonte, user_cnpj=""):
+    if fonte == b"ruim":
+        raise ValueError("XML quebrado")
+    return {"numero": fonte.decode()}
+
+
+@pytest.fixture
+def pool_de_threads(monkeypatch):
+    """Pool de threads no lugar do de processos: o processar_xml trocado vale nos workers."""
+    pool = ThreadPoolExecutor(2)
+    monkeypatch.setattr(parse_pool, "PARSE_WORKERS", 2)
+    monkeypatch.setattr(parse_pool, "_obter_pool", lambda: pool)
+    monkeypatch.setattr(parse_pool, "processar_xml", _processar_xml_falso)
+    yield pool
+    pool.shutdown()
+
+
+def test_falha_de_um_arquivo_vira_erro_so_dele(pool_de_threads):
+    fontes = [b"1", b"2", b"ruim", b"4", b"5", b"6", b"7", b"8", b"9"]
+    resultados = list(parsear_em_paralelo([(fonte, "xml", CNPJ) for fonte in fontes]))
+
+    assert isinstance(resultados[2], ErroParsing)
+    assert "XML quebrado" in str(resultados[2])
+    assert [r["numero"] for i, r in enumerate(resultados) if i != 2] == ["1", "2", "4", "5", "6", "7", "8", "9"]
+
+
+def test_lote_que_nao_volta_do_pool_vira_erro_dos_seus_arquivos(monkeypatch):
+    class PoolQueFalha:
+        def submit(self, funcao, lote):
+            futuro = Future()
+            if lote[0][0] == b"0":
+                futuro.set_exception(pickle.PicklingError("não serializável"))
+            else:
+                futuro.set_result(funcao(lote))
+            return futuro
+
+    monkeypatch.setattr(parse_pool, "PARSE_WORKERS", 2)
+    monkeypatch.setattr(parse_pool, "_obter_pool", PoolQueFalha)
+    monkeypatch.setattr(parse_pool, "processar_xml", _processar_xml_falso)
+
+    resultados = list(parsear_em_paralelo([(str(i).encode(), "xml", CNPJ) for i in range(16)]))
+
+    assert len(resultados) == 16
+    assert all(isinstance(r, ErroParsing) for r in resultados[:2])  # Lotes de 16 // (2 * 4) = 2
+    assert [r["numero"] for r in resultados[2:]] == [str(i) for i in range(2, 16)]
+
+
+def test_upload_segue_quando_um_xml_falha(banco, monkeypatch):
+    from routes import documents
+
+    monkeypatch.setattr(parse_pool, "PARSE_WORKERS", 1)
+    monkeypatch.setattr(parse_pool, "processar_xml", _processar_xml_falso)
+    monkeypatch.setattr(documents, "_enfileirar_nota", lambda resultados, pendentes, base, dados, ok, erro:
+                        resultados.append({**base, "status": ok}))
+
+    arquivos = [FileStorage(stream=io.BytesIO(conteudo), filename=nome)
+                for nome, conteudo in (("a.xml", b"1"), ("b.xml", b"ruim"), ("c.xml", b"3"))]
+    resultados = documents.processar_arquivos(arquivos, api_key="", user_cnpj=CNPJ)
+
+    assert [r["status"] for r in resultados] == ["sucesso (XML->DB)", "erro parsing: ValueError: XML quebrado", "sucesso (XML->DB)"]
@@ -0,0 +1,104 @@
+"""Extração de texto dos PDFs (processors/pdf_extractor.py): parada antecipada e cache em disco."""
+import os
+import json
+import time
+
+import pdfplumber
+import pytest
+
+from danfes import gerar_danfes
+from processors import pdf_extractor
+
+CORPUS = os.path.dirname(gerar_danfes.__file__)
+with open(os.path.join(CORPUS, "verdade.json"), encoding="utf-8") as _arquivo:
+    VERDADE = json.load(_arquivo)
+
+DUAS_FOLHAS_E_BOLETO = "danfe_11_boleto.pdf"  # FOLHA 1/2, FOLHA 2/2 e uma página de boleto
+UMA_FOLHA_E_BOLETO = "danfe_03_boleto.pdf"
+
+
+@pytest.fixture(autouse=True)
+def cache_temporario(tmp_path, monkeypatch):
+    """Cache de texto num diretório do teste (não suja src/cache nem reaproveita resultados)."""
+    monkeypatch.setattr(pdf_extractor, "CACHE_DIR", str(tmp_path / "cache"))
+
+
+@pytest.fixture
+def paginas_lidas(monkeypatch):
+    """Quantas páginas tiveram o texto extraído."""
+    lidas = []
+    extract_text = pdfplumber.page.Page.extract_text
+
+    def contar(pagina, *args, **kwargs):
+        lidas.append(pagina.page_number)
+        return extract_text(pagina, *args, **kwargs)
+    monkeypatch.setattr(pdfplumber.page.Page, "extract_text", contar)
+    return lidas
+
+
+def _caminho(nome):
+    return os.path.join(CORPUS, nome)
+
+
+def _pagina_texto(texto):
+    pagina = gerar_danfes.Pagina()
+    pagina.t(20, 40, texto, 10)
+    return pagina
+
+
+def test_le_as_folhas_de_continuacao_e_pula_o_boleto(paginas_lidas):
+    with pdfplumber.open(_caminho(DUAS_FOLHAS_E_BOLETO)) as pdf:
+        assert len(pdf.pages) == 3
+    paginas_lidas.clear()
+
+    texto = pdf_extractor.extrair_texto_pdf(_caminho(DUAS_FOLHAS_E_BOLETO))
+
+    assert paginas_lidas == [1, 2]
+    assert "FOLHA 2/2" in texto and "BOLETO" not in texto
+    ultimo_item = VERDADE[DUAS_FOLHAS_E_BOLETO]["itens"][-1]
+    assert ultimo_item["codigo_produto"] in texto  # O último item está na folha de continuação
+
+
+def test_danfe_de_uma_folha_para_na_primeira_pagina(paginas_lidas):
+    texto = pdf_extractor.extrair_texto_pdf(_caminho(UMA_FOLHA_E_BOLETO))
+
+    assert paginas_lidas == [1]
+    assert "FOLHA 1/1" in texto and "BOLETO" not in texto
+
+
+def test_sem_os_dados_da_nfe_le_todas_as_paginas(tmp_path, paginas_lidas):
+    # Sem chave/CNPJ/total na primeira página: não há onde parar antes
+    caminho = tmp_path / "sem_nfe.pdf"
+    gerar_danfes.salvar([_pagina_texto("Relatório interno"), _pagina_texto("BOLETO BANCÁRIO")], str(caminho))
+
+    texto = pdf_extractor.extrair_texto_pdf(str(caminho))
+
+    assert paginas_lidas == [1, 2]
+    assert "BOLETO" in texto
+
+
+def test_mesmo_arquivo_vem_do_cache_em_disco(paginas_lidas):
+    primeiro = pdf_extractor.extrair_texto_pdf(_caminho(DUAS_FOLHAS_E_BOLETO))
+    sha = pdf_extractor.hash_arquivo(_caminho(DUAS_FOLHAS_E_BOLETO))
+    assert os.path.exists(pdf_extractor._caminho_cache(sha))
+    paginas_lidas.clear()
+
+    # Mesmo conteúdo, agora em bytes (como chega no upload): nenhuma página é aberta
+    with open(_caminho(DUAS_FOLHAS_E_BOLETO), "rb") as arquivo:
+        segundo = pdf_extractor.extrair_texto_pdf(arquivo.read())
+
+    assert segundo == primeiro
+    assert paginas_lidas == []
+
+
+def test_poda_apaga_os_menos_usados(monkeypatch):
+    for indice, sha in enumerate(("a" * 64, "b" * 64, "c" * 64)):
+        pdf_extractor.gravar_cache(sha, "x" * 1000)
+        os.utime(pdf_extractor._caminho_cache(sha), (time.time() - 100 + indice, time.time() - 100 + indice))
+    assert pdf_extractor.ler_cache("a" * 64)  # Leitura conta como uso recente
+    monkeypatch.setattr(pdf_extractor, "CACHE_MAX_BYTES", 2000)
+
+    pdf_extractor.podar_cache()
+
+    assert pdf_extractor.ler_cache("b" * 64) is None
+    assert pdf_extractor.ler_cache("a" * 64) and pdf_extractor.ler_cache("c" * 64)
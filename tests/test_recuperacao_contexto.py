@@ -0,0 +1,121 @@
+"""Contexto do chat recuperado conforme a pergunta (services/recuperacao_contexto.py)."""
+import re
+from datetime import date
+
+import pytest
+
+from database.connection import SessionLocal
+from models.nota_fiscal import NotaFiscal, ItemNota
+from services.indice_busca import criar_indice_busca
+from services.recuperacao_contexto import extrair_filtros, recuperar_contexto
+from services.resumo_fiscal import reconstruir_resumo
+
+CNPJ = "11222333000181"
+BETA = "64795776000128"
+GAMA = "22263229720925"
+DELTA = "33444555000199"
+OMEGA = "55666777000122"
+
+
+def _nota(numero, dia, contraparte, nome, ncm, cfop, tipo="Saída"):
+    emitente, destinatario = (CNPJ, contraparte) if tipo == "Saída" else (contraparte, CNPJ)
+    return NotaFiscal(
+        numero=str(numero), chave_nfe=f"3525{numero:040d}", data_emissao=dia, tipo_operacao=tipo,
+        cnpj_emitente=emitente, nome_emitente=nome if tipo == "Entrada" else "Ferragens Alfa Ltda",
+        cnpj_destinatario=destinatario, nome_destinatario=nome if tipo == "Saída" else "Ferragens Alfa Ltda",
+        natureza_operacao="Venda" if tipo == "Saída" else "Compra", valor_total_nota=100,
+        itens=[ItemNota(descricao_produto=f"Produto {numero}", ncm=ncm, cfop=cfop, quantidade=1,
+                        valor_unitario=100, valor_total=100, icms_valor=18.0)]
+    )
+
+
+@pytest.fixture
+def db(banco):
+    with banco.begin() as conn:
+        criar_indice_busca(conn)
+    session = SessionLocal()
+    session.add_all([
+        _nota(1, date(2024, 3, 5), BETA, "Construtora Beta", "73181500", "5102"),
+        _nota(2, date(2024, 3, 20), GAMA, "Mercado Gama", "84713012", "5102"),
+        _nota(3, date(2024, 4, 10), GAMA, "Mercado Gama", "73181500", "6102"),
+        _nota(4, date(2024, 6, 15), DELTA, "Distribuidora Delta", "39269090", "1102", tipo="Entrada"),
+    ])
+    # As 5 mais recentes não casam com nenhum filtro dos testes: cair no contexto
+    # padrão ("últimas 5 notas") devolveria só elas
+    session.add_all([_nota(n, date(2025, n - 3, 1), OMEGA, "Padaria Omega", "19059090", "5405") for n in range(10, 15)])
+    session.commit()
+    reconstruir_resumo(session, invalidar_cache=False)
+    yield session
+    session.close()
+
+
+def _numeros(contexto):
+    return [int(numero) for numero in re.findall(r"^- Nota (\d+) ", contexto, re.MULTILINE)]
+
+
+def test_filtros_de_codigos_e_periodo(db):
+    filtros = extrair_filtros(db, CNPJ, "Quanto vendi do NCM 7318.15.00 com CFOP 5.102 em março de 2024?")
+    assert filtros["ncm"] == ["73181500"] and filtros["cfop"] == ["5102"]
+    assert filtros["meses"] == ["2024-03"] and filtros["agregado"]
+    assert filtros["termos"] == []
+
+    # Ano não vira CFOP; sem a palavra "cfop", número de 4 dígitos não é CFOP
+    filtros = extrair_filtros(db, CNPJ, "Compras com cfop 2102 em 2025")
+    assert filtros["cfop"] == ["2102"]
+    assert filtros["meses"] == [f"2025-{mes:02d}" for mes in range(1, 13)]
+    assert extrair_filtros(db, CNPJ, "Notas de 2024 com 5102 itens")["cfop"] == []
+
+
+def test_mes_sem_ano_usa_o_ultimo_em_que_ha_notas(db):
+    assert extrair_filtros(db, CNPJ, "Notas de abril")["meses"] == ["2024-04"]
+    assert extrair_filtros(db, CNPJ, "Vendas em 03/2024 e 2024-06")["meses"] == ["2024-03", "2024-06"]
+
+
+def test_contraparte_vira_termo_de_busca(db):
+    filtros = extrair_filtros(db, CNPJ, "Quais notas emiti para a Construtora Beta?")
+    assert filtros["termos"] == ["construtora", "beta"]
+    assert filtros["ncm"] == filtros["cfop"] == filtros["meses"] == []
+
+    contexto = recuperar_contexto(db, CNPJ, "Quais notas emiti para a Construtora Beta?")
+    assert contexto.startswith("Notas relevantes para a pergunta (termos construtora, beta)")
+    assert _numeros(contexto) == [1]
+
+    contexto = recuperar_contexto(db, CNPJ, "O que comprei da Distribuidora Delta?")
+    assert _numeros(contexto) == [4]
+
+
+def test_ncm_e_cfop_buscam_em_todas_as_notas(db):
+    contexto = recuperar_contexto(db, CNPJ, "Itens com NCM 7318.15.00")
+    assert _numeros(contexto) == [3, 1]  # Empate: a mais recente primeiro
+    assert "Totais dos itens com NCM 73181500: 2 itens em 2 notas" in contexto
+
+    contexto = recuperar_contexto(db, CNPJ, "Vendas interestaduais, CFOP 6102")
+    assert _numeros(contexto) == [3]
+
+
+def test_nota_que_casa_com_mais_filtros_vem_primeiro(db):
+    # A nota 1 é mais antiga que a 3, mas casa com o NCM e com o cliente
+    contexto = recuperar_contexto(db, CNPJ, "Itens do NCM 7318 vendidos para a Construtora Beta")
+    assert _numeros(contexto)[:2] == [1, 3]
+
+    # Número da nota pesa mais que o NCM
+    contexto = recuperar_contexto(db, CNPJ, "Nota 2 e itens com NCM 7318")
+    assert _numeros(contexto) == [2, 3, 1]
+
+
+def test_periodo_traz_notas_do_mes_e_resumo_mensal(db):
+    contexto = recuperar_contexto(db, CNPJ, "Notas de março de 2024")
+    assert _numeros(contexto) == [2, 1]
+    assert "Resumo mensal" in contexto
+    assert "- 2024-03 Saída (emitente): 2 notas" in contexto
+    assert "2025-" not in contexto
+
+
+def test_filtro_sem_resultado_nao_cai_nas_ultimas_notas(db):
+    contexto = recuperar_contexto(db, CNPJ, "Itens com NCM 9999.99.99")
+    assert contexto.startswith("Nenhuma nota encontrada para os filtros da pergunta (NCM 99999999)")
+    assert _numeros(contexto) == []
+
+
+def test_pergunta_sem_filtro_usa_o_contexto_padrao(db):
+    assert _numeros(recuperar_contexto(db, CNPJ, "Oi, tudo bem?")) == [14, 13, 12, 11, 10]
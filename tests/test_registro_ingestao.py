@@ -0,0 +1,63 @@
+"""Registro de arquivos ingeridos (services/registro_ingestao.py) com mais de um worker no mesmo banco."""
+import io
+import hashlib
+
+from services.registro_ingestao import RegistroIngestao, FiltroBloom
+
+
+def _sha(texto):
+    return hashlib.sha256(texto.encode()).hexdigest()
+
+
+def test_arquivo_registrado_por_outro_worker_e_encontrado(banco):
+    worker_a, worker_b = RegistroIngestao(), RegistroIngestao()
+    assert worker_a.buscar([_sha("nota.pdf")]) == {}  # Filtro do A carregado com o banco vazio
+
+    worker_b.registrar([(_sha("nota.pdf"), ["3525" + "1" * 40], "nota.pdf")])
+
+    assert worker_a.buscar([_sha("nota.pdf"), _sha("outra.pdf")]) == {_sha("nota.pdf"): ["3525" + "1" * 40]}
+    assert worker_a.metrics["duplicados"] == 1
+
+
+def test_hash_novo_descartado_pelo_filtro(banco):
+    registro = RegistroIngestao()
+    registro.registrar([(_sha(f"nota-{i}.xml"), [], f"nota-{i}.xml") for i in range(50)])
+
+    assert set(registro.buscar([_sha(f"nota-{i}.xml") for i in range(50)])) == {_sha(f"nota-{i}.xml") for i in range(50)}
+    registro.buscar([_sha(f"nova-{i}.xml") for i in range(200)])
+    assert registro.metrics["descartados_filtro"] >= 190  # ~1% de falsos positivos
+    assert registro._filtro.itens == 50  # Cada linha entra uma vez só
+
+
+def test_filtro_bloom_sem_falso_negativo():
+    filtro = FiltroBloom(1000)
+    for i in range(1000):
+        filtro.adicionar(_sha(str(i)))
+    assert all(_sha(str(i)) in filtro for i in range(1000))
+    assert sum(_sha(f"x{i}") in filtro for i in range(1000)) < 50
+
+
+def test_reenvio_tem_o_mesmo_status_pelo_hash_e_pela_chave(banco, monkeypatch):
+    from werkzeug.datastructures import FileStorage
+    from processors import parse_pool
+    from routes import documents
+    from services.registro_ingestao import registro_ingestao
+
+    chave = "35250111222333000181550010000001001000000011"
+    nota = {
+        "numero": "100", "chave_nfe": chave, "data_emissao": "2025-01-10", "cnpj_emitente": "11222333000181",
+        "cnpj_destinatario": "64795776000128", "tipo_operacao": "Saída", "valor_total_nota": 300, "itens": []
+    }
+    monkeypatch.setattr(parse_pool, "PARSE_WORKERS", 1)
+    monkeypatch.setattr(parse_pool, "processar_xml", lambda fonte, user_cnpj="": dict(nota))
+    monkeypatch.setattr(registro_ingestao, "_filtro", None)  # Filtro do banco de outro teste
+
+    def enviar(conteudo):
+        arquivo = FileStorage(stream=io.BytesIO(conteudo), filename="nota.xml")
+        return documents.processar_arquivos([arquivo], user_cnpj="11222333000181")[0]
+
+    assert enviar(b"<nfe/>")["status"] == "sucesso (XML->DB)"
+    pelo_hash = enviar(b"<nfe/>")  # Mesmo arquivo: nem chega ao parser
+    pela_chave = enviar(b"<nfe versao='2'/>")  # Outro arquivo, mesma nota
+    assert pelo_hash["status"] == pela_chave["status"] == documents.STATUS_DUPLICADA
+    assert pelo_hash["chaves_nfe"] == [chave]
@@ -0,0 +1,55 @@
+"""Cache de respostas por CNPJ (services/response_cache.py) com dois workers no mesmo banco."""
+import pytest
+from flask import Flask, jsonify, session
+
+from services import response_cache
+from services.response_cache import CacheLocal, cache_por_cnpj
+
+CNPJ = "11222333000181"
+
+
+@pytest.fixture
+def app(banco):
+    app = Flask(__name__)
+    app.secret_key = "teste"
+    app.chamadas = 0
+
+    @app.route("/metricas")
+    @cache_por_cnpj()
+    def metricas():
+        app.chamadas += 1
+        return jsonify({"cnpj": session["cnpj"], "chamada": app.chamadas})
+
+    yield app
+    response_cache.configurar_backend(CacheLocal())
+
+
+def _cliente(app):
+    cliente = app.test_client()
+    with cliente.session_transaction() as sessao:
+        sessao["cnpj"] = CNPJ
+    return cliente
+
+
+def test_invalidacao_de_um_worker_vale_no_outro(app):
+    worker_a, worker_b = CacheLocal(), CacheLocal()
+    cliente = _cliente(app)
+
+    response_cache.configurar_backend(worker_a)
+    assert cliente.get("/metricas").headers["X-Cache"] == "MISS"
+    assert cliente.get("/metricas").headers["X-Cache"] == "HIT"
+
+    response_cache.configurar_backend(worker_b)
+    response_cache.invalidar_cnpj(CNPJ)  # Upload processado pelo outro worker
+
+    response_cache.configurar_backend(worker_a)
+    resposta = cliente.get("/metricas")
+    assert resposta.headers["X-Cache"] == "MISS"
+    assert resposta.get_json()["chamada"] == 2
+
+
+def test_etag_responde_304(app):
+    response_cache.configurar_backend(CacheLocal())
+    cliente = _cliente(app)
+    etag = cliente.get("/metricas").headers["ETag"]
+    assert cliente.get("/metricas", headers={"If-None-Match": etag}).status_code == 304
@@ -0,0 +1,82 @@
+"""Gravação das notas do upload em lote (routes/documents.py, salvar_notas_em_lote)."""
+import pytest
+from sqlalchemy import event
+
+from database.connection import SessionLocal
+from models.nota_fiscal import NotaFiscal, ItemNota
+from models.resumo_fiscal import ResumoMensal
+from routes.documents import salvar_notas_em_lote, LOTE_IN_SQLITE
+
+CNPJ = "11222333000181"
+CLIENTE = "64795776000128"
+
+
+def _dados(numero, chave=True, **extras):
+    dados = {
+        "numero": str(numero), "chave_nfe": f"3525{numero:040d}" if chave else "", "data_emissao": "2025-01-10",
+        "cnpj_emitente": CNPJ, "cnpj_destinatario": CLIENTE, "tipo_operacao": "Saída", "valor_total_nota": "100.00",
+        "itens": [{"descricao_produto": f"Produto {numero}", "quantidade": "1", "valor_unitario": "100",
+                   "valor_total": "100", "ncm": "73181500", "cfop": "5102", "icms_valor": 18.0}]
+    }
+    dados.update(extras)
+    return dados
+
+
+@pytest.fixture
+def db(banco):
+    session = SessionLocal()
+    yield session
+    session.close()
+
+
+def test_lote_grande_consulta_chaves_em_blocos(db, banco):
+    total = 2 * LOTE_IN_SQLITE + 200
+    existentes = set(range(0, total, 2))  # Metade já no banco, espalhada por todos os blocos
+    db.add_all([NotaFiscal(numero=str(n), chave_nfe=f"3525{n:040d}", cnpj_emitente=CNPJ) for n in existentes])
+    db.commit()
+
+    consultas_in = []
+
+    def ao_executar(conn, cursor, sql, parametros, contexto, varios):
+        if "chave_nfe IN" in sql:
+            consultas_in.append(len(parametros))
+    event.listen(banco, "before_cursor_execute", ao_executar)
+
+    resultados = salvar_notas_em_lote([_dados(n) for n in range(total)])
+
+    assert len(consultas_in) == 3 and max(consultas_in) <= LOTE_IN_SQLITE
+    assert [r["ok"] for r in resultados] == [n not in existentes for n in range(total)]
+    assert all(r["reason"] == "duplicado" for n, r in enumerate(resultados) if n in existentes)
+    assert db.query(NotaFiscal).count() == total
+    assert db.query(ItemNota).count() == total - len(existentes)
+    resumo = db.query(ResumoMensal).filter_by(cnpj=CNPJ, papel="emitente").one()
+    assert resumo.num_notas == total - len(existentes)
+
+
+def test_duplicadas_dentro_do_lote(db):
+    resultados = salvar_notas_em_lote([
+        _dados(1), _dados(1),  # Mesma chave
+        _dados(2, chave=False), _dados(2, chave=False),  # Sem chave: mesmo número/emitente/data
+        _dados(2, chave=False, data_emissao="2025-01-11"),  # Mesmo número, outra data: nota diferente
+    ])
+
+    assert resultados == [{"ok": True}, {"ok": False, "reason": "duplicado"},
+                          {"ok": True}, {"ok": False, "reason": "duplicado"}, {"ok": True}]
+    assert db.query(NotaFiscal).count() == 3
+    # Reenvio do mesmo lote: tudo duplicado, inclusive as sem chave
+    assert all(r == {"ok": False, "reason": "duplicado"} for r in salvar_notas_em_lote([_dados(1), _dados(2, chave=False)]))
+
+
+def test_falha_no_lote_cai_para_uma_nota_por_vez(db):
+    ruim = _dados(2)
+    ruim["itens"][0]["icms_valor"] = "dezoito"  # Valor que não converte: derruba o lote inteiro
+
+    resultados = salvar_notas_em_lote([_dados(1), ruim, _dados(1), _dados(3)])
+
+    assert resultados[0] == {"ok": True} and resultados[3] == {"ok": True}
+    assert resultados[1]["ok"] is False and "dezoito" in resultados[1]["reason"]
+    assert resultados[2] == {"ok": False, "reason": "duplicado"}  # Marcada antes da falha, continua duplicada
+    assert sorted(n.numero for n in db.query(NotaFiscal)) == ["1", "3"]
+    assert db.query(ItemNota).count() == 2
+    resumo = db.query(ResumoMensal).filter_by(cnpj=CNPJ, ano_mes="2025-01", papel="emitente").one()
+    assert resumo.num_notas == 2 and resumo.icms == pytest.approx(36.0)
@@ -0,0 +1,152 @@
+"""Cache da busca web (services/web_search.py) com um provedor falso local."""
+import logging
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import esperar
+from database.connection import SessionLocal
+from models.busca_web import BuscaWebCache
+from services import web_search
+from services.web_search import WebSearchCache, configurar_provedor, chave_consulta
+
+
+class ProvedorFalso:
+    """Provedor com search(query, max_results) que conta as chamadas e devolve a rodada atual."""
+
+    def __init__(self):
+        self.chamadas = []
+        self.rodada = 1
+        self.liberar = threading.Event()
+        self.liberar.set()
+
+    def search(self, query, max_results):
+        self.liberar.wait(5)
+        self.chamadas.append(query)
+        return {"results": [{"title": f"{query} r{self.rodada}", "content": "...", "url": "http://exemplo"}]}
+
+
+@pytest.fixture
+def provedor(banco):
+    falso = ProvedorFalso()
+    configurar_provedor(lambda api_key: falso)
+    yield falso
+    configurar_provedor(None)
+
+
+def _envelhecer(consulta, segundos, max_results=3):
+    """Recua buscado_em da entrada em cache, simulando o tempo passando."""
+    chave, _ = chave_consulta(consulta, max_results)
+    session = SessionLocal()
+    try:
+        linha = session.get(BuscaWebCache, chave)
+        linha.buscado_em = datetime.utcnow() - timedelta(seconds=segundos)
+        session.commit()
+    finally:
+        session.close()
+
+
+def test_falha_na_revalidacao_mantem_a_entrada_e_loga_aviso(provedor, caplog):
+    cache = WebSearchCache(ttl=60, stale=600)
+    antiga = cache.buscar("regime simples", "chave")
+    _envelhecer("regime simples", 120)
+
+    def falhar(query, max_results):
+        raise ConnectionError("provedor fora do ar")
+    provedor.search = falhar
+
+    with caplog.at_level(logging.WARNING):
+        assert cache.buscar("regime simples", "chave") == antiga
+        assert esperar(lambda: "provedor fora do ar" in caplog.text)
+    assert cache.metrics["erros_revalidacao"] == 1
+    assert cache.buscar("regime simples", "chave") == antiga  # Continua servindo a antiga
+
+
+def test_hit_no_cache_nao_chama_provedor(provedor):
+    cache = WebSearchCache(ttl=60, stale=60)
+    primeira = cache.buscar("alíquota do ICMS em SP", "chave")
+    # Mesma consulta normalizada (caixa/acentos): sai do banco
+    segunda = cache.buscar("Aliquota do ICMS em SP", "chave")
+
+    assert segunda == primeira
+    assert len(provedor.chamadas) == 1
+    assert cache.metrics["misses"] == 1
+    assert cache.metrics["hits"] == 1
+
+
+def test_entrada_stale_servida_e_revalidada_em_segundo_plano(provedor):
+    cache = WebSearchCache(ttl=60, stale=600)
+    antiga = cache.buscar("tabela ncm", "chave")
+    _envelhecer("tabela ncm", 120)  # Passou do TTL, dentro da janela stale
+
+    provedor.rodada = 2
+    provedor.liberar.clear()  # Segura a revalidação: a resposta não pode esperar por ela
+    servida = cache.buscar("tabela ncm", "chave")
+    assert servida == antiga
+    assert cache.metrics["stale_hits"] == 1
+
+    provedor.liberar.set()
+    assert esperar(lambda: cache.metrics["revalidacoes"] == 1)
+    assert len(provedor.chamadas) == 2
+
+    # O resultado revalidado já vale como hit dentro do TTL
+    assert cache.buscar("tabela ncm", "chave")[0]["title"].endswith("r2")
+    assert cache.metrics["hits"] == 1
+    assert len(provedor.chamadas) == 2
+
+
+def test_revalidacao_nao_duplica_busca(provedor):
+    cache = WebSearchCache(ttl=60, stale=600)
+    cache.buscar("cfop 5102", "chave")
+    _envelhecer("cfop 5102", 120)
+
+    provedor.liberar.clear()
+    cache.buscar("cfop 5102", "chave")
+    cache.buscar("cfop 5102", "chave")
+    provedor.liberar.set()
+    assert esperar(lambda: cache.metrics["revalidacoes"] >= 1)
+    assert esperar(lambda: not cache._revalidando)
+    assert len(provedor.chamadas) == 2
+
+
+def test_expirada_alem_da_janela_stale_busca_de_novo(provedor):
+    cache = WebSearchCache(ttl=60, stale=60)
+    cache.buscar("simples nacional anexo I", "chave")
+    _envelhecer("simples nacional anexo I", 500)
+
+    provedor.rodada = 2
+    resultado = cache.buscar("simples nacional anexo I", "chave")
+    assert resultado[0]["title"].endswith("r2")
+    assert cache.metrics["misses"] == 2
+    assert cache.metrics["stale_hits"] == 0
+    assert len(provedor.chamadas) == 2
+
+
+def test_limite_de_entradas_descarta_as_menos_acessadas(provedor):
+    cache = WebSearchCache(ttl=60, stale=60, max_entries=2)
+    for consulta in ("consulta a", "consulta b", "consulta c"):
+        cache.buscar(consulta, "chave")
+
+    session = SessionLocal()
+    try:
+        restantes = {linha.consulta for linha in session.query(BuscaWebCache)}
+    finally:
+        session.close()
+    assert restantes == {"consulta b", "consulta c"}
+
+    cache.buscar("consulta a", "chave")  # Foi descartada: volta ao provedor
+    assert provedor.chamadas.count("consulta a") == 2
+
+
+def test_cliente_do_provedor_reaproveitado_por_chave(banco):
+    criados = []
+    configurar_provedor(lambda api_key: criados.append(api_key) or ProvedorFalso())
+    try:
+        cache = WebSearchCache()
+        assert cache.cliente("k1") is cache.cliente("k1")
+        cache.cliente("k2")
+        assert criados == ["k1", "k2"]
+        assert web_search.provedor_disponivel()
+    finally:
+        configurar_provedor(None)